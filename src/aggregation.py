@@ -0,0 +1,265 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Sequence
+
+
+class StreamingAggregator:
+    """シナリオ・パスの結果をチャンク単位で受け取り, 年・項目ごとの統計量を一定のメモリで集計する
+
+    件数, 最小値, 最大値, 負の件数は厳密に, 平均・分散はChanの並列アルゴリズムで集計する.
+    分位点はt-digest（マージ型）で近似する. ワーカーごとの部分集計はmergeで結合できる.
+
+    Args:
+        years (Sequence[int]): 年
+        columns (Sequence[str]): 集計する項目
+        compression (int, optional): t-digestの圧縮パラメーター（大きいほど高精度）. Defaults to 200.
+    """
+
+    def __init__(
+        self, years: Sequence[int], columns: Sequence[str], compression: int = 200
+    ) -> None:
+        self.years = np.asarray(years)
+        self.columns = list(columns)
+        self.compression = compression
+        shape = (len(self.columns), len(self.years))
+        self.counts = np.zeros(len(self.columns), dtype=np.int64)
+        self.means = np.zeros(shape)
+        self.m2s = np.zeros(shape)
+        self.mins = np.full(shape, np.inf)
+        self.maxs = np.full(shape, -np.inf)
+        self.negative_counts = np.zeros(shape, dtype=np.int64)
+        # 項目・年ごとのt-digestのセントロイド（平均, 重み）
+        self.digests = [
+            [(np.zeros(0), np.zeros(0)) for _ in self.years] for _ in self.columns
+        ]
+
+    def update(self, datas: Dict[str, np.ndarray]) -> None:
+        """チャンクの結果を集計に加える
+
+        Args:
+            datas (Dict[str, np.ndarray]): 項目名 -> 配列（チャンクのパス数 x 年数）
+        """
+        for i, column in enumerate(self.columns):
+            values = np.asarray(datas[column], dtype=float)
+            if values.ndim != 2 or values.shape[1] != len(self.years):
+                raise AggregationError(
+                    f"shape of values is invalid! column is {column} and shape is {values.shape}"
+                )
+            count = len(values)
+            if count == 0:
+                continue
+            chunk_means = values.mean(axis=0)
+            chunk_m2s = ((values - chunk_means) ** 2).sum(axis=0)
+            self.__merge_moments(i, count, chunk_means, chunk_m2s)
+            self.mins[i] = np.minimum(self.mins[i], values.min(axis=0))
+            self.maxs[i] = np.maximum(self.maxs[i], values.max(axis=0))
+            self.negative_counts[i] += (values < 0).sum(axis=0)
+
+            # チャンクは全ての年で件数が同じため, 年をまとめて圧縮してから既存のセントロイドと結合する
+            sorted_values = np.sort(values, axis=0)
+            starts = _get_bucket_starts(np.ones(count), compression=self.compression)
+            bucket_weights = np.diff(np.append(starts, count)).astype(float)
+            bucket_means = (
+                np.add.reduceat(sorted_values, starts, axis=0) / bucket_weights[:, None]
+            )
+            for j in range(len(self.years)):
+                self.__merge_digest(i, j, bucket_means[:, j], bucket_weights)
+
+    def update_long(self, columns: Dict[str, np.ndarray]) -> None:
+        """シナリオ・年ごとの行からなる結果（シナリオ順・年順に並んだ列）を集計に加える
+
+        Args:
+            columns (Dict[str, np.ndarray]): 列名 -> 配列（シナリオ数 x 年数の行）
+        """
+        self.update(
+            {
+                column: np.asarray(columns[column]).reshape(-1, len(self.years))
+                for column in self.columns
+            }
+        )
+
+    def merge(self, other: "StreamingAggregator") -> "StreamingAggregator":
+        """他の集計（ワーカーの部分集計など）を結合する"""
+        if self.columns != other.columns or not np.array_equal(self.years, other.years):
+            raise AggregationError("columns or years of aggregators are different!")
+        for i in range(len(self.columns)):
+            if other.counts[i] == 0:
+                continue
+            self.__merge_moments(i, other.counts[i], other.means[i], other.m2s[i])
+            for j in range(len(self.years)):
+                means, weights = other.digests[i][j]
+                self.__merge_digest(i, j, means, weights)
+        self.mins = np.minimum(self.mins, other.mins)
+        self.maxs = np.maximum(self.maxs, other.maxs)
+        self.negative_counts += other.negative_counts
+        return self
+
+    def get_quantiles(self, column: str, quantiles: Sequence[float]) -> np.ndarray:
+        """項目の年ごとの分位点を返す
+
+        Args:
+            column (str): 項目
+            quantiles (Sequence[float]): 分位点（0〜1）
+
+        Returns:
+            np.ndarray: 分位点の数 x 年数
+        """
+        i = self.columns.index(column)
+        results = np.full((len(quantiles), len(self.years)), np.nan)
+        if self.counts[i] == 0:
+            return results
+        for j in range(len(self.years)):
+            means, weights = self.digests[i][j]
+            total_weight = weights.sum()
+            centers = np.cumsum(weights) - weights / 2
+            xs = np.concatenate([[0.0], centers, [total_weight]])
+            ys = np.concatenate([[self.mins[i, j]], means, [self.maxs[i, j]]])
+            results[:, j] = np.interp(np.asarray(quantiles) * total_weight, xs, ys)
+        return results
+
+    def summarize(
+        self,
+        columns: List[str] = None,
+        quantiles: Sequence[float] = (0.05, 0.25, 0.5, 0.75, 0.95),
+    ) -> pd.DataFrame:
+        """年・項目ごとの統計量（件数, 平均, 標準偏差, 最小値, 最大値, 分位点, 負の確率）を返す
+
+        Args:
+            columns (List[str], optional): 項目. Defaults to None（全項目）.
+            quantiles (Sequence[float], optional): 分位点. Defaults to (0.05, 0.25, 0.5, 0.75, 0.95).
+
+        Returns:
+            pd.DataFrame: (年, 項目)をインデックスとした統計量
+        """
+        columns = self.columns if columns is None else columns
+        dfs = []
+        for column in columns:
+            i = self.columns.index(column)
+            count = self.counts[i]
+            if count > 0:
+                summary = {
+                    "count": np.full(len(self.years), count),
+                    "mean": self.means[i],
+                    "std": np.sqrt(self.m2s[i] / count),
+                    "min": self.mins[i],
+                    "max": self.maxs[i],
+                }
+            else:
+                # 集計していない項目の統計量は欠損値とする
+                empty = np.full(len(self.years), np.nan)
+                summary = {
+                    "count": np.full(len(self.years), count),
+                    "mean": empty,
+                    "std": empty,
+                    "min": empty,
+                    "max": empty,
+                }
+            for q, values in zip(quantiles, self.get_quantiles(column, quantiles)):
+                summary[f"p{q * 100:g}"] = values
+            summary["負の確率"] = (
+                self.negative_counts[i] / count
+                if count > 0
+                else np.full(len(self.years), np.nan)
+            )
+            df = pd.DataFrame(summary, index=self.years)
+            df.index.name = "年"
+            df.insert(0, "項目", column)
+            dfs.append(df)
+        return pd.concat(dfs).set_index("項目", append=True)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """np.savezで保存できる配列に変換する"""
+        digest_sizes = np.array(
+            [[len(means) for means, _ in digests] for digests in self.digests],
+            dtype=np.int64,
+        )
+        all_means = [means for digests in self.digests for means, _ in digests]
+        all_weights = [weights for digests in self.digests for _, weights in digests]
+        return {
+            "years": self.years,
+            "columns": np.array(self.columns, dtype=str),
+            "compression": np.array(self.compression),
+            "counts": self.counts,
+            "means": self.means,
+            "m2s": self.m2s,
+            "mins": self.mins,
+            "maxs": self.maxs,
+            "negative_counts": self.negative_counts,
+            "digest_sizes": digest_sizes,
+            "digest_means": np.concatenate(all_means),
+            "digest_weights": np.concatenate(all_weights),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "StreamingAggregator":
+        aggregator = cls(
+            years=arrays["years"],
+            columns=[str(column) for column in arrays["columns"]],
+            compression=int(arrays["compression"]),
+        )
+        aggregator.counts = np.array(arrays["counts"])
+        aggregator.means = np.array(arrays["means"])
+        aggregator.m2s = np.array(arrays["m2s"])
+        aggregator.mins = np.array(arrays["mins"])
+        aggregator.maxs = np.array(arrays["maxs"])
+        aggregator.negative_counts = np.array(arrays["negative_counts"])
+        offsets = np.concatenate([[0], np.cumsum(arrays["digest_sizes"].ravel())])
+        for k in range(len(offsets) - 1):
+            i, j = divmod(k, len(aggregator.years))
+            target = slice(offsets[k], offsets[k + 1])
+            aggregator.digests[i][j] = (
+                np.array(arrays["digest_means"][target]),
+                np.array(arrays["digest_weights"][target]),
+            )
+        return aggregator
+
+    def save(self, file_path: str) -> None:
+        with open(file_path, "wb") as f:
+            np.savez(f, **self.to_arrays())
+
+    @classmethod
+    def load(cls, file_path: str) -> "StreamingAggregator":
+        with np.load(file_path) as arrays:
+            return cls.from_arrays({name: arrays[name] for name in arrays.files})
+
+    def __merge_moments(
+        self, i: int, count: int, means: np.ndarray, m2s: np.ndarray
+    ) -> None:
+        total_count = self.counts[i] + count
+        delta = means - self.means[i]
+        self.m2s[i] = (
+            self.m2s[i] + m2s + delta**2 * self.counts[i] * count / total_count
+        )
+        self.means[i] = self.means[i] + delta * count / total_count
+        self.counts[i] = total_count
+
+    def __merge_digest(
+        self, i: int, j: int, means: np.ndarray, weights: np.ndarray
+    ) -> None:
+        current_means, current_weights = self.digests[i][j]
+        means = np.concatenate([current_means, means])
+        weights = np.concatenate([current_weights, weights])
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        starts = _get_bucket_starts(weights, compression=self.compression)
+        bucket_weights = np.add.reduceat(weights, starts)
+        bucket_means = np.add.reduceat(means * weights, starts) / bucket_weights
+        self.digests[i][j] = (bucket_means, bucket_weights)
+
+
+def _get_bucket_starts(weights: np.ndarray, compression: int) -> np.ndarray:
+    """値の順に並んだセントロイドを, t-digestのスケール関数k1で同じ区間となるものごとにまとめる
+
+    Returns:
+        np.ndarray: 各区間の先頭のインデックス
+    """
+    cumulative_weights = np.cumsum(weights)
+    total_weight = cumulative_weights[-1]
+    q = (cumulative_weights - weights / 2) / total_weight
+    k = compression / (2 * np.pi) * np.arcsin(2 * q - 1)
+    bucket_ids = np.floor(k)
+    return np.flatnonzero(np.diff(bucket_ids, prepend=-np.inf) != 0)
+
+
+class AggregationError(Exception):
+    pass
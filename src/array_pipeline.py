@@ -0,0 +1,597 @@
+"""pandasを利用せずにシミュレーションを計算する軽量な計算経路
+
+パラメーターファイルをpandasを利用せずに読み込み（parameter_formats.read_sheet_rows）, executor.STAGESと同じ計算をnumpyの配列で行う.
+計算結果は列名 -> 配列の辞書（以下, 列データ）とし, 列の順序・行の順序はCalculatorの出力に合わせる.
+算出項目・税金・不動産収支・売却などの計算はutilの配列の関数をCalculatorと共有し, ここではパラメーター・列データの取得と並べ替えのみを行う.
+pandasはto_data_framesでDataFrameに変換する場合のみ読み込む.
+"""
+
+from investment_metrics import calc_investment_metrics, calc_investment_schedule
+from loan import MonthlyLoanSchedule, calc_monthly_loan_schedule
+from parameter_formats import ParameterFormatError, read_sheet_rows
+from typing import Dict, List
+from util import (
+    calc_cash_flow_array,
+    calc_deprecation_cost_array,
+    calc_derived_building_values,
+    calc_real_estate_cash_array,
+    calc_real_estate_price_array,
+    calc_real_estate_sale_array,
+    calc_tax_amount_array,
+    calc_tax_columns_array,
+)
+import csv
+import numpy as np
+import os
+
+# 年をインデックスとするデータ（CSVではインデックス列として先頭に出力する）
+YEAR_INDEX_DATA_NAMES = (
+    "tax_data",
+    "tax_data_with_real_estate_cash",
+    "cash_flow_data",
+)
+
+INITIAL_EXPENSES_ITEM = "初期費用（不動産取得税、事務手数料、登記費用、印紙代、火災保険料、金融機関手数料、など）"
+
+
+class ArrayParameters:
+    """配列での計算に利用するパラメーター（算出項目は計算済みとする）
+
+    Args:
+        income_columns (Dict[str, np.ndarray]): income_simulationシートの列（"年"を含む）
+        building_values (Dict[str, Dict[str, object]]): 物件名 -> 物件情報の項目 -> 値
+        rent_ratios (Dict[int, float]): 年数 -> 家賃割合(%)
+        other_values (Dict[str, object]): other_parametersシートの項目 -> 値
+    """
+
+    def __init__(
+        self,
+        income_columns: Dict[str, np.ndarray],
+        building_values: Dict[str, Dict[str, object]],
+        rent_ratios: Dict[int, float],
+        other_values: Dict[str, object],
+    ) -> None:
+        self.income_columns = income_columns
+        self.building_values = building_values
+        self.rent_ratios = rent_ratios
+        self.other_values = other_values
+
+    @classmethod
+    def from_parameters(cls, parameters) -> "ArrayParameters":
+        """params.Parametersから変換する"""
+        income_df = parameters.get_income_df()
+        income_columns = {"年": income_df.index.to_numpy()}
+        income_columns.update(
+            {column: income_df[column].to_numpy() for column in income_df.columns}
+        )
+        building_df = parameters.get_buidling_df()
+        building_values = {
+            building_name: building_df[building_name].to_dict()
+            for building_name in building_df.columns
+        }
+        other_dict = parameters.get_other_dict()
+        return cls(
+            income_columns=income_columns,
+            building_values=building_values,
+            rent_ratios=other_dict["rent_decrease_rate"]["家賃割合(%)"].to_dict(),
+            other_values=other_dict["other_parameters"]["value"].to_dict(),
+        )
+
+    def get_building_names(self) -> List[str]:
+        return list(self.building_values.keys())
+
+    def get_years(self) -> np.ndarray:
+        years = self.income_columns["年"]
+        return np.arange(years.min(), years.max() + 1)
+
+    def get_building_array(self, item: str, dtype=None) -> np.ndarray:
+        """物件情報の項目を物件順の配列で返す"""
+        return np.array(
+            [values[item] for values in self.building_values.values()], dtype=dtype
+        )
+
+    def get_building_years(self, item: str) -> np.ndarray:
+        """物件情報の日付の項目の年を物件順の配列で返す"""
+        return np.array(
+            [values[item].year for values in self.building_values.values()],
+            dtype=np.int64,
+        )
+
+
+def read_array_parameters(params_file_path: str) -> ArrayParameters:
+    """パラメーターファイルを読み込み, 算出項目を計算したArrayParametersを返す
+
+    Args:
+        params_file_path (str): パラメーターファイル（Excel, JSON, YAML, NPZ）のパス
+
+    Returns:
+        ArrayParameters: パラメーター
+    """
+    try:
+        sheets = read_sheet_rows(params_file_path)
+    except ParameterFormatError as e:
+        raise ArrayPipelineError(str(e)) from e
+
+    # income_simulationシート（列ごとの配列）
+    header, *rows = sheets["income_simulation"]
+    income_columns = {
+        "年" if i == 0 else column: np.array([row[i] for row in rows])
+        for i, column in enumerate(header)
+        if i == 0 or column is not None
+    }
+
+    # building_informationシート（物件名が空欄の列は削除する）
+    header, *rows = sheets["building_information"]
+    building_values = {
+        building_name: {row[0]: row[i] for row in rows}
+        for i, building_name in enumerate(header)
+        if i > 0 and building_name is not None
+    }
+
+    # その他のシート（1列目をインデックスとする）
+    def read_column(sheet_name: str, column: str) -> dict:
+        header, *rows = sheets[sheet_name]
+        if column not in header:
+            raise ArrayPipelineError(
+                f"{column} column is not exist in {sheet_name} sheet!"
+            )
+        index = header.index(column)
+        return {row[0]: row[index] for row in rows}
+
+    durable_lives = read_column("building_durable_life", "耐用年数")
+    for values in building_values.values():
+        _derive_building_values(values=values, durable_lives=durable_lives)
+
+    return ArrayParameters(
+        income_columns=income_columns,
+        building_values=building_values,
+        rent_ratios=read_column("rent_decrease_rate", "家賃割合(%)"),
+        other_values=read_column("other_parameters", "value"),
+    )
+
+
+def _derive_building_values(values: dict, durable_lives: dict) -> None:
+    """物件情報の算出項目を計算する（params.derive_parametersと同じ計算）"""
+    values.update(
+        calc_derived_building_values(
+            values, building_limit_of_frame=durable_lives[values["構造"]]
+        )
+    )
+
+
+def calc_tax_columns(
+    parameters: ArrayParameters, real_estate_cash: Dict[str, np.ndarray] = None
+) -> Dict[str, np.ndarray]:
+    """TaxCalculatorと同じ税金のデータを計算する"""
+    years = parameters.income_columns["年"]
+    book_income = None
+    if real_estate_cash is not None:
+        # 不動産収支の情報がある場合は、不動産収支を考慮して、所得金額を計算する
+        rows = {year: i for i, year in enumerate(real_estate_cash["年"])}
+        if any(year not in rows for year in years):
+            raise ArrayPipelineError(
+                "real estate cash data does not cover the years of income simulation!"
+            )
+        book_income = real_estate_cash["帳簿上の収支"][[rows[year] for year in years]]
+
+    columns = dict(parameters.income_columns)
+    columns.update(
+        calc_tax_columns_array(
+            income=parameters.income_columns["給与（万円）"] * 10000,
+            expenses=parameters.income_columns["経費（万円）"] * 10000,
+            real_estate_income=book_income,
+        )
+    )
+    return columns
+
+
+def calc_building_deprecation_columns(
+    parameters: ArrayParameters,
+) -> Dict[str, np.ndarray]:
+    """BuildingDeprecationCalculatorと同じ減価償却のデータを計算する"""
+    simulation_interval = len(parameters.get_years())
+    building_names = parameters.get_building_names()
+    year_indices = np.arange(1, simulation_interval + 1)
+    costs = calc_deprecation_cost_array(
+        frame_intervals=parameters.get_building_array(
+            "減価償却期間（躯体部分）", dtype=float
+        ),
+        equip_intervals=parameters.get_building_array(
+            "減価償却期間（設備部分）", dtype=float
+        ),
+        frame_costs=parameters.get_building_array(
+            "減価償却費用（躯体）（円/年）", dtype=np.int64
+        ),
+        equip_costs=parameters.get_building_array(
+            "減価償却費用（設備）（円/年）", dtype=np.int64
+        ),
+        simulation_interval=simulation_interval,
+    )
+    return {
+        "年": np.tile(year_indices, len(building_names)),
+        "物件名": np.repeat(np.array(building_names, dtype=str), simulation_interval),
+        "減価償却費用": costs.ravel(),
+    }
+
+
+def get_monthly_loan_schedule(parameters: ArrayParameters) -> MonthlyLoanSchedule:
+    """LoanCalculator.calc_monthly_scheduleと同じ月単位のローン返済スケジュールを計算する（物件名の順に並べる）"""
+    building_names = sorted(parameters.get_building_names())
+    building_values = [parameters.building_values[name] for name in building_names]
+    return calc_monthly_loan_schedule(
+        building_names=building_names,
+        loan_conditions=[
+            (values["借入金額"], values["月利（%）"], values["ローン期間（年）"] * 12)
+            for values in building_values
+        ],
+        building_ratios=[values["建物割合（%）"] for values in building_values],
+        month_count=len(parameters.get_years()) * 12,
+    )
+
+
+def calc_loan_columns(parameters: ArrayParameters) -> Dict[str, np.ndarray]:
+    """LoanCalculatorと同じローン利息のデータを計算する（物件名の順に並べる）"""
+    return get_monthly_loan_schedule(parameters=parameters).aggregate_per_year()
+
+
+def _get_per_building(
+    parameters: ArrayParameters,
+    columns: Dict[str, np.ndarray],
+    column: str,
+) -> np.ndarray:
+    """物件名・年数（1始まり）の行からなるデータの列を, 物件数 x 年数の配列に並べ替える"""
+    building_names = parameters.get_building_names()
+    simulation_interval = len(parameters.get_years())
+    values = np.zeros((len(building_names), simulation_interval), dtype=np.int64)
+    building_indices = {name: i for i, name in enumerate(building_names)}
+    for building_name, year_index, value in zip(
+        columns["物件名"], columns["年"], columns[column]
+    ):
+        values[building_indices[building_name], year_index - 1] = value
+    return values
+
+
+def calc_real_estate_cash_per_building_columns(
+    parameters: ArrayParameters,
+    loan_columns: Dict[str, np.ndarray],
+    building_deprecation_columns: Dict[str, np.ndarray],
+) -> Dict[str, np.ndarray]:
+    """RealEstateCashPerBuildingCalculatorと同じ物件ごとの不動産収支のデータを計算する（物件名, 年の順に並べる）"""
+    years = parameters.get_years()
+    purchase_years = parameters.get_building_years("契約日")
+    sale_years = parameters.get_building_years("売却予定日")
+    ownership = (purchase_years[:, None] <= years) & (years <= sale_years[:, None])
+    is_purchase_year = purchase_years[:, None] == years
+
+    # 物件の購入年を1年目とした年数の値を, シミュレーション年の位置に移す
+    year_indices = years - purchase_years[:, None] + 1
+    if np.any(ownership & ((year_indices < 1) | (year_indices > len(years)))):
+        raise ArrayPipelineError(
+            "purchase year of building is out of the simulation period!"
+        )
+    year_indices = np.clip(year_indices, 1, len(years)) - 1
+    rows = np.arange(len(purchase_years))[:, None]
+
+    def get_owned_values(columns: Dict[str, np.ndarray], column: str) -> np.ndarray:
+        values = _get_per_building(parameters, columns, column)[rows, year_indices]
+        return np.where(ownership, values, 0)
+
+    # 物件経費は購入年は初期費用, 不動産取得税を加える
+    fixed_expenses = (
+        parameters.get_building_array("管理費（円/月）", dtype=np.int64)
+        + parameters.get_building_array("修繕積立金（円/月）", dtype=np.int64)
+    ) * 12 + parameters.get_building_array("その他経費（固定資産税）（円/年）", dtype=np.int64)
+    initial_expenses = parameters.get_building_array(
+        INITIAL_EXPENSES_ITEM, dtype=np.int64
+    )
+    purchase_expenses = initial_expenses + parameters.get_building_array(
+        "不動産取得税", dtype=np.int64
+    )
+    rents = parameters.get_building_array("家賃収入（円/月）", dtype=np.int64)
+    if parameters.other_values["家賃減少"]:
+        ratios = np.array(
+            [float(parameters.rent_ratios[i + 1]) for i in range(len(years))]
+        )
+        rents = (rents[:, None] * ratios / 100).astype(np.int64)
+    else:
+        rents = np.broadcast_to(rents[:, None], ownership.shape)
+    is_cut_initial_cost = parameters.other_values["初期費用カット"]
+
+    # get_real_estate_cash_componentsと同じ形式の値から, RealEstateCashPerBuildingCalculatorと同じ計算を行う
+    values = calc_real_estate_cash_array(
+        {
+            "保有期間": ownership,
+            "家賃収入（円/月）": np.where(ownership, rents, 0),
+            "物件経費": np.where(
+                ownership,
+                fixed_expenses[:, None]
+                + np.where(is_purchase_year, purchase_expenses[:, None], 0),
+                0,
+            ),
+            "減価償却費": get_owned_values(
+                building_deprecation_columns, "減価償却費用"
+            ),
+            "ローン利息（建物分）": get_owned_values(loan_columns, "利息(建物分のみ)"),
+            "ローン支払い": get_owned_values(loan_columns, "毎年返済額"),
+            "初期費用カット": np.where(
+                ownership & is_purchase_year & bool(is_cut_initial_cost),
+                initial_expenses[:, None],
+                0,
+            ),
+            "雑費割合": parameters.get_building_array("雑費割合（%）", dtype=float),
+            "雑費上限": parameters.get_building_array("雑費上限", dtype=np.int64),
+            "雑費下限": parameters.get_building_array("雑費下限", dtype=np.int64),
+        }
+    )
+    building_names = parameters.get_building_names()
+    columns = {
+        "年": np.tile(years, len(building_names)),
+        "物件名": np.repeat(np.array(building_names, dtype=object), len(years)),
+    }
+    columns.update({name: np.ravel(array) for name, array in values.items()})
+    return columns
+
+
+def _get_building_year_array(
+    parameters: ArrayParameters, columns: Dict[str, np.ndarray], column: str
+) -> np.ndarray:
+    """物件名, 年の順に並べた物件ごとのデータの列を, 物件数 x 年数の配列として返す"""
+    return columns[column].reshape(
+        len(parameters.get_building_names()), len(parameters.get_years())
+    )
+
+
+def calc_real_estate_cash_columns(
+    parameters: ArrayParameters, per_building_columns: Dict[str, np.ndarray]
+) -> Dict[str, np.ndarray]:
+    """RealEstateCashCalculatorと同じ不動産収支のデータを, 物件ごとの不動産収支を年ごとに合算して計算する"""
+    columns = {"年": parameters.get_years()}
+    for name in per_building_columns:
+        if name in ("年", "物件名"):
+            continue
+        columns[name] = _get_building_year_array(
+            parameters, per_building_columns, name
+        ).sum(axis=0)
+    return columns
+
+
+def calc_real_estate_tax_attribution_columns(
+    parameters: ArrayParameters, per_building_columns: Dict[str, np.ndarray]
+) -> Dict[str, np.ndarray]:
+    """RealEstateTaxAttributionCalculatorと同じ物件ごとの税額への影響のデータを計算する"""
+    book_incomes = _get_building_year_array(
+        parameters, per_building_columns, "帳簿上の収支"
+    )
+    real_incomes = _get_building_year_array(
+        parameters, per_building_columns, "リアル収支"
+    )
+
+    # 全物件の場合と, 物件ごとにその物件を除いた場合の税額をまとめて計算する
+    total_book_income = book_incomes.sum(axis=0)
+    taxes = calc_tax_amount_array(
+        income=parameters.income_columns["給与（万円）"] * 10000,
+        expenses=parameters.income_columns["経費（万円）"] * 10000,
+        real_estate_income=np.vstack(
+            [total_book_income, total_book_income - book_incomes]
+        ),
+    )
+    tax_effects = taxes[0] - taxes[1:]
+    return {
+        "年": per_building_columns["年"],
+        "物件名": per_building_columns["物件名"],
+        "帳簿上の収支": book_incomes.ravel(),
+        "リアル収支": real_incomes.ravel(),
+        "税額への影響": tax_effects.ravel(),
+        "税引後収支": (real_incomes - tax_effects).ravel(),
+    }
+
+
+def calc_real_estate_price_columns(
+    parameters: ArrayParameters,
+) -> Dict[str, np.ndarray]:
+    """RealEstatePriceSimuationCalculatorと同じ物件価格のデータを計算する"""
+    simulation_interval = len(parameters.get_years())
+    building_names = parameters.get_building_names()
+    prices = calc_real_estate_price_array(
+        prices=parameters.get_building_array("物件価格"),
+        decrease_rates=parameters.get_building_array("物件価格減少率(%/年)"),
+        first_year_decrease_rates=parameters.get_building_array(
+            "物件価格初年度減少率(%/年)"
+        ),
+        simulation_interval=simulation_interval,
+    )
+    return {
+        "年": np.tile(np.arange(1, simulation_interval + 1), len(building_names)),
+        "物件名": np.repeat(np.array(building_names, dtype=str), simulation_interval),
+        "想定評価額": prices.ravel(),
+    }
+
+
+def calc_real_estate_sale_columns(
+    parameters: ArrayParameters,
+    loan_columns: Dict[str, np.ndarray],
+    building_deprecation_columns: Dict[str, np.ndarray],
+    real_estate_price_columns: Dict[str, np.ndarray],
+) -> Dict[str, np.ndarray]:
+    """RealEstateSaleSimulationCalculatorと同じ物件売却のデータを計算する"""
+    values = calc_real_estate_sale_array(
+        prices=_get_per_building(parameters, real_estate_price_columns, "想定評価額"),
+        loan_balances=_get_per_building(parameters, loan_columns, "ローン残高"),
+        deprecation_costs=_get_per_building(
+            parameters, building_deprecation_columns, "減価償却費用"
+        ),
+        purchase_prices=parameters.get_building_array("物件価格", dtype=np.int64),
+        sale_expenses=parameters.get_building_array("譲渡費用（円）", dtype=np.int64),
+    )
+    columns = {
+        "年": real_estate_price_columns["年"],
+        "物件名": real_estate_price_columns["物件名"],
+    }
+    columns.update({name: np.ravel(array) for name, array in values.items()})
+    return columns
+
+
+def calc_cash_flow_columns(
+    parameters: ArrayParameters,
+    tax_columns: Dict[str, np.ndarray],
+    tax_with_real_estate_columns: Dict[str, np.ndarray],
+    real_estate_cash_columns: Dict[str, np.ndarray],
+    real_estate_sale_columns: Dict[str, np.ndarray],
+) -> Dict[str, np.ndarray]:
+    """CashFlowCalculatorと同じキャッシュフローのデータを計算する"""
+    years = parameters.get_years()
+
+    def get_tax(columns: Dict[str, np.ndarray]) -> np.ndarray:
+        rows = {year: i for i, year in enumerate(columns["年"])}
+        return columns["税額"][[rows[year] for year in years]]
+
+    columns = {"年": years}
+    columns.update(
+        calc_cash_flow_array(
+            years=years,
+            real_cash=real_estate_cash_columns["リアル収支"],
+            tax_diffs=get_tax(tax_with_real_estate_columns) - get_tax(tax_columns),
+            sale_years=parameters.get_building_years("売却予定日"),
+            sale_profits=_get_per_building(
+                parameters, real_estate_sale_columns, "売却差額"
+            ),
+        )
+    )
+    return columns
+
+
+def calc_investment_metrics_columns(
+    parameters: ArrayParameters, cash_flow_columns: Dict[str, np.ndarray]
+) -> Dict[str, np.ndarray]:
+    """InvestmentMetricsCalculatorと同じ投資指標のデータを計算する"""
+    investments = parameters.get_building_array("初期投資金額")
+    first_investment, later_investments = calc_investment_schedule(
+        investments=investments,
+        purchase_years=parameters.get_building_years("契約日"),
+        years=cash_flow_columns["年"],
+    )
+    columns = {"初期投資金額": np.array([float(investments.sum())])}
+    columns.update(
+        calc_investment_metrics(
+            cash_flows=cash_flow_columns["収支差額"],
+            initial_investments=first_investment,
+            later_investments=later_investments,
+        )
+    )
+    return columns
+
+
+def execute_array_pipeline(
+    parameters: ArrayParameters,
+) -> Dict[str, Dict[str, np.ndarray]]:
+    """executor.STAGESと同じ順序で全てのデータを計算する
+
+    Args:
+        parameters (ArrayParameters): パラメーター
+
+    Returns:
+        Dict[str, Dict[str, np.ndarray]]: データ名 -> 列データ
+    """
+    results = {"tax_data": calc_tax_columns(parameters=parameters)}
+    if parameters.other_values["tax_only"]:
+        return results
+
+    results["building_deprecation_data"] = calc_building_deprecation_columns(
+        parameters=parameters
+    )
+    results["loan_data"] = calc_loan_columns(parameters=parameters)
+    results["real_estate_cash_per_building_data"] = (
+        calc_real_estate_cash_per_building_columns(
+            parameters=parameters,
+            loan_columns=results["loan_data"],
+            building_deprecation_columns=results["building_deprecation_data"],
+        )
+    )
+    results["real_estate_cash_data"] = calc_real_estate_cash_columns(
+        parameters=parameters,
+        per_building_columns=results["real_estate_cash_per_building_data"],
+    )
+    results["tax_data_with_real_estate_cash"] = calc_tax_columns(
+        parameters=parameters, real_estate_cash=results["real_estate_cash_data"]
+    )
+    results["real_estate_tax_attribution_data"] = (
+        calc_real_estate_tax_attribution_columns(
+            parameters=parameters,
+            per_building_columns=results["real_estate_cash_per_building_data"],
+        )
+    )
+    results["real_estate_price_data"] = calc_real_estate_price_columns(
+        parameters=parameters
+    )
+    results["real_estate_sale_data"] = calc_real_estate_sale_columns(
+        parameters=parameters,
+        loan_columns=results["loan_data"],
+        building_deprecation_columns=results["building_deprecation_data"],
+        real_estate_price_columns=results["real_estate_price_data"],
+    )
+    results["cash_flow_data"] = calc_cash_flow_columns(
+        parameters=parameters,
+        tax_columns=results["tax_data"],
+        tax_with_real_estate_columns=results["tax_data_with_real_estate_cash"],
+        real_estate_cash_columns=results["real_estate_cash_data"],
+        real_estate_sale_columns=results["real_estate_sale_data"],
+    )
+    results["investment_metrics_data"] = calc_investment_metrics_columns(
+        parameters=parameters, cash_flow_columns=results["cash_flow_data"]
+    )
+    return results
+
+
+def to_data_frames(results: Dict[str, Dict[str, np.ndarray]]) -> dict:
+    """列データをExecutorの出力と同じ形式のDataFrameに変換する（pandasを読み込む）"""
+    import pandas as pd
+
+    dfs = {}
+    for data_name, columns in results.items():
+        df = pd.DataFrame(columns)
+        if data_name in YEAR_INDEX_DATA_NAMES:
+            df = df.set_index(keys="年", drop=True)
+        dfs[data_name] = df
+    return dfs
+
+
+def save_results_csv(
+    results: Dict[str, Dict[str, np.ndarray]], output_folder_path: str
+) -> None:
+    """列データをExecutor.save_resultsと同じ形式のCSVで保存する
+
+    Args:
+        results (Dict[str, Dict[str, np.ndarray]]): データ名 -> 列データ
+        output_folder_path (str): 出力フォルダのパス
+    """
+    os.makedirs(output_folder_path, exist_ok=True)
+    for data_name, columns in results.items():
+        names = list(columns.keys())
+        arrays = [_to_csv_values(columns[name]) for name in names]
+        with open(
+            os.path.join(output_folder_path, f"{data_name}.csv"),
+            "w",
+            newline="",
+            encoding="utf-8",
+        ) as f:
+            writer = csv.writer(f, lineterminator="\n")
+            if data_name in YEAR_INDEX_DATA_NAMES:
+                # 年をインデックス列として出力する
+                writer.writerow(names)
+                writer.writerows(zip(*arrays))
+            else:
+                # pandasのRangeIndexと同様に, 名前のない行番号の列を先頭に出力する
+                writer.writerow([""] + names)
+                writer.writerows(zip(range(len(arrays[0])), *arrays))
+
+
+def _to_csv_values(values: np.ndarray) -> list:
+    """配列をCSVに書き込む値のリストに変換する（DataFrame.to_csvと同様に欠損値は空欄とする）"""
+    values = np.asarray(values)
+    if values.dtype.kind == "f" and np.isnan(values).any():
+        return ["" if np.isnan(value) else value for value in values.tolist()]
+    return values.tolist()
+
+
+class ArrayPipelineError(Exception):
+    pass
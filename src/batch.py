@@ -0,0 +1,106 @@
+"""複数のパラメーターファイルの一括計算（中断しても再開できる）
+
+計算結果は<結果フォルダ>/<パラメーターファイル名>/に保存し, ファイルごとの完了を
+<結果フォルダ>/checkpoints/に記録する. 同じ結果フォルダで再実行すると, パラメーターファイルの内容が
+変わっておらず, 計算結果のCSVが破損していないファイルはスキップする.
+
+    python batch.py <result folder> <parameter file path> [<parameter file path> ...]
+"""
+
+from checkpoint import CheckpointStore, Progress, ProgressTracker, fingerprint_file
+from typing import Callable, Dict, List
+import argparse
+import os
+import time
+
+CHECKPOINT_DIR = "checkpoints"
+
+
+def run_batch(
+    parameter_file_paths: List[str],
+    result_folder: str,
+    on_progress: Callable[[Progress], None] = None,
+) -> Dict[str, bool]:
+    """パラメーターファイルごとに計算し, 計算結果を保存する（完了済みのファイルはスキップする）
+
+    Args:
+        parameter_file_paths (List[str]): パラメーターファイルのパス
+        result_folder (str): 結果フォルダ（再開する場合は前回と同じフォルダを指定する）
+        on_progress (Callable[[Progress], None], optional): ファイルごとに進捗を通知する関数. Defaults to None.
+
+    Returns:
+        Dict[str, bool]: パラメーターファイルのパス -> 今回計算した場合はTrue（スキップした場合はFalse）
+    """
+    keys = [_get_key(file_path) for file_path in parameter_file_paths]
+    if len(set(keys)) != len(keys):
+        raise BatchError("file names of parameter files must be unique!")
+
+    store = CheckpointStore(directory=os.path.join(result_folder, CHECKPOINT_DIR))
+    tracker = ProgressTracker(total=len(parameter_file_paths), on_progress=on_progress)
+    statuses = {}
+    for file_path, key in zip(parameter_file_paths, keys):
+        output_folder = os.path.join(result_folder, key)
+        fingerprint = fingerprint_file(file_path)
+        if fingerprint is None:
+            raise BatchError(f"parameter file is not exist! path is {file_path}")
+        if store.is_done(
+            key=key,
+            fingerprint=fingerprint,
+            get_output_fingerprint=lambda name: fingerprint_file(
+                os.path.join(output_folder, name)
+            ),
+        ):
+            statuses[file_path] = False
+            tracker.skip()
+            continue
+
+        # pandasやCalculatorの読み込みは時間がかかるため, 全てスキップする場合は読み込まない
+        from executor import Executor
+
+        start = time.perf_counter()
+        executor = Executor(parameter_file_path=file_path, result_folder=output_folder)
+        output_paths = executor.save_results(dfs=executor.execute())
+
+        # 全ての計算結果を保存した後に記録し, 途中で中断したファイルは再開時に再計算する
+        store.record(
+            key=key,
+            fingerprint=fingerprint,
+            outputs={
+                os.path.basename(path): fingerprint_file(path)
+                for path in output_paths.values()
+            },
+            elapsed_time=time.perf_counter() - start,
+        )
+        statuses[file_path] = True
+        tracker.complete()
+    return statuses
+
+
+def _get_key(parameter_file_path: str) -> str:
+    return os.path.splitext(os.path.basename(parameter_file_path))[0]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("result_folder", help="set the result folder to resume")
+    parser.add_argument("param_file_paths", nargs="+", help="set parameters file paths")
+    return parser.parse_args()
+
+
+def main(args):
+    statuses = run_batch(
+        parameter_file_paths=args.param_file_paths,
+        result_folder=args.result_folder,
+        on_progress=lambda progress: print(progress.format()),
+    )
+    skipped_count = len([status for status in statuses.values() if not status])
+    print(f"calculated {len(statuses) - skipped_count} files, skipped {skipped_count}")
+
+
+class BatchError(Exception):
+    pass
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
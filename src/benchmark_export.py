@@ -0,0 +1,97 @@
+"""計算結果の保存（CSV, Excelファイル）のベンチマーク
+
+サンプルのパラメーターファイルから物件数・シミュレーション期間を増やしたパラメーターファイルを作成して計算し,
+Executor.save_resultsのCSVとExcelファイルの保存時間（中央値）とピークメモリ（tracemalloc）を比較する.
+
+    python benchmark_export.py --buildings 1000 --years 50 --repeat 3
+"""
+
+from executor import Executor
+import argparse
+import openpyxl
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+SAMPLE_PARAMETER_FILE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "parameters_sample.xlsx",
+)
+
+
+def make_portfolio_parameters(building_count: int, years: int, file_path: str) -> None:
+    """サンプルの物件を繰り返して物件数を, 最終年の値を繰り返してシミュレーション期間を増やしたパラメーターファイルを作成する"""
+    # 数式の計算結果を値として読み込む
+    workbook = openpyxl.load_workbook(SAMPLE_PARAMETER_FILE_PATH, data_only=True)
+
+    worksheet = workbook["building_information"]
+    rows = [[cell.value for cell in row] for row in worksheet.iter_rows()]
+    sample_count = len([value for value in rows[0][1:] if value is not None])
+    worksheet.delete_cols(2, worksheet.max_column)
+    for i in range(building_count):
+        for row_index, row in enumerate(rows, start=1):
+            value = f"物件{i:04d}" if row_index == 1 else row[1 + i % sample_count]
+            worksheet.cell(row=row_index, column=2 + i, value=value)
+
+    for sheet_name in ["income_simulation", "rent_decrease_rate"]:
+        worksheet = workbook[sheet_name]
+        last_row = [cell.value for cell in worksheet[worksheet.max_row]]
+        start_year = worksheet.cell(row=2, column=1).value
+        for year in range(int(last_row[0]) + 1, int(start_year) + years):
+            worksheet.append([year, *last_row[1:]])
+    for row in workbook["other_parameters"].iter_rows():
+        if row[0].value == "シミュレーション期間":
+            row[1].value = years
+    workbook.save(file_path)
+
+
+def measure(save, repeat: int) -> tuple:
+    """保存時間の中央値（秒）とピークメモリ（MB）を返す"""
+    elapsed_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        save()
+        elapsed_times.append(time.perf_counter() - start)
+
+    # tracemallocは処理を遅くするため, 時間とは別に計測する
+    tracemalloc.start()
+    save()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(elapsed_times), peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--buildings", type=int, default=1000)
+    parser.add_argument("--years", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        parameter_file_path = os.path.join(tmp_dir, "portfolio.xlsx")
+        make_portfolio_parameters(
+            building_count=args.buildings,
+            years=args.years,
+            file_path=parameter_file_path,
+        )
+        executor = Executor(
+            parameter_file_path=parameter_file_path,
+            result_folder=os.path.join(tmp_dir, "result"),
+        )
+        dfs = executor.execute()
+        row_count = sum(len(df) for df in dfs.values())
+        print(f"{args.buildings} buildings x {args.years} years: {row_count} rows")
+
+        for file_format in ["csv", "xlsx"]:
+            elapsed_time, peak = measure(
+                lambda: executor.save_results(dfs=dfs, file_format=file_format),
+                repeat=args.repeat,
+            )
+            print(f"{file_format}: {elapsed_time:.3f}s, peak memory {peak:.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""確率シミュレーションのパスの並列計算のベンチマーク
+
+物件数・シミュレーション期間を増やしたパラメーターで, 直列の計算, タスクごとにシミュレーターを送り計算結果を
+pickleで受け取るワーカープール（単純な並列化）, 共有メモリのワーカープール（SharedMemoryPathRunner）の
+計算時間をワーカー数ごとに表示し, 計算結果が直列の計算と一致することを確認する.
+
+    python benchmark_parallel_paths.py --buildings 30 --years 35 --paths 50000 --workers 1 2 4
+"""
+
+from benchmark_export import make_portfolio_parameters
+from parallel_paths import DEFAULT_CHUNK_SIZE, SharedMemoryPathRunner
+from params import ParametersReader
+from vacancy import StochasticCashFlowSimulator, VacancyModel
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import multiprocessing
+import numpy as np
+import os
+import tempfile
+import time
+
+
+def simulate_chunk(simulator: StochasticCashFlowSimulator, start: int, count: int):
+    return simulator.simulate(path_count=count, path_offset=start).datas
+
+
+def simulate_naive(
+    executor: ProcessPoolExecutor,
+    simulator: StochasticCashFlowSimulator,
+    path_count: int,
+) -> dict:
+    futures = [
+        executor.submit(
+            simulate_chunk,
+            simulator,
+            start,
+            min(DEFAULT_CHUNK_SIZE, path_count - start),
+        )
+        for start in range(0, path_count, DEFAULT_CHUNK_SIZE)
+    ]
+    chunks = [future.result() for future in futures]
+    return {
+        column: np.concatenate([chunk[column] for chunk in chunks])
+        for column in chunks[0]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--buildings", type=int, default=30)
+    parser.add_argument("--years", type=int, default=35)
+    parser.add_argument("--paths", type=int, default=50000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, "portfolio.xlsx")
+        make_portfolio_parameters(
+            building_count=args.buildings, years=args.years, file_path=file_path
+        )
+        parameters = ParametersReader(params_file_path=file_path).read_params()
+    simulator = StochasticCashFlowSimulator(
+        parameters=parameters,
+        model=VacancyModel.from_parameters(parameters=parameters, rent_reset_std=0.05),
+    )
+
+    start = time.perf_counter()
+    expected = simulator.simulate(path_count=args.paths).datas
+    print(f"{args.buildings} buildings x {args.years} years, {args.paths} paths")
+    print(f"serial {time.perf_counter() - start:.2f}s")
+
+    for max_workers in args.workers:
+        # ワーカーの起動は含めず, 2回目の計算時間を計測する
+        with ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            simulate_naive(
+                executor=executor,
+                simulator=simulator,
+                path_count=DEFAULT_CHUNK_SIZE * max_workers,
+            )
+            start = time.perf_counter()
+            naive_datas = simulate_naive(
+                executor=executor, simulator=simulator, path_count=args.paths
+            )
+            naive_time = time.perf_counter() - start
+
+        with SharedMemoryPathRunner(
+            simulator=simulator, max_workers=max_workers
+        ) as runner:
+            runner.simulate(path_count=DEFAULT_CHUNK_SIZE * max_workers)
+            start = time.perf_counter()
+            shared_datas = runner.simulate(path_count=args.paths).datas
+            shared_time = time.perf_counter() - start
+
+        identical = all(
+            np.array_equal(expected[column], naive_datas[column])
+            and np.array_equal(expected[column], shared_datas[column])
+            for column in expected
+        )
+        print(
+            f"{max_workers} workers: naive {naive_time:.2f}s, "
+            f"shared memory {shared_time:.2f}s, identical {identical}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""パラメーターファイルの形式（Excel, JSON, YAML, NPZ）ごとの読み込み時間のベンチマーク
+
+物件数・シミュレーション期間を増やしたExcelファイルを作成して各形式に変換し,
+ParametersReader（pandas）とread_array_parameters（--lean）の読み込み時間（中央値）を比較する.
+
+    python benchmark_parameters.py --buildings 1000 --years 50 --repeat 3
+"""
+
+from array_pipeline import read_array_parameters
+from benchmark_export import make_portfolio_parameters
+from parameter_formats import read_sheet_rows, write_sheet_rows
+from params import ParametersReader
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+FILE_EXTENSIONS = [".xlsx", ".json", ".yaml", ".npz"]
+
+
+def measure(read, repeat: int) -> float:
+    """読み込み時間の中央値（秒）を返す"""
+    elapsed_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        read()
+        elapsed_times.append(time.perf_counter() - start)
+    return statistics.median(elapsed_times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--buildings", type=int, default=1000)
+    parser.add_argument("--years", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_paths = {
+            extension: os.path.join(tmp_dir, f"portfolio{extension}")
+            for extension in FILE_EXTENSIONS
+        }
+        make_portfolio_parameters(
+            building_count=args.buildings,
+            years=args.years,
+            file_path=file_paths[".xlsx"],
+        )
+        sheets = read_sheet_rows(file_paths[".xlsx"])
+        for extension in FILE_EXTENSIONS[1:]:
+            write_sheet_rows(sheets=sheets, file_path=file_paths[extension])
+
+        print(f"{args.buildings} buildings x {args.years} years")
+        for extension, file_path in file_paths.items():
+            pandas_time = measure(
+                lambda: ParametersReader(params_file_path=file_path).read_params(),
+                repeat=args.repeat,
+            )
+            lean_time = measure(
+                lambda: read_array_parameters(params_file_path=file_path),
+                repeat=args.repeat,
+            )
+            print(
+                f"{extension}: pandas {pandas_time:.3f}s, lean {lean_time:.3f}s, "
+                f"{os.path.getsize(file_path) / 1024:.0f}KB"
+            )
+
+
+if __name__ == "__main__":
+    main()
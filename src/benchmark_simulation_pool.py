@@ -0,0 +1,80 @@
+"""ダッシュボードの同時利用を想定したワーカープールのベンチマーク
+
+セッションごとのスレッドからサンプルのパラメーターファイルのシミュレーションを同時に投入し,
+完了までの時間（中央値, 95パーセンタイル）, スループット, 受け付けなかったジョブ数を表示する.
+
+    python benchmark_simulation_pool.py --sessions 24 --workers 4
+"""
+
+from benchmark_export import SAMPLE_PARAMETER_FILE_PATH
+from simulation_pool import DONE, SimulationPool, SimulationPoolBusyError
+import argparse
+import numpy as np
+import os
+import threading
+import time
+
+
+def run_session(
+    pool: SimulationPool,
+    session_id: str,
+    parameter_bytes: bytes,
+    latencies: list,
+    rejected: list,
+) -> None:
+    start = time.perf_counter()
+    try:
+        job = pool.submit(
+            session_id=session_id,
+            parameter_bytes=parameter_bytes,
+            file_name=os.path.basename(SAMPLE_PARAMETER_FILE_PATH),
+        )
+    except SimulationPoolBusyError:
+        rejected.append(session_id)
+        return
+    while pool.get_status(job_id=job.job_id).state != DONE:
+        time.sleep(0.1)
+    pool.pop_result(job_id=job.job_id)
+    latencies.append(time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=24)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-pending", type=int, default=64)
+    args = parser.parse_args()
+
+    with open(SAMPLE_PARAMETER_FILE_PATH, "rb") as f:
+        parameter_bytes = f.read()
+    pool = SimulationPool(max_workers=args.workers, max_pending=args.max_pending)
+
+    # ワーカーの起動時間を含めないよう, 1度実行してから計測する
+    latencies, rejected = [], []
+    run_session(pool, "warmup", parameter_bytes, latencies, rejected)
+
+    latencies, rejected = [], []
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(
+            target=run_session,
+            args=(pool, f"session{i}", parameter_bytes, latencies, rejected),
+        )
+        for i in range(args.sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed_time = time.perf_counter() - start
+    pool.shutdown()
+
+    print(f"{args.sessions} sessions, {pool.max_workers} workers")
+    print(
+        f"latency p50 {np.median(latencies):.2f}s, p95 {np.percentile(latencies, 95):.2f}s, "
+        f"throughput {len(latencies) / elapsed_time:.2f} jobs/s, rejected {len(rejected)}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""ステージの計算結果のキャッシュを利用したスイープのベンチマーク
+
+物件数・シミュレーション期間を増やしたパラメーターで, 給与と1物件の金利の2軸のスイープを
+キャッシュなし（スイープ軸に依存するステージを毎回計算する）とキャッシュありで計算し,
+計算時間とステージごとのヒット率を表示する.
+
+    python benchmark_stage_cache.py --buildings 100 --years 35 --salaries 10 --rates 10
+"""
+
+from benchmark_export import make_portfolio_parameters
+from executor import execute_stages, get_dependent_stage_names
+from params import ParametersReader
+from sweep import ScenarioRunner, ScenarioSpace, SweepAxis
+import argparse
+import numpy as np
+import os
+import tempfile
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--buildings", type=int, default=100)
+    parser.add_argument("--years", type=int, default=35)
+    parser.add_argument("--salaries", type=int, default=10)
+    parser.add_argument("--rates", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, "portfolio.xlsx")
+        make_portfolio_parameters(
+            building_count=args.buildings, years=args.years, file_path=file_path
+        )
+        parameters = ParametersReader(params_file_path=file_path).read_params()
+    space = ScenarioSpace(
+        axes=[
+            SweepAxis(
+                item="給与（万円）",
+                values=np.linspace(400, 1200, args.salaries).round().tolist(),
+            ),
+            SweepAxis(
+                item="金利（%）",
+                values=np.linspace(0.5, 3.0, args.rates).round(3).tolist(),
+                building_name=parameters.get_building_names()[0],
+            ),
+        ]
+    )
+
+    start = time.perf_counter()
+    base_dfs = execute_stages(parameters=parameters)
+    stage_names = get_dependent_stage_names(
+        space.get_changed_items(parameters=parameters)
+    )
+    for index in range(len(space)):
+        execute_stages(
+            parameters=space.apply(parameters=parameters, index=index),
+            dfs=base_dfs,
+            stage_names=stage_names,
+        )
+    uncached_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    runner = ScenarioRunner(parameters=parameters, space=space)
+    for index in range(len(space)):
+        runner.run_scenario(index=index)
+    cached_time = time.perf_counter() - start
+
+    print(f"{args.buildings} buildings x {args.years} years, {len(space)} scenarios")
+    print(f"without cache {uncached_time:.2f}s, with cache {cached_time:.2f}s")
+    print(runner.cache.format_stats())
+
+
+if __name__ == "__main__":
+    main()
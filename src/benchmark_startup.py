@@ -0,0 +1,72 @@
+"""CLIの起動時間のベンチマーク
+
+`python main.py --help`と, サンプルのパラメーターファイルでの1回の計算（--lean及び通常の計算）の
+実行時間（インタープリターの起動を含む）を計測し, 中央値が予算を超えた場合は終了コード1で終了する.
+
+    python benchmark_startup.py --repeat 5
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+MAIN_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+SAMPLE_PARAMETER_FILE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "parameters_sample.xlsx",
+)
+
+# 計測対象（名前, main.pyの引数, 予算（秒））. 予算がNoneの場合は比較用に計測のみ行う
+BENCHMARKS = [
+    ("help", ["--help"], 0.15),
+    ("lean run", [SAMPLE_PARAMETER_FILE_PATH, "--lean"], 0.6),
+    ("pandas run", [SAMPLE_PARAMETER_FILE_PATH], None),
+]
+
+
+def measure(arguments: list, repeat: int) -> float:
+    """main.pyを別プロセスで実行し, 実行時間の中央値（秒）を返す"""
+    elapsed_times = []
+    for _ in range(repeat):
+        # 計算結果の出力先（main.pyと同じフォルダのsimulation_result）を汚さないように, 一時フォルダにコピーして実行する
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for file_name in os.listdir(os.path.dirname(MAIN_FILE_PATH)):
+                if file_name.endswith(".py"):
+                    shutil.copy(
+                        os.path.join(os.path.dirname(MAIN_FILE_PATH), file_name),
+                        tmp_dir,
+                    )
+            start = time.perf_counter()
+            subprocess.run(
+                [sys.executable, os.path.join(tmp_dir, "main.py"), *arguments],
+                check=True,
+                stdout=subprocess.DEVNULL,
+            )
+            elapsed_times.append(time.perf_counter() - start)
+    return statistics.median(elapsed_times)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5, help="set the number of runs")
+    args = parser.parse_args()
+
+    is_over_budget = False
+    for name, arguments, budget in BENCHMARKS:
+        elapsed_time = measure(arguments=arguments, repeat=args.repeat)
+        if budget is None:
+            print(f"{name}: {elapsed_time:.3f}s")
+            continue
+        status = "OK" if elapsed_time <= budget else "OVER BUDGET"
+        print(f"{name}: {elapsed_time:.3f}s (budget {budget:.3f}s) {status}")
+        is_over_budget = is_over_budget or elapsed_time > budget
+    return 1 if is_over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""物件ごとの税額への影響の計算のベンチマーク
+
+物件数を増やしたパラメーターで, 物件を1つずつ除いたパラメーターで全ステージを計算する方法（物件数回の計算）と,
+real_estate_tax_attribution_dataのステージ（税額の計算を1度にまとめて行う）の計算時間を比較し, 結果が一致することを確認する.
+
+    python benchmark_tax_attribution.py --buildings 30 --years 35
+"""
+
+from benchmark_export import make_portfolio_parameters
+from executor import execute_stages, get_stage
+from params import ParametersReader
+import argparse
+import numpy as np
+import os
+import tempfile
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--buildings", type=int, default=30)
+    parser.add_argument("--years", type=int, default=35)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, "portfolio.xlsx")
+        make_portfolio_parameters(
+            building_count=args.buildings, years=args.years, file_path=file_path
+        )
+        parameters = ParametersReader(params_file_path=file_path).read_params()
+    dfs = execute_stages(parameters=parameters)
+    building_names = parameters.get_building_names()
+    taxes = dfs["tax_data_with_real_estate_cash"]["税額"].to_numpy()
+
+    # 物件を1つずつ除いたパラメーターで全ステージを計算する
+    start = time.perf_counter()
+    rerun_effects = []
+    for building_name in building_names:
+        building_dfs = execute_stages(
+            parameters=parameters.select_buildings(
+                [name for name in building_names if name != building_name]
+            )
+        )
+        rerun_effects.append(
+            taxes - building_dfs["tax_data_with_real_estate_cash"]["税額"].to_numpy()
+        )
+    rerun_time = time.perf_counter() - start
+
+    stage = get_stage("real_estate_tax_attribution_data")
+    start = time.perf_counter()
+    df = stage.calculator_class(parameters=parameters).calculate(
+        dfs={name: dfs[name] for name in stage.required_dfs}
+    )
+    stage_time = time.perf_counter() - start
+
+    identical = np.array_equal(
+        np.concatenate(rerun_effects), df["税額への影響"].to_numpy()
+    )
+    print(f"{args.buildings} buildings x {args.years} years")
+    print(
+        f"reruns {rerun_time:.2f}s, batched stage {stage_time:.3f}s, identical {identical}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,29 @@
-import math
-
-from params import Parameters
+from params import Parameters, YEAR_ITEM
+from loan import MonthlyLoanSchedule, calc_monthly_loan_schedule
+from investment_metrics import (
+    calc_investment_metrics,
+    get_initial_investment,
+    get_investment_schedule,
+)
+import numpy as np
 import pandas as pd
 from abc import ABCMeta, abstractmethod
 from util import (
-    convert_positive_number_or_zero,
-    calc_income_deduction,
-    calc_income_tax,
-    calc_resident_tax,
+    calc_cash_flow_array,
+    calc_deprecation_cost_array,
+    calc_real_estate_cash_array,
+    calc_real_estate_price_array,
+    calc_real_estate_sale_array,
+    calc_tax_amount_array,
+    calc_tax_columns_array,
 )
-from typing import Dict
+from typing import Dict, Tuple
 
 
 class AbstractCalculator(metaclass=ABCMeta):
+    # 計算で参照するパラメーターの項目（シート名, 項目名）
+    parameter_items = ()
+
     def __init__(self, parameters: Parameters, other_params: dict = None) -> None:
         self._parameters = parameters
         self._other_params = other_params
@@ -23,186 +34,140 @@ class AbstractCalculator(metaclass=ABCMeta):
 
 
 class BuildingDeprecationCalculator(AbstractCalculator):
+    parameter_items = (
+        YEAR_ITEM,
+        ("building_information", "減価償却期間（躯体部分）"),
+        ("building_information", "減価償却期間（設備部分）"),
+        ("building_information", "減価償却費用（躯体）（円/年）"),
+        ("building_information", "減価償却費用（設備）（円/年）"),
+    )
+
     def calculate(self, dfs: Dict[str, pd.DataFrame] = {}) -> pd.DataFrame:
         # パラメーターの取得
         simulation_interval = self._parameters.get_simulation_interval()
         building_names = self._parameters.get_building_names()
 
-        # DataFrameの列を設定
-        columns = ["年", "物件名", "減価償却費用"]
-
         # 物件ごとに減価償却費用を算出
-        datas = []
-        for building_name in building_names:
-            for year in range(1, 1 + simulation_interval):
-                data = []
-                # パラメーターの取得
-                (
-                    frame_interval,
-                    equip_interval,
-                ) = self._parameters.get_deprecation_interval(
-                    building_name=building_name
-                )
-                frame_cost, equip_cost = self._parameters.get_deprecation_costs(
-                    building_name=building_name
-                )
-
-                # 躯体の減価償却費用を設定
-                deprecation_frame_cost = frame_cost if year <= frame_interval else 0
-
-                # 設備の減価償却費用を設定
-                deprecation_equip_cost = equip_cost if year <= equip_interval else 0
+        intervals = [
+            self._parameters.get_deprecation_interval(building_name=building_name)
+            for building_name in building_names
+        ]
+        costs = [
+            self._parameters.get_deprecation_costs(building_name=building_name)
+            for building_name in building_names
+        ]
+        deprecation_costs = calc_deprecation_cost_array(
+            frame_intervals=np.array([frame for frame, _ in intervals], dtype=float),
+            equip_intervals=np.array([equip for _, equip in intervals], dtype=float),
+            frame_costs=np.array([frame for frame, _ in costs], dtype=np.int64),
+            equip_costs=np.array([equip for _, equip in costs], dtype=np.int64),
+            simulation_interval=simulation_interval,
+        )
+        return pd.DataFrame(
+            {
+                "年": np.tile(
+                    np.arange(1, simulation_interval + 1), len(building_names)
+                ),
+                "物件名": np.repeat(building_names, simulation_interval),
+                "減価償却費用": deprecation_costs.ravel(),
+            }
+        )
 
-                # 減価償却費用の合計を設定
-                data.extend(
-                    [
-                        year,
-                        building_name,
-                        deprecation_frame_cost + deprecation_equip_cost,
-                    ]
-                )
 
-                datas.append(data)
+class LoanCalculator(AbstractCalculator):
+    parameter_items = (
+        YEAR_ITEM,
+        ("building_information", "建物割合（%）"),
+        ("building_information", "ローン期間（年）"),
+        ("building_information", "月利（%）"),
+        ("building_information", "借入金額"),
+    )
 
-        return pd.DataFrame(data=datas, columns=columns)
+    def calculate(self, dfs: Dict[str, pd.DataFrame] = {}) -> pd.DataFrame:
+        # 月ごとのローン返済スケジュールを取得し、年単位で集計する
+        schedule = self.calc_monthly_schedule()
+        return pd.DataFrame(schedule.aggregate_per_year())
 
+    def calc_monthly_schedule(self) -> MonthlyLoanSchedule:
+        """全物件（物件名の順）の月単位のローン返済スケジュールを計算する
 
-class LoanCalculator(AbstractCalculator):
-    def calculate(self, dfs: Dict[str, pd.DataFrame] = {}) -> pd.DataFrame:
-        # パラメーターの取得
+        Returns:
+            MonthlyLoanSchedule: 物件・返済回数ごとの行はget_rowsで必要な物件・月のみ展開する
+        """
         simulation_interval = self._parameters.get_simulation_interval()
-        building_names = self._parameters.get_building_names()
-
-        # 物件ごとに月ごとのローン利息を計算し、DataFrameを構築する
-        columns_per_month = [
-            "回数",
-            "物件名",
-            "毎月返済額",
-            "利息返済額",
-            "元金返済額",
-            "ローン残高",
-            "利息(建物分のみ)",
-        ]
-        datas = []
+        building_names = sorted(self._parameters.get_building_names())
+        loan_conditions = []
         for building_name in building_names:
-            datas_per_building = []
-            building_ratio = self._parameters.get_building_ratio(
-                building_name=building_name
-            )
             (
                 payment_count,
                 monthly_interest,
                 total_loan_amount,
             ) = self._parameters.get_loan_info(building_name=building_name)
-            monthly_interest = monthly_interest / 100
-            monthly_payment_amount = int(
-                (
-                    total_loan_amount
-                    * monthly_interest
-                    * math.pow(1 + monthly_interest, payment_count)
-                )
-                / (math.pow(1 + monthly_interest, payment_count) - 1)
-            )
-
-            for index in range(1, simulation_interval * 12 + 1):
-                # 利息返済額の計算
-                if index == 1:
-                    interest_payment_amount = int(total_loan_amount * monthly_interest)
-                elif index > payment_count:
-                    # ローン返済期間を超えたら、利息返済額を0に設定する
-                    interest_payment_amount = 0
-                else:
-                    latest_data = datas_per_building[index - 2]
-                    latest_loan_credit = latest_data[columns_per_month.index("ローン残高")]
-                    interest_payment_amount = int(latest_loan_credit * monthly_interest)
-
-                # 元金返済額の計算
-                principal_payment_amount = convert_positive_number_or_zero(
-                    monthly_payment_amount - interest_payment_amount
-                )
-
-                # ローン残高の計算
-                if index == 1:
-                    total_loan_amount = self._parameters.get_loan_info(
-                        building_name=building_name
-                    )[2]
-                    loan_credit = convert_positive_number_or_zero(
-                        total_loan_amount - principal_payment_amount
-                    )
-                elif index > payment_count:
-                    # ローン返済期間を超えたら、ローン残高を0に設定する
-                    loan_credit = 0
-                else:
-                    loan_credit = convert_positive_number_or_zero(
-                        latest_data[5] - principal_payment_amount
-                    )
-
-                # 利息（建物分のみ）の計算
-                interest_paymant_amount_of_building = int(
-                    interest_payment_amount * building_ratio / 100
-                )
-
-                # データの追加
-                datas_per_building.append(
-                    [
-                        index,
-                        building_name,
-                        monthly_payment_amount if index <= payment_count else 0,
-                        interest_payment_amount,
-                        principal_payment_amount,
-                        loan_credit,
-                        interest_paymant_amount_of_building,
-                    ]
-                )
-            datas.extend(datas_per_building)
-        df_per_month = pd.DataFrame(data=datas, columns=columns_per_month)
-
-        # ローン利息や残高を年単位で計算しなおす
-        columns_per_year = ["年", "毎年返済額", "利息返済額", "元金返済額", "ローン残高", "利息(建物分のみ)"]
-
-        def calc_data_per_year(df: pd.DataFrame):
-            datas = []
-            for index in range(simulation_interval):
-                year = index + 1
-                target_df = df[
-                    ((1 + 12 * index) <= df["回数"]) & (df["回数"] <= 12 * (index + 1))
-                ]
-
-                # 毎年返済額を算出
-                yearly_paymant_amount = target_df["毎月返済額"].sum()
+            loan_conditions.append((total_loan_amount, monthly_interest, payment_count))
+        return calc_monthly_loan_schedule(
+            building_names=building_names,
+            loan_conditions=loan_conditions,
+            building_ratios=[
+                self._parameters.get_building_ratio(building_name=building_name)
+                for building_name in building_names
+            ],
+            month_count=simulation_interval * 12,
+        )
 
-                # 利息返済額を算出
-                interest_payment_amount = target_df["利息返済額"].sum()
 
-                # 元金返済額を算出
-                principal_payment_amount = target_df["元金返済額"].sum()
-
-                # ローン残高を算出
-                loan_credit = target_df["ローン残高"].min()
-
-                # 利息返済額（建物分のみ）を算出
-                interest_paymant_amount_of_building = target_df["利息(建物分のみ)"].sum()
+# TODO : 家賃を年単位なりで減少させる対応を検討する（パラメーターで設定変更とする）
+class RealEstateCashPerBuildingCalculator(AbstractCalculator):
+    parameter_items = (
+        YEAR_ITEM,
+        ("building_information", "契約日"),
+        ("building_information", "売却予定日"),
+        ("building_information", "家賃収入（円/月）"),
+        ("building_information", "管理費（円/月）"),
+        ("building_information", "修繕積立金（円/月）"),
+        ("building_information", "その他経費（固定資産税）（円/年）"),
+        (
+            "building_information",
+            "初期費用（不動産取得税、事務手数料、登記費用、印紙代、火災保険料、金融機関手数料、など）",
+        ),
+        ("building_information", "不動産取得税"),
+        ("building_information", "雑費割合（%）"),
+        ("building_information", "雑費上限"),
+        ("building_information", "雑費下限"),
+        ("rent_decrease_rate", "家賃割合(%)"),
+        ("other_parameters", "家賃減少"),
+        ("other_parameters", "初期費用カット"),
+    )
 
-                datas.append(
-                    [
-                        year,
-                        yearly_paymant_amount,
-                        interest_payment_amount,
-                        principal_payment_amount,
-                        loan_credit,
-                        interest_paymant_amount_of_building,
-                    ]
-                )
-            return pd.DataFrame(data=datas, columns=columns_per_year)
+    def calculate(self, dfs: Dict[str, pd.DataFrame] = {}) -> pd.DataFrame:
+        # 必要なDataFrameがパラメーターに設定されているかを確認
+        if "loan_data" not in dfs:
+            raise CalculatorError(
+                "please set the loan dataframe to calculate the real estate cache data!"
+            )
+        if "building_deprecation_data" not in dfs:
+            raise CalculatorError(
+                "please set the building deprecation dataframe to calculate the real estate cache data!"
+            )
 
-        df_per_year = df_per_month.groupby(["物件名"]).apply(calc_data_per_year)
-        columns_per_year.insert(1, "物件名")
-        df_per_year = df_per_year.reset_index().reindex(columns=columns_per_year)
-        return df_per_year
+        # 物件ごとの不動産収支を計算し、他の物件ごとのデータと同じく物件名, 年の順に並べる
+        df = calc_real_estate_cash_per_building(
+            parameters=self._parameters,
+            loan_df=dfs["loan_data"],
+            building_deprecation_df=dfs["building_deprecation_data"],
+        )
+        building_orders = {
+            building_name: i
+            for i, building_name in enumerate(self._parameters.get_building_names())
+        }
+        df = df.sort_values(
+            by="物件名", key=lambda s: s.map(building_orders), kind="stable"
+        )
+        return df.reset_index(drop=True)
 
 
-# TODO : 家賃を年単位なりで減少させる対応を検討する（パラメーターで設定変更とする）
 class RealEstateCashCalculator(AbstractCalculator):
+    parameter_items = (YEAR_ITEM,)
+
     def calculate(self, dfs: Dict[str, pd.DataFrame] = {}) -> pd.DataFrame:
         # パラメーターの設定
         columns = [
@@ -219,141 +184,173 @@ class RealEstateCashCalculator(AbstractCalculator):
         ]
         simulation_interval = self._parameters.get_simulation_interval()
         simulation_start_year = self._parameters.get_simulation_start_year()
-        building_names = self._parameters.get_building_names()
-
-        # 必要なDataFrameがパラメーターに設定されているかを確認
-        if "loan_data" not in dfs:
-            raise CalculatorError(
-                "please set the loan dataframe to calculate the real estate cache data!"
-            )
-        loan_df = dfs["loan_data"]
-        if "building_deprecation_data" not in dfs:
-            raise CalculatorError(
-                "please set the building deprecation dataframe to calculate the real estate cache data!"
-            )
-        building_deprecation_df = dfs["building_deprecation_data"]
 
-        # 年ごとの不動産収支を計算する
-        datas = []
-        for year in range(
+        # 物件ごとの不動産収支（計算されていない場合は計算する）を、年ごとに合算する
+        if "real_estate_cash_per_building_data" in dfs:
+            df = dfs["real_estate_cash_per_building_data"]
+        else:
+            df = RealEstateCashPerBuildingCalculator(
+                parameters=self._parameters
+            ).calculate(dfs=dfs)
+        years = range(
             simulation_start_year, simulation_start_year + simulation_interval
-        ):
-            data = [year, 0, 0, 0, 0, 0, 0, 0, 0, 0]
-            for building_name in building_names:
-                # 物件の保有期間でない場合は処理をスキップする
-                if not self._parameters.is_ownership_period(
-                    building_name=building_name, year=year
-                ):
-                    continue
-
-                # 総収入の追加
-                data_per_building = [year, 0, 0, 0, 0, 0, 0, 0, 0, 0]
-                data_per_building[1] = (
-                    self._parameters.get_building_rent_income_per_month(
-                        building_name=building_name,
-                        rent_year=(year - simulation_start_year + 1),
+        )
+        df = (
+            df.drop(columns="物件名")
+            .groupby("年")
+            .sum()
+            .reindex(years, fill_value=0)
+            .rename_axis("年")
+            .reset_index()
+        )
+        return df[columns]
+
+
+def get_real_estate_cash_components(
+    parameters: Parameters,
+    loan_df: pd.DataFrame,
+    building_deprecation_df: pd.DataFrame,
+) -> Dict[str, np.ndarray]:
+    """不動産収支の計算に利用する値を、物件ごと・年ごとの配列（物件数 x 年数）で返す
+
+    保有期間でない年の値は0とする. 雑費割合, 雑費上限, 雑費下限は物件ごとの配列（物件数）とする.
+
+    Args:
+        parameters (Parameters): パラメーター
+        loan_df (pd.DataFrame): ローン利息のデータ
+        building_deprecation_df (pd.DataFrame): 減価償却のデータ
+
+    Returns:
+        Dict[str, np.ndarray]: 項目名 -> 配列
+    """
+    simulation_interval = parameters.get_simulation_interval()
+    simulation_start_year = parameters.get_simulation_start_year()
+    building_names = parameters.get_building_names()
+    shape = (len(building_names), simulation_interval)
+    components = {
+        "保有期間": np.zeros(shape, dtype=bool),
+        "家賃収入（円/月）": np.zeros(shape, dtype=np.int64),
+        "物件経費": np.zeros(shape, dtype=np.int64),
+        "減価償却費": np.zeros(shape, dtype=np.int64),
+        "ローン利息（建物分）": np.zeros(shape, dtype=np.int64),
+        "ローン支払い": np.zeros(shape, dtype=np.int64),
+        "初期費用カット": np.zeros(shape, dtype=np.int64),
+        "雑費割合": np.zeros(len(building_names)),
+        "雑費上限": np.zeros(len(building_names), dtype=np.int64),
+        "雑費下限": np.zeros(len(building_names), dtype=np.int64),
+    }
+
+    # (物件名, 年数)から減価償却費, ローンの値を引けるようにする
+    deprecation_costs = dict(
+        zip(
+            zip(building_deprecation_df["物件名"], building_deprecation_df["年"]),
+            building_deprecation_df["減価償却費用"],
+        )
+    )
+    loan_values = dict(
+        zip(
+            zip(loan_df["物件名"], loan_df["年"]),
+            zip(loan_df["利息(建物分のみ)"], loan_df["毎年返済額"]),
+        )
+    )
+
+    is_cut_initial_cost = parameters.is_cut_initial_cost()
+    for i, building_name in enumerate(building_names):
+        components["雑費割合"][i] = parameters.get_petty_expenses_ratio(
+            building_name=building_name
+        )
+        components["雑費上限"][i] = parameters.get_petty_expenses_upper(
+            building_name=building_name
+        )
+        components["雑費下限"][i] = parameters.get_petty_expenses_lower(
+            building_name=building_name
+        )
+        # 物件ごとの値は1度だけ取得する（物件経費は購入年とそれ以外の年の2通り）
+        purchase_year = parameters.get_purchase_date(building_name=building_name).year
+        sale_year = parameters.get_expected_sale_date(building_name=building_name).year
+        rent_incomes = parameters.get_building_rent_incomes_per_month(
+            building_name=building_name, rent_years=range(1, simulation_interval + 1)
+        )
+        building_expenses = {}
+        for j in range(simulation_interval):
+            year = simulation_start_year + j
+            if not purchase_year <= year <= sale_year:
+                continue
+            components["保有期間"][i, j] = True
+            components["家賃収入（円/月）"][i, j] = rent_incomes[j]
+            is_purchase_year = year == purchase_year
+            if is_purchase_year not in building_expenses:
+                building_expenses[is_purchase_year] = (
+                    parameters.get_building_expenses(
+                        building_name=building_name, year=year
                     )
-                    * 12
-                )
-
-                # 物件経費の追加
-                data_per_building[2] = self._parameters.get_building_expenses(
-                    building_name=building_name, year=year
                 )
+            components["物件経費"][i, j] = building_expenses[is_purchase_year]
 
-                # 減価償却費の追加
-                year_index = (
-                    year
-                    - self._parameters.get_purchase_date(
-                        building_name=building_name
-                    ).year
-                    + 1
-                )
-                target_df = building_deprecation_df[
-                    (building_deprecation_df["物件名"] == building_name)
-                    & (building_deprecation_df["年"] == year_index)
-                ]
-                if len(target_df) != 1:
-                    raise CalculatorError(
-                        f"target dataframe size of building deprecation data is not one! building_name is {building_name}, year is {year} and year_index is {year_index}. size is {len(target_df)}."
-                    )
-                deprecation_cost = target_df["減価償却費用"].values[0]
-                data_per_building[3] = deprecation_cost
-
-                # ローン利息（建物分）、ローン支払い分の設定
-                target_df = loan_df[
-                    (loan_df["物件名"] == building_name) & (loan_df["年"] == year_index)
-                ]
-                if len(target_df) != 1:
-                    raise CalculatorError(
-                        f"target dataframe size of loan is not one! building_name is {building_name}, year is {year} and year_index is {year_index}. size is {len(target_df)}"
-                    )
-                data_per_building[4] = target_df["利息(建物分のみ)"].values[0]
-                data_per_building[5] = target_df["毎年返済額"].values[0]
-
-                # 雑費の設定
-                building_expenses = self._parameters.get_building_expenses(
-                    building_name=building_name, year=year
-                )
-                petty_expenses_ratio = self._parameters.get_petty_expenses_ratio(
-                    building_name=building_name
+            year_index = year - purchase_year + 1
+            if (building_name, year_index) not in deprecation_costs:
+                raise CalculatorError(
+                    f"building deprecation data is not exist! building_name is {building_name} and year_index is {year_index}."
                 )
-                petty_expenses = int(
-                    (building_expenses + deprecation_cost) * petty_expenses_ratio / 100
+            components["減価償却費"][i, j] = deprecation_costs[
+                (building_name, year_index)
+            ]
+            if (building_name, year_index) not in loan_values:
+                raise CalculatorError(
+                    f"loan data is not exist! building_name is {building_name} and year_index is {year_index}."
                 )
+            (
+                components["ローン利息（建物分）"][i, j],
+                components["ローン支払い"][i, j],
+            ) = loan_values[(building_name, year_index)]
 
-                if petty_expenses > self._parameters.get_petty_expenses_upper(
+            if is_cut_initial_cost and is_purchase_year:
+                components["初期費用カット"][i, j] = parameters.get_initial_expenses(
                     building_name=building_name
-                ):
-                    petty_expenses = self._parameters.get_petty_expenses_upper(
-                        building_name=building_name
-                    )
-                elif petty_expenses < self._parameters.get_petty_expenses_lower(
-                    building_name=building_name
-                ):
-                    petty_expenses = self._parameters.get_petty_expenses_lower(
-                        building_name=building_name
-                    )
-                data_per_building[6] = petty_expenses
-
-                # 帳簿上の支出の設定(物件経費 + 減価償却費 + ローン利息)
-                data_per_building[7] = sum(
-                    [
-                        data_per_building[2],
-                        data_per_building[3],
-                        data_per_building[4],
-                        data_per_building[6],
-                    ]
                 )
-
-                # 帳簿上の収支の設定（総収入 - 帳簿上の支出）
-                data_per_building[8] = data_per_building[1] - data_per_building[7]
-
-                # リアル収支の設定（総収入 - (物件経費 + ローン支払い)）
-                # ただし、初期物件コストの一部が自己負担ではない場合は、負担でないコストを間引く
-                data_per_building[9] = data_per_building[1] - sum(
-                    [data_per_building[2], data_per_building[5]]
-                )
-                if self._parameters.is_cut_initial_cost() and self._parameters.is_purchase_year(
-                    building_name=building_name, year=year
-                ):
-                    initial_expenses = self._parameters.get_initial_expenses(
-                        building_name=building_name
-                    )
-                    data_per_building[9] += initial_expenses
-
-                # 加算する
-                for i in range(len(data_per_building)):
-                    if i == 0:
-                        continue
-                    data[i] += data_per_building[i]
-
-            datas.append(data)
-
-        return pd.DataFrame(datas, columns=columns)
+    return components
+
+
+def calc_real_estate_cash_per_building(
+    parameters: Parameters,
+    loan_df: pd.DataFrame,
+    building_deprecation_df: pd.DataFrame,
+) -> pd.DataFrame:
+    """RealEstateCashCalculatorの不動産収支を、合算する前の物件ごとの値で返す
+
+    Args:
+        parameters (Parameters): パラメーター
+        loan_df (pd.DataFrame): ローン利息のデータ
+        building_deprecation_df (pd.DataFrame): 減価償却のデータ
+
+    Returns:
+        pd.DataFrame: 年, 物件名ごとの不動産収支（保有期間でない年は0とする）
+    """
+    c = get_real_estate_cash_components(
+        parameters=parameters,
+        loan_df=loan_df,
+        building_deprecation_df=building_deprecation_df,
+    )
+    values = calc_real_estate_cash_array(components=c)
+    building_names = parameters.get_building_names()
+    simulation_start_year = parameters.get_simulation_start_year()
+    years = np.arange(
+        simulation_start_year,
+        simulation_start_year + parameters.get_simulation_interval(),
+    )
+    df = pd.DataFrame({name: array.T.ravel() for name, array in values.items()})
+    df.insert(0, "物件名", np.tile(building_names, len(years)))
+    df.insert(0, "年", np.repeat(years, len(building_names)))
+    return df
 
 
 class TaxCalculator(AbstractCalculator):
+    parameter_items = (
+        YEAR_ITEM,
+        ("income_simulation", "給与（万円）"),
+        ("income_simulation", "経費（万円）"),
+    )
+
     def calculate(self, dfs: Dict[str, pd.DataFrame] = {}) -> pd.DataFrame:
         if "real_estate_cash_data" in dfs:
             real_estate_cach_df = dfs["real_estate_cash_data"]
@@ -361,89 +358,167 @@ class TaxCalculator(AbstractCalculator):
             real_estate_cach_df = None
 
         # パラメーターの取得
-        income_df = self._parameters.get_income_df()
-
-        # 課税所得, 税金の計算を実施
-        def calc_tax(s: pd.Series) -> pd.Series:
-            out_s = s.copy(deep=True)
-            income = s["給与（万円）"] * 10000
-            expenses = s["経費（万円）"] * 10000
-
-            # 所得金額の計算
-            out_s["給与所得控除"] = calc_income_deduction(income=income)
-            if real_estate_cach_df is not None:
-                # 不動産収支の情報がある場合は、不動産収支を考慮して、所得金額を計算する
-                target_df = real_estate_cach_df[
-                    (real_estate_cach_df["年"] == out_s.name)
-                ]["帳簿上の収支"]
-                if len(target_df) != 1:
-                    raise CalculatorError(
-                        f"target dataframe size of loan is not one! data is {out_s}. size is {len(target_df)}"
-                    )
-                out_s["所得金額"] = income - out_s["給与所得控除"] + int(target_df.values[0])
-            else:
-                out_s["所得金額"] = income - out_s["給与所得控除"]
+        df = self._parameters.get_income_df()
+        book_incomes = None
+        if real_estate_cach_df is not None:
+            # 不動産収支の情報がある場合は、不動産収支を考慮して、所得金額を計算する
+            book_incomes = real_estate_cach_df.set_index("年")["帳簿上の収支"]
+            if not book_incomes.index.is_unique or not df.index.isin(
+                book_incomes.index
+            ).all():
+                raise CalculatorError(
+                    f"real estate cash data is not unique for each year! years are {book_incomes.index.tolist()}"
+                )
+            book_incomes = book_incomes.reindex(df.index).to_numpy()
+
+        # 所得金額, 課税所得, 税金総額（所得税 + 住民税）の計算（年ごとの計算をまとめて行う）
+        columns = calc_tax_columns_array(
+            income=df["給与（万円）"].to_numpy() * 10000,
+            expenses=df["経費（万円）"].to_numpy() * 10000,
+            real_estate_income=book_incomes,
+        )
+        for name, values in columns.items():
+            df[name] = values
+        return df
 
-            # 課税所得の計算
-            out_s["基礎控除"] = 48 * 10000
-            taxable_income = out_s["所得金額"] - (out_s["基礎控除"] + expenses)
-            out_s["課税所得"] = taxable_income if taxable_income > 0 else 0
 
-            # 所得税, 住民税の計算
-            # TODO : 住民税は地域設定をして、計算を行うようにする
-            out_s["所得税"] = calc_income_tax(taxable_income=out_s["課税所得"])
-            out_s["住民税"] = calc_resident_tax(taxable_income=out_s["課税所得"], area=None)
+def calc_tax_array(
+    parameters: Parameters, real_estate_income: np.ndarray = None
+) -> np.ndarray:
+    """TaxCalculatorの税額（所得税 + 住民税）を配列で計算する
 
-            # 税金総額（所得税 + 住民税）の設定
-            out_s["税額"] = out_s["所得税"] + out_s["住民税"]
-            return out_s
+    Args:
+        parameters (Parameters): パラメーター
+        real_estate_income (np.ndarray, optional): 帳簿上の収支（..., 年数）. Defaults to None（不動産所得なし）.
 
-        df = income_df.apply(calc_tax, axis=1)
-        return df
+    Returns:
+        np.ndarray: 年ごとの税額（real_estate_incomeと同じ形状. 指定しない場合は年数）
+    """
+    income, expenses = get_income_arrays(parameters=parameters)
+    return calc_tax_amount_array(
+        income=income, expenses=expenses, real_estate_income=real_estate_income
+    )
+
+
+def get_income_arrays(parameters: Parameters) -> Tuple[np.ndarray, np.ndarray]:
+    """シミュレーション期間の年ごとの給与, 経費（円）を返す"""
+    simulation_start_year = parameters.get_simulation_start_year()
+    years = range(
+        simulation_start_year,
+        simulation_start_year + parameters.get_simulation_interval(),
+    )
+    income_df = parameters.get_income_df().reindex(years)
+    income = income_df["給与（万円）"].to_numpy() * 10000
+    expenses = income_df["経費（万円）"].to_numpy() * 10000
+    return income, expenses
+
+
+class RealEstateTaxAttributionCalculator(AbstractCalculator):
+    """物件ごと・年ごとの税額への影響（限界効果）を計算する
+
+    税額への影響は, 全物件の不動産所得を含めた税額と, その物件のみを除いた税額の差とする.
+    全物件の場合と物件ごとに除いた場合の税額は, 税額の計算を(1 + 物件数) x 年数の配列で1度に行う.
+    累進課税のため, 物件ごとの税額への影響の合計は課税差額と一致しない.
+    """
+
+    parameter_items = (
+        YEAR_ITEM,
+        ("income_simulation", "給与（万円）"),
+        ("income_simulation", "経費（万円）"),
+    )
+
+    def calculate(self, dfs: Dict[str, pd.DataFrame] = {}) -> pd.DataFrame:
+        # 必要なDataFrameがパラメーターに設定されているかを確認
+        if "real_estate_cash_per_building_data" not in dfs:
+            raise CalculatorError(
+                "please set the real estate cash per building dataframe to calculate the tax attribution data!"
+            )
+        per_building_df = dfs["real_estate_cash_per_building_data"].set_index(
+            ["物件名", "年"]
+        )
+        building_names = self._parameters.get_building_names()
+        simulation_start_year = self._parameters.get_simulation_start_year()
+        years = np.arange(
+            simulation_start_year,
+            simulation_start_year + self._parameters.get_simulation_interval(),
+        )
+
+        # 物件ごとの値を(物件数 x 年数)の配列に並べる
+        index = pd.MultiIndex.from_product([building_names, years])
+        book_incomes, real_incomes = [
+            per_building_df[column]
+            .reindex(index, fill_value=0)
+            .to_numpy()
+            .reshape(len(building_names), len(years))
+            for column in ["帳簿上の収支", "リアル収支"]
+        ]
+
+        # 全物件の場合と, 物件ごとにその物件を除いた場合の税額をまとめて計算する
+        total_book_income = book_incomes.sum(axis=0)
+        income, expenses = get_income_arrays(parameters=self._parameters)
+        taxes = calc_tax_amount_array(
+            income=income,
+            expenses=expenses,
+            real_estate_income=np.vstack(
+                [total_book_income, total_book_income - book_incomes]
+            ),
+        )
+        tax_effects = taxes[0] - taxes[1:]
+        return pd.DataFrame(
+            {
+                "年": np.tile(years, len(building_names)),
+                "物件名": np.repeat(building_names, len(years)),
+                "帳簿上の収支": book_incomes.ravel(),
+                "リアル収支": real_incomes.ravel(),
+                "税額への影響": tax_effects.ravel(),
+                "税引後収支": (real_incomes - tax_effects).ravel(),
+            }
+        )
 
 
 class RealEstatePriceSimuationCalculator(AbstractCalculator):
+    parameter_items = (
+        YEAR_ITEM,
+        ("building_information", "物件価格"),
+        ("building_information", "物件価格減少率(%/年)"),
+        ("building_information", "物件価格初年度減少率(%/年)"),
+    )
+
     def calculate(self, dfs: Dict[str, pd.DataFrame] = {}) -> pd.DataFrame:
         # パラメーターの設定
-        columns = ["年", "物件名", "想定評価額"]
         simulation_interval = self._parameters.get_simulation_interval()
         building_names = self._parameters.get_building_names()
 
         # 物件ごとの価格シミュレーションデータを作成
         # 現状は簡易的なシミュレーションとし、物件価格が年単位で（年ごとの価格に対して）1%ずつ減少するものとする
-        datas = []
-        for building_name in building_names:
-            # 物件ごとのパラメーターの取得
-            (
-                building_price,
-                decreace_rate,
-                decreate_rate_in_1st_year,
-            ) = self._parameters.get_real_estate_sale_info(building_name=building_name)
-            datas_per_building = []
-            for index in range(simulation_interval):
-                data = []
-                year = index + 1
-                data.append(year)
-                data.append(building_name)
-
-                # 査定価格の計算
-                if year == 1:
-                    value = building_price * (
-                        1 - float(decreate_rate_in_1st_year) / 100
-                    )
-                else:
-                    value = datas_per_building[index - 1][2] * (
-                        1 - float(decreace_rate) / 100
-                    )
-                data.append(int(value))
-
-                datas_per_building.append(data)
-            datas.extend(datas_per_building)
-
-        return pd.DataFrame(data=datas, columns=columns)
+        sale_infos = [
+            self._parameters.get_real_estate_sale_info(building_name=building_name)
+            for building_name in building_names
+        ]
+        prices = calc_real_estate_price_array(
+            prices=np.array([price for price, _, _ in sale_infos]),
+            decrease_rates=np.array([rate for _, rate, _ in sale_infos]),
+            first_year_decrease_rates=np.array([rate for _, _, rate in sale_infos]),
+            simulation_interval=simulation_interval,
+        )
+        return pd.DataFrame(
+            {
+                "年": np.tile(
+                    np.arange(1, simulation_interval + 1), len(building_names)
+                ),
+                "物件名": np.repeat(building_names, simulation_interval),
+                "想定評価額": prices.ravel(),
+            }
+        )
 
 
 class RealEstateSaleSimulationCalculator(AbstractCalculator):
+    parameter_items = (
+        YEAR_ITEM,
+        ("building_information", "物件価格"),
+        ("building_information", "譲渡費用（円）"),
+    )
+
     def calculate(self, dfs: Dict[str, pd.DataFrame] = {}) -> pd.DataFrame:
         # パラメーターの設定
         columns = ["年", "物件名", "想定評価額", "ローン残額", "累計減価償却費用", "売却経費", "譲渡所得税", "売却差額"]
@@ -467,82 +542,90 @@ class RealEstateSaleSimulationCalculator(AbstractCalculator):
             )
         real_estate_price_df = dfs["real_estate_price_data"]
 
-        # 物件ごとの売却シミュレーションデータを作成
-        datas = []
-        for building_name in building_names:
-            # 物件ごとのパラメーターの取得
-            (
-                building_purchase_price,
-                _,
-                _,
-            ) = self._parameters.get_real_estate_sale_info(building_name=building_name)
-            building_sale_expenses = self._parameters.get_building_sale_expenses(
-                building_name=building_name
-            )
-            datas_per_building = []
-            for index in range(simulation_interval):
-                data = []
-                year = index + 1
-                data.append(year)
-                data.append(building_name)
-
-                # 査定価格の取得
-                values = real_estate_price_df[
-                    (real_estate_price_df["物件名"] == building_name)
-                    & (real_estate_price_df["年"] == year)
-                ]["想定評価額"].values
-                if len(values) != 1:
-                    raise CalculatorError(
-                        f"real estate price data is duprecated! value is {values}"
+        # 物件ごと・年数ごとの査定価格, ローン残高, 減価償却費用から, 物件ごとの売却シミュレーションデータを作成
+        values = calc_real_estate_sale_array(
+            prices=_get_building_year_array(
+                df=real_estate_price_df,
+                column="想定評価額",
+                building_names=building_names,
+                simulation_interval=simulation_interval,
+                data_name="real estate price data",
+            ),
+            loan_balances=_get_building_year_array(
+                df=loan_df,
+                column="ローン残高",
+                building_names=building_names,
+                simulation_interval=simulation_interval,
+                data_name="loan data",
+            ),
+            deprecation_costs=_get_building_year_array(
+                df=building_deprecation_df,
+                column="減価償却費用",
+                building_names=building_names,
+                simulation_interval=simulation_interval,
+                data_name="building deprecation data",
+            ),
+            purchase_prices=np.array(
+                [
+                    self._parameters.get_real_estate_sale_info(
+                        building_name=building_name
+                    )[0]
+                    for building_name in building_names
+                ]
+            ),
+            sale_expenses=np.array(
+                [
+                    self._parameters.get_building_sale_expenses(
+                        building_name=building_name
                     )
-                building_price = values[0]
-                data.append(building_price)
-
-                # ローン残高情報を取得する
-                values = loan_df[
-                    (loan_df["物件名"] == building_name) & (loan_df["年"] == year)
-                ]["ローン残高"].values
-                if len(values) != 1:
-                    raise CalculatorError(f"loan data is duprecated! value is {values}")
-                loan_amount = values[0]
-                data.append(loan_amount)
-
-                # 累計減価償却費用の計算
-                total_deprecation_cost = building_deprecation_df[
-                    (building_deprecation_df["物件名"] == building_name)
-                    & (building_deprecation_df["年"] <= year)
-                ]["減価償却費用"].sum()
-                data.append(total_deprecation_cost)
-
-                # 売却経費の設定
-                # TODO : 繰り上げ返済手数料の計算をしたようにしたほうが良いかも（現状はシンプルに多めに金額設定している）
-                data.append(building_sale_expenses)
-
-                # 譲渡所得税の計算
-                sale_building_gain = building_price - (
-                    building_purchase_price
-                    - building_sale_expenses
-                    - total_deprecation_cost
-                )
-                if year <= 5:
-                    tax_of_sale_building = int(sale_building_gain * 0.3963)
-                else:
-                    tax_of_sale_building = int(sale_building_gain * 0.20315)
-                data.append(tax_of_sale_building)
-
-                # 売却差額の計算
-                value = building_price - (
-                    loan_amount + tax_of_sale_building + building_sale_expenses
+                    for building_name in building_names
+                ]
+            ),
+        )
+        df = pd.DataFrame({name: array.ravel() for name, array in values.items()})
+        df.insert(0, "物件名", np.repeat(building_names, simulation_interval))
+        df.insert(
+            0, "年", np.tile(np.arange(1, simulation_interval + 1), len(building_names))
+        )
+        return df[columns]
+
+
+def _get_values_per_building_year(df: pd.DataFrame, column: str) -> dict:
+    """物件名・年数ごとの行からなるデータを、(物件名, 年数) -> 値の辞書に変換する"""
+    keys = list(zip(df["物件名"], df["年"]))
+    if len(set(keys)) != len(keys):
+        raise CalculatorError(
+            f"data is duplicated for the same building and year! column is {column}"
+        )
+    return dict(zip(keys, df[column]))
+
+
+def _get_building_year_array(
+    df: pd.DataFrame,
+    column: str,
+    building_names: list,
+    simulation_interval: int,
+    data_name: str,
+) -> np.ndarray:
+    """物件名・年数ごとの行からなるデータの列を, 物件数 x 年数（1始まり）の配列に並べ替える"""
+    values = _get_values_per_building_year(df=df, column=column)
+    array = np.zeros((len(building_names), simulation_interval), dtype=np.int64)
+    for i, building_name in enumerate(building_names):
+        for j in range(simulation_interval):
+            if (building_name, j + 1) not in values:
+                raise CalculatorError(
+                    f"{data_name} is not exist! building_name is {building_name} and year is {j + 1}"
                 )
-                data.append(value)
-                datas_per_building.append(data)
-
-            datas.extend(datas_per_building)
-
-        return pd.DataFrame(datas, columns=columns)
+            array[i, j] = values[(building_name, j + 1)]
+    return array
 
 
 class CashFlowCalculator(AbstractCalculator):
+    parameter_items = (
+        YEAR_ITEM,
+        ("building_information", "売却予定日"),
+    )
+
     def calculate(self, dfs: Dict[str, pd.DataFrame] = {}) -> pd.DataFrame:
         # パラメーターの設定
         columns = ["年", "リアル収支", "課税差額", "物件売却益", "収支差額", "差額累計"]
@@ -572,67 +655,77 @@ class CashFlowCalculator(AbstractCalculator):
             )
         real_estate_sale_df = dfs["real_estate_sale_data"]
 
-        # キャッシュフローの作成
-        datas = []
-        for year in range(
+        # 年からリアル収支を引けるようにする
+        if not real_estate_cash_df["年"].is_unique:
+            raise CalculatorError(
+                f"real estate cash data is dupricated! years are {real_estate_cash_df['年'].tolist()}"
+            )
+        real_cashes = dict(
+            zip(real_estate_cash_df["年"], real_estate_cash_df["リアル収支"])
+        )
+        years = np.arange(
             simulation_start_year, simulation_start_year + simulation_interval
-        ):
-            data = []
-            data.append(year)
-            index = year - simulation_start_year
-
-            # リアル収支の設定
-            values = real_estate_cash_df[real_estate_cash_df["年"] == year][
-                "リアル収支"
-            ].values
-            if len(values) != 1:
+        )
+        for year in years:
+            if year not in real_cashes:
                 raise CalculatorError(
-                    f"real estate cash data is dupricated! value is {values}"
+                    f"real estate cash data is not exist! year is {year}"
                 )
-            real_cash_per_year = values[0]
-            data.append(real_cash_per_year)
-
-            # 課税差額の設定（不動産あり税額 - 不動産なし税額）
-            total_tax = tax_df.at[year, "税額"]
-            total_tax_with_real_estate = tax_with_real_estate_df.at[year, "税額"]
-            tax_diff = total_tax_with_real_estate - total_tax
-            data.append(tax_diff)
-
-            # 物件売却益の取得
-            # 物件売却がある年のみ計上する
-            total_profit_on_sale_of_real_estate = 0
-            for building_name in building_names:
-                sale_year = self._parameters.get_expected_sale_date(
-                    building_name=building_name
-                ).year
-                if year == sale_year:
-                    year_index = year - simulation_start_year + 1
-                    values = real_estate_sale_df[
-                        (real_estate_sale_df["年"] == year_index)
-                        & (real_estate_sale_df["物件名"] == building_name)
-                    ]["売却差額"].values
-                    if len(values) != 1:
-                        raise CalculatorError(
-                            f"real estate sale data is dupricated! value is {values}"
-                        )
-                    total_profit_on_sale_of_real_estate += values[0]
-            data.append(total_profit_on_sale_of_real_estate)
-
-            # 収支差額の計算（リアル収支 - 課税差額）
-            diff_cash = (
-                real_cash_per_year - tax_diff + total_profit_on_sale_of_real_estate
-            )
-            data.append(diff_cash)
 
-            # 差額累計の計算
-            total_diff_cash = diff_cash
-            if index != 0:
-                total_diff_cash = datas[index - 1][5] + total_diff_cash
-            data.append(total_diff_cash)
+        # キャッシュフローの作成（課税差額は不動産あり税額 - 不動産なし税額, 物件売却がある年のみ売却差額を計上する）
+        columns = calc_cash_flow_array(
+            years=years,
+            real_cash=np.array([real_cashes[year] for year in years]),
+            tax_diffs=tax_with_real_estate_df.loc[years, "税額"].to_numpy()
+            - tax_df.loc[years, "税額"].to_numpy(),
+            sale_years=np.array(
+                [
+                    self._parameters.get_expected_sale_date(
+                        building_name=building_name
+                    ).year
+                    for building_name in building_names
+                ]
+            ),
+            sale_profits=_get_building_year_array(
+                df=real_estate_sale_df,
+                column="売却差額",
+                building_names=building_names,
+                simulation_interval=simulation_interval,
+                data_name="real estate sale data",
+            ),
+        )
+        df = pd.DataFrame(columns, index=pd.Index(years, name="年"))
+        return df
+
 
-            datas.append(data)
+class InvestmentMetricsCalculator(AbstractCalculator):
+    parameter_items = (
+        YEAR_ITEM,
+        ("building_information", "初期投資金額"),
+        ("building_information", "契約日"),
+    )
 
-        return pd.DataFrame(datas, columns=columns).set_index(keys="年", drop=True)
+    def calculate(self, dfs: Dict[str, pd.DataFrame] = {}) -> pd.DataFrame:
+        # 必要なDataFrameがパラメーターに設定されているかを確認
+        if "cash_flow_data" not in dfs:
+            raise CalculatorError(
+                "please set the cash flow dataframe to calculate the investment metrics!"
+            )
+        cash_flow_df = dfs["cash_flow_data"]
+
+        # 物件ごとの初期投資金額を購入年の支出とし, 年ごとの収支差額から投資指標を計算する
+        initial_investment = get_initial_investment(parameters=self._parameters)
+        first_investment, later_investments = get_investment_schedule(
+            parameters=self._parameters
+        )
+        metrics = calc_investment_metrics(
+            cash_flows=cash_flow_df["収支差額"].to_numpy(),
+            initial_investments=first_investment,
+            later_investments=later_investments,
+        )
+        columns = {"初期投資金額": [initial_investment]}
+        columns.update({name: values for name, values in metrics.items()})
+        return pd.DataFrame(columns)
 
 
 class CalculatorError(Exception):
@@ -0,0 +1,190 @@
+"""中断したバッチ・スイープを再開するためのチェックポイント
+
+作業単位（パラメーターファイル, シナリオ・パスのチャンクなど）ごとに, 入力のフィンガープリントと
+出力のフィンガープリントを記録したJSONを, 一時ファイルからの置き換えでアトミックに書き込む.
+再開時は, 入力が同じで出力が記録時から変更・破損していない作業単位のみを完了済みとしてスキップする.
+"""
+
+from typing import Callable, Dict, NamedTuple, Optional
+import hashlib
+import json
+import os
+import time
+import uuid
+
+
+def fingerprint_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def fingerprint_json(value) -> str:
+    """JSONで表せる値のフィンガープリント（辞書のキーの順によらない）"""
+    text = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return fingerprint_bytes(text.encode("utf-8"))
+
+
+def fingerprint_file(file_path: str) -> Optional[str]:
+    """ファイルの内容のフィンガープリント（ファイルが存在しない場合はNone）"""
+    if not os.path.exists(file_path):
+        return None
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CheckpointStore:
+    """作業単位の完了記録
+
+    Args:
+        directory (str): 記録を保存するディレクトリ
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def get_record(self, key: str) -> Optional[dict]:
+        record_path = self.__get_record_path(key)
+        if not os.path.exists(record_path):
+            return None
+        try:
+            with open(record_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            return None
+
+    def is_done(
+        self,
+        key: str,
+        fingerprint: str,
+        get_output_fingerprint: Callable[[str], Optional[str]],
+    ) -> bool:
+        """作業単位が完了済みで, 出力が記録時から変更されていないかを返す
+
+        入力のフィンガープリントが異なる, または出力が変更・破損している場合は記録を削除する.
+
+        Args:
+            key (str): 作業単位のキー
+            fingerprint (str): 入力のフィンガープリント
+            get_output_fingerprint (Callable[[str], Optional[str]]): 出力名 -> 現在の出力のフィンガープリント
+
+        Returns:
+            bool: 完了済みの場合はTrue
+        """
+        record = self.get_record(key)
+        if record is None:
+            return False
+        is_valid = record["fingerprint"] == fingerprint and all(
+            get_output_fingerprint(name) == output_fingerprint
+            for name, output_fingerprint in record["outputs"].items()
+        )
+        if not is_valid:
+            self.remove(key)
+        return is_valid
+
+    def record(
+        self,
+        key: str,
+        fingerprint: str,
+        outputs: Dict[str, str],
+        elapsed_time: float = None,
+    ) -> None:
+        """作業単位の完了を記録する（出力を書き込んだ後に呼び出す）
+
+        Args:
+            key (str): 作業単位のキー
+            fingerprint (str): 入力のフィンガープリント
+            outputs (Dict[str, str]): 出力名 -> 出力のフィンガープリント
+            elapsed_time (float, optional): 作業単位の処理時間（秒）. Defaults to None.
+        """
+        record = {
+            "key": key,
+            "fingerprint": fingerprint,
+            "outputs": outputs,
+            "elapsed_time": elapsed_time,
+            "completed_at": time.time(),
+        }
+        record_path = self.__get_record_path(key)
+        tmp_record_path = f"{record_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_record_path, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_record_path, record_path)
+
+    def remove(self, key: str) -> None:
+        record_path = self.__get_record_path(key)
+        if os.path.exists(record_path):
+            os.remove(record_path)
+
+    def __get_record_path(self, key: str) -> str:
+        # キーにはファイル名に使えない文字が含まれることがあるため, ハッシュ値をファイル名とする
+        return os.path.join(
+            self.directory, f"{fingerprint_bytes(key.encode('utf-8'))[:32]}.json"
+        )
+
+
+class Progress(NamedTuple):
+    """進捗（件数はシナリオ数などの処理量の単位）"""
+
+    total: int
+    done: int
+    skipped: int
+    elapsed_time: float
+    eta: Optional[float]
+
+    def format(self) -> str:
+        eta = "-" if self.eta is None else f"{self.eta:.1f}s"
+        ratio = self.done / self.total * 100 if self.total > 0 else 100.0
+        return (
+            f"{self.done}/{self.total} ({ratio:.1f}%) done, {self.skipped} skipped, "
+            f"elapsed {self.elapsed_time:.1f}s, ETA {eta}"
+        )
+
+
+class ProgressTracker:
+    """完了件数と残り時間の見積もり
+
+    残り時間は, 今回の実行で処理した件数あたりの時間から見積もる（スキップした件数は含めない）.
+
+    Args:
+        total (int): 全件数
+        on_progress (Callable[[Progress], None], optional): 進捗が更新された時に呼び出す関数. Defaults to None.
+    """
+
+    def __init__(
+        self, total: int, on_progress: Callable[[Progress], None] = None
+    ) -> None:
+        self.total = total
+        self.on_progress = on_progress
+        self.__start_time = time.perf_counter()
+        self.__processed = 0
+        self.__skipped = 0
+
+    def skip(self, count: int = 1) -> None:
+        self.__skipped += count
+        self.__notify()
+
+    def complete(self, count: int = 1) -> None:
+        self.__processed += count
+        self.__notify()
+
+    def get_progress(self) -> Progress:
+        elapsed_time = time.perf_counter() - self.__start_time
+        done = self.__processed + self.__skipped
+        eta = None
+        if self.__processed > 0:
+            eta = elapsed_time / self.__processed * (self.total - done)
+        return Progress(
+            total=self.total,
+            done=done,
+            skipped=self.__skipped,
+            elapsed_time=elapsed_time,
+            eta=eta,
+        )
+
+    def __notify(self) -> None:
+        if self.on_progress is not None:
+            self.on_progress(self.get_progress())
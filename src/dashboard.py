@@ -1,69 +1,325 @@
 import streamlit as st
-from executor import Executor
-import os
-from datetime import datetime
-import shutil
-import matplotlib.pyplot as plt
+from typing import TYPE_CHECKING, Optional
+from result_cube import ResultCubeError
+from scenario_explorer import (
+    HEATMAP_STATISTICS,
+    VALUE_COLUMN,
+    ScenarioExplorer,
+    ScenarioExplorerError,
+)
+from simulation_pool import (
+    QUEUED,
+    RUNNING,
+    SimulationPool,
+    SimulationCancelledError,
+    SimulationPoolBusyError,
+    SimulationPoolError,
+    SimulationResult,
+)
+import time
+import uuid
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# ジョブの状態を確認する間隔（秒）
+POLLING_INTERVAL = 0.5
+
+# キューブの探索の集計結果を保持する期間（秒）と, 保持するキューブの数
+SCENARIO_EXPLORER_TTL = 60 * 60
+SCENARIO_EXPLORER_MAX_ENTRIES = 4
 
 
 def dashboard():
     st.title("Real Estate Investment Simulator")
 
     # setup sidebar
+    cube_dir = st.sidebar.text_input("result cube folder of sweep or stochastic run")
+    if cube_dir != "":
+        try:
+            scenario_explorer_page(directory=cube_dir)
+        except (ResultCubeError, ScenarioExplorerError) as e:
+            st.error(str(e))
+        return
     param_file = st.sidebar.file_uploader(
-        "please upload the parameter file", type=["xlsx"]
+        "please upload the parameter file", type=["xlsx", "json", "yaml", "yml", "npz"]
     )
 
     # check whether prepare the parameter file
     if param_file is None:
         return
     start_btn = st.button("start simulation")
-    if start_btn is False:
-        return
 
-    # start simulation when push button
-    with st.spinner("simulation process is doing..."):
-        now_date = datetime.now().strftime("%y%m%d%H%M%S")
-        result_folder = os.path.join(
-            os.path.dirname(__file__), "simulation_result", now_date,
-        )
-        executor = Executor(parameter_file_path=param_file, result_folder=result_folder)
-        dfs = executor.execute()
-        executor.save_results(dfs=dfs)
-
-        # archive result folder
-        result_file = shutil.make_archive(
-            base_name=f"result_{now_date}", format="zip", root_dir=result_folder
-        )
+    # シミュレーションは共有のワーカープールで実行し, 結果はセッションごとにメモリで保持する
+    pool = get_simulation_pool()
+    session_state = st.session_state
+    session_id = session_state.setdefault("session_id", uuid.uuid4().hex)
+    if start_btn:
+        try:
+            job = pool.submit(
+                session_id=session_id,
+                parameter_bytes=param_file.getvalue(),
+                file_name=param_file.name,
+            )
+        except SimulationPoolBusyError as e:
+            st.warning(str(e))
+        else:
+            session_state["job_id"] = job.job_id
+            session_state.pop("simulation_result", None)
+    # 計算結果のグラフ・表の表示場所（計算の途中で完了したデータから順に表示する）
+    containers = {name: st.container() for name in RESULT_VIEWS}
+    rendered_names = set()
+    if "job_id" in session_state:
+        job_id = session_state["job_id"]
+        if st.button("cancel simulation"):
+            pool.cancel(job_id=job_id)
+
+        # 再描画で待ちが中断された場合は, 次の描画で同じジョブの完了を待つ
+        try:
+            result = wait_for_simulation(
+                pool=pool,
+                job_id=job_id,
+                containers=containers,
+                rendered_names=rendered_names,
+            )
+        except SimulationCancelledError:
+            session_state.pop("job_id")
+            st.info("simulation is cancelled.")
+            return
+        except SimulationPoolError as e:
+            session_state.pop("job_id")
+            st.error(str(e))
+            return
+        session_state.pop("job_id")
+        session_state["simulation_result"] = result
+    if "simulation_result" not in session_state:
+        return
+    result = session_state["simulation_result"]
 
     # display result
-    df = dfs["tax_data"][["税額"]]
-    st.line_chart(data=df)
+    render_results(dfs=result.dfs, containers=containers, rendered_names=rendered_names)
 
-    if "cash_flow_data" in dfs:
-        df = dfs["cash_flow_data"][["収支差額", "差額累計"]]
-        fig, ax = plt.subplots()
-        ax2 = ax.twinx()
+    # display download button
+    st.download_button(
+        "download the zip of result data",
+        result.zip_bytes,
+        file_name=result.zip_file_name,
+    )
+    st.download_button(
+        "download the result workbook",
+        result.xlsx_bytes,
+        file_name=result.xlsx_file_name,
+    )
 
-        # 収支差額の設定
-        ax.plot(df.index.values, df["収支差額"], marker="o", linestyle="--", color="r")
-        ax.set_xlabel("year", fontname="MS Gothic")
-        ax.set_ylabel("cash_diff", color="r", fontname="MS Gothic")
-        ax.tick_params("y", colors="r")
 
-        # 差額累計の設定
-        ax2.plot(df.index.values, df["差額累計"], marker="x", linestyle="-", color="b")
-        ax2.set_ylabel("cash_diff_sum", color="b", fontname="MS Gothic")
-        ax2.tick_params("y", colors="b")
+def render_tax_chart(df: "pd.DataFrame"):
+    st.line_chart(data=df[["税額"]])
 
-        # キャッシュフローのグラフをプロット
-        st.pyplot(fig)
 
-    # display download button
-    with open(result_file, "rb") as f:
-        st.download_button(
-            "download the zip of result data", f, file_name="result_data.zip"
-        )
+def render_cash_flow_chart(df: "pd.DataFrame"):
+    # matplotlibの読み込みは時間がかかるため, グラフを描画する場合のみ読み込む
+    import matplotlib.pyplot as plt
+
+    df = df[["収支差額", "差額累計"]]
+    fig, ax = plt.subplots()
+    ax2 = ax.twinx()
+
+    # 収支差額の設定
+    ax.plot(df.index.values, df["収支差額"], marker="o", linestyle="--", color="r")
+    ax.set_xlabel("year", fontname="MS Gothic")
+    ax.set_ylabel("cash_diff", color="r", fontname="MS Gothic")
+    ax.tick_params("y", colors="r")
+
+    # 差額累計の設定
+    ax2.plot(df.index.values, df["差額累計"], marker="x", linestyle="-", color="b")
+    ax2.set_ylabel("cash_diff_sum", color="b", fontname="MS Gothic")
+    ax2.tick_params("y", colors="b")
+
+    # キャッシュフローのグラフをプロット
+    st.pyplot(fig)
+    plt.close(fig)
+
+
+def render_investment_metrics_table(df: "pd.DataFrame"):
+    st.dataframe(df)
+
+
+# データ名 -> 計算結果のグラフ・表の表示（表示する順）
+RESULT_VIEWS = {
+    "tax_data": render_tax_chart,
+    "cash_flow_data": render_cash_flow_chart,
+    "investment_metrics_data": render_investment_metrics_table,
+}
+
+
+def render_results(dfs: dict, containers: dict, rendered_names: set):
+    """計算済みのデータのグラフ・表のうち, 表示していないものを表示場所に表示する"""
+    for name, render in RESULT_VIEWS.items():
+        if name in dfs and name not in rendered_names:
+            with containers[name]:
+                render(dfs[name])
+            rendered_names.add(name)
+
+
+def wait_for_simulation(
+    pool: SimulationPool, job_id: str, containers: dict, rendered_names: set
+) -> SimulationResult:
+    """ジョブの待ち順位・進捗を表示しながら完了を待ち, 計算結果を返す
+
+    待つ間に完了したステージのデータのグラフ・表を順に表示する（表示したデータ名をrendered_namesに追加する）.
+    待つ間はスリープするのみで, ワーカープールの計算や他のセッションを妨げない.
+    """
+    message = st.empty()
+    progress_bar = st.progress(0.0)
+    while True:
+        status = pool.get_status(job_id=job_id)
+        if status.state == QUEUED:
+            message.info(
+                f"waiting in queue: {status.position} / {status.pending_count} "
+                f"({status.running_count} running), estimated {status.eta:.0f}s"
+            )
+        elif status.state == RUNNING:
+            message.info(
+                f"simulation process is doing... {status.completed_stage_count} / "
+                f"{status.stage_count or '-'} stages, elapsed {status.elapsed_time:.1f}s, "
+                f"ETA {status.eta:.1f}s"
+            )
+            if status.stage_count > 0:
+                progress_bar.progress(
+                    status.completed_stage_count / (status.stage_count + 1)
+                )
+            render_results(
+                dfs=pool.get_dfs(job_id=job_id),
+                containers=containers,
+                rendered_names=rendered_names,
+            )
+        else:
+            break
+        time.sleep(POLLING_INTERVAL)
+    message.empty()
+    progress_bar.empty()
+    return pool.pop_result(job_id=job_id)
+
+
+@st.cache_resource
+def get_simulation_pool() -> SimulationPool:
+    # サーバーのプロセスで1つのワーカープールを全セッションで共有する
+    return SimulationPool()
+
+
+def scenario_explorer_page(directory: str, page_size: int = 50):
+    """計算結果キューブ（スイープ・確率シミュレーション）の探索ページ
+
+    集計はサーバー側で行い, ブラウザには描画する分（分位点の帯, ヒートマップのセル, 表の1ページ）のみを送る.
+    """
+    explorer = get_scenario_explorer(directory=directory)
+    scenario_axis = explorer.scenario_axis
+    st.write(
+        f"{scenario_axis}: {explorer.get_written_count()} / {explorer.cube.shape[0]}"
+    )
+
+    # 表示する項目・年・物件などを選択する
+    metric = st.sidebar.selectbox("metric", explorer.get_metrics())
+    years = explorer.get_years()
+    year = st.sidebar.selectbox("year", years, index=len(years) - 1)
+    selection = {
+        axis: st.sidebar.selectbox(axis, labels)
+        for axis, labels in explorer.get_selection_axes().items()
+    }
+
+    # フィルター（スイープ軸の値の範囲, 選択した年の値の範囲）
+    filters = {}
+    with st.sidebar.expander("filters"):
+        for column in [*explorer.get_sweep_axis_names(), VALUE_COLUMN]:
+            lower = _parse_filter_bound(
+                st.text_input(f"{column} lower", key=f"{column}_lower"),
+                name=f"{column} lower",
+            )
+            upper = _parse_filter_bound(
+                st.text_input(f"{column} upper", key=f"{column}_upper"),
+                name=f"{column} upper",
+            )
+            if lower is not None or upper is not None:
+                filters[column] = (lower, upper)
+    mask = explorer.get_filter_mask(
+        filters=filters, metric=metric, year=year, selection=selection
+    )
+
+    # matplotlibの読み込みは時間がかかるため, 探索ページを表示する場合のみ読み込む
+    import matplotlib.pyplot as plt
+
+    # ファンチャート（分位点の帯）
+    st.subheader(f"{metric} percentile bands")
+    bands_df = explorer.get_percentile_bands(
+        metric=metric, selection=selection, mask=mask
+    )
+    fig, ax = plt.subplots()
+    ax.fill_between(bands_df.index, bands_df["p5"], bands_df["p95"], alpha=0.2)
+    ax.fill_between(bands_df.index, bands_df["p25"], bands_df["p75"], alpha=0.4)
+    ax.plot(bands_df.index, bands_df["p50"], color="b")
+    ax.set_xlabel("year")
+    st.pyplot(fig)
+    plt.close(fig)
+
+    # ヒートマップ（2つのスイープ軸）
+    sweep_axis_names = explorer.get_sweep_axis_names()
+    if len(sweep_axis_names) >= 2:
+        st.subheader(f"{metric} heatmap in {year}")
+        x_axis = st.selectbox("x axis", sweep_axis_names, index=0)
+        y_axis = st.selectbox("y axis", sweep_axis_names, index=1)
+        statistic = st.selectbox("statistic", list(HEATMAP_STATISTICS.keys()))
+        if x_axis != y_axis:
+            heatmap_df = explorer.get_heatmap(
+                metric=metric,
+                year=year,
+                x_axis=x_axis,
+                y_axis=y_axis,
+                selection=selection,
+                statistic=statistic,
+            )
+            fig, ax = plt.subplots()
+            image = ax.imshow(heatmap_df.to_numpy(), aspect="auto", origin="lower")
+            ax.set_xticks(range(len(heatmap_df.columns)), heatmap_df.columns)
+            ax.set_yticks(range(len(heatmap_df.index)), heatmap_df.index)
+            ax.tick_params(axis="x", labelrotation=90)
+            fig.colorbar(image, ax=ax)
+            st.pyplot(fig)
+            plt.close(fig)
+
+    # シナリオの表（フィルター・並び替えした結果を1ページずつ表示する）
+    st.subheader("scenarios")
+    sort_order = st.selectbox("sort by value", ["none", "ascending", "descending"])
+    sort_ascending = {"none": None, "ascending": True, "descending": False}[sort_order]
+    page_count = max(1, -(-int(mask.sum()) // page_size))
+    page = st.number_input("page", min_value=1, max_value=page_count, value=1)
+    page_df, total = explorer.get_page(
+        metric=metric,
+        year=year,
+        selection=selection,
+        filters=filters,
+        sort_ascending=sort_ascending,
+        page=page - 1,
+        page_size=page_size,
+    )
+    st.write(f"{total} {scenario_axis} matched (page {page} / {page_count})")
+    st.dataframe(page_df)
+
+
+def _parse_filter_bound(text: str, name: str) -> Optional[float]:
+    """フィルターの範囲の入力を数値に変換する（空欄の場合と, 数値でない場合は警告を表示してNoneを返す）"""
+    if text.strip() == "":
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        st.warning(f"{name} is not a number! value is {text}")
+        return None
+
+
+@st.cache_resource(ttl=SCENARIO_EXPLORER_TTL, max_entries=SCENARIO_EXPLORER_MAX_ENTRIES)
+def get_scenario_explorer(directory: str) -> ScenarioExplorer:
+    # セッション・再描画をまたいで集計結果を再利用する（書き込み中のキューブは集計ごとに書き込みフラグを読み直す）
+    return ScenarioExplorer(directory=directory)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,546 @@
+"""共有ディレクトリを作業キューとした分散スイープ
+
+キューのディレクトリ構成:
+    manifest.json       スイープ条件（シナリオ空間, 出力データ名, 作業単位の数など）
+    parameters.xlsx     基準のパラメーターファイル（コーディネーターがコピーする）
+    units/todo/         未処理の作業単位
+    units/leases/       処理中の作業単位（取得したワーカーIDを書き込み, ファイルの更新時刻をハートビートとして更新する）
+    results/            作業単位ごとの計算結果（列ごとの配列を保存した.npz）
+
+作業単位の取得・返却はファイルのrename（同一ファイルシステム内でアトミック）で行う.
+ハートビートが途絶えた作業単位はリース切れとして未処理に戻し、別のワーカーが再処理する.
+結果ファイルは作業単位ごとに1つで、一時ファイルからの置き換えで書き込むため、
+同じ作業単位を複数のワーカーが処理した場合でも結果が重複して集計されることはない.
+"""
+
+from params import ParametersReader
+from aggregation import StreamingAggregator
+from result_cube import ResultCube
+from sweep import (
+    ScenarioSpace,
+    ScenarioRunner,
+    SweepAxis,
+    columns_to_frame,
+    get_cube_axes,
+    get_cube_dtype,
+)
+import numpy as np
+import pandas as pd
+from typing import Dict, List
+import argparse
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+
+
+class SweepCoordinator:
+    """シナリオ空間を作業単位に分割してキューを作成し、結果を集約する
+
+    Args:
+        queue_dir (str): キューのディレクトリ（全ワーカーから参照できる共有ディレクトリ）
+    """
+
+    def __init__(self, queue_dir: str) -> None:
+        self.queue_dir = queue_dir
+
+    def create(
+        self,
+        parameter_file_path: str,
+        space: ScenarioSpace,
+        unit_size: int = 100,
+        data_name: str = "cash_flow_data",
+    ) -> int:
+        """キューを作成する
+
+        Args:
+            parameter_file_path (str): 基準のパラメーターファイル
+            space (ScenarioSpace): シナリオ空間
+            unit_size (int, optional): 作業単位あたりのシナリオ数. Defaults to 100.
+            data_name (str, optional): 出力するデータ名. Defaults to "cash_flow_data".
+
+        Returns:
+            int: 作業単位の数
+        """
+        if unit_size < 1:
+            raise DistributedSweepError(
+                f"unit_size must be positive! value is {unit_size}"
+            )
+        if os.path.exists(_get_manifest_path(self.queue_dir)):
+            raise DistributedSweepError(
+                f"queue already exists! path is {self.queue_dir}"
+            )
+        for folder in [_TODO_DIR, _LEASES_DIR, _RESULTS_DIR]:
+            os.makedirs(os.path.join(self.queue_dir, folder), exist_ok=True)
+
+        # パラメーターファイルをキューにコピーし、全ワーカーが同じ条件で計算するようにする
+        _, ext = os.path.splitext(parameter_file_path)
+        parameter_file_name = f"parameters{ext}"
+        shutil.copyfile(
+            parameter_file_path, os.path.join(self.queue_dir, parameter_file_name)
+        )
+
+        # 作業単位を作成する
+        scenario_count = len(space)
+        unit_ids = []
+        for start in range(0, scenario_count, unit_size):
+            unit_id = f"{len(unit_ids):08d}"
+            unit = {
+                "unit_id": unit_id,
+                "start": start,
+                "stop": min(start + unit_size, scenario_count),
+            }
+            _write_json(os.path.join(self.queue_dir, _TODO_DIR, unit_id), unit)
+            unit_ids.append(unit_id)
+
+        # マニフェストは最後に書き込み、マニフェストがあるキューは作成済みであるとする
+        manifest = {
+            "parameter_file": parameter_file_name,
+            "space": space.to_dict(),
+            "data_name": data_name,
+            "scenario_count": scenario_count,
+            "unit_ids": unit_ids,
+        }
+        _write_json(_get_manifest_path(self.queue_dir), manifest)
+        return len(unit_ids)
+
+    def get_progress(self) -> Dict[str, int]:
+        """作業単位の処理状況を返す
+
+        Returns:
+            Dict[str, int]: total, todo, leased, done
+        """
+        manifest = _read_manifest(self.queue_dir)
+        done_ids = _list_result_unit_ids(self.queue_dir)
+        return {
+            "total": len(manifest["unit_ids"]),
+            "todo": len(os.listdir(os.path.join(self.queue_dir, _TODO_DIR))),
+            "leased": len(os.listdir(os.path.join(self.queue_dir, _LEASES_DIR))),
+            "done": len(done_ids & set(manifest["unit_ids"])),
+        }
+
+    def reduce(self, output_path: str = None) -> pd.DataFrame:
+        """全作業単位の結果を作業単位の順に結合する
+
+        Args:
+            output_path (str, optional): 結合結果を保存する.npzのパス. Defaults to None.
+
+        Returns:
+            pd.DataFrame: 全シナリオの結果
+        """
+        manifest = _read_manifest(self.queue_dir)
+        missing_ids = set(manifest["unit_ids"]) - _list_result_unit_ids(self.queue_dir)
+        if len(missing_ids) > 0:
+            raise DistributedSweepError(
+                f"some units are not finished! count is {len(missing_ids)}"
+            )
+
+        columns = {}
+        for unit_id in manifest["unit_ids"]:
+            with np.load(_get_result_path(self.queue_dir, unit_id)) as unit_columns:
+                for name in unit_columns.files:
+                    columns.setdefault(name, []).append(unit_columns[name])
+        columns = {name: np.concatenate(values) for name, values in columns.items()}
+        if output_path is not None:
+            _save_columns(output_path, columns)
+        return columns_to_frame(columns)
+
+    def reduce_aggregated(self, columns: List[str]) -> StreamingAggregator:
+        """全作業単位の結果を作業単位ごとに読み込み, 年・項目ごとの統計量に集計する
+
+        結合結果を保持しないため, シナリオ数によらず一定のメモリで集計できる.
+
+        Args:
+            columns (List[str]): 集計する列
+
+        Returns:
+            StreamingAggregator: 年・項目ごとの集計
+        """
+        manifest = _read_manifest(self.queue_dir)
+        missing_ids = set(manifest["unit_ids"]) - _list_result_unit_ids(self.queue_dir)
+        if len(missing_ids) > 0:
+            raise DistributedSweepError(
+                f"some units are not finished! count is {len(missing_ids)}"
+            )
+
+        aggregator = None
+        for unit_id in manifest["unit_ids"]:
+            with np.load(_get_result_path(self.queue_dir, unit_id)) as unit_columns:
+                if aggregator is None:
+                    scenario_indices = unit_columns["シナリオ番号"]
+                    years = unit_columns["年"][scenario_indices == scenario_indices[0]]
+                    aggregator = StreamingAggregator(years=years, columns=columns)
+                aggregator.update_long({name: unit_columns[name] for name in columns})
+        return aggregator
+
+    def reduce_cube(self, directory: str) -> ResultCube:
+        """全作業単位の結果を作業単位ごとに読み込み, 計算結果キューブに書き込む
+
+        結合結果を保持しないため, シナリオ数によらず一定のメモリで書き込める.
+
+        Args:
+            directory (str): キューブのディレクトリ
+
+        Returns:
+            ResultCube: 書き込んだキューブ
+        """
+        manifest = _read_manifest(self.queue_dir)
+        missing_ids = set(manifest["unit_ids"]) - _list_result_unit_ids(self.queue_dir)
+        if len(missing_ids) > 0:
+            raise DistributedSweepError(
+                f"some units are not finished! count is {len(missing_ids)}"
+            )
+
+        space = ScenarioSpace.from_dict(manifest["space"])
+        cube = None
+        for unit_id in manifest["unit_ids"]:
+            with np.load(_get_result_path(self.queue_dir, unit_id)) as unit_columns:
+                columns = {name: unit_columns[name] for name in unit_columns.files}
+            if cube is None:
+                # 軸は先頭のシナリオの行から求める（物件・年は全シナリオで共通）
+                scenario_indices = columns["シナリオ番号"]
+                first_columns = {
+                    name: values[scenario_indices == scenario_indices[0]]
+                    for name, values in columns.items()
+                }
+                axes = get_cube_axes(
+                    columns=first_columns,
+                    excluded_columns=["シナリオ番号", *space.get_axis_names()],
+                )
+                cube = ResultCube.create(
+                    directory=directory,
+                    axes=[("シナリオ番号", range(manifest["scenario_count"])), *axes],
+                    dtype=get_cube_dtype(columns=columns, metrics=axes[-1][1]),
+                    attributes={
+                        "space": manifest["space"],
+                        "data_name": manifest["data_name"],
+                    },
+                )
+            cube.write_columns(columns)
+        cube.flush()
+        return cube
+
+
+class SweepWorker:
+    """キューから作業単位を取得して計算し、結果を保存する
+
+    Args:
+        queue_dir (str): キューのディレクトリ
+        lease_timeout (float, optional): ハートビートが途絶えてからリース切れとするまでの秒数. Defaults to 60.
+        heartbeat_interval (float, optional): ハートビートの間隔（秒）. Defaults to 10.
+        worker_id (str, optional): ワーカーID. Defaults to None（ホスト名とプロセスIDから作成）.
+    """
+
+    def __init__(
+        self,
+        queue_dir: str,
+        lease_timeout: float = 60,
+        heartbeat_interval: float = 10,
+        worker_id: str = None,
+    ) -> None:
+        if heartbeat_interval >= lease_timeout:
+            raise DistributedSweepError(
+                "heartbeat_interval must be smaller than lease_timeout!"
+            )
+        self.queue_dir = queue_dir
+        self.lease_timeout = lease_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.worker_id = (
+            worker_id
+            if worker_id is not None
+            else f"{socket.gethostname()}-{os.getpid()}"
+        )
+        self.__runner = None
+
+    def run(self, max_units: int = None, poll_interval: float = 1.0) -> int:
+        """作業単位がなくなるまで処理を続ける
+
+        未処理の作業単位がなく、処理中の作業単位が残っている場合は、リース切れを待って再処理する.
+
+        Args:
+            max_units (int, optional): 処理する作業単位の上限. Defaults to None.
+            poll_interval (float, optional): 他ワーカーの処理完了を待つ間隔（秒）. Defaults to 1.0.
+
+        Returns:
+            int: 処理した作業単位の数
+        """
+        processed_count = 0
+        while max_units is None or processed_count < max_units:
+            unit = self.claim()
+            if unit is None:
+                self.requeue_expired_leases()
+                if len(os.listdir(os.path.join(self.queue_dir, _LEASES_DIR))) == 0 and (
+                    len(os.listdir(os.path.join(self.queue_dir, _TODO_DIR))) == 0
+                ):
+                    break
+                time.sleep(poll_interval)
+                continue
+            self.process(unit=unit)
+            processed_count += 1
+        return processed_count
+
+    def claim(self) -> dict:
+        """未処理の作業単位を1つ取得する. 取得できない場合はNoneを返す"""
+        todo_dir = os.path.join(self.queue_dir, _TODO_DIR)
+        for unit_id in sorted(os.listdir(todo_dir)):
+            todo_path = os.path.join(todo_dir, unit_id)
+            lease_path = os.path.join(self.queue_dir, _LEASES_DIR, unit_id)
+            try:
+                # 取得直後にリース切れと判定されないように、更新時刻を更新してから移動する
+                os.utime(todo_path)
+                os.rename(todo_path, lease_path)
+            except FileNotFoundError:
+                # 他のワーカーが先に取得した
+                continue
+            # リースに取得したワーカーIDを書き込み, 解放・ハートビートは自分のリースのみに行う
+            unit = _read_json(lease_path)
+            unit["worker_id"] = self.worker_id
+            _write_lease(self.queue_dir, unit_id, unit)
+            return unit
+        return None
+
+    def process(self, unit: dict) -> None:
+        """作業単位を計算して結果を保存し、リースを解放する"""
+        unit_id = unit["unit_id"]
+        lease_path = os.path.join(self.queue_dir, _LEASES_DIR, unit_id)
+        result_path = _get_result_path(self.queue_dir, unit_id)
+
+        # リース切れ後に別のワーカーが処理済みの場合は計算しない
+        if not os.path.exists(result_path):
+            stop_event = threading.Event()
+            heartbeat = threading.Thread(
+                target=self.__heartbeat, args=(lease_path, stop_event), daemon=True
+            )
+            heartbeat.start()
+            try:
+                columns = self.__get_runner().run(range(unit["start"], unit["stop"]))
+                _save_columns(result_path, columns)
+            finally:
+                stop_event.set()
+                heartbeat.join()
+
+        # リース切れで他のワーカーが取得し直したリースは削除しない
+        if self.__is_lease_owner(lease_path):
+            try:
+                os.remove(lease_path)
+            except FileNotFoundError:
+                pass
+
+    def format_cache_stats(self) -> str:
+        """ステージの計算結果のキャッシュのヒット率を表示用の文字列で返す（未処理の場合は空文字列）"""
+        if self.__runner is None:
+            return ""
+        return self.__runner.cache.format_stats()
+
+    def requeue_expired_leases(self) -> List[str]:
+        """リース切れの作業単位を未処理に戻す
+
+        Returns:
+            List[str]: 未処理に戻した作業単位のID
+        """
+        leases_dir = os.path.join(self.queue_dir, _LEASES_DIR)
+        requeued_ids = []
+        now = time.time()
+        for unit_id in os.listdir(leases_dir):
+            lease_path = os.path.join(leases_dir, unit_id)
+            try:
+                if now - os.path.getmtime(lease_path) <= self.lease_timeout:
+                    continue
+                if os.path.exists(_get_result_path(self.queue_dir, unit_id)):
+                    os.remove(lease_path)
+                    continue
+                os.rename(lease_path, os.path.join(self.queue_dir, _TODO_DIR, unit_id))
+            except FileNotFoundError:
+                # 他のワーカーが先に処理した
+                continue
+            requeued_ids.append(unit_id)
+        return requeued_ids
+
+    def __heartbeat(self, lease_path: str, stop_event: threading.Event) -> None:
+        while not stop_event.wait(self.heartbeat_interval):
+            # リース切れで他のワーカーに渡った場合は更新しない
+            if not self.__is_lease_owner(lease_path):
+                return
+            try:
+                os.utime(lease_path)
+            except FileNotFoundError:
+                return
+
+    def __is_lease_owner(self, lease_path: str) -> bool:
+        try:
+            lease = _read_json(lease_path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+        return lease.get("worker_id") == self.worker_id
+
+    def __get_runner(self) -> ScenarioRunner:
+        if self.__runner is None:
+            manifest = _read_manifest(self.queue_dir)
+            reader = ParametersReader(
+                params_file_path=os.path.join(
+                    self.queue_dir, manifest["parameter_file"]
+                )
+            )
+            self.__runner = ScenarioRunner(
+                parameters=reader.read_params(),
+                space=ScenarioSpace.from_dict(manifest["space"]),
+                data_name=manifest["data_name"],
+            )
+        return self.__runner
+
+
+_TODO_DIR = os.path.join("units", "todo")
+_LEASES_DIR = os.path.join("units", "leases")
+_RESULTS_DIR = "results"
+
+
+def _get_manifest_path(queue_dir: str) -> str:
+    return os.path.join(queue_dir, "manifest.json")
+
+
+def _get_result_path(queue_dir: str, unit_id: str) -> str:
+    return os.path.join(queue_dir, _RESULTS_DIR, f"{unit_id}.npz")
+
+
+def _list_result_unit_ids(queue_dir: str) -> set:
+    return {
+        file_name[: -len(".npz")]
+        for file_name in os.listdir(os.path.join(queue_dir, _RESULTS_DIR))
+        if file_name.endswith(".npz")
+    }
+
+
+def _read_manifest(queue_dir: str) -> dict:
+    manifest_path = _get_manifest_path(queue_dir)
+    if not os.path.exists(manifest_path):
+        raise DistributedSweepError(f"queue is not created! path is {queue_dir}")
+    return _read_json(manifest_path)
+
+
+def _read_json(file_path: str) -> dict:
+    with open(file_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json(file_path: str, d: dict) -> None:
+    tmp_file_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_file_path, "w", encoding="utf-8") as f:
+        json.dump(d, f, ensure_ascii=False)
+    os.replace(tmp_file_path, file_path)
+
+
+def _write_lease(queue_dir: str, unit_id: str, unit: dict) -> None:
+    # 一時ファイルはleasesの外に書き込み, リース切れの判定でリースとして扱われないようにする
+    tmp_file_path = os.path.join(
+        queue_dir, "units", f"{unit_id}.{uuid.uuid4().hex}.tmp"
+    )
+    with open(tmp_file_path, "w", encoding="utf-8") as f:
+        json.dump(unit, f, ensure_ascii=False)
+    os.replace(tmp_file_path, os.path.join(queue_dir, _LEASES_DIR, unit_id))
+
+
+def _save_columns(file_path: str, columns: Dict[str, np.ndarray]) -> None:
+    # 書き込み途中の結果を読まないように、一時ファイルに書き込んでから置き換える
+    tmp_file_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_file_path, "wb") as f:
+        np.savez(f, **columns)
+    os.replace(tmp_file_path, file_path)
+
+
+def _parse_axis(value: str) -> SweepAxis:
+    # 項目名:値1,値2,...  または  物件名:項目名:値1,値2,...
+    fields = value.split(":")
+    if len(fields) == 2:
+        building_name, item, values = None, fields[0], fields[1]
+    elif len(fields) == 3:
+        building_name, item, values = fields
+    else:
+        raise argparse.ArgumentTypeError(f"axis format is invalid! value is {value}")
+    return SweepAxis(
+        item=item,
+        values=[json.loads(v) for v in values.split(",")],
+        building_name=building_name,
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    create_parser = subparsers.add_parser("create", help="create the work queue")
+    create_parser.add_argument("queue_dir", help="set the shared queue folder")
+    create_parser.add_argument("param_file_path", help="set parameters file path")
+    create_parser.add_argument(
+        "--axis",
+        type=_parse_axis,
+        action="append",
+        required=True,
+        help="set the sweep axis as [building:]item:value1,value2,...",
+    )
+    create_parser.add_argument("--unit-size", type=int, default=100)
+    create_parser.add_argument("--data-name", default="cash_flow_data")
+
+    worker_parser = subparsers.add_parser("worker", help="process the work units")
+    worker_parser.add_argument("queue_dir", help="set the shared queue folder")
+    worker_parser.add_argument("--lease-timeout", type=float, default=60)
+    worker_parser.add_argument("--heartbeat-interval", type=float, default=10)
+
+    reduce_parser = subparsers.add_parser("reduce", help="merge the results")
+    reduce_parser.add_argument("queue_dir", help="set the shared queue folder")
+    reduce_parser.add_argument("output_path", help="set the output .npz file path")
+
+    reduce_cube_parser = subparsers.add_parser(
+        "reduce-cube", help="write the results into a result cube"
+    )
+    reduce_cube_parser.add_argument("queue_dir", help="set the shared queue folder")
+    reduce_cube_parser.add_argument("cube_dir", help="set the output cube folder")
+
+    progress_parser = subparsers.add_parser("progress", help="show the progress")
+    progress_parser.add_argument("queue_dir", help="set the shared queue folder")
+    return parser.parse_args()
+
+
+def main(args):
+    if args.command == "create":
+        coordinator = SweepCoordinator(queue_dir=args.queue_dir)
+        unit_count = coordinator.create(
+            parameter_file_path=args.param_file_path,
+            space=ScenarioSpace(axes=args.axis),
+            unit_size=args.unit_size,
+            data_name=args.data_name,
+        )
+        print(f"created {unit_count} units")
+    elif args.command == "worker":
+        worker = SweepWorker(
+            queue_dir=args.queue_dir,
+            lease_timeout=args.lease_timeout,
+            heartbeat_interval=args.heartbeat_interval,
+        )
+        processed_count = worker.run()
+        print(f"{worker.worker_id} processed {processed_count} units")
+        if processed_count > 0:
+            print(worker.format_cache_stats())
+    elif args.command == "reduce":
+        df = SweepCoordinator(queue_dir=args.queue_dir).reduce(
+            output_path=args.output_path
+        )
+        print(f"merged {len(df)} rows")
+    elif args.command == "reduce-cube":
+        cube = SweepCoordinator(queue_dir=args.queue_dir).reduce_cube(
+            directory=args.cube_dir
+        )
+        print(f"wrote the result cube of shape {cube.shape}")
+    elif args.command == "progress":
+        print(SweepCoordinator(queue_dir=args.queue_dir).get_progress())
+
+
+class DistributedSweepError(Exception):
+    pass
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
@@ -0,0 +1,380 @@
+"""計算結果を1つのExcelファイル（データごとのシート）に書き出す
+
+シートのXMLを行のブロックごとにzipへ直接書き込むため（書き込み専用・メモリ使用量一定）,
+物件ごとの大きなデータでも全体をメモリに保持しない.
+文字列は共有文字列表を使わずにセルに直接書き込み, 書式は見出し行, 整数・小数の桁区切りのみとする.
+見出し行の固定, 列幅, オートフィルターを設定する.
+
+openpyxlの書き込み専用モードはlxmlがない環境ではセルごとの処理が遅いため（1000物件 x 50年で約30秒）,
+標準ライブラリのみで書き込む.
+"""
+
+from typing import Dict, Iterable, List, Sequence
+from xml.sax.saxutils import escape
+import math
+import numpy as np
+import os
+import zipfile
+
+# 1シートの最大行数（見出し行を含む）. 超える場合は次のシートに続けて書き込む
+MAX_SHEET_ROWS = 1048576
+
+# シート名の最大文字数
+MAX_SHEET_NAME_LENGTH = 31
+
+# 1度に文字列に変換して書き込む行数
+BLOCK_ROWS = 2000
+
+# styles.xmlのセルの書式の番号
+HEADER_STYLE = 1
+INTEGER_STYLE = 2
+FLOAT_STYLE = 3
+
+_MAIN_NAMESPACE = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_RELATIONSHIP_NAMESPACE = (
+    "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+)
+_XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+_CONTENT_TYPES_XML = (
+    _XML_DECLARATION
+    + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    + '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    + '<Default Extension="xml" ContentType="application/xml"/>'
+    + '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    + '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    + "{sheets}</Types>"
+)
+_SHEET_CONTENT_TYPE = (
+    '<Override PartName="/xl/worksheets/sheet{number}.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+)
+_ROOT_RELS_XML = (
+    _XML_DECLARATION
+    + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    + '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    + "</Relationships>"
+)
+# 書式: 0 標準, 1 見出し（太字・白文字, 背景色, 中央揃え）, 2 整数（#,##0）, 3 小数（#,##0.00）
+_STYLES_XML = (
+    _XML_DECLARATION
+    + f'<styleSheet xmlns="{_MAIN_NAMESPACE}">'
+    + '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    + '<font><b/><sz val="11"/><color rgb="FFFFFFFF"/><name val="Calibri"/></font></fonts>'
+    + '<fills count="3"><fill><patternFill patternType="none"/></fill>'
+    + '<fill><patternFill patternType="gray125"/></fill>'
+    + '<fill><patternFill patternType="solid"><fgColor rgb="FF4F81BD"/><bgColor indexed="64"/></patternFill></fill></fills>'
+    + '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    + '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    + '<cellXfs count="4"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    + '<xf numFmtId="0" fontId="1" fillId="2" borderId="0" xfId="0" applyFont="1" applyFill="1" applyAlignment="1">'
+    + '<alignment horizontal="center" vertical="center"/></xf>'
+    + '<xf numFmtId="3" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    + '<xf numFmtId="4" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    + '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    + "</styleSheet>"
+)
+
+
+class XlsxStreamWriter:
+    """シートを1つずつ書き込むExcelファイルのライター
+
+    Args:
+        file_path (str): 出力するExcelファイルのパス
+    """
+
+    def __init__(self, file_path: str) -> None:
+        folder_path = os.path.dirname(file_path)
+        if folder_path != "":
+            os.makedirs(folder_path, exist_ok=True)
+        self.file_path = file_path
+        self.__zip_file = zipfile.ZipFile(
+            file_path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1
+        )
+        self.__sheets = []
+
+    def __enter__(self) -> "XlsxStreamWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def write_sheet(
+        self,
+        sheet_name: str,
+        names: List[str],
+        columns: List[Sequence],
+        styles: List[int] = None,
+    ) -> None:
+        """列ごとの値を1つのシートに書き込む
+
+        Args:
+            sheet_name (str): シート名
+            names (List[str]): 列名
+            columns (List[Sequence]): 列ごとの値（配列またはリスト. 欠損値は空のセルとする）
+            styles (List[int], optional): 列ごとのセルの書式の番号. Defaults to None（値の型から決める）.
+        """
+        if styles is None:
+            styles = [_get_style(column) for column in columns]
+        if sheet_name in [name for name, _, _ in self.__sheets]:
+            raise ExcelExportError(f"sheet name is duplicated! name is {sheet_name}")
+        row_count = len(columns[0]) if len(columns) > 0 else 0
+        if row_count + 1 > MAX_SHEET_ROWS:
+            raise ExcelExportError(
+                f"row count exceeds the limit of a sheet! count is {row_count}"
+            )
+        letters = [_get_column_letter(i) for i in range(len(names))]
+        last_cell = f"{letters[-1] if letters else 'A'}{row_count + 1}"
+        number = len(self.__sheets) + 1
+        self.__sheets.append((sheet_name, number, last_cell))
+
+        with self.__zip_file.open(f"xl/worksheets/sheet{number}.xml", "w") as f:
+            cols = "".join(
+                f'<col min="{i + 1}" max="{i + 1}" width="{_get_column_width(name)}" customWidth="1"/>'
+                for i, name in enumerate(names)
+            )
+            f.write(
+                (
+                    _XML_DECLARATION
+                    + f'<worksheet xmlns="{_MAIN_NAMESPACE}" xmlns:r="{_RELATIONSHIP_NAMESPACE}">'
+                    + f'<dimension ref="A1:{last_cell}"/>'
+                    + '<sheetViews><sheetView workbookViewId="0">'
+                    + '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+                    + "</sheetView></sheetViews>"
+                    + '<sheetFormatPr defaultRowHeight="15"/>'
+                    + (f"<cols>{cols}</cols>" if cols else "")
+                    + "<sheetData>"
+                    + '<row r="1">'
+                    + "".join(
+                        _render_string_cell(f"{letter}1", name, HEADER_STYLE)
+                        for letter, name in zip(letters, names)
+                    )
+                    + "</row>"
+                ).encode("utf-8")
+            )
+
+            # 列ごとにセルのXMLを作成してから行にまとめる（ブロック単位で書き込み, メモリ使用量を一定にする）
+            for start in range(0, row_count, BLOCK_ROWS):
+                stop = min(start + BLOCK_ROWS, row_count)
+                row_numbers = range(start + 2, stop + 2)
+                rendered_columns = [
+                    _render_cells(
+                        letter, row_numbers, _to_cell_values(values[start:stop]), style
+                    )
+                    for letter, values, style in zip(letters, columns, styles)
+                ]
+                f.write(
+                    "".join(
+                        f'<row r="{row_number}">{"".join(cells)}</row>'
+                        for row_number, *cells in zip(row_numbers, *rendered_columns)
+                    ).encode("utf-8")
+                )
+            f.write(
+                (
+                    "</sheetData>"
+                    + (f'<autoFilter ref="A1:{last_cell}"/>' if names else "")
+                    + "</worksheet>"
+                ).encode("utf-8")
+            )
+
+    def close(self) -> None:
+        """ブック・書式・関連付けを書き込み, ファイルを閉じる"""
+        if self.__zip_file is None:
+            return
+        sheets = "".join(
+            f'<sheet name="{escape(name, {chr(34): "&quot;"})}" sheetId="{number}" r:id="rId{number}"/>'
+            for name, number, _ in self.__sheets
+        )
+        defined_names = "".join(
+            f'<definedName name="_xlnm._FilterDatabase" localSheetId="{number - 1}" hidden="1">'
+            + escape(
+                "'{}'!$A$1:{}".format(
+                    name.replace("'", "''"), _to_absolute_reference(last_cell)
+                )
+            )
+            + "</definedName>"
+            for name, number, last_cell in self.__sheets
+        )
+        workbook_xml = (
+            _XML_DECLARATION
+            + f'<workbook xmlns="{_MAIN_NAMESPACE}" xmlns:r="{_RELATIONSHIP_NAMESPACE}">'
+            + '<bookViews><workbookView activeTab="0"/></bookViews>'
+            + f"<sheets>{sheets}</sheets>"
+            + (f"<definedNames>{defined_names}</definedNames>" if defined_names else "")
+            + "</workbook>"
+        )
+        sheet_count = len(self.__sheets)
+        workbook_rels_xml = (
+            _XML_DECLARATION
+            + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + "".join(
+                f'<Relationship Id="rId{number}" '
+                'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+                f'Target="worksheets/sheet{number}.xml"/>'
+                for _, number, _ in self.__sheets
+            )
+            + f'<Relationship Id="rId{sheet_count + 1}" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+            'Target="styles.xml"/>' + "</Relationships>"
+        )
+        content_types_xml = _CONTENT_TYPES_XML.format(
+            sheets="".join(
+                _SHEET_CONTENT_TYPE.format(number=number)
+                for _, number, _ in self.__sheets
+            )
+        )
+        self.__zip_file.writestr("[Content_Types].xml", content_types_xml)
+        self.__zip_file.writestr("_rels/.rels", _ROOT_RELS_XML)
+        self.__zip_file.writestr("xl/workbook.xml", workbook_xml)
+        self.__zip_file.writestr("xl/_rels/workbook.xml.rels", workbook_rels_xml)
+        self.__zip_file.writestr("xl/styles.xml", _STYLES_XML)
+        self.__zip_file.close()
+        self.__zip_file = None
+
+
+def save_results_xlsx(results: Dict[str, Dict[str, Sequence]], file_path: str) -> str:
+    """列データをデータ名ごとのシートに書き込み, 1つのExcelファイルとして保存する
+
+    シートの最大行数を超えるデータは, 「データ名_2」などのシートに続けて書き込む.
+
+    Args:
+        results (Dict[str, Dict[str, Sequence]]): データ名 -> 列名 -> 値
+        file_path (str): 出力するExcelファイルのパス
+
+    Returns:
+        str: 出力したExcelファイルのパス
+    """
+    with XlsxStreamWriter(file_path=file_path) as writer:
+        for data_name, columns in results.items():
+            names = [str(name) for name in columns.keys()]
+            values = [np.asarray(column) for column in columns.values()]
+            styles = [_get_style(column) for column in values]
+            row_count = len(values[0]) if len(values) > 0 else 0
+            rows_per_sheet = MAX_SHEET_ROWS - 1
+            for part, start in enumerate(range(0, max(row_count, 1), rows_per_sheet)):
+                suffix = "" if part == 0 else f"_{part + 1}"
+                writer.write_sheet(
+                    sheet_name=data_name[: MAX_SHEET_NAME_LENGTH - len(suffix)]
+                    + suffix,
+                    names=names,
+                    columns=[
+                        column_values[start : start + rows_per_sheet]
+                        for column_values in values
+                    ],
+                    styles=styles,
+                )
+    return file_path
+
+
+def get_result_xlsx_file_name(parameter_file_path, suffix: str = "") -> str:
+    """計算結果のExcelファイル名（パラメーターファイル名_result.xlsx）を返す
+
+    Args:
+        parameter_file_path: パラメーターファイルのパス（またはnameを持つアップロードされたファイル）
+        suffix (str, optional): 「_result」の後に付ける文字列（ジョブIDなど）. Defaults to "".
+    """
+    file_name = getattr(parameter_file_path, "name", parameter_file_path)
+    stem = os.path.splitext(os.path.basename(str(file_name)))[0]
+    return f"{stem}_result{suffix}.xlsx"
+
+
+def frames_to_columns(dfs: dict) -> Dict[str, Dict[str, np.ndarray]]:
+    """DataFrameを列データに変換する（名前のあるインデックスは先頭の列とし, 行番号のインデックスは出力しない）
+
+    Args:
+        dfs (dict): データ名 -> DataFrame
+
+    Returns:
+        Dict[str, Dict[str, np.ndarray]]: データ名 -> 列名 -> 値
+    """
+    results = {}
+    for data_name, df in dfs.items():
+        if df.index.name is not None:
+            df = df.reset_index()
+        results[data_name] = {
+            str(column): df[column].to_numpy() for column in df.columns
+        }
+    return results
+
+
+def _render_cells(
+    letter: str, row_numbers: Iterable[int], values: list, style: int
+) -> List[str]:
+    if style in (INTEGER_STYLE, FLOAT_STYLE):
+        return [
+            (
+                ""
+                if value is None
+                else f'<c r="{letter}{row_number}" s="{style}"><v>{value!r}</v></c>'
+            )
+            for row_number, value in zip(row_numbers, values)
+        ]
+    return [
+        _render_value_cell(f"{letter}{row_number}", value)
+        for row_number, value in zip(row_numbers, values)
+    ]
+
+
+def _render_value_cell(reference: str, value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{reference}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{reference}"><v>{value!r}</v></c>'
+    return _render_string_cell(reference, str(value), 0)
+
+
+def _render_string_cell(reference: str, value: str, style: int) -> str:
+    style_attribute = f' s="{style}"' if style != 0 else ""
+    return (
+        f'<c r="{reference}"{style_attribute} t="inlineStr">'
+        f'<is><t xml:space="preserve">{escape(value)}</t></is></c>'
+    )
+
+
+def _to_cell_values(values: Sequence) -> list:
+    """Excelに書き込める値（Pythonの値. 欠損値・無限大はNone）のリストに変換する"""
+    array = np.asarray(values)
+    if array.dtype.kind == "f":
+        return [v if math.isfinite(v) else None for v in array.tolist()]
+    if array.dtype.kind in ("i", "u", "b", "U"):
+        return array.tolist()
+    return [
+        None if v is None or (isinstance(v, float) and not math.isfinite(v)) else v
+        for v in array.tolist()
+    ]
+
+
+def _get_style(values: Sequence) -> int:
+    kind = np.asarray(values).dtype.kind
+    if kind in ("i", "u"):
+        return INTEGER_STYLE
+    if kind == "f":
+        return FLOAT_STYLE
+    return 0
+
+
+def _get_column_letter(index: int) -> str:
+    """0始まりの列番号をExcelの列名（A, B, ..., AA, ...）に変換する"""
+    letters = ""
+    index += 1
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def _get_column_width(name: str) -> int:
+    # 全角文字は半角2文字分の幅とする
+    return max(sum(1 if ord(c) < 128 else 2 for c in name) + 2, 12)
+
+
+def _to_absolute_reference(cell: str) -> str:
+    """セル番地（G50001）を絶対参照（$G$50001）に変換する"""
+    letters = cell.rstrip("0123456789")
+    return f"${letters}${cell[len(letters):]}"
+
+
+class ExcelExportError(Exception):
+    pass
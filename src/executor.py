@@ -1,76 +1,598 @@
-from params import ParametersReader
+from params import Parameters, ParametersReader, expand_parameter_items
+from loan import MonthlyLoanSchedule
 from calculator import (
+    AbstractCalculator,
     BuildingDeprecationCalculator,
     LoanCalculator,
     TaxCalculator,
     RealEstateCashCalculator,
+    RealEstateCashPerBuildingCalculator,
     RealEstatePriceSimuationCalculator,
+    RealEstateTaxAttributionCalculator,
     RealEstateSaleSimulationCalculator,
     CashFlowCalculator,
+    InvestmentMetricsCalculator,
+    calc_real_estate_cash_per_building,
+)
+from parameters_diff import ParametersDiff, get_item_fingerprints
+from checkpoint import fingerprint_json
+from stage_cache import StageCache
+from excel_export import (
+    frames_to_columns,
+    get_result_xlsx_file_name,
+    save_results_xlsx,
 )
 import pandas as pd
-from typing import Dict
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Tuple, Type
 import os
 
 
+class Stage(NamedTuple):
+    # 計算結果のデータ名
+    name: str
+    # 計算に利用するCalculator
+    calculator_class: Type[AbstractCalculator]
+    # 計算に必要な上流のデータ名
+    required_dfs: Tuple[str, ...]
+    # 物件ごとに独立した行を出力するか（物件の一部のみを再計算できる）
+    per_building: bool = False
+
+
+# シミュレーションの計算ステージ（実行順）
+STAGES = [
+    # 不動産所得を考慮しない税金のデータを作成
+    Stage("tax_data", TaxCalculator, ()),
+    # 減価償却のデータを作成
+    Stage("building_deprecation_data", BuildingDeprecationCalculator, (), True),
+    # ローン利息のデータを作成
+    Stage("loan_data", LoanCalculator, (), True),
+    # 物件ごとの不動産収支の計算
+    Stage(
+        "real_estate_cash_per_building_data",
+        RealEstateCashPerBuildingCalculator,
+        ("loan_data", "building_deprecation_data"),
+        True,
+    ),
+    # 不動産収支の計算（物件ごとの不動産収支を年ごとに合算する）
+    Stage(
+        "real_estate_cash_data",
+        RealEstateCashCalculator,
+        ("real_estate_cash_per_building_data",),
+    ),
+    # 不動産収支込みの税金のデータを作成
+    Stage("tax_data_with_real_estate_cash", TaxCalculator, ("real_estate_cash_data",)),
+    # 物件ごとの税額への影響のデータを作成
+    Stage(
+        "real_estate_tax_attribution_data",
+        RealEstateTaxAttributionCalculator,
+        ("real_estate_cash_per_building_data",),
+    ),
+    # 物件の価格シミュレーションのデータを作成
+    Stage("real_estate_price_data", RealEstatePriceSimuationCalculator, (), True),
+    # 物件の売却シミュレーションのデータを作成
+    Stage(
+        "real_estate_sale_data",
+        RealEstateSaleSimulationCalculator,
+        ("loan_data", "building_deprecation_data", "real_estate_price_data"),
+        True,
+    ),
+    # キャッシュフローのデータを作成
+    Stage(
+        "cash_flow_data",
+        CashFlowCalculator,
+        (
+            "tax_data",
+            "tax_data_with_real_estate_cash",
+            "real_estate_cash_data",
+            "real_estate_sale_data",
+        ),
+    ),
+    # 投資指標（IRR, NPV, エクイティマルチプル, 回収年数）のデータを作成
+    Stage("investment_metrics_data", InvestmentMetricsCalculator, ("cash_flow_data",)),
+]
+
+# 実行するステージの構成自体を変える項目（変更時は全ステージを再計算する）
+STRUCTURAL_ITEMS = {("other_parameters", "tax_only")}
+
+
+def get_stage(name: str) -> Stage:
+    for stage in STAGES:
+        if stage.name == name:
+            return stage
+    raise ExecutorError(f"stage is not exist! name is {name}")
+
+
+def get_stage_parameter_items(name: str) -> set:
+    """ステージが参照する入力項目（算出項目は算出元の項目に展開する）を返す
+
+    Args:
+        name (str): ステージ名
+
+    Returns:
+        set: (シート名, 項目名)の集合
+    """
+    stage = get_stage(name=name)
+    return expand_parameter_items(stage.calculator_class.parameter_items)
+
+
+def get_dependent_stage_names(changed_items: Iterable[Tuple[str, str]]) -> List[str]:
+    """変更された入力項目の影響を受けるステージ名を実行順で返す
+
+    Args:
+        changed_items (Iterable[Tuple[str, str]]): 変更された(シート名, 項目名)
+
+    Returns:
+        List[str]: 再計算が必要なステージ名
+    """
+    changed_items = set(changed_items)
+    if len(changed_items & STRUCTURAL_ITEMS) > 0:
+        return [stage.name for stage in STAGES]
+
+    dependent_names = []
+    for stage in STAGES:
+        is_changed = len(get_stage_parameter_items(stage.name) & changed_items) > 0
+        is_upstream_changed = any(
+            name in dependent_names for name in stage.required_dfs
+        )
+        if is_changed or is_upstream_changed:
+            dependent_names.append(stage.name)
+    return dependent_names
+
+
+def get_stage_keys(
+    parameters: Parameters, stage_names: Iterable[str] = None
+) -> Dict[str, str]:
+    """ステージのキャッシュのキー（参照する入力項目の値と, 上流のステージのキーのハッシュ値）を返す
+
+    キーが同じステージは, 同じ入力から計算されるため計算結果も同じとなる.
+
+    Args:
+        parameters (Parameters): パラメーター
+        stage_names (Iterable[str], optional): キーを返すステージ名. Defaults to None（全ステージ）.
+
+    Returns:
+        Dict[str, str]: ステージ名 -> キー
+    """
+    stage_items = {
+        stage.name: sorted(get_stage_parameter_items(stage.name)) for stage in STAGES
+    }
+    item_fingerprints = get_item_fingerprints(
+        parameters=parameters,
+        items={item for items in stage_items.values() for item in items},
+    )
+    keys = {}
+    for stage in STAGES:
+        keys[stage.name] = fingerprint_json(
+            {
+                "name": stage.name,
+                "items": [
+                    [*item, item_fingerprints[item]] for item in stage_items[stage.name]
+                ],
+                "upstream": [keys[name] for name in stage.required_dfs],
+            }
+        )
+    if stage_names is None:
+        return keys
+    return {name: keys[name] for name in stage_names}
+
+
+class StageEvent(NamedTuple):
+    """ステージの計算の完了"""
+
+    # 計算したステージ名
+    name: str
+    # ステージの計算結果
+    df: pd.DataFrame
+    # 計算を完了したステージ数と, 計算するステージの総数
+    completed_count: int
+    stage_count: int
+
+
+def iter_stages(
+    parameters: Parameters,
+    dfs: Dict[str, pd.DataFrame] = None,
+    stage_names: Iterable[str] = None,
+    building_names: Iterable[str] = None,
+    cache: StageCache = None,
+) -> Iterator[StageEvent]:
+    """指定したステージを実行順に計算し, ステージの計算が完了するごとにStageEventを返す
+
+    引数はexecute_stagesと同じ. 計算せずにdfsの結果を再利用するステージのイベントは返さない.
+    ジェネレーターを途中で閉じる（反復をやめる）と, 以降のステージは計算しない.
+
+    Yields:
+        StageEvent: 計算したステージ名と計算結果
+    """
+    stages, dfs = _get_stages_to_execute(parameters=parameters, dfs=dfs)
+    stage_names = None if stage_names is None else set(stage_names)
+    building_names = None if building_names is None else list(building_names)
+    stage_count = len(
+        [stage for stage in stages if stage_names is None or stage.name in stage_names]
+    )
+
+    keys = None if cache is None else get_stage_keys(parameters=parameters)
+
+    completed_count = 0
+    for stage in stages:
+        if stage_names is not None and stage.name not in stage_names:
+            if stage.name not in dfs:
+                raise ExecutorError(
+                    f"{stage.name} is not calculated! please set it to dfs or stage_names."
+                )
+            continue
+        if stage.per_building and building_names is not None and stage.name in dfs:
+            calculator = stage.calculator_class(
+                parameters=parameters.select_buildings(building_names=building_names)
+            )
+            df = calculator.calculate(
+                dfs={name: dfs[name] for name in stage.required_dfs}
+            )
+            dfs[stage.name] = _merge_building_rows(
+                base_df=dfs[stage.name], df=df, building_names=building_names
+            )
+        else:
+            calculator = stage.calculator_class(parameters=parameters)
+            required_dfs = {name: dfs[name] for name in stage.required_dfs}
+            if cache is None:
+                df = calculator.calculate(dfs=required_dfs)
+            else:
+                df = cache.get_or_calculate(
+                    name=stage.name,
+                    key=keys[stage.name],
+                    calculate=lambda: calculator.calculate(dfs=required_dfs),
+                )
+            dfs[stage.name] = df.copy(deep=True)
+        completed_count += 1
+        yield StageEvent(
+            name=stage.name,
+            df=dfs[stage.name],
+            completed_count=completed_count,
+            stage_count=stage_count,
+        )
+
+
+def execute_stages(
+    parameters: Parameters,
+    dfs: Dict[str, pd.DataFrame] = None,
+    stage_names: Iterable[str] = None,
+    building_names: Iterable[str] = None,
+    cache: StageCache = None,
+) -> Dict[str, pd.DataFrame]:
+    """指定したステージを実行順に計算する
+
+    指定していないステージの結果はdfsに含まれるものを再利用する.
+    building_namesを指定した場合、物件ごとのステージは指定した物件のみを計算し、dfsの他の物件の行と結合する.
+    cacheを指定した場合、キー（get_stage_keys）が同じステージはキャッシュの計算結果を再利用する
+    （dfsの計算結果はparametersから計算したものとする）.
+
+    Args:
+        parameters (Parameters): パラメーター
+        dfs (Dict[str, pd.DataFrame], optional): 計算済みのデータ. Defaults to None.
+        stage_names (Iterable[str], optional): 計算するステージ名. Defaults to None（全ステージ）.
+        building_names (Iterable[str], optional): 物件ごとのステージで計算する物件名. Defaults to None（全物件）.
+        cache (StageCache, optional): ステージの計算結果のキャッシュ. Defaults to None.
+
+    Returns:
+        Dict[str, pd.DataFrame]: 計算結果のデータ
+    """
+    _, results = _get_stages_to_execute(parameters=parameters, dfs=dfs)
+    for event in iter_stages(
+        parameters=parameters,
+        dfs=dfs,
+        stage_names=stage_names,
+        building_names=building_names,
+        cache=cache,
+    ):
+        results[event.name] = event.df
+    return results
+
+
+def _get_stages_to_execute(
+    parameters: Parameters, dfs: Dict[str, pd.DataFrame] = None
+) -> Tuple[List[Stage], Dict[str, pd.DataFrame]]:
+    """実行するステージと, 再利用する計算済みのデータ（コピー）を返す"""
+    dfs = {} if dfs is None else dict(dfs)
+
+    # 税金計算のみの場合は、不動産所得を考慮しない税金のデータのみ作成する
+    if parameters.is_only_tax_calculation():
+        dfs = {name: df for name, df in dfs.items() if name == "tax_data"}
+        return STAGES[:1], dfs
+    return STAGES, dfs
+
+
+def _merge_building_rows(
+    base_df: pd.DataFrame, df: pd.DataFrame, building_names: Iterable[str]
+) -> pd.DataFrame:
+    """base_dfの指定した物件の行をdfの行に置き換える（物件の並び順はbase_dfに合わせる）"""
+    building_orders = {
+        building_name: i for i, building_name in enumerate(base_df["物件名"].unique())
+    }
+    if any(building_name not in building_orders for building_name in building_names):
+        raise ExecutorError(
+            f"building is not exist in calculated data! building_names are {building_names}"
+        )
+    df = pd.concat(
+        [base_df[~base_df["物件名"].isin(building_names)], df], ignore_index=True
+    )
+    df = df.sort_values(
+        by="物件名", key=lambda s: s.map(building_orders), kind="stable"
+    )
+    return df.reset_index(drop=True)
+
+
+# 差分を出力するデータ（年ごとの値の差分とする）
+DIFF_DATA_NAMES = [
+    "real_estate_cash_data",
+    "tax_data_with_real_estate_cash",
+    "cash_flow_data",
+]
+# 基準・変更後のいずれかが税額のみの計算の場合に差分を出力するデータ
+TAX_ONLY_DIFF_DATA_NAMES = ["tax_data"]
+
+
+class DiffResult(NamedTuple):
+    # 基準のパラメーターの計算結果
+    base_dfs: Dict[str, pd.DataFrame]
+    # 変更後のパラメーターの計算結果
+    revised_dfs: Dict[str, pd.DataFrame]
+    # 変更後 - 基準の差分のデータ
+    delta_dfs: Dict[str, pd.DataFrame]
+    # パラメーターの差分
+    diff: ParametersDiff
+    # 再計算したステージ名
+    stage_names: List[str]
+
+
+def execute_diff(
+    base_parameters: Parameters,
+    revised_parameters: Parameters,
+    base_dfs: Dict[str, pd.DataFrame] = None,
+) -> DiffResult:
+    """基準のパラメーターの計算結果を再利用して変更後のパラメーターを計算し、差分のデータを作成する
+
+    パラメーターの区画（物件ごとの列, 物件以外のシート）のハッシュ値を比較し、
+    変更された入力項目に依存するステージのみを再計算する. 変更が物件情報のみの場合、
+    物件ごとのステージは変更された物件のみを再計算する.
+
+    Args:
+        base_parameters (Parameters): 基準のパラメーター
+        revised_parameters (Parameters): 変更後のパラメーター
+        base_dfs (Dict[str, pd.DataFrame], optional): 基準のパラメーターの計算結果. Defaults to None（計算する）.
+
+    Returns:
+        DiffResult: 差分の計算結果
+    """
+    diff = ParametersDiff(base=base_parameters, revised=revised_parameters)
+    if base_dfs is None:
+        base_dfs = execute_stages(parameters=base_parameters)
+
+    building_names = diff.get_partial_building_names()
+    stage_names = get_dependent_stage_names(diff.changed_items)
+    if diff.is_structural or base_parameters.is_only_tax_calculation():
+        stage_names = [stage.name for stage in STAGES]
+        revised_dfs = execute_stages(parameters=revised_parameters)
+    else:
+        # 物件ごとの不動産収支は変更された物件のみを再計算し、全物件の行を年ごとに合算する
+        revised_dfs = execute_stages(
+            parameters=revised_parameters,
+            dfs=base_dfs,
+            stage_names=stage_names,
+            building_names=building_names,
+        )
+    # 変更後が税額のみの計算の場合は税額のデータのみを計算するため, 計算したステージのみを返す
+    stage_names = [name for name in stage_names if name in revised_dfs]
+
+    delta_dfs = calc_delta_dfs(
+        base_parameters=base_parameters,
+        base_dfs=base_dfs,
+        revised_parameters=revised_parameters,
+        revised_dfs=revised_dfs,
+        building_names=building_names,
+    )
+    return DiffResult(
+        base_dfs=base_dfs,
+        revised_dfs=revised_dfs,
+        delta_dfs=delta_dfs,
+        diff=diff,
+        stage_names=stage_names,
+    )
+
+
+def calc_delta_dfs(
+    base_parameters: Parameters,
+    base_dfs: Dict[str, pd.DataFrame],
+    revised_parameters: Parameters,
+    revised_dfs: Dict[str, pd.DataFrame],
+    building_names: Iterable[str] = None,
+    per_building_delta_df: pd.DataFrame = None,
+) -> Dict[str, pd.DataFrame]:
+    """年ごと及び年・物件ごとの差分（変更後 - 基準）のデータを作成する
+
+    基準・変更後のいずれかが税額のみの計算の場合は, 不動産収支を含まない税額のデータの差分を作成する.
+
+    Args:
+        base_parameters (Parameters): 基準のパラメーター
+        base_dfs (Dict[str, pd.DataFrame]): 基準のパラメーターの計算結果
+        revised_parameters (Parameters): 変更後のパラメーター
+        revised_dfs (Dict[str, pd.DataFrame]): 変更後のパラメーターの計算結果
+        building_names (Iterable[str], optional): 物件ごとの差分を作成する物件名. Defaults to None（全物件）.
+        per_building_delta_df (pd.DataFrame, optional): 計算済みの物件ごとの不動産収支の差分. Defaults to None.
+
+    Returns:
+        Dict[str, pd.DataFrame]: "<データ名>_diff" -> 差分のデータ
+    """
+    names = DIFF_DATA_NAMES
+    if (
+        base_parameters.is_only_tax_calculation()
+        or revised_parameters.is_only_tax_calculation()
+    ):
+        names = TAX_ONLY_DIFF_DATA_NAMES
+
+    delta_dfs = {}
+    for name in names:
+        if name not in base_dfs or name not in revised_dfs:
+            raise ExecutorError(f"{name} is not calculated! cannot make the diff.")
+        base_df = _get_year_indexed_df(base_dfs[name])
+        revised_df = _get_year_indexed_df(revised_dfs[name])
+        delta_dfs[f"{name}_diff"] = revised_df.subtract(base_df, fill_value=0)
+
+    # 不動産収支は物件ごとの差分も作成する（物件を指定した場合は変更された物件のみ）
+    if per_building_delta_df is None:
+        per_building_delta_df = calc_real_estate_cash_per_building_delta(
+            base_parameters=base_parameters,
+            base_dfs=base_dfs,
+            revised_parameters=revised_parameters,
+            revised_dfs=revised_dfs,
+            building_names=building_names,
+        )
+    if per_building_delta_df is not None:
+        delta_dfs["real_estate_cash_data_per_building_diff"] = per_building_delta_df
+    return delta_dfs
+
+
+def calc_real_estate_cash_per_building_delta(
+    base_parameters: Parameters,
+    base_dfs: Dict[str, pd.DataFrame],
+    revised_parameters: Parameters,
+    revised_dfs: Dict[str, pd.DataFrame],
+    building_names: Iterable[str] = None,
+) -> pd.DataFrame:
+    """年・物件ごとの不動産収支の差分（変更後 - 基準）を作成する
+
+    Returns:
+        pd.DataFrame: (年, 物件名)をインデックスとした差分. 計算に必要なデータがない場合はNone
+    """
+    building_names = None if building_names is None else list(building_names)
+    if all(
+        "real_estate_cash_per_building_data" in dfs for dfs in (base_dfs, revised_dfs)
+    ):
+        base_df, revised_df = [
+            _select_building_rows(
+                df=dfs["real_estate_cash_per_building_data"],
+                building_names=building_names,
+            )
+            for dfs in (base_dfs, revised_dfs)
+        ]
+        return revised_df.subtract(base_df, fill_value=0)
+
+    required_names = ["loan_data", "building_deprecation_data"]
+    if not all(name in base_dfs and name in revised_dfs for name in required_names):
+        return None
+    base_df, revised_df = [
+        calc_real_estate_cash_per_building(
+            parameters=(
+                parameters
+                if building_names is None
+                else parameters.select_buildings(building_names=building_names)
+            ),
+            loan_df=dfs["loan_data"],
+            building_deprecation_df=dfs["building_deprecation_data"],
+        ).set_index(["年", "物件名"])
+        for parameters, dfs in [
+            (base_parameters, base_dfs),
+            (revised_parameters, revised_dfs),
+        ]
+    ]
+    return revised_df.subtract(base_df, fill_value=0)
+
+
+def _select_building_rows(
+    df: pd.DataFrame, building_names: List[str] = None
+) -> pd.DataFrame:
+    """物件ごとの不動産収支から指定した物件の行を選び, (年, 物件名)をインデックスとして年, 物件名の順に並べる"""
+    if building_names is not None:
+        building_orders = {
+            building_name: i for i, building_name in enumerate(building_names)
+        }
+        df = df[df["物件名"].isin(building_names)].sort_values(
+            by="物件名", key=lambda s: s.map(building_orders), kind="stable"
+        )
+    return df.sort_values(by="年", kind="stable").set_index(["年", "物件名"])
+
+
+def _get_year_indexed_df(df: pd.DataFrame) -> pd.DataFrame:
+    if "年" in df.columns:
+        df = df.set_index("年")
+    return df.select_dtypes("number")
+
+
 class Executor:
     def __init__(self, parameter_file_path: str, result_folder: str) -> None:
         self.__parameter_file_path = parameter_file_path
         self.__result_folder = result_folder
 
-    def execute(self) -> Dict[str, pd.DataFrame]:
-        dfs = {}
+    def read_parameters(self) -> Parameters:
+        reader = ParametersReader(params_file_path=self.__parameter_file_path)
+        return reader.read_params()
 
+    def execute(self, parameters: Parameters = None) -> Dict[str, pd.DataFrame]:
         # パラメーターファイルの読み込みを行う
-        reader = ParametersReader(params_file_path=self.__parameter_file_path)
-        parameters = reader.read_params()
-
-        # 不動産所得を考慮しない税金のデータを作成
-        tc = TaxCalculator(parameters=parameters)
-        df = tc.calculate()
-        dfs["tax_data"] = df.copy(deep=True)
-
-        # 税金計算のみの場合は、ここで処理が終了
-        if parameters.is_only_tax_calculation():
-            return dfs
-
-        # 減価償却のデータを作成
-        bdc = BuildingDeprecationCalculator(parameters=parameters)
-        df = bdc.calculate()
-        dfs["building_deprecation_data"] = df.copy(deep=True)
-
-        # ローン利息のデータを作成
-        lc = LoanCalculator(parameters=parameters)
-        df = lc.calculate()
-        dfs["loan_data"] = df.copy(deep=True)
-
-        # 不動産収支の計算
-        recc = RealEstateCashCalculator(parameters=parameters)
-        df = recc.calculate(dfs=dfs)
-        dfs["real_estate_cash_data"] = df.copy(deep=True)
-
-        # 不動産収支込みの税金のデータを作成
-        df = tc.calculate(dfs=dfs)
-        dfs["tax_data_with_real_estate_cash"] = df.copy(deep=True)
-
-        # 物件の価格シミュレーションのデータを作成
-        repc = RealEstatePriceSimuationCalculator(parameters=parameters)
-        df = repc.calculate()
-        dfs["real_estate_price_data"] = df.copy(deep=True)
-
-        # 物件の売却シミュレーションのデータを作成
-        resc = RealEstateSaleSimulationCalculator(parameters=parameters)
-        df = resc.calculate(dfs=dfs)
-        dfs["real_estate_sale_data"] = df.copy(deep=True)
-
-        # キャッシュフローのデータを作成
-        cfc = CashFlowCalculator(parameters=parameters)
-        df = cfc.calculate(dfs=dfs)
-        dfs["cash_flow_data"] = df.copy(deep=True)
-
-        return dfs
-
-    def save_results(self, dfs: Dict[str, pd.DataFrame]) -> Dict[str, str]:
+        if parameters is None:
+            parameters = self.read_parameters()
+
+        return execute_stages(parameters=parameters)
+
+    def iter_execute(self, parameters: Parameters = None) -> Iterator[StageEvent]:
+        """全ステージを計算し, ステージの計算が完了するごとにStageEventを返す（途中で閉じると以降は計算しない）"""
+        if parameters is None:
+            parameters = self.read_parameters()
+
+        return iter_stages(parameters=parameters)
+
+    def calc_monthly_loan_schedule(
+        self, parameters: Parameters = None
+    ) -> MonthlyLoanSchedule:
+        """月単位のローン返済スケジュールを計算する（返済回数ごとの行はget_rowsで必要な物件・月のみ展開する）"""
+        if parameters is None:
+            parameters = self.read_parameters()
+
+        return LoanCalculator(parameters=parameters).calc_monthly_schedule()
+
+    def execute_diff(
+        self,
+        revised_parameter_file_path: str,
+        base_dfs: Dict[str, pd.DataFrame] = None,
+    ) -> DiffResult:
+        """パラメーターファイルを基準とし、変更後のパラメーターファイルとの差分を計算する
+
+        Args:
+            revised_parameter_file_path (str): 変更後のパラメーターファイルのパス
+            base_dfs (Dict[str, pd.DataFrame], optional): 基準の計算結果. Defaults to None（計算する）.
+
+        Returns:
+            DiffResult: 差分の計算結果
+        """
+        reader = ParametersReader(params_file_path=revised_parameter_file_path)
+        return execute_diff(
+            base_parameters=self.read_parameters(),
+            revised_parameters=reader.read_params(),
+            base_dfs=base_dfs,
+        )
+
+    def save_results(
+        self, dfs: Dict[str, pd.DataFrame], file_format: str = "csv"
+    ) -> Dict[str, str]:
+        """計算結果を保存する
+
+        Args:
+            dfs (Dict[str, pd.DataFrame]): 計算結果
+            file_format (str, optional): "csv"（データごとのCSV）または"xlsx"（データごとのシートからなる1つのExcelファイル）. Defaults to "csv".
+
+        Returns:
+            Dict[str, str]: データ名 -> 保存したファイルのパス
+        """
+        if file_format == "xlsx":
+            file_path = save_results_xlsx(
+                results=frames_to_columns(dfs=dfs),
+                file_path=os.path.join(
+                    self.__result_folder,
+                    get_result_xlsx_file_name(self.__parameter_file_path),
+                ),
+            )
+            return {name: file_path for name in dfs}
+        if file_format != "csv":
+            raise ExecutorError(f"file format is not supported! value is {file_format}")
+
         os.makedirs(self.__result_folder, exist_ok=True)
         file_paths = {}
         for name, df in dfs.items():
@@ -78,3 +600,7 @@ class Executor:
             df.to_csv(file_path)
             file_paths[name] = file_path
         return file_paths
+
+
+class ExecutorError(Exception):
+    pass
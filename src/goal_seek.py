@@ -0,0 +1,317 @@
+from params import Parameters
+from executor import execute_stages, get_dependent_stage_names
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import numpy as np
+from typing import Dict, List
+
+
+class TargetMetric:
+    """ゴールシークの対象とする指標（計算結果データの1セル）
+
+    Args:
+        data_name (str): データ名（cash_flow_data, real_estate_sale_dataなど）
+        column (str): 列名
+        year (int, optional): 年. 指定しない場合は最終年の値を対象とする.
+            cash_flow_dataは西暦, real_estate_sale_dataは年数（1始まり）で指定する.
+        building_name (str, optional): 物件名. 物件ごとのデータの場合に指定する.
+    """
+
+    def __init__(
+        self,
+        data_name: str = "cash_flow_data",
+        column: str = "差額累計",
+        year: int = None,
+        building_name: str = None,
+    ) -> None:
+        self.data_name = data_name
+        self.column = column
+        self.year = year
+        self.building_name = building_name
+
+    def get_value(self, dfs: Dict[str, pd.DataFrame]) -> float:
+        if self.data_name not in dfs:
+            raise GoalSeekError(f"{self.data_name} is not calculated!")
+        df = dfs[self.data_name]
+        if "物件名" in df.columns:
+            if self.building_name is None:
+                raise GoalSeekError(
+                    f"please set building_name to get the metric of {self.data_name}!"
+                )
+            df = df[df["物件名"] == self.building_name]
+        years = df["年"] if "年" in df.columns else df.index.to_series()
+        year = years.max() if self.year is None else self.year
+        values = df[(years == year).values][self.column].values
+        if len(values) != 1:
+            raise GoalSeekError(
+                f"target metric is not unique! data_name is {self.data_name}, year is {year} and size is {len(values)}"
+            )
+        return float(values[0])
+
+
+class GoalSeekResult:
+    """ゴールシークの結果
+
+    valueは指標が目標値以上となる側の探索区間端の値（secant法では最終推定値）となる.
+    """
+
+    def __init__(
+        self,
+        value: float,
+        metric_value: float,
+        lower: float,
+        upper: float,
+        iterations: int,
+        evaluations: int,
+        converged: bool,
+    ) -> None:
+        self.value = value
+        self.metric_value = metric_value
+        self.lower = lower
+        self.upper = upper
+        self.iterations = iterations
+        self.evaluations = evaluations
+        self.converged = converged
+
+
+class GoalSeeker:
+    """入力項目を1つ変化させ、指標が目標値となる値を求める
+
+    対象の入力項目に依存するステージのみを再計算し、それ以外のステージの結果は基準の計算結果を再利用する.
+
+    Args:
+        parameters (Parameters): 基準のパラメーター
+        item (str): 変化させる入力項目名
+        metric (TargetMetric): 対象の指標
+        target_value (float, optional): 目標値. Defaults to 0.
+        building_name (str, optional): 物件名. 物件情報の項目の場合に指定する.
+        batch_size (int, optional): 1回の探索で評価する候補点の数. Defaults to 4.
+        max_workers (int, optional): 候補点を並列評価するプロセス数. Defaults to None（逐次評価）.
+    """
+
+    def __init__(
+        self,
+        parameters: Parameters,
+        item: str,
+        metric: TargetMetric,
+        target_value: float = 0,
+        building_name: str = None,
+        batch_size: int = 4,
+        max_workers: int = None,
+    ) -> None:
+        if batch_size < 1:
+            raise GoalSeekError(f"batch_size must be positive! value is {batch_size}")
+        self.__parameters = parameters
+        self.__item = item
+        self.__metric = metric
+        self.__target_value = target_value
+        self.__building_name = building_name
+        self.__batch_size = batch_size
+        self.__max_workers = max_workers
+
+        # 基準の計算結果と, 対象の入力項目に依存するステージを算出しておく
+        sheet_name = parameters.get_item_sheet_name(
+            item=item, building_name=building_name
+        )
+        self.__stage_names = get_dependent_stage_names([(sheet_name, item)])
+        self.__base_dfs = execute_stages(parameters=parameters)
+        self.__is_integer_item = isinstance(
+            parameters.get_value(item=item, building_name=building_name),
+            (int, np.integer),
+        )
+        self.__is_integer = False
+        self.__evaluations = 0
+        self.__pool = None
+
+    def get_dependent_stage_names(self) -> List[str]:
+        return list(self.__stage_names)
+
+    def evaluate(self, values: List[float]) -> List[float]:
+        """候補値ごとに指標と目標値の差を計算する
+
+        Args:
+            values (List[float]): 入力項目の候補値
+
+        Returns:
+            List[float]: 指標 - 目標値
+        """
+        args = self.__get_evaluation_args()
+        if self.__pool is not None and len(values) > 1:
+            metric_values = list(self.__pool.map(_evaluate_in_worker, values))
+        else:
+            metric_values = [_evaluate_candidate(value, *args) for value in values]
+        self.__evaluations += len(values)
+        return [metric_value - self.__target_value for metric_value in metric_values]
+
+    def solve(
+        self,
+        lower: float,
+        upper: float,
+        method: str = "bisection",
+        xtol: float = 1.0,
+        ftol: float = 0.0,
+        max_iterations: int = 100,
+    ) -> GoalSeekResult:
+        """指標が目標値となる入力項目の値を求める
+
+        Args:
+            lower (float): 探索範囲の下限（secant法では1点目の初期値）
+            upper (float): 探索範囲の上限（secant法では2点目の初期値）
+            method (str, optional): bisection（区間を分割する二分法）またはsecant. Defaults to "bisection".
+            xtol (float, optional): 入力項目の許容誤差. Defaults to 1.0.
+                整数の項目で1以上を指定した場合は, 候補値を整数に丸めて探索する.
+            ftol (float, optional): 指標の許容誤差. Defaults to 0.0.
+            max_iterations (int, optional): 最大探索回数. Defaults to 100.
+
+        Returns:
+            GoalSeekResult: 探索結果
+        """
+        if lower >= upper:
+            raise GoalSeekError(
+                f"lower must be smaller than upper! lower is {lower} and upper is {upper}"
+            )
+        if method == "bisection":
+            solve_method = self.__solve_bisection
+        elif method == "secant":
+            solve_method = self.__solve_secant
+        else:
+            raise GoalSeekError(f"method is not supported! method is {method}")
+        self.__evaluations = 0
+        self.__is_integer = self.__is_integer_item and xtol >= 1
+
+        # 並列評価する場合は, 探索中はワーカープロセスを使い回す
+        if self.__max_workers is None or self.__max_workers <= 1:
+            return solve_method(lower, upper, xtol, ftol, max_iterations)
+        with ProcessPoolExecutor(
+            max_workers=self.__max_workers,
+            initializer=_init_worker,
+            initargs=self.__get_evaluation_args(),
+        ) as pool:
+            self.__pool = pool
+            try:
+                return solve_method(lower, upper, xtol, ftol, max_iterations)
+            finally:
+                self.__pool = None
+
+    def __solve_bisection(
+        self, lower: float, upper: float, xtol: float, ftol: float, max_iterations: int
+    ) -> GoalSeekResult:
+        f_lower, f_upper = self.evaluate([lower, upper])
+        if f_lower * f_upper > 0:
+            raise GoalSeekError(
+                f"target value is not bracketed! metric differences are {f_lower} and {f_upper}"
+            )
+
+        # 区間内の候補点をまとめて評価し, 符号が変わる小区間に探索範囲を狭める
+        iterations = 0
+        while (
+            upper - lower > xtol
+            and min(abs(f_lower), abs(f_upper)) > ftol
+            and iterations < max_iterations
+        ):
+            iterations += 1
+            candidates = self.__make_candidates(lower, upper)
+            if len(candidates) == 0:
+                break
+            diffs = self.evaluate(candidates)
+            xs = [lower] + candidates + [upper]
+            fs = [f_lower] + diffs + [f_upper]
+            for i in range(len(xs) - 1):
+                if fs[i] * fs[i + 1] <= 0:
+                    lower, upper = xs[i], xs[i + 1]
+                    f_lower, f_upper = fs[i], fs[i + 1]
+                    break
+
+        converged = upper - lower <= xtol or min(abs(f_lower), abs(f_upper)) <= ftol
+        if abs(f_lower) <= ftol or (abs(f_upper) > ftol and f_lower >= 0):
+            value, diff = lower, f_lower
+        else:
+            value, diff = upper, f_upper
+        return GoalSeekResult(
+            value=value,
+            metric_value=diff + self.__target_value,
+            lower=lower,
+            upper=upper,
+            iterations=iterations,
+            evaluations=self.__evaluations,
+            converged=converged,
+        )
+
+    def __solve_secant(
+        self, x0: float, x1: float, xtol: float, ftol: float, max_iterations: int
+    ) -> GoalSeekResult:
+        f0, f1 = self.evaluate([x0, x1])
+        iterations = 0
+        converged = abs(f1) <= ftol
+        while not converged and iterations < max_iterations:
+            iterations += 1
+            if f1 == f0:
+                break
+            x2 = x1 - f1 * (x1 - x0) / (f1 - f0)
+            if self.__is_integer:
+                x2 = int(round(x2))
+            (f2,) = self.evaluate([x2])
+            x0, f0, x1, f1 = x1, f1, x2, f2
+            converged = abs(x1 - x0) <= xtol or abs(f1) <= ftol
+        return GoalSeekResult(
+            value=x1,
+            metric_value=f1 + self.__target_value,
+            lower=min(x0, x1),
+            upper=max(x0, x1),
+            iterations=iterations,
+            evaluations=self.__evaluations,
+            converged=converged,
+        )
+
+    def __get_evaluation_args(self) -> tuple:
+        return (
+            self.__parameters,
+            self.__item,
+            self.__building_name,
+            self.__metric,
+            self.__base_dfs,
+            self.__stage_names,
+        )
+
+    def __make_candidates(self, lower: float, upper: float) -> List[float]:
+        candidates = np.linspace(lower, upper, self.__batch_size + 2)[1:-1]
+        if self.__is_integer:
+            candidates = np.unique(np.round(candidates).astype(np.int64))
+        return [
+            candidate.item() for candidate in candidates if lower < candidate < upper
+        ]
+
+
+def _evaluate_candidate(
+    value: float,
+    parameters: Parameters,
+    item: str,
+    building_name: str,
+    metric: TargetMetric,
+    base_dfs: Dict[str, pd.DataFrame],
+    stage_names: List[str],
+) -> float:
+    candidate_parameters = parameters.with_value(
+        item=item, value=value, building_name=building_name
+    )
+    dfs = execute_stages(
+        parameters=candidate_parameters, dfs=base_dfs, stage_names=stage_names
+    )
+    return metric.get_value(dfs=dfs)
+
+
+# 並列評価時のワーカープロセスごとの評価条件
+_worker_args = None
+
+
+def _init_worker(*args) -> None:
+    global _worker_args
+    _worker_args = args
+
+
+def _evaluate_in_worker(value: float) -> float:
+    return _evaluate_candidate(value, *_worker_args)
+
+
+class GoalSeekError(Exception):
+    pass
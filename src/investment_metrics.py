@@ -0,0 +1,469 @@
+"""キャッシュフローの投資指標（IRR, NPV, エクイティマルチプル, 回収年数）の一括計算
+
+年ごとの収支差額（シナリオ・パス数 x 年数）と初期投資金額から, シナリオ・パスごとの投資指標を配列演算でまとめて計算する.
+収支差額は1年目以降の年末の収支とし, 物件ごとの初期投資金額は購入年の年初（初年度に購入する物件はシミュレーション開始時の0年目,
+以降の年に購入する物件は前年の年末）の支出とする.
+IRRは収束していないシナリオ・パスのみを対象に, 区間を保ちながらNewton法（区間外に出る場合は二分法）で反復する.
+
+計算結果キューブ（スイープ・確率シミュレーション）の投資指標をチャンク単位で計算し, 新しいキューブに書き込む.
+
+    python investment_metrics.py <cube directory> <output directory> <parameter file path> --discount-rates 0.03 0.05
+"""
+
+from result_cube import METRIC_AXIS, ResultCube
+from typing import TYPE_CHECKING, Dict, Sequence, Tuple
+import argparse
+import numpy as np
+
+if TYPE_CHECKING:
+    # 軽量な計算経路（array_pipeline）でpandasを読み込まないため, paramsは型の参照のみとする
+    # sweepはexecutor（InvestmentMetricsCalculatorを含むcalculator）を読み込むため, 同じく型の参照のみとする
+    from params import Parameters
+    from sweep import ScenarioSpace
+
+# NPVを計算する割引率（年率）
+DEFAULT_DISCOUNT_RATES = (0.03, 0.05, 0.07)
+
+IRR_COLUMN = "IRR"
+EQUITY_MULTIPLE_COLUMN = "エクイティマルチプル"
+PAYBACK_COLUMN = "回収年数"
+
+# IRRを探索する区間（下限は割引係数（1 + IRR）^-年数がオーバーフローしない範囲とする）
+IRR_LOWER = -0.9
+IRR_UPPER = 10.0
+IRR_MAX_ITERATIONS = 100
+IRR_TOLERANCE = 1e-10
+
+# 初期投資金額を変化させるスイープ軸の項目
+INITIAL_INVESTMENT_ITEM = "初期投資金額"
+
+
+def get_npv_column(discount_rate: float) -> str:
+    return f"NPV（{discount_rate * 100:g}%）"
+
+
+def get_metric_columns(discount_rates: Sequence[float] = DEFAULT_DISCOUNT_RATES):
+    """calc_investment_metricsが返す指標の列名（順序どおり）"""
+    return [
+        IRR_COLUMN,
+        *[get_npv_column(discount_rate) for discount_rate in discount_rates],
+        EQUITY_MULTIPLE_COLUMN,
+        PAYBACK_COLUMN,
+    ]
+
+
+def calc_investment_metrics(
+    cash_flows: np.ndarray,
+    initial_investments,
+    discount_rates: Sequence[float] = DEFAULT_DISCOUNT_RATES,
+    later_investments: np.ndarray = None,
+) -> Dict[str, np.ndarray]:
+    """シナリオ・パスごとの投資指標を計算する
+
+    1年目以降の投資金額がある場合, IRR・NPV・回収年数はその年の収支差額から投資金額を引いて計算し,
+    エクイティマルチプルは収支差額の合計を投資金額の合計で割る.
+
+    Args:
+        cash_flows (np.ndarray): 年ごとの収支差額（シナリオ・パス数 x 年数. 1次元の場合は1シナリオ）
+        initial_investments: 0年目の初期投資金額（スカラーまたはシナリオ・パス数の配列）
+        discount_rates (Sequence[float], optional): NPVの割引率. Defaults to DEFAULT_DISCOUNT_RATES.
+        later_investments (np.ndarray, optional): 1年目以降の年末の投資金額（年数, またはシナリオ・パス数 x 年数の配列）. Defaults to None.
+
+    Returns:
+        Dict[str, np.ndarray]: 指標名 -> シナリオ・パスごとの値（計算できない場合はnan）
+    """
+    cash_flows, initial_investments = _to_batch(cash_flows, initial_investments)
+    # 1年目以降の投資金額がない場合は, 0年目の初期投資金額のみで計算する
+    total_cash_flows, total_investments = cash_flows, initial_investments
+    if later_investments is not None and np.any(later_investments):
+        later_investments = np.broadcast_to(
+            np.asarray(later_investments, dtype=float), cash_flows.shape
+        )
+        total_investments = initial_investments + later_investments.sum(axis=1)
+        cash_flows = cash_flows - later_investments
+    metrics = {
+        IRR_COLUMN: calc_irr_array(
+            cash_flows=cash_flows, initial_investments=initial_investments
+        )
+    }
+    npvs = calc_npv_array(
+        cash_flows=cash_flows,
+        initial_investments=initial_investments,
+        discount_rates=discount_rates,
+    )
+    for i, discount_rate in enumerate(discount_rates):
+        metrics[get_npv_column(discount_rate)] = npvs[:, i]
+    metrics[EQUITY_MULTIPLE_COLUMN] = calc_equity_multiple_array(
+        cash_flows=total_cash_flows, initial_investments=total_investments
+    )
+    metrics[PAYBACK_COLUMN] = calc_payback_years_array(
+        cash_flows=cash_flows, initial_investments=initial_investments
+    )
+    return metrics
+
+
+def calc_npv_array(
+    cash_flows: np.ndarray, initial_investments, discount_rates: Sequence[float]
+) -> np.ndarray:
+    """割引率ごとのNPV（シナリオ・パス数 x 割引率の数）を返す"""
+    cash_flows, initial_investments = _to_batch(cash_flows, initial_investments)
+    periods = np.arange(1, cash_flows.shape[1] + 1)
+    discounts = (1 + np.asarray(discount_rates, dtype=float)) ** -periods[:, None]
+    return cash_flows @ discounts - initial_investments[:, None]
+
+
+def calc_irr_array(
+    cash_flows: np.ndarray,
+    initial_investments,
+    max_iterations: int = IRR_MAX_ITERATIONS,
+    tolerance: float = IRR_TOLERANCE,
+) -> np.ndarray:
+    """IRR（NPVが0となる割引率）を返す
+
+    探索区間の両端でNPVの符号が変わらない（IRRが存在しない, または区間外）シナリオ・パスと,
+    max_iterations回で収束しないシナリオ・パスはnanとする. 区間内に複数のIRRがある場合はそのうちの1つを返す.
+
+    Args:
+        cash_flows (np.ndarray): 年ごとの収支差額（シナリオ・パス数 x 年数）
+        initial_investments: 初期投資金額（スカラーまたはシナリオ・パス数の配列）
+        max_iterations (int, optional): 最大の反復回数. Defaults to IRR_MAX_ITERATIONS.
+        tolerance (float, optional): 収束とみなすIRRの変化量. Defaults to IRR_TOLERANCE.
+
+    Returns:
+        np.ndarray: シナリオ・パスごとのIRR
+    """
+    cash_flows, initial_investments = _to_batch(cash_flows, initial_investments)
+    flows = np.concatenate([-initial_investments[:, None], cash_flows], axis=1)
+    count = len(flows)
+    irrs = np.full(count, np.nan)
+    lowers = np.full(count, IRR_LOWER)
+    uppers = np.full(count, IRR_UPPER)
+    lower_signs = np.sign(_calc_npv_and_derivative(flows, lowers)[0])
+    upper_signs = np.sign(_calc_npv_and_derivative(flows, uppers)[0])
+
+    # 区間の両端でNPVの符号が異なるもののみを反復し, 収束したものから反復の対象を除く
+    active = np.flatnonzero(lower_signs * upper_signs < 0)
+    rates = np.full(count, 0.1)
+    for _ in range(max_iterations):
+        if len(active) == 0:
+            break
+        rate = rates[active]
+        npvs, derivatives = _calc_npv_and_derivative(flows[active], rate)
+
+        # NPVの符号が下限と同じ場合は下限を, 異なる場合は上限を更新する
+        is_lower_side = np.sign(npvs) == lower_signs[active]
+        lower = np.where(is_lower_side, rate, lowers[active])
+        upper = np.where(is_lower_side, uppers[active], rate)
+        lowers[active], uppers[active] = lower, upper
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            newton_rate = rate - npvs / derivatives
+        is_newton = (
+            np.isfinite(newton_rate) & (lower < newton_rate) & (newton_rate < upper)
+        )
+        next_rate = np.where(is_newton, newton_rate, (lower + upper) / 2)
+        next_rate = np.where(npvs == 0, rate, next_rate)
+        is_converged = (np.abs(next_rate - rate) <= tolerance) | (
+            upper - lower <= tolerance
+        )
+        rates[active] = next_rate
+        irrs[active[is_converged]] = next_rate[is_converged]
+        active = active[~is_converged]
+    return irrs
+
+
+def calc_equity_multiple_array(
+    cash_flows: np.ndarray, initial_investments
+) -> np.ndarray:
+    """エクイティマルチプル（収支差額の合計 / 初期投資金額. 初期投資金額が0以下の場合はnan）を返す"""
+    cash_flows, initial_investments = _to_batch(cash_flows, initial_investments)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(
+            initial_investments > 0,
+            cash_flows.sum(axis=1) / initial_investments,
+            np.nan,
+        )
+
+
+def calc_payback_years_array(cash_flows: np.ndarray, initial_investments) -> np.ndarray:
+    """回収年数（収支差額の累計が初期投資金額以上となる最初の年数. 回収できない場合はnan）を返す"""
+    cash_flows, initial_investments = _to_batch(cash_flows, initial_investments)
+    is_recovered = np.cumsum(cash_flows, axis=1) >= initial_investments[:, None]
+    return np.where(is_recovered.any(axis=1), is_recovered.argmax(axis=1) + 1.0, np.nan)
+
+
+def get_initial_investment(parameters: "Parameters") -> float:
+    """全物件の初期投資金額の合計を返す"""
+    return float(
+        sum(
+            parameters.get_value(item=INITIAL_INVESTMENT_ITEM, building_name=name)
+            for name in parameters.get_building_names()
+        )
+    )
+
+
+def calc_investment_schedule(
+    investments, purchase_years, years: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """物件ごとの初期投資金額を購入年の年初の支出とし, 0年目の初期投資金額と1年目以降の年末の投資金額に振り分ける
+
+    シミュレーション開始年以前に購入した物件は0年目, 最終年より後に購入する物件は最終年の年末の支出とする.
+
+    Args:
+        investments: 物件ごとの初期投資金額（物件数, または物件数 x シナリオ数の配列）
+        purchase_years: 物件ごとの購入年（物件数の配列）
+        years (np.ndarray): シミュレーション年（収支差額の年）
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: 0年目の初期投資金額（スカラー, またはシナリオ数）と,
+            1年目以降の年末の投資金額（年数, またはシナリオ数 x 年数）
+    """
+    investments = np.asarray(investments, dtype=float)
+    periods = np.clip(
+        np.asarray(purchase_years, dtype=np.int64) - years[0], 0, len(years)
+    )
+    # 0年目からの年数の位置に物件ごとの初期投資金額を加える
+    outlays = np.zeros(investments.shape[1:] + (len(years) + 1,))
+    rows = np.indices(investments.shape[1:])
+    for investment, period in zip(investments, periods):
+        np.add.at(outlays, (*rows, period), investment)
+    return outlays[..., 0], outlays[..., 1:]
+
+
+def get_investment_schedule(
+    parameters: "Parameters",
+) -> Tuple[np.ndarray, np.ndarray]:
+    """全物件の初期投資金額を購入年に振り分け, 0年目の初期投資金額と1年目以降の年末の投資金額を返す"""
+    building_names = parameters.get_building_names()
+    return calc_investment_schedule(
+        investments=[
+            parameters.get_value(item=INITIAL_INVESTMENT_ITEM, building_name=name)
+            for name in building_names
+        ],
+        purchase_years=[
+            parameters.get_purchase_date(name).year for name in building_names
+        ],
+        years=np.arange(
+            parameters.get_simulation_start_year(),
+            parameters.get_simulation_end_year() + 1,
+        ),
+    )
+
+
+def get_scenario_investment_schedule(
+    parameters: "Parameters", space: "ScenarioSpace", indices: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """シナリオごとに全物件の初期投資金額を購入年に振り分ける（スイープ軸で初期投資金額を変化させる場合に対応する）
+
+    物件の購入年は基準のパラメーターの契約日とする.
+
+    Args:
+        parameters (Parameters): 基準のパラメーター
+        space (ScenarioSpace): シナリオ空間
+        indices (np.ndarray): シナリオ番号
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: シナリオごとの0年目の初期投資金額（シナリオ数）と,
+            1年目以降の年末の投資金額（購入年がすべて初年度以前の場合は年数, それ以外はシナリオ数 x 年数）
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    building_names = parameters.get_building_names()
+    investments = {
+        name: np.full(
+            len(indices),
+            parameters.get_value(item=INITIAL_INVESTMENT_ITEM, building_name=name),
+            dtype=float,
+        )
+        for name in building_names
+    }
+    # シナリオ番号を軸ごとの値の位置に分解する（最後の軸が最も速く変化する）
+    positions = np.unravel_index(indices, [len(axis.values) for axis in space.axes])
+    for axis, position in zip(space.axes, positions):
+        if axis.item == "契約日":
+            raise InvestmentMetricsError(
+                "sweep axis of purchase date is not supported in investment metrics!"
+            )
+        if axis.item != INITIAL_INVESTMENT_ITEM:
+            continue
+        if axis.building_name not in investments:
+            raise InvestmentMetricsError(
+                f"building is not exist! building_name is {axis.building_name}"
+            )
+        investments[axis.building_name] = np.asarray(axis.values, dtype=float)[position]
+
+    years = np.arange(
+        parameters.get_simulation_start_year(),
+        parameters.get_simulation_end_year() + 1,
+    )
+    purchase_years = np.array(
+        [parameters.get_purchase_date(name).year for name in building_names]
+    )
+    # 全ての物件を初年度以前に購入する場合は, 1年目以降の投資金額（0）をシナリオごとに持たない
+    if (purchase_years <= years[0]).all():
+        return np.sum(list(investments.values()), axis=0), np.zeros(len(years))
+    return calc_investment_schedule(
+        investments=list(investments.values()),
+        purchase_years=purchase_years,
+        years=years,
+    )
+
+
+def write_metrics_cube(
+    cube: ResultCube,
+    directory: str,
+    initial_investments,
+    discount_rates: Sequence[float] = DEFAULT_DISCOUNT_RATES,
+    column: str = "収支差額",
+    chunk_size: int = 10000,
+    later_investments: np.ndarray = None,
+) -> ResultCube:
+    """計算結果キューブ（先頭の軸 x 年 x 項目）の投資指標を計算し, 先頭の軸 x 項目のキューブに書き込む
+
+    先頭の軸のチャンクごとに読み込んで計算するため, キューブ全体をメモリに読み込まない.
+    書き込み済みでないシナリオ・パスは計算せず, 書き込み済みのフラグも立てない.
+
+    Args:
+        cube (ResultCube): 計算結果キューブ
+        directory (str): 書き込むキューブのディレクトリ
+        initial_investments: 初期投資金額（スカラーまたは先頭の軸の長さの配列）
+        discount_rates (Sequence[float], optional): NPVの割引率. Defaults to DEFAULT_DISCOUNT_RATES.
+        column (str, optional): 収支差額の項目名. Defaults to "収支差額".
+        chunk_size (int, optional): 1回に計算する先頭の軸の数. Defaults to 10000.
+        later_investments (np.ndarray, optional): 1年目以降の年末の投資金額（年数, または先頭の軸の長さ x 年数の配列）. Defaults to None.
+
+    Returns:
+        ResultCube: 投資指標のキューブ
+    """
+    axis_names = cube.get_axis_names()
+    if axis_names[1:] != ["年", METRIC_AXIS]:
+        raise InvestmentMetricsError(
+            f"axes of result cube must be (scenario or path, 年, {METRIC_AXIS})! axes are {axis_names}"
+        )
+    initial_investments = np.broadcast_to(
+        np.asarray(initial_investments, dtype=float), (cube.shape[0],)
+    )
+    if later_investments is not None:
+        later_investments = np.broadcast_to(
+            np.asarray(later_investments, dtype=float), cube.shape[:2]
+        )
+    metrics_cube = ResultCube.create(
+        directory=directory,
+        axes=[
+            (axis_names[0], cube.get_labels(axis_names[0])),
+            (METRIC_AXIS, get_metric_columns(discount_rates=discount_rates)),
+        ],
+        dtype="float64",
+        attributes={
+            **cube.attributes,
+            "source": cube.directory,
+            "discount_rates": list(discount_rates),
+        },
+    )
+    written = cube.get_written()
+    for start, cash_flows in cube.iter_select(
+        selection={METRIC_AXIS: column}, chunk_size=chunk_size
+    ):
+        rows = np.flatnonzero(written[start : start + len(cash_flows)])
+        if len(rows) == 0:
+            continue
+        metrics = calc_investment_metrics(
+            cash_flows=cash_flows[rows],
+            initial_investments=initial_investments[start + rows],
+            discount_rates=discount_rates,
+            later_investments=(
+                None if later_investments is None else later_investments[start + rows]
+            ),
+        )
+        metrics_cube.write(start + rows, np.stack(list(metrics.values()), axis=-1))
+    metrics_cube.flush()
+    return metrics_cube
+
+
+def _calc_npv_and_derivative(flows: np.ndarray, rates: np.ndarray) -> tuple:
+    """0年目からのキャッシュフローの割引率ごとのNPVと, 割引率についての微分を返す
+
+    NPVを割引係数 v = 1 / (1 + 割引率) の多項式としてHorner法で計算し, 累乗の計算を避ける.
+    """
+    factors = 1 / (1 + rates)
+    npvs = np.zeros(len(flows))
+    derivatives = np.zeros(len(flows))
+    for t in range(flows.shape[1] - 1, -1, -1):
+        derivatives = derivatives * factors + npvs
+        npvs = npvs * factors + flows[:, t]
+    return npvs, -derivatives * factors**2
+
+
+def _to_batch(cash_flows: np.ndarray, initial_investments) -> tuple:
+    """収支差額を（シナリオ・パス数 x 年数）の配列に, 初期投資金額をシナリオ・パス数の配列にする"""
+    cash_flows = np.asarray(cash_flows, dtype=float)
+    if cash_flows.ndim == 1:
+        cash_flows = cash_flows[None, :]
+    if cash_flows.ndim != 2:
+        raise InvestmentMetricsError(
+            f"cash flows must be 1 or 2 dimensional! shape is {cash_flows.shape}"
+        )
+    initial_investments = np.broadcast_to(
+        np.asarray(initial_investments, dtype=float), (len(cash_flows),)
+    )
+    return cash_flows, initial_investments
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("cube_directory", help="set the result cube directory")
+    parser.add_argument(
+        "output_directory", help="set the directory of investment metrics cube"
+    )
+    parser.add_argument(
+        "param_file_path", help="set the parameters file path of the simulation"
+    )
+    parser.add_argument(
+        "--discount-rates",
+        type=float,
+        nargs="+",
+        default=list(DEFAULT_DISCOUNT_RATES),
+        help="set the discount rates of NPV",
+    )
+    parser.add_argument("--column", default="収支差額")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    return parser.parse_args()
+
+
+def main(args):
+    from params import ParametersReader
+    from sweep import ScenarioSpace
+
+    parameters = ParametersReader(params_file_path=args.param_file_path).read_params()
+    cube = ResultCube(directory=args.cube_directory)
+
+    # スイープのキューブはシナリオごとの初期投資金額, 確率シミュレーションのキューブは全パスで同じ初期投資金額とする
+    if "space" in cube.attributes:
+        first_axis = cube.get_axis_names()[0]
+        initial_investments, later_investments = get_scenario_investment_schedule(
+            parameters=parameters,
+            space=ScenarioSpace.from_dict(cube.attributes["space"]),
+            indices=np.asarray(cube.get_labels(first_axis)),
+        )
+    else:
+        initial_investments, later_investments = get_investment_schedule(
+            parameters=parameters
+        )
+    metrics_cube = write_metrics_cube(
+        cube=cube,
+        directory=args.output_directory,
+        initial_investments=initial_investments,
+        discount_rates=args.discount_rates,
+        column=args.column,
+        chunk_size=args.chunk_size,
+        later_investments=later_investments,
+    )
+    print(f"investment metrics are written to {metrics_cube.directory}")
+
+
+class InvestmentMetricsError(Exception):
+    pass
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
@@ -0,0 +1,355 @@
+import math
+
+import numpy as np
+from loan_schedule_cache import get_loan_schedule_cache
+from typing import Dict, Iterable, List, Tuple
+from util import convert_positive_number_or_zero
+
+# ローン返済スケジュールの行（calc_loan_scheduleの返り値の行の並び）
+LOAN_SCHEDULE_ROWS = ["毎月返済額", "利息返済額", "元金返済額", "ローン残高"]
+
+
+def calc_loan_schedule(
+    total_loan_amount: int,
+    monthly_interest: float,
+    payment_count: int,
+    month_count: int,
+) -> np.ndarray:
+    """元利均等返済のローン返済スケジュールを月単位で計算する
+
+    Args:
+        total_loan_amount (int): 借入金額
+        monthly_interest (float): 月利（%ではなく割合）
+        payment_count (int): 返済回数
+        month_count (int): 計算する月数
+
+    Returns:
+        np.ndarray: LOAN_SCHEDULE_ROWSの各行を月ごとに並べた配列（行数 x month_count）
+    """
+    monthly_payment_amount = int(
+        (
+            total_loan_amount
+            * monthly_interest
+            * math.pow(1 + monthly_interest, payment_count)
+        )
+        / (math.pow(1 + monthly_interest, payment_count) - 1)
+    )
+
+    schedule = np.zeros((len(LOAN_SCHEDULE_ROWS), month_count), dtype=np.int64)
+    loan_credit = total_loan_amount
+    for index in range(1, month_count + 1):
+        # 利息返済額の計算
+        if index > payment_count:
+            # ローン返済期間を超えたら、利息返済額を0に設定する
+            interest_payment_amount = 0
+        else:
+            interest_payment_amount = int(loan_credit * monthly_interest)
+
+        # 元金返済額の計算
+        principal_payment_amount = convert_positive_number_or_zero(
+            monthly_payment_amount - interest_payment_amount
+        )
+
+        # ローン残高の計算
+        if index == 1:
+            loan_credit = convert_positive_number_or_zero(
+                total_loan_amount - principal_payment_amount
+            )
+        elif index > payment_count:
+            # ローン返済期間を超えたら、ローン残高を0に設定する
+            loan_credit = 0
+        else:
+            loan_credit = convert_positive_number_or_zero(
+                loan_credit - principal_payment_amount
+            )
+
+        schedule[:, index - 1] = [
+            monthly_payment_amount if index <= payment_count else 0,
+            interest_payment_amount,
+            principal_payment_amount,
+            loan_credit,
+        ]
+    return schedule
+
+
+def calc_monthly_payment(
+    total_loan_amount, monthly_interest, payment_count
+) -> np.ndarray:
+    """元利均等返済の毎月返済額（calc_loan_scheduleと同じく円未満を切り捨てる）を返す
+
+    引数は配列（ブロードキャストする）を指定できる. 月利が0の場合は借入金額 / 返済回数とする.
+
+    Args:
+        total_loan_amount: 借入金額
+        monthly_interest: 月利（%ではなく割合）
+        payment_count: 返済回数
+
+    Returns:
+        np.ndarray: 毎月返済額
+    """
+    total_loan_amount, monthly_interest, payment_count = np.broadcast_arrays(
+        np.asarray(total_loan_amount, dtype=np.float64),
+        np.asarray(monthly_interest, dtype=np.float64),
+        np.asarray(payment_count, dtype=np.float64),
+    )
+    growth = np.power(1 + monthly_interest, payment_count)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        payment = np.where(
+            monthly_interest > 0,
+            (total_loan_amount * monthly_interest * growth) / (growth - 1),
+            total_loan_amount / payment_count,
+        )
+    return np.trunc(payment).astype(np.int64)
+
+
+def calc_loan_balance(
+    total_loan_amount, monthly_interest, payment_count, months
+) -> np.ndarray:
+    """monthsか月目の返済後のローン残高を, 月数によらない計算量（閉形式）で返す
+
+    残高は借入金額 x (1 + 月利)^月数 - 毎月返済額 x ((1 + 月利)^月数 - 1) / 月利 の円未満を切り捨てた値とし,
+    返済回数を超えた月は0とする. calc_loan_scheduleは毎月の利息の円未満を切り捨てるため,
+    その残高との差（本関数 - calc_loan_schedule）は 0以上 ((1 + 月利)^月数 - 1) / 月利 円以下となる
+    （月利0.1%, 35年返済の完済前で最大521円）. 引数は配列（ブロードキャストする）を指定できる.
+
+    Args:
+        total_loan_amount: 借入金額
+        monthly_interest: 月利（%ではなく割合）
+        payment_count: 返済回数
+        months: 返済後の残高を求める月数（0の場合は借入金額）
+
+    Returns:
+        np.ndarray: ローン残高
+    """
+    months = np.asarray(months)
+    balances = calc_annuity_balance(
+        principal=np.asarray(total_loan_amount, dtype=np.float64),
+        monthly_interest=np.asarray(monthly_interest, dtype=np.float64),
+        payment=calc_monthly_payment(
+            total_loan_amount, monthly_interest, payment_count
+        ),
+        months=np.minimum(months, payment_count),
+    )
+    balances = np.where(months > payment_count, 0, np.maximum(balances, 0))
+    return np.trunc(balances).astype(np.int64)
+
+
+def calc_cumulative_interest(
+    total_loan_amount, monthly_interest, payment_count, months
+) -> np.ndarray:
+    """monthsか月目までの利息返済額の累計を, 月数によらない計算量（閉形式）で返す
+
+    利息の累計は 毎月返済額 x 返済月数 - (借入金額 - ローン残高) とする.
+    calc_loan_scheduleの利息返済額の累計との差はcalc_loan_balanceと同じ範囲となる.
+
+    Args:
+        total_loan_amount: 借入金額
+        monthly_interest: 月利（%ではなく割合）
+        payment_count: 返済回数
+        months: 利息を累計する月数
+
+    Returns:
+        np.ndarray: 利息返済額の累計
+    """
+    paid_months = np.minimum(np.asarray(months), payment_count)
+    payment = calc_monthly_payment(total_loan_amount, monthly_interest, payment_count)
+    balances = calc_annuity_balance(
+        principal=np.asarray(total_loan_amount, dtype=np.float64),
+        monthly_interest=np.asarray(monthly_interest, dtype=np.float64),
+        payment=payment,
+        months=paid_months,
+    )
+    interests = payment * paid_months - (total_loan_amount - np.maximum(balances, 0))
+    return np.trunc(interests).astype(np.int64)
+
+
+def calc_annuity_balance(principal, monthly_interest, payment, months) -> np.ndarray:
+    """毎月paymentを返済した場合のmonthsか月目の残高（円未満を切り捨てない. 完済後は負となる）
+
+    引数は配列（ブロードキャストする）を指定できる.
+
+    Args:
+        principal: 元金
+        monthly_interest: 月利（%ではなく割合）
+        payment: 毎月返済額
+        months: 月数
+
+    Returns:
+        np.ndarray: 残高
+    """
+    growth = np.power(1 + monthly_interest, months)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(
+            monthly_interest > 0,
+            principal * growth - payment * (growth - 1) / monthly_interest,
+            principal - payment * months,
+        )
+
+
+class MonthlyLoanSchedule:
+    """全物件の月単位のローン返済スケジュール
+
+    スケジュールは物件数 x LOAN_SCHEDULE_ROWS x 月数の配列で保持し, 行（物件・返済回数ごと）には
+    get_rowsで指定した物件・月のみ展開する. 年単位のローン利息のデータも同じ配列から集計する.
+
+    Args:
+        building_names (List[str]): 物件名（配列の物件の並び）
+        schedules (np.ndarray): calc_loan_scheduleの配列を物件ごとに並べた配列（月数は12の倍数）
+        building_ratios (np.ndarray): 物件ごとの建物割合（%）
+    """
+
+    def __init__(
+        self,
+        building_names: List[str],
+        schedules: np.ndarray,
+        building_ratios: np.ndarray,
+    ) -> None:
+        if schedules.shape[:2] != (len(building_names), len(LOAN_SCHEDULE_ROWS)):
+            raise LoanScheduleError(
+                f"shape of schedules is invalid! shape is {schedules.shape}"
+            )
+        if schedules.shape[2] % 12 != 0:
+            raise LoanScheduleError(
+                f"month count must be a multiple of 12! value is {schedules.shape[2]}"
+            )
+        self.building_names = list(building_names)
+        self.schedules = schedules
+        self.building_ratios = np.asarray(building_ratios, dtype=np.float64)
+        self.__building_indices = {
+            building_name: i for i, building_name in enumerate(self.building_names)
+        }
+
+    @property
+    def month_count(self) -> int:
+        return self.schedules.shape[2]
+
+    @property
+    def nbytes(self) -> int:
+        return self.schedules.nbytes + self.building_ratios.nbytes
+
+    def aggregate_per_year(self) -> Dict[str, np.ndarray]:
+        """LoanCalculatorと同じ年単位のローン利息のデータを返す（物件ごとに年数の行を並べる）
+
+        返済額・利息・元金は年内の合計, 残高は年内の最小値とし, 全物件をまとめて計算する.
+
+        Returns:
+            Dict[str, np.ndarray]: 年, 物件名, 毎年返済額, 利息返済額, 元金返済額, ローン残高, 利息(建物分のみ)
+        """
+        building_count = len(self.building_names)
+        year_count = self.month_count // 12
+        schedule_per_year = self.schedules.reshape(
+            building_count, len(LOAN_SCHEDULE_ROWS), year_count, 12
+        )
+        return {
+            "年": np.tile(np.arange(1, year_count + 1), building_count),
+            "物件名": np.repeat(np.array(self.building_names, dtype=str), year_count),
+            "毎年返済額": schedule_per_year[:, 0].sum(axis=2).ravel(),
+            "利息返済額": schedule_per_year[:, 1].sum(axis=2).ravel(),
+            "元金返済額": schedule_per_year[:, 2].sum(axis=2).ravel(),
+            "ローン残高": schedule_per_year[:, 3].min(axis=2).ravel(),
+            "利息(建物分のみ)": self.__get_interests_of_building(
+                building_indices=np.arange(building_count), months=None
+            )
+            .reshape(building_count, year_count, 12)
+            .sum(axis=2)
+            .ravel(),
+        }
+
+    def get_rows(
+        self, building_names: Iterable[str] = None, months: Iterable[int] = None
+    ) -> Dict[str, np.ndarray]:
+        """指定した物件・月のスケジュールを, 物件・返済回数ごとの行に展開する
+
+        Args:
+            building_names (Iterable[str], optional): 物件名. Defaults to None（全物件）.
+            months (Iterable[int], optional): 返済回数（1始まりの月数）. Defaults to None（全ての月）.
+
+        Returns:
+            Dict[str, np.ndarray]: 物件名, 回数, 年, 毎月返済額, 利息返済額, 元金返済額, ローン残高, 利息(建物分のみ)
+        """
+        if building_names is None:
+            building_names = self.building_names
+        building_names = list(building_names)
+        for building_name in building_names:
+            if building_name not in self.__building_indices:
+                raise LoanScheduleError(
+                    f"building is not exist in loan schedule! building_name is {building_name}"
+                )
+        building_indices = np.array(
+            [self.__building_indices[name] for name in building_names], dtype=np.int64
+        )
+        if months is None:
+            months = np.arange(1, self.month_count + 1)
+        months = np.asarray(list(months), dtype=np.int64)
+        if ((months < 1) | (months > self.month_count)).any():
+            raise LoanScheduleError(
+                f"months are out of range! month count is {self.month_count}"
+            )
+
+        values = self.schedules[building_indices[:, None], :, months[None, :] - 1]
+        interests_of_building = self.__get_interests_of_building(
+            building_indices=building_indices, months=months
+        )
+        columns = {
+            "物件名": np.repeat(np.array(building_names, dtype=str), len(months)),
+            "回数": np.tile(months, len(building_names)),
+            "年": np.tile((months - 1) // 12 + 1, len(building_names)),
+        }
+        for i, row_name in enumerate(LOAN_SCHEDULE_ROWS):
+            columns[row_name] = values[:, :, i].ravel()
+        columns["利息(建物分のみ)"] = interests_of_building.ravel()
+        return columns
+
+    def __get_interests_of_building(
+        self, building_indices: np.ndarray, months: np.ndarray = None
+    ) -> np.ndarray:
+        """建物分の利息（利息返済額 x 建物割合）を物件数 x 月数の配列で返す"""
+        interests = self.schedules[
+            building_indices, LOAN_SCHEDULE_ROWS.index("利息返済額")
+        ]
+        if months is not None:
+            interests = interests[:, months - 1]
+        return (interests * self.building_ratios[building_indices, None] / 100).astype(
+            np.int64
+        )
+
+
+def calc_monthly_loan_schedule(
+    building_names: List[str],
+    loan_conditions: List[Tuple[int, float, int]],
+    building_ratios: List[float],
+    month_count: int,
+) -> MonthlyLoanSchedule:
+    """物件ごとのローン返済スケジュールを計算し, MonthlyLoanScheduleにまとめる
+
+    物件ごとのスケジュールはプロセス全体で共有するLoanScheduleCacheから取得する.
+
+    Args:
+        building_names (List[str]): 物件名
+        loan_conditions (List[Tuple[int, float, int]]): 物件ごとの借入金額, 月利（%）, 返済回数
+        building_ratios (List[float]): 物件ごとの建物割合（%）
+        month_count (int): 計算する月数
+
+    Returns:
+        MonthlyLoanSchedule: 全物件の月単位のローン返済スケジュール
+    """
+    cache = get_loan_schedule_cache()
+    schedules = np.zeros(
+        (len(building_names), len(LOAN_SCHEDULE_ROWS), month_count), dtype=np.int64
+    )
+    for i, (total_loan_amount, monthly_interest, payment_count) in enumerate(
+        loan_conditions
+    ):
+        key = (total_loan_amount, monthly_interest / 100, payment_count, month_count)
+        schedules[i] = cache.get_or_calculate(
+            key=key, calculate=lambda: calc_loan_schedule(*key)
+        )
+    return MonthlyLoanSchedule(
+        building_names=building_names,
+        schedules=schedules,
+        building_ratios=np.array(building_ratios, dtype=np.float64),
+    )
+
+
+class LoanScheduleError(Exception):
+    pass
@@ -0,0 +1,469 @@
+"""繰り上げ返済・借り換えのシナリオ
+
+1物件のローンについて, 実行する時期（返済回数）の候補ごとの繰り上げ返済・借り換えの効果を配列演算でまとめて計算する.
+ローンの残高・返済額・利息は元利均等返済の閉形式（loan.calc_loan_balanceと同じ式）で候補数 x 月数の配列として求め,
+年ごとのローン支払い・利息（建物分）の変化から, リアル収支, 課税差額（税額を再計算する）, 物件売却益（売却時の残高）と
+収支差額の変化を計算する. 基準（実行しない場合）も同じ式で計算するため, 差分には毎月の利息の切り捨てによる誤差を含まない.
+繰り上げ返済額・手数料は実行した年の支出とし, 手数料は実行した年の帳簿上の支出（経費）とする.
+
+    python loan_scenarios.py <parameter file path> prepay 物件A --amount 5000000 --method shorten
+    python loan_scenarios.py <parameter file path> refinance 物件A --rate 0.9 --fee 300000 --months 60 120 180
+"""
+
+from calculator import calc_tax_array
+from executor import execute_stages
+from investment_metrics import DEFAULT_DISCOUNT_RATES, calc_npv_array, get_npv_column
+from loan import calc_annuity_balance, calc_monthly_payment
+from params import Parameters
+from typing import Dict, NamedTuple, Sequence
+import argparse
+import numpy as np
+import pandas as pd
+
+# 繰り上げ返済の方法（期間短縮型: 毎月返済額を変えずに返済回数を減らす, 返済額軽減型: 返済回数を変えずに毎月返済額を減らす）
+SHORTEN_TERM = "shorten"
+REDUCE_PAYMENT = "reduce"
+
+
+class LoanScenarioResult(NamedTuple):
+    """実行する時期の候補ごとの繰り上げ返済・借り換えの効果"""
+
+    # 実行する返済回数（この回数の返済の後に実行する）と, 実行する年
+    months: np.ndarray
+    years: np.ndarray
+    # 年ごとの変化（実行する場合 - 実行しない場合）: 項目名 -> 候補数 x 年数の配列
+    deltas: Dict[str, np.ndarray]
+    # 候補ごとの集計: 項目名 -> 候補数の配列
+    summary: Dict[str, np.ndarray]
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.summary)
+
+
+def calc_prepayment_scenarios(
+    parameters: Parameters,
+    building_name: str,
+    months,
+    amount,
+    fee=0,
+    method: str = SHORTEN_TERM,
+    dfs: Dict[str, pd.DataFrame] = None,
+    discount_rates: Sequence[float] = DEFAULT_DISCOUNT_RATES,
+) -> LoanScenarioResult:
+    """一部繰り上げ返済の効果を, 実行する時期の候補ごとに計算する
+
+    繰り上げ返済額がその時点の残高を超える場合は残高（全額返済）とする.
+
+    Args:
+        parameters (Parameters): パラメーター
+        building_name (str): 物件名
+        months: 実行する返済回数の候補（配列）
+        amount: 繰り上げ返済額（スカラーまたは候補数の配列）
+        fee (optional): 手数料（スカラーまたは候補数の配列）. Defaults to 0.
+        method (str, optional): SHORTEN_TERM（期間短縮型）またはREDUCE_PAYMENT（返済額軽減型）. Defaults to SHORTEN_TERM.
+        dfs (Dict[str, pd.DataFrame], optional): パラメーターの計算結果. Defaults to None（計算する）.
+        discount_rates (Sequence[float], optional): 収支差額の変化のNPVの割引率. Defaults to DEFAULT_DISCOUNT_RATES.
+
+    Returns:
+        LoanScenarioResult: 候補ごとの効果
+    """
+    if method not in (SHORTEN_TERM, REDUCE_PAYMENT):
+        raise LoanScenarioError(
+            f"prepayment method is not supported! value is {method}"
+        )
+    loan = _BuildingLoan(parameters=parameters, building_name=building_name)
+    months, amount, fee = np.broadcast_arrays(
+        loan.validate_months(months=months),
+        np.asarray(amount, dtype=np.float64),
+        np.asarray(fee, dtype=np.float64),
+    )
+    balances = loan.calc_balances(months=months)
+    amount = np.minimum(amount, balances)
+    remaining_counts = loan.payment_count - months
+    if method == SHORTEN_TERM:
+        payments = np.full(months.shape, float(loan.payment))
+    else:
+        payments = calc_monthly_payment(
+            balances - amount, loan.monthly_interest, remaining_counts
+        ).astype(np.float64)
+    return _calc_scenario_effects(
+        loan=loan,
+        months=months,
+        principals=balances - amount,
+        monthly_interests=np.full(months.shape, loan.monthly_interest),
+        payment_counts=remaining_counts,
+        payments=payments,
+        cash_outflows=amount + fee,
+        expenses=fee,
+        dfs=dfs,
+        discount_rates=discount_rates,
+    )
+
+
+def calc_refinance_scenarios(
+    parameters: Parameters,
+    building_name: str,
+    months,
+    interest_rate,
+    fee=0,
+    payment_count=None,
+    dfs: Dict[str, pd.DataFrame] = None,
+    discount_rates: Sequence[float] = DEFAULT_DISCOUNT_RATES,
+) -> LoanScenarioResult:
+    """借り換え（その時点の残高を新しい金利・返済回数で借り直す）の効果を, 実行する時期の候補ごとに計算する
+
+    Args:
+        parameters (Parameters): パラメーター
+        building_name (str): 物件名
+        months: 実行する返済回数の候補（配列）
+        interest_rate: 借り換え後の金利（%/年. スカラーまたは候補数の配列）
+        fee (optional): 手数料（スカラーまたは候補数の配列）. Defaults to 0.
+        payment_count (optional): 借り換え後の返済回数（スカラーまたは候補数の配列）. Defaults to None（残りの返済回数）.
+        dfs (Dict[str, pd.DataFrame], optional): パラメーターの計算結果. Defaults to None（計算する）.
+        discount_rates (Sequence[float], optional): 収支差額の変化のNPVの割引率. Defaults to DEFAULT_DISCOUNT_RATES.
+
+    Returns:
+        LoanScenarioResult: 候補ごとの効果
+    """
+    loan = _BuildingLoan(parameters=parameters, building_name=building_name)
+    months = loan.validate_months(months=months)
+    if payment_count is None:
+        payment_count = loan.payment_count - months
+    months, interest_rate, fee, payment_count = np.broadcast_arrays(
+        months,
+        np.asarray(interest_rate, dtype=np.float64),
+        np.asarray(fee, dtype=np.float64),
+        np.asarray(payment_count, dtype=np.int64),
+    )
+    if (payment_count < 1).any():
+        raise LoanScenarioError("payment count after refinance must be positive!")
+    balances = loan.calc_balances(months=months)
+    monthly_interests = interest_rate / 12 / 100
+    return _calc_scenario_effects(
+        loan=loan,
+        months=months,
+        principals=balances,
+        monthly_interests=monthly_interests,
+        payment_counts=payment_count,
+        payments=calc_monthly_payment(
+            balances, monthly_interests, payment_count
+        ).astype(np.float64),
+        cash_outflows=fee,
+        expenses=fee,
+        dfs=dfs,
+        discount_rates=discount_rates,
+    )
+
+
+class _BuildingLoan:
+    """1物件のローン条件と, シミュレーション期間の年"""
+
+    def __init__(self, parameters: Parameters, building_name: str) -> None:
+        if building_name not in parameters.get_building_names():
+            raise LoanScenarioError(
+                f"building is not exist! building_name is {building_name}"
+            )
+        self.parameters = parameters
+        self.building_name = building_name
+        (
+            self.payment_count,
+            monthly_interest,
+            self.total_loan_amount,
+        ) = parameters.get_loan_info(building_name=building_name)
+        self.monthly_interest = monthly_interest / 100
+        self.payment = calc_monthly_payment(
+            self.total_loan_amount, self.monthly_interest, self.payment_count
+        )
+        self.building_ratio = parameters.get_building_ratio(building_name=building_name)
+        self.year_count = parameters.get_simulation_interval()
+        self.start_year = parameters.get_simulation_start_year()
+        self.purchase_year = parameters.get_purchase_date(
+            building_name=building_name
+        ).year
+        self.sale_year = parameters.get_expected_sale_date(
+            building_name=building_name
+        ).year
+
+    def validate_months(self, months) -> np.ndarray:
+        """実行する返済回数の候補を検証する（返済期間内で, 売却予定年・シミュレーション終了年までに実行するもの）"""
+        months = np.atleast_1d(np.asarray(months, dtype=np.int64))
+        if months.ndim != 1 or len(months) == 0:
+            raise LoanScenarioError("please set the candidate months as 1-d array!")
+        last_year = min(self.sale_year, self.start_year + self.year_count - 1)
+        years = self.get_years(months=months)
+        invalid = (
+            (months < 1)
+            | (months >= min(self.payment_count, self.year_count * 12))
+            | (years < self.start_year)
+            | (years > last_year)
+        )
+        if invalid.any():
+            raise LoanScenarioError(
+                f"months are out of the loan period or after sale! months are {months[invalid].tolist()}"
+            )
+        return months
+
+    def get_years(self, months: np.ndarray) -> np.ndarray:
+        """返済回数の返済を行う年（購入年を1年目とする）"""
+        return self.purchase_year + (months - 1) // 12
+
+    def calc_balances(self, months: np.ndarray) -> np.ndarray:
+        return calc_annuity_balance(
+            principal=float(self.total_loan_amount),
+            monthly_interest=self.monthly_interest,
+            payment=float(self.payment),
+            months=months,
+        )
+
+
+def _calc_scenario_effects(
+    loan: _BuildingLoan,
+    months: np.ndarray,
+    principals: np.ndarray,
+    monthly_interests: np.ndarray,
+    payment_counts: np.ndarray,
+    payments: np.ndarray,
+    cash_outflows: np.ndarray,
+    expenses: np.ndarray,
+    dfs: Dict[str, pd.DataFrame],
+    discount_rates: Sequence[float],
+) -> LoanScenarioResult:
+    """返済回数monthsの後のローンを新しい条件に置き換えた場合の, 年ごとの変化と候補ごとの集計を計算する"""
+    if dfs is None:
+        dfs = execute_stages(parameters=loan.parameters)
+    month_indices = np.arange(1, loan.year_count * 12 + 1)
+
+    # 月ごとの返済額・利息・残高（基準: 月数, 実行する場合: 候補数 x 月数）
+    base_values = _calc_monthly_values(
+        principals=np.float64(loan.total_loan_amount),
+        monthly_interests=np.float64(loan.monthly_interest),
+        payment_counts=np.int64(loan.payment_count),
+        payments=np.float64(loan.payment),
+        months=month_indices,
+    )
+    new_values = _calc_monthly_values(
+        principals=principals[:, None],
+        monthly_interests=monthly_interests[:, None],
+        payment_counts=payment_counts[:, None],
+        payments=payments[:, None],
+        months=month_indices - months[:, None],
+    )
+    is_after = month_indices > months[:, None]
+    year_deltas = {}
+    for name, base in base_values.items():
+        values = np.where(is_after, new_values[name], base)
+        shape = (len(months), loan.year_count, 12)
+        if name == "ローン残高":
+            # 年末（返済回数が12の倍数の月）の残高とする
+            year_deltas[name] = (values - base).reshape(shape)[:, :, -1]
+        else:
+            year_deltas[name] = (values - base).reshape(shape).sum(axis=2)
+    year_deltas = {name: np.rint(delta) for name, delta in year_deltas.items()}
+
+    # ローンの年数（購入年を1年目とする）を, シミュレーションの年に並べ替える（保有期間でない年は0とする）
+    calendar_years = loan.start_year + np.arange(loan.year_count)
+    loan_year_indices = calendar_years - loan.purchase_year
+    owned = (
+        (loan.purchase_year <= calendar_years)
+        & (calendar_years <= loan.sale_year)
+        & (loan_year_indices < loan.year_count)
+    )
+    loan_year_indices = np.where(owned, loan_year_indices, 0)
+    payment_deltas = year_deltas["ローン支払い"][:, loan_year_indices] * owned
+    interest_deltas = year_deltas["利息返済額"][:, loan_year_indices] * owned
+    building_interest_deltas = np.rint(interest_deltas * loan.building_ratio / 100)
+
+    event_years = loan.get_years(months=months)
+    is_event_year = calendar_years == event_years[:, None]
+    real_cash_deltas = -payment_deltas - cash_outflows[:, None] * is_event_year
+    book_income_deltas = -building_interest_deltas - expenses[:, None] * is_event_year
+
+    # 課税差額は不動産収支込みの税額の変化とする（不動産収支なしの税額は変わらない）
+    book_incomes = dfs["real_estate_cash_data"]["帳簿上の収支"].to_numpy()
+    tax_deltas = calc_tax_array(
+        parameters=loan.parameters,
+        real_estate_income=book_incomes + book_income_deltas.astype(np.int64),
+    ) - calc_tax_array(parameters=loan.parameters, real_estate_income=book_incomes)
+
+    # 売却年の物件売却益は売却時の残高の分だけ変わる（CashFlowCalculatorと同じく, シミュレーション開始からの年数の残高とする）
+    sale_deltas = np.zeros_like(real_cash_deltas)
+    sale_index = loan.sale_year - loan.start_year
+    if 0 <= sale_index < loan.year_count:
+        sale_deltas[:, sale_index] = -year_deltas["ローン残高"][:, sale_index]
+
+    cash_flow_deltas = real_cash_deltas - tax_deltas + sale_deltas
+    deltas = {
+        "ローン支払い": payment_deltas,
+        "ローン利息（建物分）": building_interest_deltas,
+        "帳簿上の収支": book_income_deltas,
+        "リアル収支": real_cash_deltas,
+        "課税差額": tax_deltas,
+        "物件売却益": sale_deltas,
+        "収支差額": cash_flow_deltas,
+    }
+    deltas = {name: delta.astype(np.int64) for name, delta in deltas.items()}
+
+    summary = {
+        "返済回数": months,
+        "実行年": event_years,
+        "実行時の残高": np.trunc(loan.calc_balances(months=months)).astype(np.int64),
+        "一時支出": np.rint(cash_outflows).astype(np.int64),
+        "毎月返済額（実行後）": np.trunc(payments).astype(np.int64),
+        "返済回数（実行後）": _calc_payoff_months(
+            principals=principals,
+            monthly_interests=monthly_interests,
+            payment_counts=payment_counts,
+            payments=payments,
+        ),
+        "利息の変化": interest_deltas.sum(axis=1).astype(np.int64),
+    }
+    summary.update(
+        {
+            f"{name}の変化": deltas[name].sum(axis=1)
+            for name in ("課税差額", "物件売却益", "収支差額")
+        }
+    )
+    npvs = calc_npv_array(
+        cash_flows=deltas["収支差額"].astype(np.float64),
+        initial_investments=0,
+        discount_rates=discount_rates,
+    )
+    for i, discount_rate in enumerate(discount_rates):
+        summary[f"{get_npv_column(discount_rate)}の変化"] = npvs[:, i]
+    return LoanScenarioResult(
+        months=months, years=event_years, deltas=deltas, summary=summary
+    )
+
+
+def _calc_monthly_values(
+    principals: np.ndarray,
+    monthly_interests: np.ndarray,
+    payment_counts: np.ndarray,
+    payments: np.ndarray,
+    months: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """元利均等返済のmonthsか月目の返済額・利息・返済後の残高（閉形式. monthsが1未満の月は0とする）
+
+    残高が毎月返済額を下回った月（期間短縮型の最終回）と返済回数の月は, 残高と利息を全て返済する.
+    """
+    previous_balances = np.maximum(
+        calc_annuity_balance(principals, monthly_interests, payments, months - 1), 0
+    )
+    is_paying = (months >= 1) & (months <= payment_counts)
+    interests = previous_balances * monthly_interests
+    payoffs = previous_balances + interests
+    paid = np.where(months == payment_counts, payoffs, np.minimum(payments, payoffs))
+    balances = np.where(
+        months >= payment_counts,
+        0,
+        np.maximum(
+            calc_annuity_balance(principals, monthly_interests, payments, months), 0
+        ),
+    )
+    return {
+        "ローン支払い": np.where(is_paying, paid, 0),
+        "利息返済額": np.where(is_paying, interests, 0),
+        "ローン残高": np.where(months >= 1, balances, 0),
+    }
+
+
+def _calc_payoff_months(
+    principals: np.ndarray,
+    monthly_interests: np.ndarray,
+    payment_counts: np.ndarray,
+    payments: np.ndarray,
+) -> np.ndarray:
+    """完済までの返済回数（返済回数を上限とする）"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        months = np.where(
+            monthly_interests > 0,
+            -np.log1p(-principals * monthly_interests / payments)
+            / np.log1p(monthly_interests),
+            principals / payments,
+        )
+    months = np.where(principals <= 0, 0, np.ceil(months - 1e-9))
+    return np.minimum(np.nan_to_num(months, nan=np.inf), payment_counts).astype(
+        np.int64
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("param_file_path", help="set parameters file path")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    prepay_parser = subparsers.add_parser("prepay", help="partial prepayment")
+    prepay_parser.add_argument("building_name", help="set the building name")
+    prepay_parser.add_argument("--amount", type=float, required=True)
+    prepay_parser.add_argument(
+        "--method", choices=[SHORTEN_TERM, REDUCE_PAYMENT], default=SHORTEN_TERM
+    )
+
+    refinance_parser = subparsers.add_parser("refinance", help="refinance")
+    refinance_parser.add_argument("building_name", help="set the building name")
+    refinance_parser.add_argument(
+        "--rate", type=float, required=True, help="set the interest rate (%%/year)"
+    )
+    refinance_parser.add_argument(
+        "--payment-count",
+        type=int,
+        help="set the payment count after refinance (default: remaining count)",
+    )
+
+    for subparser in (prepay_parser, refinance_parser):
+        subparser.add_argument("--fee", type=float, default=0)
+        subparser.add_argument(
+            "--months",
+            type=int,
+            nargs="+",
+            help="set the candidate payment counts (default: every 12 months)",
+        )
+        subparser.add_argument("--output", help="set the output csv file path")
+    return parser.parse_args()
+
+
+def main(args):
+    from params import ParametersReader
+
+    parameters = ParametersReader(params_file_path=args.param_file_path).read_params()
+    months = args.months
+    if months is None:
+        # 返済期間内・売却予定年までの12か月ごとの候補とする
+        loan = _BuildingLoan(parameters=parameters, building_name=args.building_name)
+        months = np.arange(12, min(loan.payment_count, loan.year_count * 12), 12)
+        months = months[
+            loan.get_years(months=months)
+            <= min(loan.sale_year, loan.start_year + loan.year_count - 1)
+        ]
+
+    if args.command == "prepay":
+        result = calc_prepayment_scenarios(
+            parameters=parameters,
+            building_name=args.building_name,
+            months=months,
+            amount=args.amount,
+            fee=args.fee,
+            method=args.method,
+        )
+    else:
+        result = calc_refinance_scenarios(
+            parameters=parameters,
+            building_name=args.building_name,
+            months=months,
+            interest_rate=args.rate,
+            fee=args.fee,
+            payment_count=args.payment_count,
+        )
+    df = result.to_frame()
+    if args.output is not None:
+        df.to_csv(args.output, index=False)
+    print(df.to_string(index=False))
+
+
+class LoanScenarioError(Exception):
+    pass
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
@@ -0,0 +1,218 @@
+import numpy as np
+from collections import OrderedDict
+from typing import Callable, Dict, Tuple
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+# 共有ディレクトリに保存するスケジュールの合計サイズの上限の既定値（バイト）
+DEFAULT_MAX_DIRECTORY_BYTES = 256 * 1024 * 1024
+
+
+class LoanScheduleCache:
+    """ローン返済スケジュール（月単位）のLRUキャッシュ
+
+    キーはローン条件（借入金額, 月利, 返済回数, シミュレーション月数）とし、値は読み取り専用のnumpy配列とする.
+    directoryを指定した場合はスケジュールを.npyファイルとしても保存し、
+    同じディレクトリを指定した別プロセス（ワーカープロセスなど）からメモリマップで読み込めるようにする.
+    ディレクトリのファイルの合計サイズがmax_directory_bytesを超える場合は、更新日時（読み込み時にも更新する）が
+    古いファイルから削除する（読み込み済みのメモリマップは削除後も利用できる）.
+
+    Args:
+        maxsize (int, optional): メモリ上に保持するスケジュールの最大数. Defaults to 1024.
+        directory (str, optional): スケジュールを共有するディレクトリ. Defaults to None.
+        max_directory_bytes (int, optional): ディレクトリのファイルの合計サイズの上限（バイト）. Defaults to DEFAULT_MAX_DIRECTORY_BYTES.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        directory: str = None,
+        max_directory_bytes: int = DEFAULT_MAX_DIRECTORY_BYTES,
+    ) -> None:
+        if maxsize < 1:
+            raise LoanScheduleCacheError(
+                f"maxsize must be positive! value is {maxsize}"
+            )
+        if max_directory_bytes < 1:
+            raise LoanScheduleCacheError(
+                f"max_directory_bytes must be positive! value is {max_directory_bytes}"
+            )
+        self.__maxsize = maxsize
+        self.__directory = directory
+        self.__max_directory_bytes = max_directory_bytes
+        self.__evictions = 0
+        self.__schedules = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__disk_hits = 0
+        self.__misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def get_or_calculate(
+        self, key: Tuple, calculate: Callable[[], np.ndarray]
+    ) -> np.ndarray:
+        """キャッシュ済みのスケジュールを返す. 存在しない場合は計算してキャッシュする
+
+        Args:
+            key (Tuple): ローン条件
+            calculate (Callable[[], np.ndarray]): スケジュールの計算処理
+
+        Returns:
+            np.ndarray: 読み取り専用のスケジュール
+        """
+        with self.__lock:
+            if key in self.__schedules:
+                self.__schedules.move_to_end(key)
+                self.__hits += 1
+                return self.__schedules[key]
+
+        schedule = self.__load(key=key)
+        if schedule is not None:
+            with self.__lock:
+                self.__disk_hits += 1
+        else:
+            schedule = np.array(calculate())
+            schedule.flags.writeable = False
+            self.__save(key=key, schedule=schedule)
+            with self.__lock:
+                self.__misses += 1
+
+        with self.__lock:
+            self.__schedules[key] = schedule
+            self.__schedules.move_to_end(key)
+            while len(self.__schedules) > self.__maxsize:
+                self.__schedules.popitem(last=False)
+        return schedule
+
+    def get_stats(self) -> Dict[str, int]:
+        """キャッシュの統計情報を返す
+
+        Returns:
+            Dict[str, int]: hits（メモリ上のヒット数）, disk_hits（共有ディレクトリのヒット数）, misses,
+            evictions（共有ディレクトリから削除したファイル数）, currsize, maxsize
+        """
+        with self.__lock:
+            return {
+                "hits": self.__hits,
+                "disk_hits": self.__disk_hits,
+                "misses": self.__misses,
+                "evictions": self.__evictions,
+                "currsize": len(self.__schedules),
+                "maxsize": self.__maxsize,
+            }
+
+    def clear(self) -> None:
+        """メモリ上のスケジュールと統計情報を削除する（共有ディレクトリのファイルは残す）"""
+        with self.__lock:
+            self.__schedules.clear()
+            self.__hits = 0
+            self.__disk_hits = 0
+            self.__misses = 0
+            self.__evictions = 0
+
+    def __get_file_path(self, key: Tuple) -> str:
+        # メモリ上のキーと同じく, 数値の型（numpyの数値, 整数・小数）によらず同じ値は同じファイルとする
+        normalized_key = json.dumps([_normalize_key_value(value) for value in key])
+        digest = hashlib.sha256(normalized_key.encode("utf-8")).hexdigest()
+        return os.path.join(self.__directory, f"{digest}.npy")
+
+    def __load(self, key: Tuple) -> np.ndarray:
+        if self.__directory is None:
+            return None
+        file_path = self.__get_file_path(key=key)
+        try:
+            schedule = np.load(file_path, mmap_mode="r")
+        except FileNotFoundError:
+            # 存在しない, または他プロセスが削除したファイルは計算し直す
+            return None
+        # 削除の順序を最近の利用順とするため, 読み込んだファイルの更新日時を更新する
+        try:
+            os.utime(file_path)
+        except FileNotFoundError:
+            pass
+        return schedule
+
+    def __save(self, key: Tuple, schedule: np.ndarray) -> None:
+        if self.__directory is None:
+            return
+        # 書き込み途中のファイルを他プロセスが読まないように、一時ファイルに書き込んでから置き換える
+        file_path = self.__get_file_path(key=key)
+        tmp_file_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_file_path, "wb") as f:
+            np.save(f, schedule)
+        os.replace(tmp_file_path, file_path)
+        self.__evict_files(keep_file_path=file_path)
+
+    def __evict_files(self, keep_file_path: str) -> None:
+        """ディレクトリのファイルの合計サイズが上限を超える場合, 更新日時が古いファイルから削除する"""
+        files = []
+        for entry in os.scandir(self.__directory):
+            if not entry.name.endswith(".npy"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total_bytes = sum(size for _, size, _ in files)
+        for _, size, file_path in sorted(files):
+            if total_bytes <= self.__max_directory_bytes:
+                break
+            if file_path == keep_file_path:
+                continue
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+            with self.__lock:
+                self.__evictions += 1
+
+
+# プロセス全体で共有するキャッシュ
+_loan_schedule_cache = LoanScheduleCache()
+
+
+def get_loan_schedule_cache() -> LoanScheduleCache:
+    return _loan_schedule_cache
+
+
+def configure_loan_schedule_cache(
+    maxsize: int = 1024,
+    directory: str = None,
+    max_directory_bytes: int = DEFAULT_MAX_DIRECTORY_BYTES,
+) -> LoanScheduleCache:
+    """プロセス全体で共有するキャッシュを再設定する
+
+    ワーカープロセスでは、初期化処理で同じdirectoryを指定して呼び出すことでスケジュールを共有できる.
+
+    Args:
+        maxsize (int, optional): メモリ上に保持するスケジュールの最大数. Defaults to 1024.
+        directory (str, optional): スケジュールを共有するディレクトリ. Defaults to None.
+        max_directory_bytes (int, optional): ディレクトリのファイルの合計サイズの上限（バイト）. Defaults to DEFAULT_MAX_DIRECTORY_BYTES.
+
+    Returns:
+        LoanScheduleCache: 再設定したキャッシュ
+    """
+    global _loan_schedule_cache
+    _loan_schedule_cache = LoanScheduleCache(
+        maxsize=maxsize, directory=directory, max_directory_bytes=max_directory_bytes
+    )
+    return _loan_schedule_cache
+
+
+def _normalize_key_value(value):
+    """キーの値をJSONで表せるPythonの値にする（numpyの数値はPythonの数値, 整数の小数は整数とする）"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+class LoanScheduleCacheError(Exception):
+    pass
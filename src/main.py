@@ -1,44 +1,302 @@
 import argparse
-import pandas as pd
-from executor import Executor
-from typing import Dict
+from typing import TYPE_CHECKING, Dict
 import os
 from datetime import datetime
 
+# pandasやCalculatorの読み込みは時間がかかるため, 起動を速くするように利用する関数内で読み込む
+if TYPE_CHECKING:
+    import pandas as pd
+
 
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("param_file_path", help="set parameters file path")
-    return parser.parse_args()
+    parser.add_argument(
+        "--lean",
+        action="store_true",
+        help="calculate with numpy arrays without loading pandas (faster startup)",
+    )
+
+    parser.add_argument(
+        "--format",
+        dest="file_format",
+        choices=["csv", "xlsx"],
+        default="csv",
+        help="set the result format (xlsx: one workbook with a sheet per result)",
+    )
+
+    parser.add_argument(
+        "--loan-monthly",
+        nargs="*",
+        metavar="BUILDING",
+        help="output the monthly loan schedule (loan_monthly_data) of the buildings (default: all buildings)",
+    )
+    parser.add_argument(
+        "--loan-months",
+        nargs=2,
+        type=int,
+        metavar=("FIRST", "LAST"),
+        help="set the range of payment counts of the monthly loan schedule (default: all months)",
+    )
+
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="watch the parameters file and update the results in place on every save",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=0.2,
+        help="set the polling interval in seconds for --watch",
+    )
 
+    parser.add_argument(
+        "--diff",
+        dest="revised_param_file_path",
+        help="set the revised parameters file path to output the difference from the parameters file",
+    )
 
-def save_results(folder_path: str, dfs: Dict[str, pd.DataFrame]):
+    # ゴールシークの設定
+    goal_seek_group = parser.add_argument_group("goal seek")
+    goal_seek_group.add_argument(
+        "--goal-seek", dest="goal_seek_item", help="set the parameter item to solve"
+    )
+    goal_seek_group.add_argument(
+        "--building", help="set the building name of the parameter item"
+    )
+    goal_seek_group.add_argument("--lower", type=float, help="set the lower bound")
+    goal_seek_group.add_argument("--upper", type=float, help="set the upper bound")
+    goal_seek_group.add_argument(
+        "--target-data", default="cash_flow_data", help="set the data name of metric"
+    )
+    goal_seek_group.add_argument(
+        "--target-column", default="差額累計", help="set the column name of metric"
+    )
+    goal_seek_group.add_argument(
+        "--target-year", type=int, help="set the year of metric (default: last year)"
+    )
+    goal_seek_group.add_argument(
+        "--target-building", help="set the building name of metric"
+    )
+    goal_seek_group.add_argument(
+        "--target-value", type=float, default=0, help="set the target metric value"
+    )
+    goal_seek_group.add_argument(
+        "--method", choices=["bisection", "secant"], default="bisection"
+    )
+    goal_seek_group.add_argument(
+        "--batch-size", type=int, default=4, help="set candidates per iteration"
+    )
+    goal_seek_group.add_argument(
+        "--workers", type=int, help="set the number of processes for candidates"
+    )
+    goal_seek_group.add_argument(
+        "--xtol", type=float, default=1.0, help="set the tolerance of the item"
+    )
+    args = parser.parse_args()
+
+    # 組み合わせられないオプションは無視せずにエラーとする
+    modes = [
+        name
+        for name, is_enabled in (
+            ("--goal-seek", args.goal_seek_item is not None),
+            ("--diff", args.revised_param_file_path is not None),
+            ("--watch", args.watch),
+        )
+        if is_enabled
+    ]
+    if len(modes) > 1:
+        parser.error(f"{' and '.join(modes)} can not be used together!")
+    for mode in modes:
+        if args.lean:
+            parser.error(f"{mode} does not support --lean!")
+        if mode != "--watch" and args.loan_monthly is not None:
+            parser.error(f"{mode} does not support --loan-monthly!")
+    if args.loan_months is not None and args.loan_monthly is None:
+        parser.error("--loan-months requires --loan-monthly!")
+    if args.goal_seek_item is not None and (args.lower is None or args.upper is None):
+        parser.error("please set --lower and --upper for goal seek!")
+    return args
+
+
+def save_results(folder_path: str, dfs: Dict[str, "pd.DataFrame"]):
     os.makedirs(folder_path, exist_ok=True)
     for name, df in dfs.items():
         file_path = os.path.join(folder_path, f"{name}.csv")
         df.to_csv(file_path)
 
 
-def main(args):
-    # パラメーターの設定
-    param_file_path = args.param_file_path
-    result_folder = os.path.join(
+def goal_seek(args):
+    from executor import Executor
+    from goal_seek import GoalSeeker, TargetMetric
+
+    executor = Executor(parameter_file_path=args.param_file_path, result_folder=None)
+    seeker = GoalSeeker(
+        parameters=executor.read_parameters(),
+        item=args.goal_seek_item,
+        metric=TargetMetric(
+            data_name=args.target_data,
+            column=args.target_column,
+            year=args.target_year,
+            building_name=args.target_building,
+        ),
+        target_value=args.target_value,
+        building_name=args.building,
+        batch_size=args.batch_size,
+        max_workers=args.workers,
+    )
+    result = seeker.solve(
+        lower=args.lower, upper=args.upper, method=args.method, xtol=args.xtol
+    )
+    print(f"{args.goal_seek_item}: {result.value}")
+    print(f"{args.target_column}: {result.metric_value}")
+    print(f"range: [{result.lower}, {result.upper}]")
+    print(
+        f"converged: {result.converged}, iterations: {result.iterations}, evaluations: {result.evaluations}"
+    )
+
+
+def get_loan_monthly_rows(args, schedule) -> dict:
+    """--loan-monthly, --loan-monthsで指定した物件・月のローン返済スケジュールを行に展開する"""
+    months = None
+    if args.loan_months is not None:
+        months = range(args.loan_months[0], args.loan_months[1] + 1)
+    return schedule.get_rows(building_names=args.loan_monthly or None, months=months)
+
+
+def get_result_folder() -> str:
+    return os.path.join(
         os.path.dirname(__file__),
         "simulation_result",
         datetime.now().strftime("%y%m%d%H%M%S"),
     )
+
+
+def diff(args):
+    from executor import Executor
+
+    # 基準のパラメーターファイルの計算結果を再利用し、変更後のパラメーターファイルとの差分を出力する
+    executor = Executor(
+        parameter_file_path=args.param_file_path, result_folder=get_result_folder()
+    )
+    result = executor.execute_diff(
+        revised_parameter_file_path=args.revised_param_file_path
+    )
+    file_paths = executor.save_results(
+        dfs=result.delta_dfs, file_format=args.file_format
+    )
+    changed_partitions = [
+        sheet_name if building_name is None else f"{sheet_name}:{building_name}"
+        for sheet_name, building_name in result.diff.changed_partitions
+    ]
+    print(f"changed partitions: {', '.join(changed_partitions) or 'none'}")
+    print(f"recalculated stages: {', '.join(result.stage_names) or 'none'}")
+    # xlsxの場合は全てのデータが1つのファイルとなるため, 同じパスは1度だけ表示する
+    for file_path in dict.fromkeys(file_paths.values()):
+        print(file_path)
+
+
+def watch(args):
+    from watch import ParameterFileWatcher, format_update
+
+    # 変更された入力項目に依存するステージのみを再計算し, 同じ結果フォルダのファイルを書き換える
+    calc_extra_dfs = None
+    if args.loan_monthly is not None:
+        import pandas as pd
+        from executor import Executor
+
+        executor = Executor(
+            parameter_file_path=args.param_file_path, result_folder=None
+        )
+
+        def calc_extra_dfs(parameters):
+            schedule = executor.calc_monthly_loan_schedule(parameters=parameters)
+            return {
+                "loan_monthly_data": pd.DataFrame(get_loan_monthly_rows(args, schedule))
+            }
+
+    result_folder = get_result_folder()
+    watcher = ParameterFileWatcher(
+        parameter_file_path=args.param_file_path,
+        result_folder=result_folder,
+        file_format=args.file_format,
+        calc_extra_dfs=calc_extra_dfs,
+    )
+    print(f"watching {args.param_file_path} (results: {result_folder}, Ctrl+C to stop)")
+    try:
+        watcher.run(
+            on_update=lambda update: print(format_update(update), flush=True),
+            on_error=lambda e: print(f"failed to update: {e}", flush=True),
+            interval=args.interval,
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+def main(args):
+    # パラメーターの設定
+    param_file_path = args.param_file_path
+    result_folder = get_result_folder()
     dfs = {}
 
+    # pandasを読み込まずに配列で計算し, 同じ形式のCSV（またはExcelファイル）を保存する
+    if args.lean:
+        from array_pipeline import (
+            execute_array_pipeline,
+            read_array_parameters,
+            save_results_csv,
+        )
+
+        parameters = read_array_parameters(params_file_path=param_file_path)
+        results = execute_array_pipeline(parameters=parameters)
+        if args.loan_monthly is not None:
+            from array_pipeline import get_monthly_loan_schedule
+
+            results["loan_monthly_data"] = get_loan_monthly_rows(
+                args, get_monthly_loan_schedule(parameters=parameters)
+            )
+        if args.file_format == "xlsx":
+            from excel_export import get_result_xlsx_file_name, save_results_xlsx
+
+            save_results_xlsx(
+                results=results,
+                file_path=os.path.join(
+                    result_folder, get_result_xlsx_file_name(param_file_path)
+                ),
+            )
+        else:
+            save_results_csv(results=results, output_folder_path=result_folder)
+        return
+
     # シミュレーション処理の実施
+    from executor import Executor
+
     executor = Executor(
         parameter_file_path=param_file_path, result_folder=result_folder
     )
-    dfs = executor.execute()
+    parameters = executor.read_parameters()
+    dfs = executor.execute(parameters=parameters)
+    if args.loan_monthly is not None:
+        import pandas as pd
+
+        dfs["loan_monthly_data"] = pd.DataFrame(
+            get_loan_monthly_rows(
+                args, executor.calc_monthly_loan_schedule(parameters=parameters)
+            )
+        )
 
     # 処理結果を保存する
-    executor.save_results(dfs=dfs)
+    executor.save_results(dfs=dfs, file_format=args.file_format)
 
 
 if __name__ == "__main__":
     args = parse_args()
-    main(args)
+    if args.goal_seek_item is not None:
+        goal_seek(args)
+    elif args.revised_param_file_path is not None:
+        diff(args)
+    elif args.watch:
+        watch(args)
+    else:
+        main(args)
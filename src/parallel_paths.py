@@ -0,0 +1,262 @@
+"""確率シミュレーションのパスを, 共有メモリを利用して複数プロセスで並列に計算する
+
+パラメーターをコンパイルした決定的な値（StochasticCashFlowSimulator.get_compiled_inputs）と計算結果の配列は
+共有メモリに配置し, ワーカーには共有メモリの名前・形状・データ型のみを送る. ワーカーはパスのチャンクを計算して
+計算結果の配列の担当範囲（重複しないパスの範囲）に直接書き込むため, 大きな配列をプロセス間でコピーしない.
+
+パスの乱数は(シード, 物件名, パスのブロック番号)ごとのストリームで決まり, チャンクはブロックの境界で分けるため,
+計算結果はワーカー数・チャンクサイズによらず直列の計算（simulate）とビット単位で一致する.
+"""
+
+from vacancy import (
+    PATH_BLOCK_SIZE,
+    StochasticCashFlowResult,
+    StochasticCashFlowSimulator,
+)
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+from typing import Dict, List, NamedTuple
+import multiprocessing
+import numpy as np
+import os
+
+# 1つのタスクで計算するパス数の既定値（PATH_BLOCK_SIZEの倍数とする）
+DEFAULT_CHUNK_SIZE = 8 * PATH_BLOCK_SIZE
+
+# ワーカーのプロセスで共有する状態（初期化時に作成する）
+_worker_state = {}
+
+
+class SharedArraySpec(NamedTuple):
+    """共有メモリの配列の情報（ワーカーに送り, 同じ配列を参照する）"""
+
+    name: str
+    shape: tuple
+    dtype: str
+
+
+class SharedArrays:
+    """名前 -> 共有メモリの配列
+
+    createで作成したプロセスが所有し, unlinkで共有メモリを解放する. 他のプロセスはattachで参照する.
+    """
+
+    def __init__(
+        self,
+        memories: Dict[str, shared_memory.SharedMemory],
+        specs: Dict[str, SharedArraySpec],
+    ) -> None:
+        self.__memories = memories
+        self.specs = specs
+        self.arrays = {
+            key: np.ndarray(
+                spec.shape, dtype=np.dtype(spec.dtype), buffer=memories[key].buf
+            )
+            for key, spec in specs.items()
+        }
+
+    @classmethod
+    def create(cls, arrays: Dict[str, np.ndarray]) -> "SharedArrays":
+        """配列をコピーした共有メモリを作成する"""
+        shared_arrays = cls.allocate(
+            {key: (value.shape, value.dtype) for key, value in arrays.items()}
+        )
+        for key, value in arrays.items():
+            shared_arrays.arrays[key][...] = value
+        return shared_arrays
+
+    @classmethod
+    def allocate(cls, layouts: Dict[str, tuple]) -> "SharedArrays":
+        """名前 -> (形状, データ型)の空の共有メモリを作成する"""
+        memories = {}
+        specs = {}
+        try:
+            for key, (shape, dtype) in layouts.items():
+                dtype = np.dtype(dtype)
+                size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+                memory = shared_memory.SharedMemory(create=True, size=size)
+                memories[key] = memory
+                specs[key] = SharedArraySpec(
+                    name=memory.name, shape=tuple(shape), dtype=dtype.str
+                )
+        except Exception:
+            for memory in memories.values():
+                memory.close()
+                memory.unlink()
+            raise
+        return cls(memories=memories, specs=specs)
+
+    @classmethod
+    def attach(cls, specs: Dict[str, SharedArraySpec]) -> "SharedArrays":
+        """他のプロセスで作成した共有メモリを参照する"""
+        memories = {
+            key: shared_memory.SharedMemory(name=spec.name)
+            for key, spec in specs.items()
+        }
+        return cls(memories=memories, specs=specs)
+
+    def close(self) -> None:
+        """このプロセスの参照を閉じる（配列は利用できなくなる）"""
+        self.arrays = {}
+        for memory in self.__memories.values():
+            memory.close()
+
+    def unlink(self) -> None:
+        """共有メモリを解放する（作成したプロセスで1度だけ呼ぶ）"""
+        self.close()
+        for memory in self.__memories.values():
+            memory.unlink()
+        self.__memories = {}
+
+
+class SharedMemoryPathRunner:
+    """StochasticCashFlowSimulatorのパスを, 共有メモリのワーカープールで並列に計算する
+
+    コンパイル済みの入力は作成時に1度だけ共有メモリに配置し, ワーカーは起動時にそれを参照してシミュレーターを作成する.
+    ワーカーのプールは最初のsimulateで起動し, shutdown（またはwith文の終了）まで再利用する.
+
+    Args:
+        simulator (StochasticCashFlowSimulator): シミュレーター
+        max_workers (int, optional): ワーカー数. Defaults to None（CPU数）.
+        chunk_size (int, optional): 1つのタスクで計算するパス数（PATH_BLOCK_SIZEの倍数）. Defaults to DEFAULT_CHUNK_SIZE.
+    """
+
+    def __init__(
+        self,
+        simulator: StochasticCashFlowSimulator,
+        max_workers: int = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> None:
+        if chunk_size < 1 or chunk_size % PATH_BLOCK_SIZE != 0:
+            raise ParallelPathsError(
+                f"chunk_size must be a multiple of {PATH_BLOCK_SIZE}! value is {chunk_size}"
+            )
+        self.max_workers = (os.cpu_count() or 1) if max_workers is None else max_workers
+        self.chunk_size = chunk_size
+        self.__simulator = simulator
+        self.__inputs = SharedArrays.create(simulator.get_compiled_inputs())
+        self.__executor = None
+
+    def simulate(
+        self, path_count: int, path_offset: int = 0, columns: List[str] = None
+    ) -> StochasticCashFlowResult:
+        """パスごとの不動産収支, 税額, キャッシュフローを並列に計算する（simulateと同じ結果を返す）
+
+        Args:
+            path_count (int): パス数
+            path_offset (int, optional): 先頭のパス番号. Defaults to 0.
+            columns (List[str], optional): 返す項目. Defaults to None（全項目）.
+
+        Returns:
+            StochasticCashFlowResult: パスごと・年ごとの結果
+        """
+        if path_count < 1:
+            raise ParallelPathsError(
+                f"path_count must be positive! value is {path_count}"
+            )
+        # 項目とデータ型は1パスの計算結果から決める
+        probe = self.__simulator.simulate(path_count=1, path_offset=path_offset)
+        columns = list(probe.datas.keys()) if columns is None else columns
+        outputs = SharedArrays.allocate(
+            {
+                column: ((path_count, len(probe.years)), probe.datas[column].dtype)
+                for column in columns
+            }
+        )
+        try:
+            executor = self.__get_executor()
+            futures = [
+                executor.submit(
+                    _simulate_chunk,
+                    output_specs=outputs.specs,
+                    path_offset=path_offset,
+                    start=start,
+                    count=count,
+                )
+                for start, count in self.__split(path_count, path_offset)
+            ]
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                # 実行中のタスクが共有メモリに書き込み終わるまで待ってから解放する
+                wait(futures)
+                raise
+            datas = {column: outputs.arrays[column].copy() for column in columns}
+        finally:
+            outputs.unlink()
+        return StochasticCashFlowResult(years=probe.years, datas=datas)
+
+    def shutdown(self) -> None:
+        """ワーカーのプールを終了し, 共有メモリを解放する"""
+        if self.__executor is not None:
+            self.__executor.shutdown()
+            self.__executor = None
+        if self.__inputs is not None:
+            self.__inputs.unlink()
+            self.__inputs = None
+
+    def __enter__(self) -> "SharedMemoryPathRunner":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.shutdown()
+
+    def __split(self, path_count: int, path_offset: int):
+        # チャンクの境界を通しのパス番号でchunk_sizeの倍数に揃え, 乱数のブロックを複数のタスクで生成しない
+        start = path_offset
+        stop = path_offset + path_count
+        while start < stop:
+            chunk_stop = min((start // self.chunk_size + 1) * self.chunk_size, stop)
+            yield start, chunk_stop - start
+            start = chunk_stop
+
+    def __get_executor(self) -> ProcessPoolExecutor:
+        if self.__inputs is None:
+            raise ParallelPathsError("runner is already shutdown!")
+        if self.__executor is None:
+            simulator = self.__simulator
+            self.__executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_initialize_worker,
+                initargs=(
+                    self.__inputs.specs,
+                    simulator.get_model(),
+                    simulator.get_building_names(),
+                    simulator.get_seed(),
+                ),
+            )
+        return self.__executor
+
+
+def _initialize_worker(
+    input_specs: Dict[str, SharedArraySpec], model, building_names: List[str], seed: int
+) -> None:
+    inputs = SharedArrays.attach(input_specs)
+    _worker_state["inputs"] = inputs
+    _worker_state["simulator"] = StochasticCashFlowSimulator.from_compiled_inputs(
+        inputs=inputs.arrays, model=model, building_names=building_names, seed=seed
+    )
+
+
+def _simulate_chunk(
+    output_specs: Dict[str, SharedArraySpec], path_offset: int, start: int, count: int
+) -> int:
+    outputs = SharedArrays.attach(output_specs)
+    try:
+        result = _worker_state["simulator"].simulate(
+            path_count=count, path_offset=start
+        )
+        target = slice(start - path_offset, start - path_offset + count)
+        for column, values in outputs.arrays.items():
+            values[target] = result.datas[column]
+    finally:
+        outputs.close()
+    return count
+
+
+class ParallelPathsError(Exception):
+    pass
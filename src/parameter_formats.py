@@ -0,0 +1,364 @@
+"""パラメーターファイルの形式（Excel, JSON, YAML, NPZ）ごとの読み書き
+
+どの形式もExcelファイルと同じシート構成（INPUT_SHEET_NAMES）とし, シートごとの行（先頭行は見出し）を読み込む.
+
+- JSON, YAML: 手で編集するパラメーター向け. シート名 -> 行のリストとし, 日付は"2021-09-01"の形式で記述する.
+- NPZ: プログラムで生成する大量のパラメーター向け. シートの列ごとの配列を"<シート名>/<列名>"に保存する.
+  物件情報は物件ごとの値を1つの配列とするため, 行と列を入れ替えて（項目を列として）保存する.
+
+Excelファイルから他の形式に変換する場合は以下を実行する.
+
+    python parameter_formats.py <input file path> <output file path (.json, .yaml, .npz)>
+"""
+
+from datetime import date, datetime
+from schema import DATE_BUILDING_ITEMS, INPUT_SHEET_NAMES
+from typing import Dict, List
+import argparse
+import json
+import numpy as np
+import os
+
+EXCEL_EXTENSIONS = (".xlsx", ".xlsm")
+JSON_EXTENSIONS = (".json",)
+YAML_EXTENSIONS = (".yaml", ".yml")
+NPZ_EXTENSIONS = (".npz",)
+PARAMETER_FILE_EXTENSIONS = (
+    EXCEL_EXTENSIONS + JSON_EXTENSIONS + YAML_EXTENSIONS + NPZ_EXTENSIONS
+)
+
+# 行と列を入れ替えて保存するシート（NPZ）
+TRANSPOSED_SHEET_NAMES = ("building_information",)
+
+
+def get_parameter_file_extension(params_file) -> str:
+    """パラメーターファイルの拡張子（小文字）を返す
+
+    Args:
+        params_file: パラメーターファイルのパス（またはnameを持つアップロードされたファイル）
+    """
+    file_name = getattr(params_file, "name", params_file)
+    return os.path.splitext(str(file_name))[1].lower()
+
+
+def is_excel_file(params_file) -> bool:
+    return get_parameter_file_extension(params_file) in EXCEL_EXTENSIONS
+
+
+def read_sheet_rows(params_file) -> Dict[str, List[list]]:
+    """パラメーターファイルを読み込み, シート名 -> 行（先頭行は見出し）を返す
+
+    空行は除き, 空欄はnp.nan（見出しの空欄はNone）, 整数値の小数はpandasと同様にint,
+    物件情報の日付はdatetimeとする（どの形式でもExcelファイルと同じ値となる）.
+
+    Args:
+        params_file: パラメーターファイルのパス（またはnameを持つアップロードされたファイル）
+
+    Returns:
+        Dict[str, List[list]]: シート名 -> 行
+    """
+    extension = get_parameter_file_extension(params_file)
+    if extension in EXCEL_EXTENSIONS:
+        sheets = _read_excel(params_file)
+    elif extension in JSON_EXTENSIONS:
+        sheets = _read_text(params_file, load=json.load)
+    elif extension in YAML_EXTENSIONS:
+        sheets = _read_text(params_file, load=_load_yaml)
+    elif extension in NPZ_EXTENSIONS:
+        sheets = _read_npz(params_file)
+    else:
+        raise ParameterFormatError(
+            f"parameter file format is not supported! extension is {extension}"
+        )
+
+    for sheet_name in INPUT_SHEET_NAMES:
+        if sheet_name not in sheets:
+            raise ParameterFormatError(
+                "parameter format is invalid! {} sheet is not exist in parameter file.".format(
+                    sheet_name
+                )
+            )
+    if extension in EXCEL_EXTENSIONS:
+        return sheets
+    return {
+        sheet_name: _normalize_rows(sheet_name, sheets[sheet_name])
+        for sheet_name in INPUT_SHEET_NAMES
+    }
+
+
+def write_sheet_rows(sheets: Dict[str, List[list]], file_path: str) -> None:
+    """シート名 -> 行をJSON, YAML, NPZのパラメーターファイルに保存する
+
+    見出しが空欄の列（物件名が空欄の列など）は保存しない.
+
+    Args:
+        sheets (Dict[str, List[list]]): シート名 -> 行（read_sheet_rowsの戻り値）
+        file_path (str): 保存先のパス
+    """
+    sheets = {
+        sheet_name: _drop_unnamed_columns(sheets[sheet_name])
+        for sheet_name in INPUT_SHEET_NAMES
+    }
+    extension = get_parameter_file_extension(file_path)
+    if extension in JSON_EXTENSIONS:
+        # 行は1行ずつ記述し, 手で編集しやすくする
+        text_sheets = _to_text_sheets(sheets, to_date=_format_date)
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write("{\n")
+            for i, (sheet_name, rows) in enumerate(text_sheets.items()):
+                f.write(f"  {json.dumps(sheet_name, ensure_ascii=False)}: [\n")
+                f.write(
+                    ",\n".join(
+                        f"    {json.dumps(row, ensure_ascii=False)}" for row in rows
+                    )
+                )
+                f.write("\n  ]" + (",\n" if i < len(text_sheets) - 1 else "\n"))
+            f.write("}\n")
+    elif extension in YAML_EXTENSIONS:
+        import yaml
+
+        with open(file_path, "w", encoding="utf-8") as f:
+            yaml.safe_dump(
+                _to_text_sheets(sheets, to_date=_to_date),
+                f,
+                allow_unicode=True,
+                sort_keys=False,
+                default_flow_style=None,
+            )
+    elif extension in NPZ_EXTENSIONS:
+        arrays = {}
+        for sheet_name, rows in sheets.items():
+            if sheet_name in TRANSPOSED_SHEET_NAMES:
+                rows = _transpose(rows)
+            header, *rows = rows
+            for i, column in enumerate(header):
+                key = f"{sheet_name}/{column}"
+                arrays[key] = _to_array(key, [row[i] for row in rows])
+        np.savez(file_path, **arrays)
+    else:
+        raise ParameterFormatError(
+            f"parameter file format is not supported to write! extension is {extension}"
+        )
+
+
+def _read_excel(params_file) -> Dict[str, List[list]]:
+    # openpyxlは読み込み自体に時間がかかるため利用時に読み込む
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(params_file, read_only=True, data_only=True)
+    try:
+        return {
+            sheet_name: _read_worksheet_rows(workbook[sheet_name])
+            for sheet_name in INPUT_SHEET_NAMES
+            if sheet_name in workbook.sheetnames
+        }
+    finally:
+        workbook.close()
+
+
+def _read_worksheet_rows(worksheet) -> List[list]:
+    """シートの行を読み込む（空行は除き, 整数値の小数はpandasと同様にintに変換する）"""
+    rows = []
+    for row in worksheet.iter_rows(values_only=True):
+        if all(value is None for value in row):
+            continue
+        rows.append(
+            [
+                (
+                    int(value)
+                    if isinstance(value, float) and value.is_integer()
+                    else (np.nan if value is None else value)
+                )
+                for value in row
+            ]
+        )
+    # ヘッダーの空欄はNoneのままとする
+    if len(rows) > 0:
+        rows[0] = [None if value is np.nan else value for value in rows[0]]
+    return rows
+
+
+def _load_yaml(f):
+    # PyYAMLはYAMLファイルを読み込む場合のみ必要とする
+    try:
+        import yaml
+    except ImportError as e:
+        raise ParameterFormatError(
+            "PyYAML is required to read YAML parameter files!"
+        ) from e
+    return yaml.load(f, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+
+
+def _read_text(params_file, load) -> Dict[str, List[list]]:
+    if isinstance(params_file, (str, os.PathLike)):
+        with open(params_file, "r", encoding="utf-8") as f:
+            sheets = load(f)
+    else:
+        sheets = load(params_file)
+    if not isinstance(sheets, dict):
+        raise ParameterFormatError(
+            "parameter format is invalid! top level must be a mapping of sheet name to rows."
+        )
+    return sheets
+
+
+def _read_npz(params_file) -> Dict[str, List[list]]:
+    # 文字列・日付は固定長の配列として保存するため, pickleは許可しない
+    with np.load(params_file, allow_pickle=False) as npz:
+        columns = {}
+        for key in npz.files:
+            sheet_name, _, column = key.partition("/")
+            columns.setdefault(sheet_name, {})[column] = _from_array(npz[key])
+
+    sheets = {}
+    for sheet_name, sheet_columns in columns.items():
+        lengths = {len(values) for values in sheet_columns.values()}
+        if len(lengths) != 1:
+            raise ParameterFormatError(
+                f"parameter format is invalid! column lengths of {sheet_name} sheet are different."
+            )
+        rows = [list(sheet_columns)] + [
+            list(row) for row in zip(*sheet_columns.values())
+        ]
+        if sheet_name in TRANSPOSED_SHEET_NAMES:
+            rows = _transpose(rows)
+        sheets[sheet_name] = rows
+    return sheets
+
+
+def _normalize_rows(sheet_name: str, rows) -> List[list]:
+    """JSON, YAML, NPZから読み込んだ行を, Excelファイルから読み込んだ行と同じ値に変換する"""
+    if (
+        not isinstance(rows, list)
+        or len(rows) == 0
+        or not all(isinstance(row, list) for row in rows)
+    ):
+        raise ParameterFormatError(
+            f"parameter format is invalid! {sheet_name} sheet must be a list of rows."
+        )
+    header, *rows = rows
+    normalized = [list(header)]
+    for row in rows:
+        if len(row) != len(header):
+            raise ParameterFormatError(
+                f"parameter format is invalid! row length of {sheet_name} sheet is different from the header. row is {row}"
+            )
+        if all(_is_blank(value) for value in row):
+            continue
+        values = [_normalize_value(value) for value in row]
+        if sheet_name == "building_information" and values[0] in DATE_BUILDING_ITEMS:
+            values[1:] = [_parse_date(value) for value in values[1:]]
+        normalized.append(values)
+    return normalized
+
+
+def _is_blank(value) -> bool:
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+def _normalize_value(value):
+    if _is_blank(value) or value == "":
+        return np.nan
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError as e:
+            raise ParameterFormatError(
+                f"date format is invalid! value is {value}"
+            ) from e
+    return value
+
+
+def _format_date(value: datetime) -> str:
+    return _to_date(value).isoformat()
+
+
+def _to_date(value: datetime):
+    # 時刻が0時の場合は日付のみとする
+    if value.hour == value.minute == value.second == value.microsecond == 0:
+        return value.date()
+    return value
+
+
+def _to_text_sheets(sheets: Dict[str, List[list]], to_date) -> dict:
+    def to_text_value(value):
+        if _is_blank(value):
+            return None
+        if isinstance(value, datetime):
+            return to_date(value)
+        if isinstance(value, np.generic):
+            return value.item()
+        return value
+
+    return {
+        sheet_name: [[to_text_value(value) for value in row] for row in rows]
+        for sheet_name, rows in sheets.items()
+    }
+
+
+def _drop_unnamed_columns(rows: List[list]) -> List[list]:
+    # 先頭の列（インデックス）は見出しが空欄でも残す
+    indices = [i for i, column in enumerate(rows[0]) if i == 0 or not _is_blank(column)]
+    return [[row[i] for i in indices] for row in rows]
+
+
+def _transpose(rows: List[list]) -> List[list]:
+    return [list(row) for row in zip(*rows)]
+
+
+def _to_array(key: str, values: list) -> np.ndarray:
+    """列の値を, pickleを使わずに保存できる型の配列に変換する（空欄は日付はNaT, 文字列は空文字とする）"""
+    present = [value for value in values if not _is_blank(value)]
+    if all(isinstance(value, datetime) for value in present) and len(present) > 0:
+        return np.array(
+            [np.datetime64("NaT") if _is_blank(value) else value for value in values],
+            dtype="datetime64[s]",
+        )
+    if all(isinstance(value, str) for value in present) and len(present) > 0:
+        return np.array(["" if _is_blank(value) else value for value in values])
+    if all(isinstance(value, (int, float, np.number)) for value in present):
+        is_float = any(isinstance(value, (float, np.floating)) for value in values)
+        return np.array(values, dtype=np.float64 if is_float else np.int64)
+    raise ParameterFormatError(
+        f"values of a column must have the same type! column is {key}"
+    )
+
+
+def _from_array(array: np.ndarray) -> list:
+    if array.dtype.kind == "M":
+        return [np.nan if value is None else value for value in array.tolist()]
+    return array.tolist()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input_file_path", help="set the parameter file to convert")
+    parser.add_argument(
+        "output_file_path", help="set the output file path (.json, .yaml, .npz)"
+    )
+    return parser.parse_args()
+
+
+def main(args):
+    write_sheet_rows(
+        sheets=read_sheet_rows(args.input_file_path), file_path=args.output_file_path
+    )
+
+
+class ParameterFormatError(Exception):
+    pass
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
@@ -0,0 +1,237 @@
+from checkpoint import fingerprint_json
+from params import Parameters
+from schema import DERIVED_BUILDING_ITEMS, YEAR_ITEM
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import numpy as np
+import pandas as pd
+
+# 物件ごとではないシート（シート全体を1つの区画とする）
+GLOBAL_SHEET_NAMES = [
+    "income_simulation",
+    "rent_decrease_rate",
+    "basic_exemption",
+    "exemption_from_income",
+    "building_durable_life",
+    "other_parameters",
+]
+
+# 行が入力項目となるシート（その他のシートは列を入力項目とする）
+ROW_ITEM_SHEET_NAMES = ["other_parameters"]
+
+
+def get_partition_fingerprints(
+    parameters: Parameters,
+) -> Dict[Tuple[str, Optional[str]], str]:
+    """パラメーターを区画（物件ごとの列, 物件以外のシート）に分け, 区画ごとのハッシュ値を返す
+
+    物件情報の算出項目は入力項目から決まるため, ハッシュ値の計算から除く.
+
+    Args:
+        parameters (Parameters): パラメーター
+
+    Returns:
+        Dict[Tuple[str, Optional[str]], str]: (シート名, 物件名（物件以外のシートはNone）) -> ハッシュ値
+    """
+    fingerprints = {}
+    building_df = _get_input_building_df(parameters=parameters)
+    for building_name in building_df.columns:
+        fingerprints[("building_information", building_name)] = _get_fingerprint(
+            building_df[building_name].to_dict()
+        )
+    for sheet_name, df in _get_global_dfs(parameters=parameters).items():
+        fingerprints[(sheet_name, None)] = _get_fingerprint(
+            {"index": df.index.tolist(), **df.to_dict(orient="list")}
+        )
+    return fingerprints
+
+
+def get_parameters_fingerprint(parameters: Parameters) -> str:
+    """パラメーター全体のフィンガープリント（区画ごとのハッシュ値から計算する）"""
+    fingerprints = get_partition_fingerprints(parameters=parameters)
+    return fingerprint_json(
+        sorted([*key, fingerprint] for key, fingerprint in fingerprints.items())
+    )
+
+
+def get_item_fingerprints(parameters: Parameters, items) -> Dict[Tuple[str, str], str]:
+    """入力項目ごとに, 値（物件情報の項目は物件名と物件ごとの値）のハッシュ値を返す
+
+    算出項目は算出元の入力項目を指定する. パラメーターに存在しない項目のハッシュ値は値をNoneとして計算する.
+
+    Args:
+        parameters (Parameters): パラメーター
+        items: (シート名, 項目名)のリスト
+
+    Returns:
+        Dict[Tuple[str, str], str]: (シート名, 項目名) -> ハッシュ値
+    """
+    building_df = _get_input_building_df(parameters=parameters)
+    global_dfs = _get_global_dfs(parameters=parameters)
+    fingerprints = {}
+    for sheet_name, item in items:
+        labels, values = None, None
+        if sheet_name == "building_information":
+            if item in building_df.index:
+                labels = building_df.columns.tolist()
+                values = building_df.loc[item].tolist()
+        elif (sheet_name, item) == YEAR_ITEM:
+            values = global_dfs["income_simulation"].index.tolist()
+        elif sheet_name in global_dfs:
+            df = global_dfs[sheet_name]
+            if sheet_name in ROW_ITEM_SHEET_NAMES and item in df.index:
+                values = list(np.ravel(df.loc[item]))
+            elif sheet_name not in ROW_ITEM_SHEET_NAMES and item in df.columns:
+                labels = df.index.tolist()
+                values = df[item].tolist()
+        fingerprints[(sheet_name, item)] = _get_fingerprint(
+            {"labels": labels, "values": values}
+        )
+    return fingerprints
+
+
+class ParametersDiff:
+    """2つのパラメーターの差分（変更された区画と入力項目）
+
+    Args:
+        base (Parameters): 基準のパラメーター
+        revised (Parameters): 変更後のパラメーター
+    """
+
+    def __init__(self, base: Parameters, revised: Parameters) -> None:
+        base_fingerprints = get_partition_fingerprints(parameters=base)
+        revised_fingerprints = get_partition_fingerprints(parameters=revised)
+        self.changed_partitions = sorted(
+            (
+                key
+                for key in set(base_fingerprints) | set(revised_fingerprints)
+                if base_fingerprints.get(key) != revised_fingerprints.get(key)
+            ),
+            key=lambda key: (key[0], "" if key[1] is None else key[1]),
+        )
+
+        # 物件の追加・削除・並び替えは、全ての物件・ステージの再計算が必要となる
+        self.is_structural = base.get_building_names() != revised.get_building_names()
+        self.changed_building_names = [
+            building_name
+            for sheet_name, building_name in self.changed_partitions
+            if sheet_name == "building_information"
+        ]
+        self.changed_items = set()
+        base_building_df = _get_input_building_df(parameters=base)
+        revised_building_df = _get_input_building_df(parameters=revised)
+        for building_name in self.changed_building_names:
+            if (
+                building_name not in base_building_df.columns
+                or building_name not in revised_building_df.columns
+            ):
+                continue
+            self.changed_items |= {
+                ("building_information", item)
+                for item in _get_changed_labels(
+                    base_building_df[building_name],
+                    revised_building_df[building_name],
+                )
+            }
+        base_global_dfs = _get_global_dfs(parameters=base)
+        revised_global_dfs = _get_global_dfs(parameters=revised)
+        for sheet_name, building_name in self.changed_partitions:
+            if building_name is not None:
+                continue
+            base_df = base_global_dfs[sheet_name]
+            revised_df = revised_global_dfs[sheet_name]
+            if sheet_name == "income_simulation" and not base_df.index.equals(
+                revised_df.index
+            ):
+                self.changed_items.add(YEAR_ITEM)
+            if sheet_name in ROW_ITEM_SHEET_NAMES:
+                items = _get_changed_labels(base_df, revised_df, axis=0)
+            else:
+                items = _get_changed_labels(base_df, revised_df, axis=1)
+            self.changed_items |= {(sheet_name, item) for item in items}
+
+    def is_empty(self) -> bool:
+        return len(self.changed_partitions) == 0
+
+    def get_partial_building_names(self) -> Optional[List[str]]:
+        """物件ごとのステージを、変更された物件のみ再計算できる場合はその物件名を返す
+
+        変更が物件情報の入力項目のみの場合に限り、変更のない物件の計算結果を再利用できる.
+
+        Returns:
+            Optional[List[str]]: 再計算する物件名（全ての物件を再計算する場合はNone）
+        """
+        if self.is_structural:
+            return None
+        if any(
+            sheet_name != "building_information" for sheet_name, _ in self.changed_items
+        ):
+            return None
+        return list(self.changed_building_names)
+
+
+def _get_input_building_df(parameters: Parameters) -> pd.DataFrame:
+    building_df = parameters.get_buidling_df()
+    return building_df.drop(
+        index=[item for item in DERIVED_BUILDING_ITEMS if item in building_df.index]
+    )
+
+
+def _get_global_dfs(parameters: Parameters) -> Dict[str, pd.DataFrame]:
+    other_dict = parameters.get_other_dict()
+    dfs = {"income_simulation": parameters.get_income_df()}
+    dfs.update(
+        {
+            sheet_name: other_dict[sheet_name]
+            for sheet_name in GLOBAL_SHEET_NAMES
+            if sheet_name in other_dict
+        }
+    )
+    return dfs
+
+
+def _normalize_value(value):
+    """ハッシュ値・比較が読み込み方法によらないように、値をPythonの値に変換する"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+def _get_fingerprint(values: dict) -> str:
+    normalized = {
+        str(key): (
+            [_normalize_value(v) for v in value]
+            if isinstance(value, list)
+            else _normalize_value(value)
+        )
+        for key, value in values.items()
+    }
+    text = repr(sorted(normalized.items()))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _get_changed_labels(base, revised, axis: int = 0) -> List[str]:
+    """値が異なる行（axis=0）または列（axis=1）のラベルを返す（片方にのみ存在するラベルも含む）"""
+    if isinstance(base, pd.Series):
+        base = base.to_frame()
+        revised = revised.to_frame()
+    base_labels = base.index if axis == 0 else base.columns
+    revised_labels = revised.index if axis == 0 else revised.columns
+    labels = []
+    for label in base_labels.union(revised_labels, sort=False):
+        if label not in base_labels or label not in revised_labels:
+            labels.append(label)
+            continue
+        base_values = base.loc[label] if axis == 0 else base[label]
+        revised_values = revised.loc[label] if axis == 0 else revised[label]
+        if _get_fingerprint({"values": list(np.ravel(base_values))}) != (
+            _get_fingerprint({"values": list(np.ravel(revised_values))})
+        ):
+            labels.append(label)
+    return labels
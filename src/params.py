@@ -1,8 +1,16 @@
+import numpy as np
 import pandas as pd
 from datetime import datetime
 from typing import List, Tuple
-import math
 import re
+from parameter_formats import ParameterFormatError, is_excel_file, read_sheet_rows
+from schema import (
+    DERIVED_BUILDING_ITEMS,
+    INPUT_SHEET_NAMES,
+    YEAR_ITEM,
+    expand_parameter_items,
+)
+from util import calc_derived_building_values
 
 
 class Parameters:
@@ -46,6 +54,19 @@ class Parameters:
         else:
             return self.__building_df.at["家賃収入（円/月）", building_name]
 
+    def get_building_rent_incomes_per_month(
+        self, building_name: str, rent_years: List[int]
+    ) -> List[int]:
+        """get_building_rent_income_per_monthを複数の年数についてまとめて返す"""
+        rent_income = self.__building_df.at["家賃収入（円/月）", building_name]
+        if not self.is_decrease_rent_ratio():
+            return [rent_income for _ in rent_years]
+        rent_ratios = self.__other_dict["rent_decrease_rate"]["家賃割合(%)"].to_dict()
+        return [
+            int(rent_income * float(rent_ratios[rent_year]) / 100)
+            for rent_year in rent_years
+        ]
+
     def get_petty_expenses_ratio(self, building_name: str) -> int:
         return self.__building_df.at["雑費割合（%）", building_name]
 
@@ -169,25 +190,126 @@ class Parameters:
     def get_buidling_df(self) -> pd.DataFrame:
         return self.__building_df.copy(deep=True)
 
+    def get_other_dict(self) -> dict:
+        return {name: df.copy(deep=True) for name, df in self.__other_dict.items()}
+
+    def get_value(self, item: str, building_name: str = None):
+        """入力項目の値を返す（income_simulationの項目は初年度の値を返す）
+
+        Args:
+            item (str): 項目名
+            building_name (str, optional): 物件名. 物件情報の項目の場合に指定する.
+
+        Returns:
+            項目の値
+        """
+        sheet_name = self.get_item_sheet_name(item=item, building_name=building_name)
+        if sheet_name == "building_information":
+            return self.__building_df.at[item, building_name]
+        elif sheet_name == "income_simulation":
+            return self.__income_df[item].iloc[0]
+        else:
+            return self.__other_dict["other_parameters"].at[item, "value"]
+
+    def get_item_sheet_name(self, item: str, building_name: str = None) -> str:
+        """入力項目が含まれるシート名を返す
+
+        Args:
+            item (str): 項目名
+            building_name (str, optional): 物件名. 物件情報の項目の場合に指定する.
+
+        Returns:
+            str: シート名
+        """
+        if building_name is not None:
+            if building_name not in self.get_building_names():
+                raise ParametersError(
+                    f"building is not exist! building_name is {building_name}"
+                )
+            if item not in self.__building_df.index:
+                raise ParametersError(f"building item is not exist! item is {item}")
+            return "building_information"
+        if item in self.__income_df.columns:
+            return "income_simulation"
+        if item in self.__other_dict["other_parameters"].index:
+            return "other_parameters"
+        raise ParametersError(
+            f"item is not exist! item is {item}. please set building_name for building items."
+        )
+
+    def select_buildings(self, building_names: List[str]) -> "Parameters":
+        """指定した物件のみを含むParametersを返す
+
+        Args:
+            building_names (List[str]): 物件名
+
+        Returns:
+            Parameters: 物件を絞り込んだパラメーター
+        """
+        building_names = list(building_names)
+        for building_name in building_names:
+            if building_name not in self.get_building_names():
+                raise ParametersError(
+                    f"building is not exist! building_name is {building_name}"
+                )
+        return Parameters(
+            income_df=self.__income_df,
+            building_df=self.__building_df[building_names],
+            other_dict=self.__other_dict,
+        )
+
+    def with_value(self, item: str, value, building_name: str = None) -> "Parameters":
+        """指定した入力項目の値を変更したParametersを返す（算出項目は再計算する）
+
+        income_simulationの項目は全ての年の値を変更する.
+
+        Args:
+            item (str): 項目名
+            value: 変更後の値
+            building_name (str, optional): 物件名. 物件情報の項目の場合に指定する.
+
+        Returns:
+            Parameters: 値を変更したパラメーター
+        """
+        sheet_name = self.get_item_sheet_name(item=item, building_name=building_name)
+        income_df = self.__income_df
+        building_df = self.__building_df
+        other_dict = dict(self.__other_dict)
+        if sheet_name == "building_information":
+            if item in DERIVED_BUILDING_ITEMS:
+                raise ParametersError(
+                    f"derived item can not be changed! please change the source items. item is {item}"
+                )
+            building_df = building_df.copy(deep=True)
+            building_df.at[item, building_name] = value
+            return derive_parameters(
+                income_df=income_df, building_df=building_df, other_dict=other_dict
+            )
+        elif sheet_name == "income_simulation":
+            income_df = income_df.copy(deep=True)
+            income_df[item] = value
+        else:
+            other_parameters_df = other_dict["other_parameters"].copy(deep=True)
+            other_parameters_df.at[item, "value"] = value
+            other_dict["other_parameters"] = other_parameters_df
+        return Parameters(
+            income_df=income_df, building_df=building_df, other_dict=other_dict
+        )
+
 
 class ParametersReader:
     def __init__(self, params_file_path: str) -> None:
         self.params_file_path = params_file_path
 
     def read_params(self) -> Parameters:
+        # Excel以外の形式（JSON, YAML, NPZ）は行を読み込み, Excelファイルと同じDataFrameに変換する
+        if not is_excel_file(self.params_file_path):
+            return self.__read_sheet_rows_params()
+
         # excelのシート名が想定通りかを検証する
         input_data = pd.ExcelFile(self.params_file_path)
-        input_sheet_names = [
-            "income_simulation",
-            "building_information",
-            "rent_decrease_rate",
-            "basic_exemption",
-            "exemption_from_income",
-            "building_durable_life",
-            "other_parameters",
-        ]
         actual_sheet_names = input_data.sheet_names
-        for sheet_name in input_sheet_names:
+        for sheet_name in INPUT_SHEET_NAMES:
             if sheet_name not in actual_sheet_names:
                 raise ParametersReaderException(
                     "parameter format is invalid! {} sheet is not exist in parameter excel file.".format(
@@ -196,100 +318,104 @@ class ParametersReader:
                 )
 
         # 入力パラメーターの読み込み
-        income_df = input_data.parse(input_sheet_names[0], index_col=0, header=0)
-        building_df = input_data.parse(input_sheet_names[1], index_col=0, header=0)
+        income_df = input_data.parse(INPUT_SHEET_NAMES[0], index_col=0, header=0)
+        building_df = input_data.parse(INPUT_SHEET_NAMES[1], index_col=0, header=0)
         other_dict = {
-            "rent_decrease_rate": input_data.parse(input_sheet_names[2], index_col=0),
-            "basic_exemption": input_data.parse(input_sheet_names[3], index_col=0),
-            "exemption_from_income": input_data.parse(
-                input_sheet_names[4], index_col=0
-            ),
-            "building_durable_life": input_data.parse(
-                input_sheet_names[5], index_col=0
-            ),
-            "other_parameters": input_data.parse(input_sheet_names[6], index_col=0),
+            sheet_name: input_data.parse(sheet_name, index_col=0)
+            for sheet_name in INPUT_SHEET_NAMES[2:]
         }
 
-        # 物件名が空欄の列を削除する
-        building_names = building_df.columns
-        exclude_building_names = [
-            building_name
-            for building_name in building_names
-            if re.match("Unnamed: \d", building_name)
-        ]
-        building_df = building_df.drop(columns=exclude_building_names)
-
-        # 築年数の計算（購入日を0年としてカウントする）
-        def calc_building_age(s: pd.Series) -> pd.Series:
-            init_date = s["築年"]
-            purchase_date = s["契約日"]
-            difftime = purchase_date - init_date
-            out_s = s.copy(deep=True)
-            out_s["築年数"] = math.ceil(float(difftime.days) / 365)
-            return out_s
-
-        building_df = building_df.apply(calc_building_age)
-
-        # 減価償却費の計算
-        def calc_deprecation_cost(s: pd.Series) -> pd.Series:
-            building_age = s["築年数"]
-            building_structure = s["構造"]
-            building_durable_life_df = other_dict["building_durable_life"]
-            building_limit_of_frame = building_durable_life_df.at[
-                building_structure, "耐用年数"
-            ]
-            building_limit_of_equipment = 15  # 設備の減価償却上限期間は15年で固定とする
-            out_s = s.copy(deep=True)
-
-            def calc_deprecation_interval(
-                building_limit: int, building_age: int
-            ) -> int:
-                return (
-                    (building_limit - building_age) + 0.2 * float(building_age)
-                    if building_age <= building_limit
-                    else 0.2 * float(building_age)
-                )
+        return derive_parameters(
+            income_df=income_df, building_df=building_df, other_dict=other_dict
+        )
 
-            out_s["減価償却期間（躯体部分）"] = calc_deprecation_interval(
-                building_limit_of_frame, building_age
-            )
-            out_s["減価償却期間（設備部分）"] = calc_deprecation_interval(
-                building_limit_of_equipment, building_age
-            )
+    def __read_sheet_rows_params(self) -> Parameters:
+        try:
+            sheets = read_sheet_rows(self.params_file_path)
+        except ParameterFormatError as e:
+            raise ParametersReaderException(str(e)) from e
+        dfs = {
+            sheet_name: _sheet_rows_to_df(sheets[sheet_name])
+            for sheet_name in INPUT_SHEET_NAMES
+        }
+        return derive_parameters(
+            income_df=dfs[INPUT_SHEET_NAMES[0]],
+            building_df=dfs[INPUT_SHEET_NAMES[1]],
+            other_dict={
+                sheet_name: dfs[sheet_name] for sheet_name in INPUT_SHEET_NAMES[2:]
+            },
+        )
 
-            building_cost = s["物件価格"]
-            building_ratio = float(s["建物割合（%）"]) / 100
-            building_frame_ratio = float(s["躯体割合（建物の内）"]) / 100
-            building_equip_ratio = float(s["設備割合（建物の内）"]) / 100
-            out_s["減価償却費用合計（躯体）"] = int(
-                building_cost * building_ratio * building_frame_ratio
-            )
-            out_s["減価償却費用合計（設備）"] = int(
-                building_cost * building_ratio * building_equip_ratio
-            )
-            out_s["減価償却費用（躯体）（円/年）"] = int(
-                out_s["減価償却費用合計（躯体）"] / out_s["減価償却期間（躯体部分）"]
-            )
-            out_s["減価償却費用（設備）（円/年）"] = int(
-                out_s["減価償却費用合計（設備）"] / out_s["減価償却期間（設備部分）"]
-            )
-            return out_s
 
-        building_df = building_df.apply(calc_deprecation_cost)
+def _sheet_rows_to_df(rows: List[list]) -> pd.DataFrame:
+    """シートの行（先頭行は見出し）から, 先頭の列をインデックスとしたDataFrameを作成する（見出しが空欄の列は除く）"""
+    header, *rows = rows
+    indices = [i for i, column in enumerate(header) if i > 0 and column is not None]
+    return pd.DataFrame(
+        [[row[i] for i in indices] for row in rows],
+        index=pd.Index([row[0] for row in rows], name=header[0]),
+        columns=[header[i] for i in indices],
+    )
+
+
+def derive_parameters(
+    income_df: pd.DataFrame, building_df: pd.DataFrame, other_dict: dict
+) -> Parameters:
+    """読み込んだシートから算出項目（築年数, 減価償却, ローン関連）を計算し、Parametersを生成する
+
+    Args:
+        income_df (pd.DataFrame): income_simulationシート
+        building_df (pd.DataFrame): building_informationシート
+        other_dict (dict): その他のシート（シート名 -> DataFrame）
+
+    Returns:
+        Parameters: パラメーター
+    """
+    # 物件名が空欄の列を削除する
+    building_names = building_df.columns
+    exclude_building_names = [
+        building_name
+        for building_name in building_names
+        if re.match("Unnamed: \d", building_name)
+    ]
+    building_df = building_df.drop(columns=exclude_building_names)
+
+    # 物件ごとに算出項目を計算し、物件情報の末尾の行に追加する
+    building_durable_life_df = other_dict["building_durable_life"]
+    derived_values = {}
+    for building_name in building_df.columns:
+        s = building_df[building_name]
+        derived_values[building_name] = calc_derived_building_values(
+            s,
+            building_limit_of_frame=building_durable_life_df.at[s["構造"], "耐用年数"],
+        )
 
-        # ローン関連の計算
-        def calc_loan_data(s: pd.Series):
-            out_s = s.copy(deep=True)
-            out_s["月利（%）"] = s["金利（%）"] / 12
-            out_s["借入金額"] = s["物件価格"] - s["初期投資金額"]
-            return out_s
+    # 行を1つずつ追加すると物件数が多い場合に遅いため、まとめて結合する
+    # 値の型（int, float）を変えないように、object型の配列から作成する
+    derived_items = list(next(iter(derived_values.values()), {}).keys())
+    derived_df = pd.DataFrame(
+        np.array(
+            [
+                [derived_values[building_name][item] for building_name in building_df]
+                for item in derived_items
+            ],
+            dtype=object,
+        ).reshape(len(derived_items), len(building_df.columns)),
+        index=derived_items,
+        columns=building_df.columns,
+    )
+    building_df = pd.concat(
+        [building_df.drop(index=derived_df.index, errors="ignore"), derived_df]
+    ).rename_axis(index=building_df.index.name)
+
+    return Parameters(
+        income_df=income_df, building_df=building_df, other_dict=other_dict
+    )
 
-        building_df = building_df.apply(calc_loan_data)
 
-        return Parameters(
-            income_df=income_df, building_df=building_df, other_dict=other_dict
-        )
+class ParametersReaderException(Exception):
+    pass
 
 
-class ParametersReaderException(Exception):
+class ParametersError(Exception):
     pass
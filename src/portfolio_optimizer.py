@@ -0,0 +1,611 @@
+"""予算制約のもとでの物件の組み合わせ（ポートフォリオ）の最適化
+
+候補の物件（パラメーターファイルの全物件）から, 初期投資金額の合計が予算以下, 借入金額の合計が上限以下となる
+物件の組み合わせのうち, 最終年の差額累計（またはNPV）が最大となる組み合わせを求める.
+
+    python portfolio_optimizer.py <parameter file path> --budget 3000000 --loan-cap 200000000
+
+物件ごとの年ごとのリアル収支・売却差額・帳簿上の収支は物件ごとのCalculatorで1度だけ計算し,
+組み合わせの評価は帳簿上の収支の合計から税額（累進課税のため物件の組み合わせで変わる）のみを計算する.
+組み合わせは分枝限定法で探索し, 未選択の物件を追加した場合の改善量の上界（税額が課税所得について凸であることを利用し,
+物件ごとの税額の増分の上界と, 税額を線形化した上界を求める）と予算・借入金額の連続緩和により,
+改善の見込みがない組み合わせを打ち切る.
+"""
+
+from executor import get_stage
+from params import Parameters, ParametersReader
+from calculator import calc_real_estate_cash_per_building, get_income_arrays
+from typing import List
+from util import (
+    calc_income_tax_array,
+    calc_resident_tax_array,
+    calc_taxable_base_array,
+)
+import argparse
+import numpy as np
+import time
+
+OBJECTIVES = ("差額累計", "NPV")
+
+# 物件ごとに独立に計算できるステージ（実行順）
+PER_BUILDING_STAGE_NAMES = [
+    "building_deprecation_data",
+    "loan_data",
+    "real_estate_price_data",
+    "real_estate_sale_data",
+]
+
+# 税額は区分の境界でわずかに不連続（最大数百円）なため, 凸性を前提とした上界に加える余裕（円/年）
+TAX_NONCONVEXITY_SLACK = 2000
+
+# 税額を線形化する傾きを求める差分の幅（円）
+TAX_SLOPE_STEP = 5000
+
+# 予算・借入金額の2つの制約の連続緩和の上界を求める格子の点数と, 格子を細かくする回数
+LAGRANGIAN_GRID_SIZE = 16
+LAGRANGIAN_ROUNDS = 3
+
+# 目的関数の改善とみなす最小の差（円）
+TOLERANCE = 1.0
+
+
+class PortfolioResult:
+    """ポートフォリオの最適化の結果
+
+    is_optimalは探索を打ち切らずに最適性を確認できた場合にTrueとなる.
+    """
+
+    def __init__(
+        self,
+        building_names: List[str],
+        value: float,
+        initial_investment: int,
+        loan_amount: int,
+        nodes: int,
+        is_optimal: bool,
+        elapsed_time: float,
+    ) -> None:
+        self.building_names = building_names
+        self.value = value
+        self.initial_investment = initial_investment
+        self.loan_amount = loan_amount
+        self.nodes = nodes
+        self.is_optimal = is_optimal
+        self.elapsed_time = elapsed_time
+
+
+class PortfolioOptimizer:
+    """初期投資金額の予算と借入金額の上限のもとで, 目的関数が最大となる物件の組み合わせを求める
+
+    Args:
+        parameters (Parameters): 候補の物件を含むパラメーター
+        budget (float): 初期投資金額の合計の上限
+        loan_cap (float, optional): 借入金額の合計の上限. Defaults to None（上限なし）.
+        objective (str, optional): 目的関数（差額累計: 最終年の差額累計, NPV: 収支差額の正味現在価値）. Defaults to "差額累計".
+        discount_rate (float, optional): NPVの割引率（年率）. Defaults to 0.0.
+    """
+
+    def __init__(
+        self,
+        parameters: Parameters,
+        budget: float,
+        loan_cap: float = None,
+        objective: str = "差額累計",
+        discount_rate: float = 0.0,
+    ) -> None:
+        if objective not in OBJECTIVES:
+            raise PortfolioOptimizerError(
+                f"objective is not supported! value is {objective}"
+            )
+        if parameters.is_only_tax_calculation():
+            raise PortfolioOptimizerError(
+                "portfolio can not be optimized with tax_only parameters!"
+            )
+        self.building_names = parameters.get_building_names()
+        self.budget = budget
+        self.loan_cap = np.inf if loan_cap is None else loan_cap
+
+        # 物件ごとのステージを1度だけ計算する
+        dfs = {}
+        for name in PER_BUILDING_STAGE_NAMES:
+            stage = get_stage(name=name)
+            dfs[name] = stage.calculator_class(parameters=parameters).calculate(
+                dfs={required: dfs[required] for required in stage.required_dfs}
+            )
+
+        # 物件ごと・年ごとの帳簿上の収支とリアル収支（物件数 x 年数）
+        simulation_start_year = parameters.get_simulation_start_year()
+        simulation_interval = parameters.get_simulation_interval()
+        building_count = len(self.building_names)
+        cash_df = calc_real_estate_cash_per_building(
+            parameters=parameters,
+            loan_df=dfs["loan_data"],
+            building_deprecation_df=dfs["building_deprecation_data"],
+        )
+        book_incomes = (
+            cash_df["帳簿上の収支"]
+            .to_numpy(dtype=np.int64)
+            .reshape(simulation_interval, building_count)
+            .T
+        )
+        real_cashes = (
+            cash_df["リアル収支"]
+            .to_numpy(dtype=np.int64)
+            .reshape(simulation_interval, building_count)
+            .T
+        )
+
+        # 売却差額は売却予定年に計上する（CashFlowCalculatorと同じく年数はシミュレーション開始年からの年数）
+        sale_df = dfs["real_estate_sale_data"]
+        sale_profits = dict(
+            zip(zip(sale_df["物件名"], sale_df["年"]), sale_df["売却差額"])
+        )
+        sales = np.zeros_like(real_cashes)
+        for i, building_name in enumerate(self.building_names):
+            sale_year = parameters.get_expected_sale_date(
+                building_name=building_name
+            ).year
+            year_index = sale_year - simulation_start_year + 1
+            if 1 <= year_index <= simulation_interval:
+                sales[i, year_index - 1] = sale_profits[(building_name, year_index)]
+
+        # 年ごとの重み（差額累計は1, NPVは割引係数）
+        if objective == "NPV":
+            self.weights = 1 / (1 + discount_rate) ** np.arange(
+                1, simulation_interval + 1
+            )
+        else:
+            self.weights = np.ones(simulation_interval)
+
+        # 不動産所得がない場合の課税所得（不動産所得を加えて税額を計算する）
+        income, expenses = get_income_arrays(parameters=parameters)
+        self.__taxable_base = calc_taxable_base_array(income=income, expenses=expenses)
+        self.__base_tax = self.__calc_tax(np.zeros(simulation_interval, dtype=np.int64))
+
+        self.book_incomes = book_incomes
+        self.linear_values = (real_cashes + sales) @ self.weights
+        self.initial_investments = np.array(
+            [
+                parameters.get_value(item="初期投資金額", building_name=building_name)
+                for building_name in self.building_names
+            ],
+            dtype=np.float64,
+        )
+        self.loan_amounts = np.array(
+            [
+                parameters.get_value(item="借入金額", building_name=building_name)
+                for building_name in self.building_names
+            ],
+            dtype=np.float64,
+        )
+
+        # 同じ値の物件は同じグループとし, 探索で同じ組み合わせを重複して評価しない
+        keys = {}
+        self.__groups = np.array(
+            [
+                keys.setdefault(
+                    (
+                        self.book_incomes[i].tobytes(),
+                        self.linear_values[i],
+                        self.initial_investments[i],
+                        self.loan_amounts[i],
+                    ),
+                    len(keys),
+                )
+                for i in range(building_count)
+            ]
+        )
+        self.__nodes = 0
+        self.__best_value = None
+        self.__best_indices = None
+        self.__best_book_income = None
+        self.__deadline = None
+        self.__max_nodes = None
+        self.__is_stopped = False
+
+    def evaluate(self, building_names: List[str]) -> float:
+        """物件の組み合わせの目的関数の値を返す
+
+        Args:
+            building_names (List[str]): 物件名
+
+        Returns:
+            float: 目的関数の値（差額累計の場合は組み合わせのみを計算した最終年の差額累計と一致する）
+        """
+        indices = [self.__get_index(building_name) for building_name in building_names]
+        book_income = self.book_incomes[indices].sum(axis=0)
+        return float(
+            self.linear_values[indices].sum()
+            - (self.__calc_tax(book_income) - self.__base_tax) @ self.weights
+        )
+
+    def optimize(
+        self, max_nodes: int = 1000000, time_limit: float = None
+    ) -> PortfolioResult:
+        """目的関数が最大となる物件の組み合わせを分枝限定法で求める
+
+        Args:
+            max_nodes (int, optional): 探索する組み合わせの最大数. Defaults to 1000000.
+            time_limit (float, optional): 探索時間の上限（秒）. Defaults to None（上限なし）.
+
+        Returns:
+            PortfolioResult: 最適化の結果（上限に達した場合はそれまでの最良の組み合わせ）
+        """
+        start = time.perf_counter()
+        self.__nodes = 0
+        self.__max_nodes = max_nodes
+        self.__deadline = None if time_limit is None else start + time_limit
+        self.__is_stopped = False
+
+        # 単独で予算を超える物件と, どの組み合わせに追加しても改善しない物件は候補から除く
+        candidates = np.flatnonzero(
+            (self.initial_investments <= self.budget)
+            & (self.loan_amounts <= self.loan_cap)
+        )
+        empty_book_income = np.zeros(len(self.weights), dtype=np.int64)
+        upper_values = self.__get_upper_values(
+            candidates=candidates,
+            book_income=empty_book_income,
+            budget=self.budget,
+            loan_cap=self.loan_cap,
+        )
+        candidates, upper_values = (
+            candidates[upper_values > 0],
+            upper_values[upper_values > 0],
+        )
+
+        # 予算あたりの改善量の上界が大きい順に分枝し, 貪欲法の解を初期の暫定解とする
+        usages = self.initial_investments[candidates] / max(self.budget, 1)
+        if np.isfinite(self.loan_cap):
+            usages = usages + self.loan_amounts[candidates] / max(self.loan_cap, 1)
+        order = np.lexsort(
+            (self.__groups[candidates], -upper_values / np.maximum(usages, 1e-12))
+        )
+        candidates = candidates[order]
+        self.__best_indices, self.__best_value = self.__solve_greedy(candidates)
+        self.__best_book_income = self.book_incomes[self.__best_indices].sum(axis=0)
+
+        self.__search(
+            candidates=candidates,
+            indices=[],
+            book_income=empty_book_income,
+            tax=self.__base_tax,
+            value=0.0,
+            budget=self.budget,
+            loan_cap=self.loan_cap,
+            upper_values=upper_values[order],
+        )
+
+        indices = sorted(self.__best_indices)
+        return PortfolioResult(
+            building_names=[self.building_names[i] for i in indices],
+            value=self.__best_value,
+            initial_investment=int(self.initial_investments[indices].sum()),
+            loan_amount=int(self.loan_amounts[indices].sum()),
+            nodes=self.__nodes,
+            is_optimal=not self.__is_stopped,
+            elapsed_time=time.perf_counter() - start,
+        )
+
+    def __search(
+        self,
+        candidates: np.ndarray,
+        indices: List[int],
+        book_income: np.ndarray,
+        tax: np.ndarray,
+        value: float,
+        budget: float,
+        loan_cap: float,
+        upper_values: np.ndarray = None,
+    ) -> None:
+        """候補の先頭の物件を追加する・しない場合に分枝して探索する
+
+        upper_valuesは候補ごとの改善量の上界で, 選択済みの組み合わせが同じ場合は候補を減らしても上界のままのため,
+        追加しない場合の分枝では再計算しない.
+        """
+        self.__nodes += 1
+        if self.__nodes > self.__max_nodes or (
+            self.__deadline is not None and time.perf_counter() > self.__deadline
+        ):
+            self.__is_stopped = True
+            return
+        if value > self.__best_value + TOLERANCE:
+            self.__best_indices, self.__best_value = list(indices), value
+            self.__best_book_income = book_income
+
+        is_feasible = (self.initial_investments[candidates] <= budget) & (
+            self.loan_amounts[candidates] <= loan_cap
+        )
+        candidates = candidates[is_feasible]
+        if len(candidates) == 0:
+            return
+        if upper_values is None:
+            upper_values = self.__get_upper_values(
+                candidates=candidates,
+                book_income=book_income,
+                budget=budget,
+                loan_cap=loan_cap,
+            )
+        else:
+            upper_values = upper_values[is_feasible]
+
+        # 候補ごとの改善量の上界に加え, 税額を現在・暫定解の帳簿上の収支の合計で線形化した上界を求める
+        # 税額は凸のため, 線形化点での接線（傾きは線形化点からの差分で求める）以上となり,
+        # 物件ごとの改善量は リアル収支・売却差額 - 傾き x 帳簿上の収支 の和で抑えられる
+        bases = np.array([book_income, self.__best_book_income])
+        base_taxes = self.__calc_tax(np.concatenate([bases, bases + TAX_SLOPE_STEP]))
+        slopes = (base_taxes[len(bases) :] - base_taxes[: len(bases)]) / TAX_SLOPE_STEP
+        values = np.vstack(
+            [
+                upper_values,
+                self.linear_values[candidates]
+                - (slopes * self.weights) @ self.book_incomes[candidates].T,
+            ]
+        )
+        offsets = np.concatenate(
+            [
+                [0.0],
+                (
+                    tax
+                    - base_taxes[: len(bases)]
+                    + slopes * (bases - book_income)
+                    + TAX_NONCONVEXITY_SLACK
+                )
+                @ self.weights,
+            ]
+        )
+        bound = value + np.min(
+            self.__get_knapsack_bounds(
+                values=values, candidates=candidates, budget=budget, loan_cap=loan_cap
+            )
+            + offsets
+        )
+        if bound <= self.__best_value + TOLERANCE:
+            return
+
+        # 先頭の物件を追加する場合と追加しない場合に分枝する
+        # 追加しない場合は同じグループの物件も追加しない（グループ内は先頭から順に追加する組み合わせのみを探索する）
+        index = candidates[0]
+        added_book_income = book_income + self.book_incomes[index]
+        added_tax = self.__calc_tax(added_book_income)
+        self.__search(
+            candidates=candidates[1:],
+            indices=indices + [index],
+            book_income=added_book_income,
+            tax=added_tax,
+            value=value + self.linear_values[index] - (added_tax - tax) @ self.weights,
+            budget=budget - self.initial_investments[index],
+            loan_cap=loan_cap - self.loan_amounts[index],
+        )
+        if self.__is_stopped:
+            return
+        # 改善量の上界が0以下の物件は, 選択済みの組み合わせが同じ間は追加しない
+        is_remaining = (self.__groups[candidates] != self.__groups[index]) & (
+            upper_values > 0
+        )
+        self.__search(
+            candidates=candidates[is_remaining],
+            indices=indices,
+            book_income=book_income,
+            tax=tax,
+            value=value,
+            budget=budget,
+            loan_cap=loan_cap,
+            upper_values=upper_values[is_remaining],
+        )
+
+    def __get_upper_values(
+        self,
+        candidates: np.ndarray,
+        book_income: np.ndarray,
+        budget: float,
+        loan_cap: float,
+    ) -> np.ndarray:
+        """選択済みの組み合わせに候補を追加した場合の, 候補ごとの改善量の上界を返す
+
+        税額は課税所得について凸のため, 候補を追加した時の税額の増分は, 追加前の帳簿上の収支の合計が
+        最も小さい場合（黒字の物件）・最も大きい場合（赤字の物件）の増分で抑えられる.
+        帳簿上の収支の合計の範囲は, 予算内で追加できる物件数の黒字・赤字の大きい物件を追加した場合とする.
+        """
+        books = self.book_incomes[candidates]
+        count = min(
+            _get_max_item_count(self.initial_investments[candidates], budget),
+            _get_max_item_count(self.loan_amounts[candidates], loan_cap),
+        )
+        if count == 0:
+            return np.zeros(len(candidates))
+        sorted_books = np.sort(books, axis=0)
+        lowest = book_income + np.minimum(sorted_books[:count], 0).sum(axis=0)
+        highest = book_income + np.maximum(sorted_books[-count:], 0).sum(axis=0)
+        bases = np.where(books < 0, highest, lowest)
+        tax_increases = self.__calc_tax(bases + books) - self.__calc_tax(bases)
+        return (
+            self.linear_values[candidates]
+            - (tax_increases - TAX_NONCONVEXITY_SLACK) @ self.weights
+        )
+
+    def __get_knapsack_bounds(
+        self,
+        values: np.ndarray,
+        candidates: np.ndarray,
+        budget: float,
+        loan_cap: float,
+    ) -> np.ndarray:
+        """予算・借入金額の2つの制約の連続緩和の上界を, 値の組（行）ごとに借入金額の制約のラグランジュ緩和で求める
+
+        借入金額の制約の乗数λ（>= 0）ごとに, λ x 借入金額の上限 + 予算のみの連続緩和（値から λ x 借入金額を引く）は
+        上界となるため, λについて凸な上界を格子上で最小化し, 最小の格子点の周辺で格子を細かくする.
+
+        Args:
+            values (np.ndarray): 物件を追加した場合の改善量（値の組の数 x 候補数）
+
+        Returns:
+            np.ndarray: 値の組ごとの上界
+        """
+        initial_investments = self.initial_investments[candidates]
+        bounds = _fractional_knapsack(
+            values=values, weights=initial_investments, capacity=budget
+        )
+        if not np.isfinite(loan_cap) or len(candidates) == 0:
+            return bounds
+        loan_amounts = self.loan_amounts[candidates]
+        bounds = np.minimum(
+            bounds,
+            _fractional_knapsack(
+                values=values, weights=loan_amounts, capacity=loan_cap
+            ),
+        )
+        rows = np.arange(len(values))
+        lower = np.zeros(len(values))
+        upper = np.max(values / np.maximum(loan_amounts, 1), axis=1, initial=0.0)
+        steps = np.linspace(0, 1, LAGRANGIAN_GRID_SIZE)
+        for _ in range(LAGRANGIAN_ROUNDS):
+            multipliers = lower[:, None] + (upper - lower)[:, None] * steps
+            grid_bounds = multipliers * loan_cap + _fractional_knapsack(
+                values=(
+                    values[:, None, :] - multipliers[:, :, None] * loan_amounts
+                ).reshape(-1, len(candidates)),
+                weights=initial_investments,
+                capacity=budget,
+            ).reshape(multipliers.shape)
+            best = np.argmin(grid_bounds, axis=1)
+            bounds = np.minimum(bounds, grid_bounds[rows, best])
+            lower = multipliers[rows, np.maximum(best - 1, 0)]
+            upper = multipliers[rows, np.minimum(best + 1, LAGRANGIAN_GRID_SIZE - 1)]
+        return bounds
+
+    def __solve_greedy(self, candidates: np.ndarray) -> tuple:
+        """改善量が最も大きい物件を予算内で順に追加する"""
+        indices = []
+        book_income = np.zeros(len(self.weights), dtype=np.int64)
+        tax = self.__base_tax
+        value = 0.0
+        budget, loan_cap = self.budget, self.loan_cap
+        remaining = candidates
+        while True:
+            remaining = remaining[
+                (self.initial_investments[remaining] <= budget)
+                & (self.loan_amounts[remaining] <= loan_cap)
+            ]
+            if len(remaining) == 0:
+                break
+            added_taxes = self.__calc_tax(book_income + self.book_incomes[remaining])
+            gains = self.linear_values[remaining] - (added_taxes - tax) @ self.weights
+            best = int(np.argmax(gains))
+            if gains[best] <= TOLERANCE:
+                break
+            index = remaining[best]
+            indices.append(index)
+            book_income = book_income + self.book_incomes[index]
+            tax = added_taxes[best]
+            value += gains[best]
+            budget -= self.initial_investments[index]
+            loan_cap -= self.loan_amounts[index]
+            remaining = np.delete(remaining, best)
+        return indices, value
+
+    def __calc_tax(self, book_income: np.ndarray) -> np.ndarray:
+        """帳簿上の収支の合計（..., 年数）から税額を計算する（TaxCalculatorと同じ計算）"""
+        taxable_income = self.__taxable_base + book_income
+        taxable_income = np.where(taxable_income > 0, taxable_income, 0)
+        return calc_income_tax_array(
+            taxable_income=taxable_income
+        ) + calc_resident_tax_array(taxable_income=taxable_income, area=None)
+
+    def __get_index(self, building_name: str) -> int:
+        if building_name not in self.building_names:
+            raise PortfolioOptimizerError(
+                f"building is not exist! building_name is {building_name}"
+            )
+        return self.building_names.index(building_name)
+
+
+def _get_max_item_count(weights: np.ndarray, capacity: float) -> int:
+    """容量内に含められる最大の個数（軽い順に追加した場合の個数）"""
+    if not np.isfinite(capacity):
+        return len(weights)
+    return int(np.searchsorted(np.cumsum(np.sort(weights)), capacity, side="right"))
+
+
+def _fractional_knapsack(
+    values: np.ndarray, weights: np.ndarray, capacity: float
+) -> np.ndarray:
+    """ナップサック問題の連続緩和の最適値を, 値の組（行）ごとにまとめて求める（値が0以下の物件は含めない）
+
+    Args:
+        values (np.ndarray): 値（値の組の数 x 物件数）
+        weights (np.ndarray): 重み（物件数）
+        capacity (float): 容量
+
+    Returns:
+        np.ndarray: 値の組ごとの最適値
+    """
+    values = np.maximum(values, 0)
+    if values.shape[1] == 0:
+        return np.zeros(len(values))
+    order = np.argsort(-values / np.maximum(weights, 1e-12), axis=1, kind="stable")
+    sorted_values = np.take_along_axis(values, order, axis=1)
+    sorted_weights = weights[order]
+    cumulative_weights = np.cumsum(sorted_weights, axis=1)
+
+    # 容量に収まる物件は全て含め, 収まらない最初の物件は容量の残りの分だけ含める
+    is_full = cumulative_weights <= capacity
+    bounds = (sorted_values * is_full).sum(axis=1)
+    counts = is_full.sum(axis=1)
+    rows = np.arange(len(values))
+    next_indices = np.minimum(counts, values.shape[1] - 1)
+    used = np.where(counts > 0, cumulative_weights[rows, counts - 1], 0.0)
+    next_weights = sorted_weights[rows, next_indices]
+    fractions = np.where(
+        (counts < values.shape[1]) & (next_weights > 0),
+        (capacity - used) / np.maximum(next_weights, 1e-12),
+        0.0,
+    )
+    return bounds + sorted_values[rows, next_indices] * fractions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "param_file_path", help="set the parameters file path of candidate buildings"
+    )
+    parser.add_argument(
+        "--budget", type=float, required=True, help="set the budget of 初期投資金額"
+    )
+    parser.add_argument("--loan-cap", type=float, help="set the cap of total 借入金額")
+    parser.add_argument("--objective", choices=OBJECTIVES, default="差額累計")
+    parser.add_argument(
+        "--discount-rate", type=float, default=0.0, help="set the discount rate of NPV"
+    )
+    parser.add_argument("--max-nodes", type=int, default=1000000)
+    parser.add_argument("--time-limit", type=float, help="set the time limit (seconds)")
+    return parser.parse_args()
+
+
+def main(args):
+    parameters = ParametersReader(params_file_path=args.param_file_path).read_params()
+    optimizer = PortfolioOptimizer(
+        parameters=parameters,
+        budget=args.budget,
+        loan_cap=args.loan_cap,
+        objective=args.objective,
+        discount_rate=args.discount_rate,
+    )
+    result = optimizer.optimize(max_nodes=args.max_nodes, time_limit=args.time_limit)
+    print(f"buildings: {', '.join(result.building_names)}")
+    print(f"{args.objective}: {result.value:,.0f}")
+    print(
+        f"初期投資金額: {result.initial_investment:,}, 借入金額: {result.loan_amount:,}"
+    )
+    print(
+        f"optimal: {result.is_optimal}, nodes: {result.nodes}, elapsed {result.elapsed_time:.1f}s"
+    )
+
+
+class PortfolioOptimizerError(Exception):
+    pass
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
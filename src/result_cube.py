@@ -0,0 +1,317 @@
+"""メモリマップしたnumpy配列によるディスク上の計算結果キューブ
+
+キューブのディレクトリ構成:
+    header.json     軸（名前とラベル）, 形状, データ型, 属性（シナリオ空間など）
+    data.npy        計算結果（軸の順の多次元配列）
+    written.npy     先頭の軸（シナリオ, パスなど）ごとの書き込み済みフラグ
+    checkpoints/    書き込みを完了したチャンクの記録（中断した書き込みの再開用）
+
+軸の名前は計算結果の列名（シナリオ番号, 物件名, 年など）とし, 最後の軸は項目（列名）とする.
+配列はメモリマップで開くため, 全体をメモリに読み込まずに書き込み・切り出しができる.
+"""
+
+from checkpoint import CheckpointStore, fingerprint_bytes
+from typing import Dict, Iterator, List, Sequence, Tuple
+import json
+import numpy as np
+import os
+import uuid
+
+# 項目の軸の名前
+METRIC_AXIS = "項目"
+
+_HEADER_FILE_NAME = "header.json"
+_DATA_FILE_NAME = "data.npy"
+_WRITTEN_FILE_NAME = "written.npy"
+_CHECKPOINT_DIR = "checkpoints"
+_FORMAT_VERSION = 1
+
+
+class ResultCube:
+    """ディスク上の計算結果キューブ
+
+    Args:
+        directory (str): キューブのディレクトリ
+        mode (str, optional): "r"（読み込み）または"r+"（書き込み）. Defaults to "r".
+    """
+
+    def __init__(self, directory: str, mode: str = "r") -> None:
+        if mode not in ("r", "r+"):
+            raise ResultCubeError(f"mode must be r or r+! value is {mode}")
+        header_path = os.path.join(directory, _HEADER_FILE_NAME)
+        if not os.path.exists(header_path):
+            raise ResultCubeError(f"result cube is not exist! path is {directory}")
+        with open(header_path, "r", encoding="utf-8") as f:
+            header = json.load(f)
+        if header["format_version"] != _FORMAT_VERSION:
+            raise ResultCubeError(
+                f"format version is not supported! version is {header['format_version']}"
+            )
+        self.directory = directory
+        self.attributes = header["attributes"]
+        self.__axis_names = [axis["name"] for axis in header["axes"]]
+        self.__labels = {axis["name"]: axis["labels"] for axis in header["axes"]}
+        self.__label_indices = {
+            name: {label: i for i, label in enumerate(labels)}
+            for name, labels in self.__labels.items()
+        }
+        self.__data = np.load(os.path.join(directory, _DATA_FILE_NAME), mmap_mode=mode)
+        self.__written = np.load(
+            os.path.join(directory, _WRITTEN_FILE_NAME), mmap_mode=mode
+        )
+
+    @classmethod
+    def create(
+        cls,
+        directory: str,
+        axes: List[Tuple[str, Sequence]],
+        dtype: str = "float64",
+        attributes: dict = None,
+    ) -> "ResultCube":
+        """キューブを作成し, 書き込みモードで開く（値は0で初期化される）
+
+        Args:
+            directory (str): キューブのディレクトリ
+            axes (List[Tuple[str, Sequence]]): 軸の名前とラベル（軸の順）. 最後の軸は項目とする.
+            dtype (str, optional): データ型. Defaults to "float64".
+            attributes (dict, optional): JSONで保存できる属性. Defaults to None.
+
+        Returns:
+            ResultCube: 作成したキューブ
+        """
+        if len(axes) < 2 or axes[-1][0] != METRIC_AXIS:
+            raise ResultCubeError(
+                f"the last axis must be {METRIC_AXIS} and at least one other axis is required!"
+            )
+        if os.path.exists(os.path.join(directory, _HEADER_FILE_NAME)):
+            raise ResultCubeError(f"result cube already exists! path is {directory}")
+        os.makedirs(directory, exist_ok=True)
+        axes = [
+            (name, [_to_json_value(label) for label in labels]) for name, labels in axes
+        ]
+        shape = tuple(len(labels) for _, labels in axes)
+        np.lib.format.open_memmap(
+            os.path.join(directory, _DATA_FILE_NAME),
+            mode="w+",
+            dtype=dtype,
+            shape=shape,
+        ).flush()
+        np.lib.format.open_memmap(
+            os.path.join(directory, _WRITTEN_FILE_NAME),
+            mode="w+",
+            dtype=bool,
+            shape=(shape[0],),
+        ).flush()
+
+        # ヘッダーは最後に書き込み, ヘッダーがあるキューブは作成済みであるとする
+        header = {
+            "format_version": _FORMAT_VERSION,
+            "dtype": np.dtype(dtype).str,
+            "shape": list(shape),
+            "axes": [{"name": name, "labels": labels} for name, labels in axes],
+            "attributes": {} if attributes is None else attributes,
+        }
+        header_path = os.path.join(directory, _HEADER_FILE_NAME)
+        tmp_header_path = f"{header_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_header_path, "w", encoding="utf-8") as f:
+            json.dump(header, f, ensure_ascii=False)
+        os.replace(tmp_header_path, header_path)
+        return cls(directory=directory, mode="r+")
+
+    @classmethod
+    def create_or_open(
+        cls,
+        directory: str,
+        axes: List[Tuple[str, Sequence]],
+        dtype: str = "float64",
+        attributes: dict = None,
+        resume: bool = False,
+    ) -> "ResultCube":
+        """キューブを作成する. resumeの場合は既存のキューブを書き込みモードで開く（軸・属性が同じ場合のみ）
+
+        Args:
+            directory (str): キューブのディレクトリ
+            axes (List[Tuple[str, Sequence]]): 軸の名前とラベル（軸の順）. 最後の軸は項目とする.
+            dtype (str, optional): データ型. Defaults to "float64".
+            attributes (dict, optional): JSONで保存できる属性. Defaults to None.
+            resume (bool, optional): 既存のキューブに書き込みを再開する. Defaults to False.
+
+        Returns:
+            ResultCube: 書き込みモードのキューブ
+        """
+        if not resume or not os.path.exists(os.path.join(directory, _HEADER_FILE_NAME)):
+            return cls.create(
+                directory=directory, axes=axes, dtype=dtype, attributes=attributes
+            )
+        cube = cls(directory=directory, mode="r+")
+        expected_axes = [
+            (name, [_to_json_value(label) for label in labels]) for name, labels in axes
+        ]
+        actual_axes = [(name, cube.get_labels(name)) for name in cube.get_axis_names()]
+        expected_attributes = json.loads(
+            json.dumps({} if attributes is None else attributes, ensure_ascii=False)
+        )
+        if (
+            actual_axes != expected_axes
+            or cube.attributes != expected_attributes
+            or cube.dtype != np.dtype(dtype)
+        ):
+            raise ResultCubeError(
+                f"existing result cube has different axes or attributes! path is {directory}"
+            )
+        return cube
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.__data.shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.__data.dtype
+
+    def get_axis_names(self) -> List[str]:
+        return list(self.__axis_names)
+
+    def get_labels(self, axis: str) -> list:
+        if axis not in self.__labels:
+            raise ResultCubeError(f"axis is not exist! axis is {axis}")
+        return list(self.__labels[axis])
+
+    def get_written(self) -> np.ndarray:
+        """先頭の軸ごとの書き込み済みフラグを返す"""
+        return np.array(self.__written)
+
+    def write(self, index, values: np.ndarray) -> None:
+        """先頭の軸の位置（整数またはスライス）に値を書き込む
+
+        Args:
+            index: 先頭の軸の位置
+            values (np.ndarray): 先頭の軸を除いた形状（スライスの場合は含めた形状）の値
+        """
+        self.__data[index] = values
+        self.__written[index] = True
+
+    def write_columns(self, columns: Dict[str, np.ndarray]) -> None:
+        """列ごとの配列（各行が軸のラベルの組み合わせ）の値を書き込む
+
+        項目以外の軸の名前の列で位置を決め, 項目の軸のラベルの列を値として書き込む.
+
+        Args:
+            columns (Dict[str, np.ndarray]): 列名 -> 配列
+        """
+        positions = tuple(
+            self.__get_indices(axis=axis, labels=columns[axis])
+            for axis in self.__axis_names[:-1]
+        )
+        values = np.stack(
+            [np.asarray(columns[label]) for label in self.__labels[METRIC_AXIS]],
+            axis=-1,
+        )
+        self.__data[positions] = values
+        self.__written[np.unique(positions[0])] = True
+
+    def select(self, selection: Dict[str, object] = None) -> np.ndarray:
+        """軸のラベルを指定して値を切り出す（切り出した部分のみを読み込む）
+
+        単一のラベルを指定した軸は次元を削除し, ラベルのリストを指定した軸はその順に並べる.
+
+        Args:
+            selection (Dict[str, object], optional): 軸の名前 -> ラベルまたはラベルのリスト. Defaults to None（全体）.
+
+        Returns:
+            np.ndarray: 切り出した値（指定しなかった軸とリストで指定した軸の順の配列）
+        """
+        return np.array(self.__select(self.__data, selection=selection))
+
+    def iter_select(
+        self, selection: Dict[str, object] = None, chunk_size: int = 10000
+    ) -> Iterator[Tuple[int, np.ndarray]]:
+        """selectの結果を先頭の軸について分割して返す（先頭の軸のラベルは指定できない）
+
+        Args:
+            selection (Dict[str, object], optional): 先頭以外の軸の名前 -> ラベルまたはラベルのリスト. Defaults to None.
+            chunk_size (int, optional): 1回に読み込む先頭の軸の数. Defaults to 10000.
+
+        Yields:
+            Tuple[int, np.ndarray]: 先頭の軸の開始位置, 切り出した値
+        """
+        selection = {} if selection is None else selection
+        if self.__axis_names[0] in selection:
+            raise ResultCubeError(
+                f"the first axis can not be selected in iter_select! axis is {self.__axis_names[0]}"
+            )
+        for start in range(0, self.shape[0], chunk_size):
+            chunk = self.__data[start : start + chunk_size]
+            yield start, np.array(self.__select(chunk, selection=selection))
+
+    def get_fingerprint(self, index) -> str:
+        """先頭の軸の位置（整数, スライスまたは整数のリスト）の値と書き込み済みフラグのフィンガープリント"""
+        data = np.ascontiguousarray(self.__data[index])
+        written = np.ascontiguousarray(self.__written[index])
+        return fingerprint_bytes(data.tobytes() + written.tobytes())
+
+    def get_checkpoint_store(self) -> CheckpointStore:
+        return CheckpointStore(directory=os.path.join(self.directory, _CHECKPOINT_DIR))
+
+    def flush(self) -> None:
+        if isinstance(self.__data, np.memmap):
+            self.__data.flush()
+            self.__written.flush()
+
+    def __select(self, data: np.ndarray, selection: Dict[str, object]) -> np.ndarray:
+        selection = {} if selection is None else selection
+        for axis in selection:
+            if axis not in self.__labels:
+                raise ResultCubeError(f"axis is not exist! axis is {axis}")
+
+        # 単一のラベルの軸は基本インデックス（ビュー）で先に切り出し, リストの軸は後からnp.takeで切り出す
+        index = []
+        list_axes = []
+        for axis in self.__axis_names:
+            if axis not in selection:
+                index.append(slice(None))
+            elif isinstance(selection[axis], (list, tuple, np.ndarray)):
+                index.append(slice(None))
+                list_axes.append(axis)
+            else:
+                index.append(self.__get_index(axis=axis, label=selection[axis]))
+        data = data[tuple(index)]
+        remaining_axes = [
+            axis
+            for axis in self.__axis_names
+            if axis not in selection or axis in list_axes
+        ]
+        for axis in list_axes:
+            indices = [
+                self.__get_index(axis=axis, label=label) for label in selection[axis]
+            ]
+            data = np.take(data, indices, axis=remaining_axes.index(axis))
+        return data
+
+    def __get_index(self, axis: str, label) -> int:
+        label = _to_json_value(label)
+        if label not in self.__label_indices[axis]:
+            raise ResultCubeError(
+                f"label is not exist! axis is {axis} and label is {label}"
+            )
+        return self.__label_indices[axis][label]
+
+    def __get_indices(self, axis: str, labels: np.ndarray) -> np.ndarray:
+        # 重複するラベルが多いため, ユニークなラベルのみを辞書で変換する
+        unique_labels, inverse = np.unique(np.asarray(labels), return_inverse=True)
+        unique_indices = np.array(
+            [self.__get_index(axis=axis, label=label) for label in unique_labels],
+            dtype=np.int64,
+        )
+        return unique_indices[inverse.ravel()]
+
+
+def _to_json_value(value):
+    """ラベルをJSONで保存できる値に変換する"""
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class ResultCubeError(Exception):
+    pass
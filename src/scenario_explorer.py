@@ -0,0 +1,357 @@
+"""計算結果キューブ（複数シナリオ・パスの結果）の探索用の集計
+
+ダッシュボードには描画する分（分位点の帯, ヒートマップのセル, 表の1ページ）のみを返し,
+シナリオ数によらずクライアントに送るデータ量が一定となるようにする.
+集計はキューブを先頭の軸について分割して読み込み, 全体をメモリに読み込まずに行う.
+"""
+
+from aggregation import StreamingAggregator
+from checkpoint import fingerprint_bytes
+from result_cube import METRIC_AXIS, ResultCube
+from sweep import ScenarioSpace
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+import threading
+import warnings
+
+# 表の値の列名
+VALUE_COLUMN = "値"
+
+# 保持する集計結果（項目・年ごとの値, 分位点の帯）の件数の既定値
+DEFAULT_CACHE_SIZE = 32
+
+# ヒートマップの集計方法
+HEATMAP_STATISTICS = {
+    "mean": np.nanmean,
+    "median": np.nanmedian,
+    "min": np.nanmin,
+    "max": np.nanmax,
+}
+
+
+class ScenarioExplorer:
+    """計算結果キューブを分位点の帯, スイープ軸のヒートマップ, シナリオの表に集計する
+
+    同じ条件の集計結果は最大cache_size件をLRUで保持し, ダッシュボードの再描画で再計算しない.
+    書き込みフラグは集計のたびに読み直し, 集計結果は書き込みフラグのフィンガープリントごとに保持するため,
+    書き込み中のキューブでも新しく書き込まれたシナリオを含めて集計する.
+
+    Args:
+        directory (str): キューブのディレクトリ
+        chunk_size (int, optional): 1回に読み込む先頭の軸（シナリオ・パス）の数. Defaults to 10000.
+        cache_size (int, optional): 種類ごとに保持する集計結果の最大数. Defaults to DEFAULT_CACHE_SIZE.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        chunk_size: int = 10000,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+    ) -> None:
+        if cache_size < 1:
+            raise ScenarioExplorerError(
+                f"cache_size must be positive! value is {cache_size}"
+            )
+        self.cube = ResultCube(directory=directory)
+        self.chunk_size = chunk_size
+        self.cache_size = cache_size
+        self.scenario_axis = self.cube.get_axis_names()[0]
+        self.space = None
+        if "space" in self.cube.attributes:
+            self.space = ScenarioSpace.from_dict(self.cube.attributes["space"])
+            if len(self.space) != self.cube.shape[0]:
+                raise ScenarioExplorerError(
+                    "scenario count of cube is different from the scenario space!"
+                )
+        self.__written = None
+        self.__written_fingerprint = None
+        self.__scenario_columns = None
+        self.__values_cache = OrderedDict()
+        self.__bands_cache = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get_selection_axes(self) -> Dict[str, list]:
+        """シナリオ・年・項目以外の軸（物件名など）のラベルを返す"""
+        return {
+            axis: self.cube.get_labels(axis)
+            for axis in self.cube.get_axis_names()[1:]
+            if axis not in ("年", METRIC_AXIS)
+        }
+
+    def get_metrics(self) -> List[str]:
+        return self.cube.get_labels(METRIC_AXIS)
+
+    def get_years(self) -> list:
+        return self.cube.get_labels("年")
+
+    def get_sweep_axis_names(self) -> List[str]:
+        return [] if self.space is None else self.space.get_axis_names()
+
+    def get_written_count(self) -> int:
+        written, _ = self.__refresh_written()
+        return int(written.sum())
+
+    def get_scenario_columns(self) -> Dict[str, np.ndarray]:
+        """シナリオごとのシナリオ番号とスイープ軸の値を返す（シナリオ番号から計算する）"""
+        if self.__scenario_columns is None:
+            scenario_count = self.cube.shape[0]
+            columns = {
+                self.scenario_axis: np.asarray(self.cube.get_labels(self.scenario_axis))
+            }
+            if self.space is not None:
+                grid_indices = np.unravel_index(
+                    np.arange(scenario_count),
+                    [len(axis.values) for axis in self.space.axes],
+                )
+                for axis, indices in zip(self.space.axes, grid_indices):
+                    columns[axis.get_name()] = np.asarray(axis.values)[indices]
+            self.__scenario_columns = columns
+        return self.__scenario_columns
+
+    def get_values(self, metric: str, year, selection: Dict = None) -> np.ndarray:
+        """シナリオごとの1つの項目・年の値を返す（未書き込みのシナリオはNaN）
+
+        Args:
+            metric (str): 項目
+            year: 年
+            selection (Dict, optional): 物件名などの軸 -> ラベル. Defaults to None.
+
+        Returns:
+            np.ndarray: シナリオ数の配列
+        """
+        selection = {} if selection is None else selection
+        written, written_fingerprint = self.__refresh_written()
+        key = (
+            written_fingerprint,
+            metric,
+            year,
+            tuple(sorted(selection.items())),
+        )
+        values = self.__get_cached(self.__values_cache, key)
+        if values is None:
+            values = np.full(self.cube.shape[0], np.nan)
+            for start, chunk in self.cube.iter_select(
+                selection={**selection, "年": year, METRIC_AXIS: metric},
+                chunk_size=self.chunk_size,
+            ):
+                values[start : start + len(chunk)] = chunk
+            values[~written] = np.nan
+            self.__set_cached(self.__values_cache, key, values)
+        return values
+
+    def get_filter_mask(self, filters: Dict[str, Tuple] = None, **kwargs) -> np.ndarray:
+        """フィルター条件を満たす（書き込み済みの）シナリオのマスクを返す
+
+        Args:
+            filters (Dict[str, Tuple], optional): 列名（スイープ軸の名前またはVALUE_COLUMN） -> (下限, 上限).
+                下限・上限はNoneの場合は制限しない. Defaults to None.
+            **kwargs: VALUE_COLUMNでフィルターする場合の値の条件（get_valuesの引数）
+
+        Returns:
+            np.ndarray: シナリオ数のbool配列
+        """
+        written, _ = self.__refresh_written()
+        mask = written.copy()
+        for column, (lower, upper) in ({} if filters is None else filters).items():
+            if column == VALUE_COLUMN:
+                values = self.get_values(**kwargs)
+            elif column in self.get_scenario_columns():
+                values = self.get_scenario_columns()[column]
+            else:
+                raise ScenarioExplorerError(
+                    f"filter column is not exist! column is {column}"
+                )
+            if lower is not None:
+                mask &= values >= lower
+            if upper is not None:
+                mask &= values <= upper
+        return mask
+
+    def get_percentile_bands(
+        self,
+        metric: str,
+        selection: Dict = None,
+        quantiles: Sequence[float] = (0.05, 0.25, 0.5, 0.75, 0.95),
+        mask: np.ndarray = None,
+    ) -> pd.DataFrame:
+        """年ごとの分位点の帯（ファンチャート用）と平均を返す
+
+        Args:
+            metric (str): 項目
+            selection (Dict, optional): 物件名などの軸 -> ラベル. Defaults to None.
+            quantiles (Sequence[float], optional): 分位点. Defaults to (0.05, 0.25, 0.5, 0.75, 0.95).
+            mask (np.ndarray, optional): 集計するシナリオのマスク. Defaults to None（書き込み済みの全シナリオ）.
+
+        Returns:
+            pd.DataFrame: 年をインデックスとした分位点（p5など）, 平均, 件数
+        """
+        selection = {} if selection is None else selection
+        written, written_fingerprint = self.__refresh_written()
+        mask = written if mask is None else mask & written
+        key = (
+            written_fingerprint,
+            metric,
+            tuple(sorted(selection.items())),
+            tuple(quantiles),
+            fingerprint_bytes(mask.tobytes()) if mask.sum() < len(mask) else None,
+        )
+        bands_df = self.__get_cached(self.__bands_cache, key)
+        if bands_df is None:
+            aggregator = StreamingAggregator(years=self.get_years(), columns=[metric])
+            for start, chunk in self.cube.iter_select(
+                selection={**selection, METRIC_AXIS: [metric]},
+                chunk_size=self.chunk_size,
+            ):
+                chunk_mask = mask[start : start + len(chunk)]
+                if chunk_mask.any():
+                    aggregator.update({metric: chunk[chunk_mask][..., 0]})
+            summary_df = aggregator.summarize(quantiles=quantiles)
+            bands_df = summary_df.xs(metric, level=METRIC_AXIS)[
+                [f"p{q * 100:g}" for q in quantiles] + ["mean", "count"]
+            ]
+            self.__set_cached(self.__bands_cache, key, bands_df)
+        return bands_df
+
+    def get_heatmap(
+        self,
+        metric: str,
+        year,
+        x_axis: str,
+        y_axis: str,
+        selection: Dict = None,
+        statistic: str = "mean",
+        max_cells: int = 50,
+    ) -> pd.DataFrame:
+        """2つのスイープ軸の値ごとの集計値（その他の軸の全組み合わせの集計）を返す
+
+        軸の値の数がmax_cellsを超える場合は, 隣り合う値をまとめてmax_cells以下のセルに間引く.
+
+        Args:
+            metric (str): 項目
+            year: 年
+            x_axis (str): 列とするスイープ軸の名前
+            y_axis (str): 行とするスイープ軸の名前
+            selection (Dict, optional): 物件名などの軸 -> ラベル. Defaults to None.
+            statistic (str, optional): 集計方法（mean, median, min, max）. Defaults to "mean".
+            max_cells (int, optional): 1つの軸あたりの最大のセル数. Defaults to 50.
+
+        Returns:
+            pd.DataFrame: y_axisの値を行, x_axisの値を列とした集計値
+        """
+        axis_names = self.get_sweep_axis_names()
+        for axis_name in (x_axis, y_axis):
+            if axis_name not in axis_names:
+                raise ScenarioExplorerError(
+                    f"sweep axis is not exist! axis is {axis_name}"
+                )
+        if x_axis == y_axis:
+            raise ScenarioExplorerError("x_axis and y_axis must be different!")
+        if statistic not in HEATMAP_STATISTICS:
+            raise ScenarioExplorerError(
+                f"statistic is not supported! value is {statistic}"
+            )
+
+        # シナリオ番号はスイープ軸の値の組み合わせの格子に対応するため, 格子に変形して集計する
+        values = self.get_values(metric=metric, year=year, selection=selection)
+        grid = values.reshape([len(axis.values) for axis in self.space.axes])
+        x_index, y_index = axis_names.index(x_axis), axis_names.index(y_axis)
+        grid = np.moveaxis(grid, (y_index, x_index), (0, 1))
+        grid = grid.reshape(grid.shape[0], grid.shape[1], -1)
+        x_values = self.space.axes[x_index].values
+        y_values = self.space.axes[y_index].values
+        y_bins = np.array_split(np.arange(len(y_values)), min(len(y_values), max_cells))
+        x_bins = np.array_split(np.arange(len(x_values)), min(len(x_values), max_cells))
+        cells = np.full((len(y_bins), len(x_bins)), np.nan)
+        with warnings.catch_warnings():
+            # 全て未書き込みのセルはNaNとする
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            for i, y_bin in enumerate(y_bins):
+                for j, x_bin in enumerate(x_bins):
+                    cell_values = grid[
+                        y_bin[0] : y_bin[-1] + 1, x_bin[0] : x_bin[-1] + 1
+                    ]
+                    if not np.isnan(cell_values).all():
+                        cells[i, j] = HEATMAP_STATISTICS[statistic](cell_values)
+        return pd.DataFrame(
+            cells,
+            index=pd.Index(_get_bin_labels(y_values, y_bins), name=y_axis),
+            columns=pd.Index(_get_bin_labels(x_values, x_bins), name=x_axis),
+        )
+
+    def get_page(
+        self,
+        metric: str,
+        year,
+        selection: Dict = None,
+        filters: Dict[str, Tuple] = None,
+        sort_ascending: Optional[bool] = None,
+        page: int = 0,
+        page_size: int = 50,
+    ) -> Tuple[pd.DataFrame, int]:
+        """フィルター条件を満たすシナリオの表の1ページを返す
+
+        Args:
+            metric (str): 項目
+            year: 年
+            selection (Dict, optional): 物件名などの軸 -> ラベル. Defaults to None.
+            filters (Dict[str, Tuple], optional): get_filter_maskのフィルター条件. Defaults to None.
+            sort_ascending (Optional[bool], optional): 値で並び替える場合の昇順・降順. Defaults to None（シナリオ番号順）.
+            page (int, optional): ページ番号（0始まり）. Defaults to 0.
+            page_size (int, optional): 1ページの行数. Defaults to 50.
+
+        Returns:
+            Tuple[pd.DataFrame, int]: ページの表, フィルター条件を満たすシナリオ数
+        """
+        values = self.get_values(metric=metric, year=year, selection=selection)
+        mask = self.get_filter_mask(
+            filters=filters, metric=metric, year=year, selection=selection
+        )
+        indices = np.flatnonzero(mask)
+        if sort_ascending is not None:
+            order = np.argsort(values[indices], kind="stable")
+            indices = indices[order if sort_ascending else order[::-1]]
+        page_indices = indices[page * page_size : (page + 1) * page_size]
+        df = pd.DataFrame(
+            {
+                column: column_values[page_indices]
+                for column, column_values in self.get_scenario_columns().items()
+            }
+        )
+        df[VALUE_COLUMN] = values[page_indices]
+        return df, len(indices)
+
+    def __refresh_written(self) -> Tuple[np.ndarray, str]:
+        # 書き込み中のキューブでも最新の書き込みフラグで集計する（キューブはメモリマップのため読み直しは軽い）
+        written = self.cube.get_written()
+        with self.__lock:
+            if self.__written is None or not np.array_equal(written, self.__written):
+                self.__written = written
+                self.__written_fingerprint = fingerprint_bytes(written.tobytes())
+            return self.__written, self.__written_fingerprint
+
+    def __get_cached(self, cache: OrderedDict, key: Tuple):
+        with self.__lock:
+            if key not in cache:
+                return None
+            cache.move_to_end(key)
+            return cache[key]
+
+    def __set_cached(self, cache: OrderedDict, key: Tuple, value) -> None:
+        with self.__lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+
+
+def _get_bin_labels(values: list, bins: List[np.ndarray]) -> List[str]:
+    return [
+        str(values[b[0]]) if len(b) == 1 else f"{values[b[0]]}〜{values[b[-1]]}"
+        for b in bins
+    ]
+
+
+class ScenarioExplorerError(Exception):
+    pass
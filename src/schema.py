@@ -0,0 +1,70 @@
+# パラメーターファイルのシート名
+INPUT_SHEET_NAMES = [
+    "income_simulation",
+    "building_information",
+    "rent_decrease_rate",
+    "basic_exemption",
+    "exemption_from_income",
+    "building_durable_life",
+    "other_parameters",
+]
+
+# 日付の物件情報の項目（JSON, YAMLのパラメーターファイルでは"2021-09-01"の形式の文字列で記述する）
+DATE_BUILDING_ITEMS = ("築年", "契約日", "売却予定日")
+
+# シミュレーション年（income_simulationシートの年）を表す項目
+YEAR_ITEM = ("income_simulation", "年")
+
+# 読み込み時に算出される物件情報の項目と、その算出に利用する項目の対応
+DERIVED_BUILDING_ITEMS = {
+    "築年数": (("building_information", "築年"), ("building_information", "契約日")),
+    "減価償却期間（躯体部分）": (
+        ("building_information", "築年数"),
+        ("building_information", "構造"),
+        ("building_durable_life", "耐用年数"),
+    ),
+    "減価償却期間（設備部分）": (("building_information", "築年数"),),
+    "減価償却費用合計（躯体）": (
+        ("building_information", "物件価格"),
+        ("building_information", "建物割合（%）"),
+        ("building_information", "躯体割合（建物の内）"),
+    ),
+    "減価償却費用合計（設備）": (
+        ("building_information", "物件価格"),
+        ("building_information", "建物割合（%）"),
+        ("building_information", "設備割合（建物の内）"),
+    ),
+    "減価償却費用（躯体）（円/年）": (
+        ("building_information", "減価償却費用合計（躯体）"),
+        ("building_information", "減価償却期間（躯体部分）"),
+    ),
+    "減価償却費用（設備）（円/年）": (
+        ("building_information", "減価償却費用合計（設備）"),
+        ("building_information", "減価償却期間（設備部分）"),
+    ),
+    "月利（%）": (("building_information", "金利（%）"),),
+    "借入金額": (
+        ("building_information", "物件価格"),
+        ("building_information", "初期投資金額"),
+    ),
+}
+
+
+def expand_parameter_items(items) -> set:
+    """算出項目を、その算出元となる入力項目に展開する
+
+    Args:
+        items: (シート名, 項目名)のリスト
+
+    Returns:
+        set: 入力項目の(シート名, 項目名)の集合
+    """
+    expanded = set()
+    pending = list(items)
+    while len(pending) > 0:
+        sheet_name, item = pending.pop()
+        if sheet_name == "building_information" and item in DERIVED_BUILDING_ITEMS:
+            pending.extend(DERIVED_BUILDING_ITEMS[item])
+        else:
+            expanded.add((sheet_name, item))
+    return expanded
@@ -0,0 +1,143 @@
+"""計算結果の整合性の確認
+
+サンプルのパラメーターファイルを変更したケースで計算し, 期待する性質を満たすことを確認する.
+いずれかの確認に失敗した場合は終了コード1で終了する.
+
+    python self_check.py
+"""
+
+from array_pipeline import ArrayParameters, execute_array_pipeline, save_results_csv
+from benchmark_export import SAMPLE_PARAMETER_FILE_PATH
+from executor import execute_stages
+from investment_metrics import get_npv_column
+from params import Parameters, ParametersReader
+from vacancy import StochasticCashFlowSimulator, VacancyModel
+import argparse
+import datetime
+import numpy as np
+import openpyxl
+import os
+import sys
+import tempfile
+
+
+def read_sample_parameters() -> Parameters:
+    """サンプルのパラメーターファイル（数式の計算結果を値とする）を読み込む"""
+    workbook = openpyxl.load_workbook(SAMPLE_PARAMETER_FILE_PATH, data_only=True)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, "parameters.xlsx")
+        workbook.save(file_path)
+        return ParametersReader(params_file_path=file_path).read_params()
+
+
+def with_late_purchase(
+    parameters: Parameters, building_name: str, purchase_year: int
+) -> Parameters:
+    """物件の契約日をシミュレーション開始より後の年に変更したパラメーターを返す"""
+    return parameters.with_value(
+        "契約日", datetime.datetime(purchase_year, 1, 1), building_name=building_name
+    ).with_value(
+        "売却予定日",
+        datetime.datetime(purchase_year + 10, 1, 1),
+        building_name=building_name,
+    )
+
+
+def check_late_purchase_rent_factors(parameters: Parameters) -> str:
+    """シミュレーション開始より後に購入した物件の家賃係数が購入年から累積することを確認する"""
+    building_name = parameters.get_building_names()[-1]
+    purchase_year = parameters.get_simulation_start_year() + 9
+    parameters = with_late_purchase(
+        parameters=parameters, building_name=building_name, purchase_year=purchase_year
+    )
+    simulator = StochasticCashFlowSimulator(
+        parameters=parameters,
+        model=VacancyModel(turnover_rate=0.5, rent_reset_mean=-0.1),
+    )
+    occupancy = simulator.simulate_occupancy(path_count=20000)
+    building_index = parameters.get_building_names().index(building_name)
+    year_index = purchase_year - parameters.get_simulation_start_year()
+
+    if occupancy["退去"][:, building_index, :year_index].any():
+        return "turnover before purchase year"
+    # 購入年は半数のパスで1回だけ家賃が改定される（期待値は0.5 * 0.9 + 0.5 * 1.0 = 0.95）
+    mean_factor = occupancy["家賃係数"][:, building_index, year_index].mean()
+    if not np.isclose(mean_factor, 0.95, atol=0.01):
+        return f"mean rent factor in purchase year is {mean_factor:.3f}, expected 0.95"
+    return ""
+
+
+def check_array_pipeline_parity(parameters: Parameters) -> str:
+    """pandasでの計算（Executor）とnumpyの配列での計算（--lean）のCSVが一致することを確認する"""
+    building_name = parameters.get_building_names()[-1]
+    cases = {
+        "sample": parameters,
+        "late purchase": with_late_purchase(
+            parameters=parameters,
+            building_name=building_name,
+            purchase_year=parameters.get_simulation_start_year() + 9,
+        ),
+    }
+    for case_name, case_parameters in cases.items():
+        dfs = execute_stages(parameters=case_parameters)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            save_results_csv(
+                results=execute_array_pipeline(
+                    parameters=ArrayParameters.from_parameters(case_parameters)
+                ),
+                output_folder_path=tmp_dir,
+            )
+            file_names = sorted(os.listdir(tmp_dir))
+            if file_names != sorted(f"{name}.csv" for name in dfs):
+                return f"{case_name}: data names are different! {file_names}"
+            for name, df in dfs.items():
+                with open(
+                    os.path.join(tmp_dir, f"{name}.csv"), encoding="utf-8", newline=""
+                ) as f:
+                    if f.read() != df.to_csv():
+                        return f"{case_name}: {name} is different"
+    return ""
+
+
+def check_late_purchase_investment(parameters: Parameters) -> str:
+    """シミュレーション開始より後に購入した物件の初期投資金額が購入年の年初の支出としてNPVに反映されることを確認する"""
+    building_name = parameters.get_building_names()[-1]
+    start_year = parameters.get_simulation_start_year()
+    parameters = with_late_purchase(
+        parameters=parameters, building_name=building_name, purchase_year=start_year + 9
+    )
+    dfs = execute_stages(parameters=parameters)
+
+    # 0年目からの収支に, 物件ごとの初期投資金額を購入年の年初の支出として加える
+    flows = np.concatenate([[0.0], dfs["cash_flow_data"]["収支差額"].to_numpy()])
+    for name in parameters.get_building_names():
+        period = max(parameters.get_purchase_date(name).year - start_year, 0)
+        flows[period] -= parameters.get_value("初期投資金額", building_name=name)
+    expected = np.sum(flows / 1.03 ** np.arange(len(flows)))
+    npv = dfs["investment_metrics_data"][get_npv_column(0.03)].iloc[0]
+    if not np.isclose(npv, expected):
+        return f"NPV is {npv:,.0f}, expected {expected:,.0f}"
+    return ""
+
+
+CHECKS = [
+    ("late purchase rent factors", check_late_purchase_rent_factors),
+    ("array pipeline parity", check_array_pipeline_parity),
+    ("late purchase investment", check_late_purchase_investment),
+]
+
+
+def main() -> int:
+    argparse.ArgumentParser().parse_args()
+
+    parameters = read_sample_parameters()
+    is_failed = False
+    for name, check in CHECKS:
+        message = check(parameters)
+        print(f"{name}: {'FAILED ' + message if message else 'ok'}")
+        is_failed = is_failed or bool(message)
+    return 1 if is_failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
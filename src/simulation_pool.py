@@ -0,0 +1,419 @@
+"""ダッシュボードの複数セッションから共有する, 上限付きのシミュレーションのワーカープール
+
+シミュレーションはワーカープロセスで実行し, ダッシュボードのリクエストのスレッドを占有しない.
+実行中のジョブ数はワーカー数以下とし, 待ちのジョブはプール内のキューで先着順に実行するため, 待ち順位を返せる.
+待ちのジョブ数の上限とセッションごとの実行中のジョブ数（1つ）で受け付けを制限する.
+
+ワーカーはステージの計算が完了するごとに, 表示するデータをジョブのキュー（Managerのプロキシ）で送るため,
+ダッシュボードは計算の途中から順にグラフ・表を表示できる. 実行中のジョブはステージの区切りで中止できる.
+
+計算結果はワーカーのジョブごとの一時フォルダに保存してzip・Excelファイルのバイト列としてメモリで返し,
+共有の結果フォルダに書き込まない（ファイル名はジョブIDを含めて一意とする）.
+"""
+
+from executor import Executor
+from excel_export import frames_to_columns, get_result_xlsx_file_name, save_results_xlsx
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from datetime import datetime
+from queue import Empty
+from typing import Dict, NamedTuple, Optional
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+# 待ちのジョブ数の上限（超える場合は受け付けない）
+DEFAULT_MAX_PENDING = 64
+
+# 完了したジョブの結果を保持する時間（秒）. 取得されずに経過した結果は破棄する
+RESULT_TTL = 600
+
+# 実行時間の見積もりの初期値（秒）と, 完了したジョブの実行時間で更新する指数移動平均の重み
+INITIAL_ESTIMATED_TIME = 5.0
+ESTIMATED_TIME_WEIGHT = 0.2
+
+# ダッシュボードに表示するデータ（ワーカーから返すDataFrame）
+DISPLAY_DATA_NAMES = ("tax_data", "cash_flow_data", "investment_metrics_data")
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class SimulationResult:
+    """ジョブの計算結果（表示するデータと, ダウンロードするファイルのバイト列）"""
+
+    def __init__(
+        self,
+        dfs: dict,
+        zip_bytes: bytes,
+        zip_file_name: str,
+        xlsx_bytes: bytes,
+        xlsx_file_name: str,
+    ) -> None:
+        self.dfs = dfs
+        self.zip_bytes = zip_bytes
+        self.zip_file_name = zip_file_name
+        self.xlsx_bytes = xlsx_bytes
+        self.xlsx_file_name = xlsx_file_name
+
+
+class JobStatus(NamedTuple):
+    """ジョブの状態
+
+    positionは待ちのジョブの中での順位（1始まり. 待ちでない場合は0）,
+    etaは完了までの残り時間の見積もり（秒. 完了した場合はNone）とする.
+    completed_stage_countとstage_countは計算を完了したステージ数と, 計算するステージの総数（開始前は0）とする.
+    """
+
+    state: str
+    position: int
+    pending_count: int
+    running_count: int
+    elapsed_time: float
+    eta: Optional[float]
+    completed_stage_count: int = 0
+    stage_count: int = 0
+    error: Optional[str] = None
+
+
+class SimulationJob:
+    def __init__(self, session_id: str, parameter_bytes: bytes, file_name: str) -> None:
+        self.job_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.parameter_bytes = parameter_bytes
+        self.file_name = file_name
+        self.state = QUEUED
+        self.submitted_time = time.perf_counter()
+        self.started_time = None
+        self.finished_time = None
+        self.result = None
+        self.error = None
+        # ワーカーから受け取った計算済みのデータと, ステージの進捗
+        self.dfs = {}
+        self.completed_stage_count = 0
+        self.stage_count = 0
+        # ワーカーとのステージの完了のキューと, 中止のイベント（Managerのプロキシ）
+        self.events = None
+        self.cancel_event = None
+
+
+class SimulationPool:
+    """シミュレーションのワーカープール（サーバーのプロセスで1つを共有する）
+
+    Args:
+        max_workers (int, optional): ワーカープロセス数. Defaults to None（CPU数）.
+        max_pending (int, optional): 待ちのジョブ数の上限. Defaults to DEFAULT_MAX_PENDING.
+        result_ttl (float, optional): 完了したジョブの結果を保持する時間（秒）. Defaults to RESULT_TTL.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = None,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        result_ttl: float = RESULT_TTL,
+    ) -> None:
+        self.max_workers = (os.cpu_count() or 1) if max_workers is None else max_workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        # 完了済みのFutureのコールバックは登録したスレッドで呼ばれるため, 再入可能なロックとする
+        self.__lock = threading.RLock()
+        self.__jobs: Dict[str, SimulationJob] = {}
+        self.__pending = deque()
+        self.__running_count = 0
+        self.__estimated_time = INITIAL_ESTIMATED_TIME
+        self.__executor = self.__create_executor()
+        # Managerのプロセスはワーカーと同様に, 最初のジョブを受け付けたときに起動する
+        self.__manager = None
+
+    def submit(
+        self, session_id: str, parameter_bytes: bytes, file_name: str
+    ) -> SimulationJob:
+        """ジョブを受け付ける（待ちのジョブ数が上限の場合, セッションのジョブが完了していない場合は受け付けない）
+
+        Args:
+            session_id (str): セッションID
+            parameter_bytes (bytes): パラメーターファイルの内容
+            file_name (str): パラメーターファイル名（拡張子で形式を判定する）
+
+        Returns:
+            SimulationJob: 受け付けたジョブ
+        """
+        with self.__lock:
+            self.__remove_expired_jobs()
+            for job in self.__jobs.values():
+                if job.session_id == session_id and job.state in (QUEUED, RUNNING):
+                    raise SimulationPoolBusyError(
+                        "simulation of this session is already running! please wait for it to finish."
+                    )
+            if len(self.__pending) >= self.max_pending:
+                raise SimulationPoolBusyError(
+                    f"simulation queue is full ({len(self.__pending)} jobs are waiting)! please retry later."
+                )
+            job = SimulationJob(
+                session_id=session_id,
+                parameter_bytes=parameter_bytes,
+                file_name=file_name,
+            )
+            if self.__manager is None:
+                self.__manager = multiprocessing.get_context("spawn").Manager()
+            job.events = self.__manager.Queue()
+            job.cancel_event = self.__manager.Event()
+            self.__jobs[job.job_id] = job
+            self.__pending.append(job)
+            self.__dispatch()
+        return job
+
+    def get_status(self, job_id: str) -> JobStatus:
+        with self.__lock:
+            job = self.__get_job(job_id)
+            self.__receive_events(job=job)
+            now = time.perf_counter()
+            position = 0
+            if job.state == QUEUED:
+                position = self.__pending.index(job) + 1
+                # 先に待っているジョブと実行中のジョブが, ワーカー数ずつ順に完了するとして見積もる
+                rounds = (position - 1) // self.max_workers + 1
+                eta = (rounds + 1) * self.__estimated_time
+                elapsed_time = now - job.submitted_time
+            elif job.state == RUNNING:
+                elapsed_time = now - job.started_time
+                eta = max(self.__estimated_time - elapsed_time, 0.0)
+            else:
+                elapsed_time = job.finished_time - job.submitted_time
+                eta = None
+            return JobStatus(
+                state=job.state,
+                position=position,
+                pending_count=len(self.__pending),
+                running_count=self.__running_count,
+                elapsed_time=elapsed_time,
+                eta=eta,
+                completed_stage_count=job.completed_stage_count,
+                stage_count=job.stage_count,
+                error=job.error,
+            )
+
+    def get_dfs(self, job_id: str) -> dict:
+        """ジョブの計算済みの表示するデータ（実行中の場合は完了したステージのみ）を返す"""
+        with self.__lock:
+            job = self.__get_job(job_id)
+            self.__receive_events(job=job)
+            if job.result is not None:
+                return dict(job.result.dfs)
+            return dict(job.dfs)
+
+    def cancel(self, job_id: str) -> None:
+        """ジョブを中止する（待ちのジョブはすぐに, 実行中のジョブは計算中のステージの完了後に中止する）"""
+        with self.__lock:
+            job = self.__get_job(job_id)
+            if job.state == QUEUED:
+                self.__pending.remove(job)
+                job.state = CANCELLED
+                job.finished_time = time.perf_counter()
+                self.__release(job=job)
+            elif job.state == RUNNING:
+                job.cancel_event.set()
+
+    def get_estimated_time(self) -> float:
+        """1ジョブの実行時間の見積もり（秒）"""
+        return self.__estimated_time
+
+    def pop_result(self, job_id: str) -> SimulationResult:
+        """完了したジョブの結果を返し, プールから削除する（結果はセッション側で保持する）"""
+        with self.__lock:
+            job = self.__get_job(job_id)
+            if job.state == CANCELLED:
+                del self.__jobs[job_id]
+                raise SimulationCancelledError(
+                    f"simulation is cancelled! job_id is {job_id}"
+                )
+            if job.state == FAILED:
+                del self.__jobs[job_id]
+                raise SimulationPoolError(f"simulation is failed! error is {job.error}")
+            if job.state != DONE:
+                raise SimulationPoolError(
+                    f"simulation is not finished! job_id is {job_id}"
+                )
+            del self.__jobs[job_id]
+            return job.result
+
+    def shutdown(self) -> None:
+        self.__executor.shutdown(wait=False, cancel_futures=True)
+        if self.__manager is not None:
+            self.__manager.shutdown()
+
+    def __dispatch(self) -> None:
+        """ワーカーに空きがあれば, 待ちのジョブを先着順に実行する（ロックを取得して呼び出す）"""
+        while self.__running_count < self.max_workers and len(self.__pending) > 0:
+            job = self.__pending.popleft()
+            job.state = RUNNING
+            job.started_time = time.perf_counter()
+            self.__running_count += 1
+            try:
+                future = self.__submit_to_executor(job=job)
+            except BrokenProcessPool:
+                # ワーカーが異常終了した場合はプールを作り直す
+                self.__executor = self.__create_executor()
+                future = self.__submit_to_executor(job=job)
+            # パラメーターファイルの内容はワーカーに渡した後は保持しない
+            job.parameter_bytes = None
+            future.add_done_callback(
+                lambda future, job=job: self.__on_finished(job=job, future=future)
+            )
+
+    def __submit_to_executor(self, job: SimulationJob) -> Future:
+        return self.__executor.submit(
+            run_simulation,
+            parameter_bytes=job.parameter_bytes,
+            file_name=job.file_name,
+            job_id=job.job_id,
+            events=job.events,
+            cancel_event=job.cancel_event,
+        )
+
+    def __on_finished(self, job: SimulationJob, future: Future) -> None:
+        with self.__lock:
+            job.finished_time = time.perf_counter()
+            self.__running_count -= 1
+            try:
+                job.result = future.result()
+                job.state = DONE
+                elapsed_time = job.finished_time - job.started_time
+                self.__estimated_time += ESTIMATED_TIME_WEIGHT * (
+                    elapsed_time - self.__estimated_time
+                )
+            except SimulationCancelledError:
+                job.state = CANCELLED
+            except Exception as e:
+                job.state = FAILED
+                job.error = f"{type(e).__name__}: {e}"
+            self.__release(job=job)
+            self.__dispatch()
+
+    def __receive_events(self, job: SimulationJob) -> None:
+        """ワーカーから送られたステージの完了を受け取る（ロックを取得して呼び出す）"""
+        if job.events is None:
+            return
+        while True:
+            try:
+                name, df, completed_count, stage_count = job.events.get_nowait()
+            except Empty:
+                return
+            if df is not None:
+                job.dfs[name] = df
+            job.completed_stage_count = completed_count
+            job.stage_count = stage_count
+
+    def __release(self, job: SimulationJob) -> None:
+        """完了したジョブのキュー・イベントを受け取り, Managerのオブジェクトを解放する（ロックを取得して呼び出す）"""
+        self.__receive_events(job=job)
+        job.events = None
+        job.cancel_event = None
+
+    def __remove_expired_jobs(self) -> None:
+        now = time.perf_counter()
+        for job_id in [
+            job.job_id
+            for job in self.__jobs.values()
+            if job.finished_time is not None
+            and now - job.finished_time > self.result_ttl
+        ]:
+            del self.__jobs[job_id]
+
+    def __get_job(self, job_id: str) -> SimulationJob:
+        if job_id not in self.__jobs:
+            raise SimulationPoolError(f"job is not exist! job_id is {job_id}")
+        return self.__jobs[job_id]
+
+    def __create_executor(self) -> ProcessPoolExecutor:
+        # サーバーのスレッドを複製しないよう, ワーカーはspawnで起動する
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+
+def run_simulation(
+    parameter_bytes: bytes,
+    file_name: str,
+    job_id: str,
+    events=None,
+    cancel_event=None,
+) -> SimulationResult:
+    """パラメーターファイルの内容からシミュレーションを実行し, 計算結果のファイルをバイト列で返す（ワーカーで実行する）
+
+    Args:
+        parameter_bytes (bytes): パラメーターファイルの内容
+        file_name (str): パラメーターファイル名
+        job_id (str): ジョブID（ファイル名に含める）
+        events (optional): ステージの完了（ステージ名, 表示するデータ, 完了したステージ数, ステージの総数）を送るキュー. Defaults to None.
+        cancel_event (optional): 設定された場合にステージの区切りで中止するイベント. Defaults to None.
+
+    Returns:
+        SimulationResult: 計算結果
+    """
+    parameter_file = io.BytesIO(parameter_bytes)
+    parameter_file.name = file_name
+    artifact_name = f"result_{datetime.now().strftime('%y%m%d%H%M%S')}_{job_id[:8]}"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        result_folder = os.path.join(tmp_dir, artifact_name)
+        executor = Executor(
+            parameter_file_path=parameter_file, result_folder=result_folder
+        )
+        dfs = {}
+        for event in executor.iter_execute():
+            dfs[event.name] = event.df
+            if events is not None:
+                df = event.df if event.name in DISPLAY_DATA_NAMES else None
+                events.put((event.name, df, event.completed_count, event.stage_count))
+            if cancel_event is not None and cancel_event.is_set():
+                # 一時フォルダは削除され, ワーカーは次のジョブを実行できる
+                raise SimulationCancelledError(
+                    f"simulation is cancelled! job_id is {job_id}"
+                )
+        executor.save_results(dfs=dfs)
+        zip_file_path = shutil.make_archive(
+            base_name=os.path.join(tmp_dir, artifact_name),
+            format="zip",
+            root_dir=result_folder,
+        )
+
+        # 全ての計算結果をシートとした1つのExcelファイルも作成する（zipと同じくジョブIDをファイル名に含める）
+        xlsx_file_path = save_results_xlsx(
+            results=frames_to_columns(dfs=dfs),
+            file_path=os.path.join(
+                tmp_dir, get_result_xlsx_file_name(file_name, suffix=f"_{job_id[:8]}")
+            ),
+        )
+        with open(zip_file_path, "rb") as f:
+            zip_bytes = f.read()
+        with open(xlsx_file_path, "rb") as f:
+            xlsx_bytes = f.read()
+    return SimulationResult(
+        dfs={name: dfs[name] for name in DISPLAY_DATA_NAMES if name in dfs},
+        zip_bytes=zip_bytes,
+        zip_file_name=os.path.basename(zip_file_path),
+        xlsx_bytes=xlsx_bytes,
+        xlsx_file_name=os.path.basename(xlsx_file_path),
+    )
+
+
+class SimulationPoolError(Exception):
+    pass
+
+
+class SimulationPoolBusyError(SimulationPoolError):
+    pass
+
+
+class SimulationCancelledError(SimulationPoolError):
+    pass
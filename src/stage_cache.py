@@ -0,0 +1,122 @@
+import pandas as pd
+from collections import OrderedDict
+from typing import Callable, Dict
+import threading
+
+# キャッシュに保持する計算結果の合計サイズの既定値（バイト）
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class StageCache:
+    """ステージの計算結果のLRUキャッシュ（内容アドレス方式）
+
+    キーはステージが参照する入力項目の値と, 上流のステージのキーから計算したハッシュ値とする
+    （executor.get_stage_keysで計算する）. 同じキーの計算結果は同じ入力から計算されるため,
+    スイープのシナリオ間で共通する部分の計算（給与のみを変える場合の減価償却・ローンなど）は1度だけ実行する.
+    計算結果の合計サイズがmax_bytesを超える場合は, 最も長く利用されていない計算結果から削除する.
+
+    Args:
+        max_bytes (int, optional): 保持する計算結果の合計サイズの上限（バイト）. Defaults to DEFAULT_MAX_BYTES.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        if max_bytes < 1:
+            raise StageCacheError(f"max_bytes must be positive! value is {max_bytes}")
+        self.__max_bytes = max_bytes
+        self.__entries = OrderedDict()
+        self.__current_bytes = 0
+        self.__lock = threading.Lock()
+        self.__stats: Dict[str, Dict[str, int]] = {}
+
+    def get_or_calculate(
+        self, name: str, key: str, calculate: Callable[[], pd.DataFrame]
+    ) -> pd.DataFrame:
+        """キャッシュ済みの計算結果を返す. 存在しない場合は計算してキャッシュする
+
+        返す計算結果はキャッシュと共有するため, 変更する場合はコピーすること.
+
+        Args:
+            name (str): ステージ名（統計情報の集計に利用する）
+            key (str): ステージのキー
+            calculate (Callable[[], pd.DataFrame]): ステージの計算処理
+
+        Returns:
+            pd.DataFrame: 計算結果
+        """
+        with self.__lock:
+            stats = self.__get_stage_stats(name=name)
+            if key in self.__entries:
+                self.__entries.move_to_end(key)
+                stats["hits"] += 1
+                return self.__entries[key][1]
+
+        df = calculate()
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        with self.__lock:
+            stats["misses"] += 1
+            # 上限を超える計算結果は保持しない
+            if size > self.__max_bytes or key in self.__entries:
+                return df
+            self.__entries[key] = (name, df, size)
+            self.__current_bytes += size
+            while self.__current_bytes > self.__max_bytes:
+                _, (evicted_name, _, evicted_size) = self.__entries.popitem(last=False)
+                self.__current_bytes -= evicted_size
+                self.__get_stage_stats(name=evicted_name)["evictions"] += 1
+        return df
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """ステージごとのキャッシュの統計情報を返す
+
+        Returns:
+            Dict[str, Dict[str, float]]: ステージ名 -> hits, misses, evictions, hit_rate（ヒット数 / 参照数）, currsize（保持している計算結果の数）
+        """
+        with self.__lock:
+            currsizes = {}
+            for name, _, _ in self.__entries.values():
+                currsizes[name] = currsizes.get(name, 0) + 1
+            return {
+                name: {
+                    **stats,
+                    "hit_rate": _get_hit_rate(stats),
+                    "currsize": currsizes.get(name, 0),
+                }
+                for name, stats in self.__stats.items()
+            }
+
+    def get_size(self) -> int:
+        """保持している計算結果の合計サイズ（バイト）"""
+        with self.__lock:
+            return self.__current_bytes
+
+    def format_stats(self) -> str:
+        """ステージごとのヒット率を表示用の文字列で返す"""
+        lines = []
+        for name, stats in self.get_stats().items():
+            lines.append(
+                f"{name}: hit rate {stats['hit_rate']:.1%} "
+                f"({stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions)"
+            )
+        lines.append(f"cache size {self.get_size() / 1024 / 1024:.1f}MB")
+        return "\n".join(lines)
+
+    def clear(self) -> None:
+        """計算結果と統計情報を削除する"""
+        with self.__lock:
+            self.__entries.clear()
+            self.__current_bytes = 0
+            self.__stats.clear()
+
+    def __get_stage_stats(self, name: str) -> Dict[str, int]:
+        if name not in self.__stats:
+            self.__stats[name] = {"hits": 0, "misses": 0, "evictions": 0}
+        return self.__stats[name]
+
+
+def _get_hit_rate(stats: Dict[str, int]) -> float:
+    lookup_count = stats["hits"] + stats["misses"]
+    return 0.0 if lookup_count == 0 else stats["hits"] / lookup_count
+
+
+class StageCacheError(Exception):
+    pass
@@ -0,0 +1,312 @@
+from params import Parameters
+from executor import execute_stages, get_dependent_stage_names
+from checkpoint import Progress, ProgressTracker, fingerprint_json
+from parameters_diff import get_parameters_fingerprint
+from result_cube import METRIC_AXIS, ResultCube
+from stage_cache import StageCache
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+import time
+
+# 計算結果キューブの軸とする列（項目の軸を除く）
+CUBE_AXIS_COLUMNS = ["物件名", "年"]
+
+
+class SweepAxis:
+    """スイープで変化させる入力項目と、その値の候補
+
+    Args:
+        item (str): 入力項目名
+        values (list): 値の候補
+        building_name (str, optional): 物件名. 物件情報の項目の場合に指定する.
+    """
+
+    def __init__(self, item: str, values: list, building_name: str = None) -> None:
+        if len(values) == 0:
+            raise SweepError(f"values of sweep axis are empty! item is {item}")
+        self.item = item
+        self.values = list(values)
+        self.building_name = building_name
+
+    def get_name(self) -> str:
+        if self.building_name is None:
+            return self.item
+        return f"{self.building_name}_{self.item}"
+
+    def to_dict(self) -> dict:
+        return {
+            "item": self.item,
+            "values": self.values,
+            "building_name": self.building_name,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "SweepAxis":
+        return cls(
+            item=d["item"], values=d["values"], building_name=d.get("building_name")
+        )
+
+
+class ScenarioSpace:
+    """スイープ軸の全組み合わせからなるシナリオ空間
+
+    シナリオ番号は軸の値の組み合わせに対応する（最後の軸が最も速く変化する）.
+
+    Args:
+        axes (List[SweepAxis]): スイープ軸
+    """
+
+    def __init__(self, axes: List[SweepAxis]) -> None:
+        if len(axes) == 0:
+            raise SweepError("please set at least one sweep axis!")
+        self.axes = list(axes)
+
+    def __len__(self) -> int:
+        return int(np.prod([len(axis.values) for axis in self.axes]))
+
+    def get_values(self, index: int) -> Tuple:
+        """シナリオ番号に対応する軸の値を返す
+
+        Args:
+            index (int): シナリオ番号
+
+        Returns:
+            Tuple: 軸ごとの値
+        """
+        if not 0 <= index < len(self):
+            raise SweepError(f"scenario index is out of range! index is {index}")
+        values = []
+        for axis in reversed(self.axes):
+            index, value_index = divmod(index, len(axis.values))
+            values.append(axis.values[value_index])
+        return tuple(reversed(values))
+
+    def get_axis_names(self) -> List[str]:
+        return [axis.get_name() for axis in self.axes]
+
+    def get_changed_items(self, parameters: Parameters) -> set:
+        return {
+            (
+                parameters.get_item_sheet_name(
+                    item=axis.item, building_name=axis.building_name
+                ),
+                axis.item,
+            )
+            for axis in self.axes
+        }
+
+    def apply(self, parameters: Parameters, index: int) -> Parameters:
+        """シナリオ番号に対応する値を設定したパラメーターを返す"""
+        for axis, value in zip(self.axes, self.get_values(index=index)):
+            parameters = parameters.with_value(
+                item=axis.item, value=value, building_name=axis.building_name
+            )
+        return parameters
+
+    def to_dict(self) -> dict:
+        return {"axes": [axis.to_dict() for axis in self.axes]}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "ScenarioSpace":
+        return cls(axes=[SweepAxis.from_dict(axis) for axis in d["axes"]])
+
+
+class ScenarioRunner:
+    """シナリオ空間の各シナリオを計算する
+
+    基準パラメーターの計算結果を1度だけ作成し、スイープ軸の項目に依存するステージのみをシナリオごとに再計算する.
+    再計算するステージはステージの計算結果のキャッシュを利用し、複数のスイープ軸のうち一部の軸のみに依存する
+    ステージ（給与と金利の軸のローンなど）は、その軸の値の組み合わせごとに1度だけ計算する.
+
+    Args:
+        parameters (Parameters): 基準のパラメーター
+        space (ScenarioSpace): シナリオ空間
+        data_name (str, optional): 出力するデータ名. Defaults to "cash_flow_data".
+        cache (StageCache, optional): ステージの計算結果のキャッシュ. Defaults to None（新たに作成する）.
+    """
+
+    def __init__(
+        self,
+        parameters: Parameters,
+        space: ScenarioSpace,
+        data_name: str = "cash_flow_data",
+        cache: StageCache = None,
+    ) -> None:
+        self.__parameters = parameters
+        self.__space = space
+        self.__data_name = data_name
+        self.cache = StageCache() if cache is None else cache
+        self.__stage_names = get_dependent_stage_names(
+            space.get_changed_items(parameters=parameters)
+        )
+        self.__base_dfs = execute_stages(parameters=parameters, cache=self.cache)
+        if data_name not in self.__base_dfs:
+            raise SweepError(f"{data_name} is not calculated in the simulation!")
+
+    def run_scenario(self, index: int) -> Dict[str, pd.DataFrame]:
+        """1つのシナリオを計算し、全データを返す"""
+        parameters = self.__space.apply(parameters=self.__parameters, index=index)
+        return execute_stages(
+            parameters=parameters,
+            dfs=self.__base_dfs,
+            stage_names=self.__stage_names,
+            cache=self.cache,
+        )
+
+    def run(self, indices: Iterable[int]) -> Dict[str, np.ndarray]:
+        """指定したシナリオを計算し、出力データを列ごとの配列にまとめて返す
+
+        各行はシナリオ・年の組み合わせとなり、シナリオ番号とスイープ軸の値の列を先頭に追加する.
+
+        Args:
+            indices (Iterable[int]): シナリオ番号
+
+        Returns:
+            Dict[str, np.ndarray]: 列名 -> 配列
+        """
+        axis_names = self.__space.get_axis_names()
+        dfs = []
+        for index in indices:
+            df = _reset_index(self.run_scenario(index=index)[self.__data_name])
+            values = self.__space.get_values(index=index)
+            columns = {"シナリオ番号": index}
+            columns.update(dict(zip(axis_names, values)))
+            df = pd.concat(
+                [pd.DataFrame(columns, index=df.index), df], axis=1, copy=False
+            )
+            dfs.append(df)
+        if len(dfs) == 0:
+            return {}
+        return frame_to_columns(pd.concat(dfs, ignore_index=True))
+
+    def run_to_cube(
+        self,
+        directory: str,
+        indices: Iterable[int] = None,
+        chunk_size: int = 100,
+        resume: bool = False,
+        on_progress: Callable[[Progress], None] = None,
+    ) -> ResultCube:
+        """指定したシナリオを計算し, 計算結果キューブに書き込む
+
+        キューブの軸はシナリオ番号, (物件名,) 年, 項目とし, chunk_sizeのシナリオごとに書き込むため,
+        計算結果の全体をメモリに保持しない. シナリオ空間は属性として保存する.
+        チャンクの書き込みごとにチェックポイントを記録し, resumeの場合は書き込み済みで
+        破損していないチャンク（入力・出力のフィンガープリントが記録と一致するもの）をスキップする.
+
+        Args:
+            directory (str): キューブのディレクトリ
+            indices (Iterable[int], optional): シナリオ番号. Defaults to None（全シナリオ）.
+            chunk_size (int, optional): 1回に書き込むシナリオ数. Defaults to 100.
+            resume (bool, optional): 既存のキューブへの書き込みを再開する. Defaults to False.
+            on_progress (Callable[[Progress], None], optional): チャンクごとに進捗を通知する関数. Defaults to None.
+
+        Returns:
+            ResultCube: 書き込んだキューブ
+        """
+        indices = range(len(self.__space)) if indices is None else list(indices)
+        base_columns = frame_to_columns(_reset_index(self.__base_dfs[self.__data_name]))
+        axes = get_cube_axes(columns=base_columns)
+        cube = ResultCube.create_or_open(
+            directory=directory,
+            axes=[("シナリオ番号", range(len(self.__space))), *axes],
+            dtype=get_cube_dtype(columns=base_columns, metrics=axes[-1][1]),
+            attributes={
+                "space": self.__space.to_dict(),
+                "data_name": self.__data_name,
+            },
+            resume=resume,
+        )
+        store = cube.get_checkpoint_store()
+        job_fingerprint = fingerprint_json(
+            {
+                "parameters": get_parameters_fingerprint(parameters=self.__parameters),
+                "space": self.__space.to_dict(),
+                "data_name": self.__data_name,
+            }
+        )
+        tracker = ProgressTracker(total=len(indices), on_progress=on_progress)
+        for start in range(0, len(indices), chunk_size):
+            chunk_indices = list(indices[start : start + chunk_size])
+            key = f"scenarios_{chunk_indices[0]}_{chunk_indices[-1]}"
+            fingerprint = fingerprint_json(
+                {"job": job_fingerprint, "indices": chunk_indices}
+            )
+            if resume and store.is_done(
+                key=key,
+                fingerprint=fingerprint,
+                get_output_fingerprint=lambda _: cube.get_fingerprint(chunk_indices),
+            ):
+                tracker.skip(len(chunk_indices))
+                continue
+
+            chunk_start_time = time.perf_counter()
+            cube.write_columns(self.run(indices=chunk_indices))
+            # キューブをディスクに書き込んでから記録し, 記録のあるチャンクは必ず書き込み済みとする
+            cube.flush()
+            store.record(
+                key=key,
+                fingerprint=fingerprint,
+                outputs={"data": cube.get_fingerprint(chunk_indices)},
+                elapsed_time=time.perf_counter() - chunk_start_time,
+            )
+            tracker.complete(len(chunk_indices))
+        return cube
+
+
+def get_cube_axes(
+    columns: Dict[str, np.ndarray], excluded_columns: Sequence[str] = ()
+) -> List[Tuple[str, list]]:
+    """列ごとの配列から, 計算結果キューブの軸（物件名, 年, 項目）を返す
+
+    Args:
+        columns (Dict[str, np.ndarray]): 列名 -> 配列
+        excluded_columns (Sequence[str], optional): 項目としない列. Defaults to ().
+
+    Returns:
+        List[Tuple[str, list]]: 軸の名前とラベル（出現順）
+    """
+    axes = [
+        (name, list(dict.fromkeys(columns[name].tolist())))
+        for name in CUBE_AXIS_COLUMNS
+        if name in columns
+    ]
+    metrics = [
+        name
+        for name, values in columns.items()
+        if name not in CUBE_AXIS_COLUMNS
+        and name not in excluded_columns
+        and values.dtype.kind in ("i", "u", "f", "b")
+    ]
+    return [*axes, (METRIC_AXIS, metrics)]
+
+
+def get_cube_dtype(columns: Dict[str, np.ndarray], metrics: List[str]) -> np.dtype:
+    """項目の列を全て表せるデータ型を返す（整数のみの場合は整数のまま保存する）"""
+    return np.result_type(*[columns[name].dtype for name in metrics])
+
+
+def _reset_index(df: pd.DataFrame) -> pd.DataFrame:
+    return df.reset_index() if df.index.name is not None else df.copy()
+
+
+def frame_to_columns(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """DataFrameを列ごとの配列に変換する（文字列の列は固定長の文字列配列とする）"""
+    columns = {}
+    for column in df.columns:
+        values = df[column].to_numpy()
+        if values.dtype.kind in ("O", "T") or isinstance(
+            df[column].dtype, pd.StringDtype
+        ):
+            values = values.astype(str)
+        columns[column] = values
+    return columns
+
+
+def columns_to_frame(columns: Dict[str, np.ndarray]) -> pd.DataFrame:
+    return pd.DataFrame({name: values for name, values in columns.items()})
+
+
+class SweepError(Exception):
+    pass
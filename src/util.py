@@ -1,7 +1,90 @@
+import numpy as np
+from datetime import datetime
+from typing import Dict
+import math
+
+# 設備の減価償却上限期間は15年で固定とする
+EQUIPMENT_DURABLE_LIFE = 15
+
+# 所得税の課税所得の区分（上限）ごとの税率と控除額（calc_income_taxと同じ区分）
+INCOME_TAX_BRACKET_UPPERS = np.array(
+    [1949000, 3299000, 6949000, 8999000, 17999000, 39999000, np.inf]
+)
+INCOME_TAX_RATES = np.array([0.05, 0.1, 0.2, 0.23, 0.33, 0.4, 0.45])
+INCOME_TAX_DEDUCTIONS = np.array([0, 97500, 427000, 636000, 1536000, 2796000, 4796000])
+
+# 基礎控除（円）
+BASIC_EXEMPTION = 48 * 10000
+
+
 def convert_positive_number_or_zero(value: float) -> int:
     return int(value) if value >= 0 else 0
 
 
+def calc_building_years(init_date: datetime, purchase_date: datetime) -> int:
+    """築年数を計算する（購入日を0年としてカウントする）"""
+    difftime = purchase_date - init_date
+    return math.ceil(float(difftime.days) / 365)
+
+
+def calc_deprecation_interval(building_limit: int, building_age: int) -> float:
+    """耐用年数と築年数から減価償却期間を計算する"""
+    return (
+        (building_limit - building_age) + 0.2 * float(building_age)
+        if building_age <= building_limit
+        else 0.2 * float(building_age)
+    )
+
+
+def calc_derived_building_values(values, building_limit_of_frame: float) -> dict:
+    """物件情報の算出項目（築年数, 減価償却, ローン関連）を計算する
+
+    Args:
+        values: 物件情報の項目 -> 値（dict, pd.Seriesなど）
+        building_limit_of_frame (float): 構造の耐用年数
+
+    Returns:
+        dict: 算出項目 -> 値（params.DERIVED_BUILDING_ITEMSの順）
+    """
+    derived_values = {}
+
+    # 築年数の計算（購入日を0年としてカウントする）
+    derived_values["築年数"] = calc_building_years(
+        init_date=values["築年"], purchase_date=values["契約日"]
+    )
+
+    # 減価償却費の計算
+    derived_values["減価償却期間（躯体部分）"] = calc_deprecation_interval(
+        building_limit_of_frame, derived_values["築年数"]
+    )
+    derived_values["減価償却期間（設備部分）"] = calc_deprecation_interval(
+        EQUIPMENT_DURABLE_LIFE, derived_values["築年数"]
+    )
+    building_cost = values["物件価格"]
+    building_ratio = float(values["建物割合（%）"]) / 100
+    building_frame_ratio = float(values["躯体割合（建物の内）"]) / 100
+    building_equip_ratio = float(values["設備割合（建物の内）"]) / 100
+    derived_values["減価償却費用合計（躯体）"] = int(
+        building_cost * building_ratio * building_frame_ratio
+    )
+    derived_values["減価償却費用合計（設備）"] = int(
+        building_cost * building_ratio * building_equip_ratio
+    )
+    derived_values["減価償却費用（躯体）（円/年）"] = int(
+        derived_values["減価償却費用合計（躯体）"]
+        / derived_values["減価償却期間（躯体部分）"]
+    )
+    derived_values["減価償却費用（設備）（円/年）"] = int(
+        derived_values["減価償却費用合計（設備）"]
+        / derived_values["減価償却期間（設備部分）"]
+    )
+
+    # ローン関連の計算
+    derived_values["月利（%）"] = values["金利（%）"] / 12
+    derived_values["借入金額"] = values["物件価格"] - values["初期投資金額"]
+    return derived_values
+
+
 def calc_income_deduction(income: int) -> int:
     """給与から給与所得控除額を計算する
 
@@ -51,3 +134,302 @@ def calc_resident_tax(taxable_income: int, area: str) -> int:
     # 特別区民税と都民税を計算している
     # 本来は区ごとに適切な計算式が必要（areaを見て、計算式を分岐させる）
     return int(taxable_income * 0.06 + taxable_income * 0.04)
+
+
+def calc_income_tax_array(taxable_income: np.ndarray) -> np.ndarray:
+    """calc_income_taxを配列の要素ごとに計算する
+
+    Args:
+        taxable_income (np.ndarray): 課税所得（円）
+
+    Returns:
+        np.ndarray: 所得税（円）
+    """
+    taxable_income = np.asarray(taxable_income)
+    # 区分ごとに全要素を計算せず, 要素ごとの区分の税率・控除額のみで計算する（calc_income_taxと同じ演算）
+    brackets = np.searchsorted(INCOME_TAX_BRACKET_UPPERS, taxable_income, side="left")
+    income_tax = (
+        taxable_income * INCOME_TAX_RATES[brackets] - INCOME_TAX_DEDUCTIONS[brackets]
+    )
+    return np.where(1000 <= taxable_income, income_tax, 0).astype(np.int64)
+
+
+def calc_resident_tax_array(taxable_income: np.ndarray, area: str) -> np.ndarray:
+    """calc_resident_taxを配列の要素ごとに計算する"""
+    taxable_income = np.asarray(taxable_income)
+    return (taxable_income * 0.06 + taxable_income * 0.04).astype(np.int64)
+
+
+def calc_petty_expenses_array(
+    expenses: np.ndarray,
+    ratio: np.ndarray,
+    upper: np.ndarray,
+    lower: np.ndarray,
+) -> np.ndarray:
+    """雑費（(物件経費 + 減価償却費) x 雑費割合を上限・下限で制限した値）を配列で計算する
+
+    Args:
+        expenses (np.ndarray): 物件経費 + 減価償却費（..., 物件数, 年数）
+        ratio (np.ndarray): 雑費割合(%)（物件数）
+        upper (np.ndarray): 雑費上限（物件数）
+        lower (np.ndarray): 雑費下限（物件数）
+
+    Returns:
+        np.ndarray: 雑費
+    """
+    petty_expenses = (expenses * ratio[:, None] / 100).astype(np.int64)
+    petty_expenses = np.where(
+        petty_expenses > upper[:, None],
+        upper[:, None],
+        np.where(petty_expenses < lower[:, None], lower[:, None], petty_expenses),
+    )
+    return petty_expenses
+
+
+def calc_taxable_base_array(income: np.ndarray, expenses: np.ndarray) -> np.ndarray:
+    """不動産所得を加える前の課税所得（給与 - 給与所得控除 - 基礎控除 - 経費. 0未満の値もそのまま返す）を配列で計算する
+
+    Args:
+        income (np.ndarray): 年ごとの給与（円）
+        expenses (np.ndarray): 年ごとの経費（円）
+
+    Returns:
+        np.ndarray: 年ごとの課税所得（不動産所得なし）
+    """
+    income_deduction = np.array(
+        [calc_income_deduction(income=value) for value in income]
+    )
+    return income - income_deduction - (BASIC_EXEMPTION + expenses)
+
+
+def calc_tax_columns_array(
+    income: np.ndarray, expenses: np.ndarray, real_estate_income: np.ndarray = None
+) -> Dict[str, np.ndarray]:
+    """給与・経費・不動産所得から税金の計算の途中の値と税額を配列で計算する（TaxCalculatorの列）
+
+    Args:
+        income (np.ndarray): 年ごとの給与（円）
+        expenses (np.ndarray): 年ごとの経費（円）
+        real_estate_income (np.ndarray, optional): 帳簿上の収支（..., 年数）. Defaults to None（不動産所得なし）.
+
+    Returns:
+        Dict[str, np.ndarray]: 給与所得控除, 所得金額, 基礎控除, 課税所得, 所得税, 住民税, 税額
+    """
+    income_deduction = np.array(
+        [calc_income_deduction(income=value) for value in income]
+    )
+
+    # 所得金額, 課税所得の計算（不動産所得は課税所得に加える）
+    total_income = income - income_deduction
+    taxable_income = calc_taxable_base_array(income=income, expenses=expenses)
+    if real_estate_income is not None:
+        real_estate_income = np.asarray(real_estate_income).astype(np.int64)
+        total_income = total_income + real_estate_income
+        taxable_income = taxable_income + real_estate_income
+    basic_exemption = np.full(len(income), BASIC_EXEMPTION)
+    taxable_income = np.where(taxable_income > 0, taxable_income, 0)
+
+    # 所得税, 住民税の計算
+    # TODO : 住民税は地域設定をして、計算を行うようにする
+    income_tax = calc_income_tax_array(taxable_income=taxable_income)
+    resident_tax = calc_resident_tax_array(taxable_income=taxable_income, area=None)
+    return {
+        "給与所得控除": income_deduction,
+        "所得金額": total_income,
+        "基礎控除": basic_exemption,
+        "課税所得": taxable_income,
+        "所得税": income_tax,
+        "住民税": resident_tax,
+        "税額": income_tax + resident_tax,
+    }
+
+
+def calc_tax_amount_array(
+    income: np.ndarray, expenses: np.ndarray, real_estate_income: np.ndarray = None
+) -> np.ndarray:
+    """給与・経費・不動産所得から税額（所得税 + 住民税）を配列で計算する（TaxCalculatorと同じ計算）
+
+    Args:
+        income (np.ndarray): 年ごとの給与（円）
+        expenses (np.ndarray): 年ごとの経費（円）
+        real_estate_income (np.ndarray, optional): 帳簿上の収支（..., 年数）. Defaults to None（不動産所得なし）.
+
+    Returns:
+        np.ndarray: 年ごとの税額
+    """
+    return calc_tax_columns_array(
+        income=income, expenses=expenses, real_estate_income=real_estate_income
+    )["税額"]
+
+
+def calc_deprecation_cost_array(
+    frame_intervals: np.ndarray,
+    equip_intervals: np.ndarray,
+    frame_costs: np.ndarray,
+    equip_costs: np.ndarray,
+    simulation_interval: int,
+) -> np.ndarray:
+    """物件ごと・購入年からの年数（1始まり）ごとの減価償却費用を配列で計算する（BuildingDeprecationCalculatorの値）
+
+    躯体・設備それぞれ, 減価償却期間内の年のみ年あたりの減価償却費用を計上する.
+
+    Args:
+        frame_intervals (np.ndarray): 減価償却期間（躯体部分）（物件数）
+        equip_intervals (np.ndarray): 減価償却期間（設備部分）（物件数）
+        frame_costs (np.ndarray): 減価償却費用（躯体）（円/年）（物件数）
+        equip_costs (np.ndarray): 減価償却費用（設備）（円/年）（物件数）
+        simulation_interval (int): シミュレーション期間（年数）
+
+    Returns:
+        np.ndarray: 減価償却費用（物件数 x 年数）
+    """
+    year_indices = np.arange(1, simulation_interval + 1)
+    return np.where(
+        year_indices <= frame_intervals[:, None], frame_costs[:, None], 0
+    ) + np.where(year_indices <= equip_intervals[:, None], equip_costs[:, None], 0)
+
+
+def calc_real_estate_cash_array(
+    components: Dict[str, np.ndarray],
+) -> Dict[str, np.ndarray]:
+    """不動産収支の計算に利用する値（calculator.get_real_estate_cash_componentsの形式）から物件ごとの不動産収支を計算する
+
+    Args:
+        components (Dict[str, np.ndarray]): 項目名 -> 配列（物件数 x 年数. 保有期間でない年の値は0とする）
+
+    Returns:
+        Dict[str, np.ndarray]: 不動産収支の項目 -> 配列（物件数 x 年数）
+    """
+    c = components
+    rent_income = c["家賃収入（円/月）"] * 12
+    petty_expenses = (
+        calc_petty_expenses_array(
+            expenses=c["物件経費"] + c["減価償却費"],
+            ratio=c["雑費割合"],
+            upper=c["雑費上限"],
+            lower=c["雑費下限"],
+        )
+        * c["保有期間"]
+    )
+    book_expenses = (
+        c["物件経費"] + c["減価償却費"] + c["ローン利息（建物分）"] + petty_expenses
+    )
+    return {
+        "総収入": rent_income,
+        "物件経費": c["物件経費"],
+        "減価償却費": c["減価償却費"],
+        "ローン利息（建物分）": c["ローン利息（建物分）"],
+        "ローン支払い": c["ローン支払い"],
+        "雑費": petty_expenses,
+        "帳簿上の支出": book_expenses,
+        "帳簿上の収支": rent_income - book_expenses,
+        "リアル収支": rent_income
+        - (c["物件経費"] + c["ローン支払い"])
+        + c["初期費用カット"],
+    }
+
+
+def calc_real_estate_price_array(
+    prices: np.ndarray,
+    decrease_rates: np.ndarray,
+    first_year_decrease_rates: np.ndarray,
+    simulation_interval: int,
+) -> np.ndarray:
+    """物件ごと・年数（1始まり）ごとの想定評価額を配列で計算する（RealEstatePriceSimuationCalculatorの値）
+
+    1年目は物件価格から初年度減少率で, 2年目以降は前年の想定評価額（円未満切り捨て）から減少率で減少させる.
+
+    Args:
+        prices (np.ndarray): 物件価格（物件数）
+        decrease_rates (np.ndarray): 物件価格減少率(%/年)（物件数）
+        first_year_decrease_rates (np.ndarray): 物件価格初年度減少率(%/年)（物件数）
+        simulation_interval (int): シミュレーション期間（年数）
+
+    Returns:
+        np.ndarray: 想定評価額（物件数 x 年数）
+    """
+    values = np.zeros((len(prices), simulation_interval), dtype=np.int64)
+    price = np.asarray(prices) * (
+        1 - np.asarray(first_year_decrease_rates, dtype=float) / 100
+    )
+    for j in range(simulation_interval):
+        if j > 0:
+            price = values[:, j - 1] * (
+                1 - np.asarray(decrease_rates, dtype=float) / 100
+            )
+        values[:, j] = price.astype(np.int64)
+    return values
+
+
+def calc_real_estate_sale_array(
+    prices: np.ndarray,
+    loan_balances: np.ndarray,
+    deprecation_costs: np.ndarray,
+    purchase_prices: np.ndarray,
+    sale_expenses: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """物件ごと・年数（1始まり）ごとに売却した場合の収支を配列で計算する（RealEstateSaleSimulationCalculatorの列）
+
+    Args:
+        prices (np.ndarray): 想定評価額（物件数 x 年数）
+        loan_balances (np.ndarray): ローン残高（物件数 x 年数）
+        deprecation_costs (np.ndarray): 減価償却費用（物件数 x 年数）
+        purchase_prices (np.ndarray): 物件価格（物件数）
+        sale_expenses (np.ndarray): 譲渡費用（円）（物件数）
+
+    Returns:
+        Dict[str, np.ndarray]: 想定評価額, ローン残額, 累計減価償却費用, 売却経費, 譲渡所得税, 売却差額（物件数 x 年数）
+    """
+    year_indices = np.arange(1, prices.shape[1] + 1)
+    total_deprecation_costs = np.cumsum(deprecation_costs, axis=1)
+    # TODO : 繰り上げ返済手数料の計算をしたようにしたほうが良いかも（現状はシンプルに多めに金額設定している）
+    sale_expenses = np.broadcast_to(np.asarray(sale_expenses)[:, None], prices.shape)
+
+    # 譲渡所得税の計算（5年以下は短期譲渡所得とする）
+    gains = prices - (
+        np.asarray(purchase_prices)[:, None] - sale_expenses - total_deprecation_costs
+    )
+    taxes = np.where(year_indices <= 5, gains * 0.3963, gains * 0.20315).astype(
+        np.int64
+    )
+    return {
+        "想定評価額": prices,
+        "ローン残額": loan_balances,
+        "累計減価償却費用": total_deprecation_costs,
+        "売却経費": sale_expenses,
+        "譲渡所得税": taxes,
+        "売却差額": prices - (loan_balances + taxes + sale_expenses),
+    }
+
+
+def calc_cash_flow_array(
+    years: np.ndarray,
+    real_cash: np.ndarray,
+    tax_diffs: np.ndarray,
+    sale_years: np.ndarray,
+    sale_profits: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """年ごとのキャッシュフローを配列で計算する（CashFlowCalculatorの列）
+
+    Args:
+        years (np.ndarray): シミュレーション年
+        real_cash (np.ndarray): 年ごとのリアル収支
+        tax_diffs (np.ndarray): 年ごとの課税差額（不動産あり税額 - 不動産なし税額）
+        sale_years (np.ndarray): 物件ごとの売却予定年（物件数）
+        sale_profits (np.ndarray): 物件ごと・シミュレーション年ごとの売却差額（物件数 x 年数）
+
+    Returns:
+        Dict[str, np.ndarray]: リアル収支, 課税差額, 物件売却益, 収支差額, 差額累計
+    """
+    # 物件売却がある年のみ売却差額を計上する
+    profits = np.where(np.asarray(sale_years)[:, None] == years, sale_profits, 0).sum(
+        axis=0
+    )
+    diff_cash = real_cash - tax_diffs + profits
+    return {
+        "リアル収支": real_cash,
+        "課税差額": tax_diffs,
+        "物件売却益": profits,
+        "収支差額": diff_cash,
+        "差額累計": np.cumsum(diff_cash),
+    }
@@ -0,0 +1,546 @@
+from params import Parameters
+from aggregation import StreamingAggregator
+from checkpoint import Progress, ProgressTracker, fingerprint_json
+from parameters_diff import get_parameters_fingerprint
+from result_cube import METRIC_AXIS, ResultCube
+from executor import execute_stages
+from calculator import (
+    calc_tax_array,
+    get_income_arrays,
+    get_real_estate_cash_components,
+)
+from util import calc_petty_expenses_array, calc_tax_amount_array
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, List, Sequence
+import time
+import zlib
+
+# 乱数を生成するパスのブロックサイズ（ブロック単位で乱数ストリームを分けるため, 分割実行でも結果は一致する）
+PATH_BLOCK_SIZE = 1024
+
+# コンパイル済みの入力（get_compiled_inputs）のうち, 物件ごとの値（get_real_estate_cash_components）以外の項目
+COMPILED_ITEMS = ("不動産所得なしの税額", "物件売却益", "給与", "経費", "年")
+
+
+class VacancyModel:
+    """入居者の退去・空室・家賃改定の確率モデル
+
+    各年に確率turnover_rateで退去が発生し, 退去した年はポアソン分布（平均mean_vacancy_months）の月数だけ空室となる.
+    退去時は再募集費用（releasing_cost）が発生し, 家賃は平均rent_reset_mean, 標準偏差rent_reset_stdの割合で改定される.
+    各値はスカラー（全物件共通）または物件数の配列で指定する.
+
+    Args:
+        turnover_rate (float, optional): 年あたりの退去確率. Defaults to 0.25.
+        mean_vacancy_months (float, optional): 退去1回あたりの平均空室月数. Defaults to 2.0.
+        releasing_cost (float, optional): 退去1回あたりの再募集費用（円）. Defaults to 0.
+        rent_reset_mean (float, optional): 退去時の家賃改定率の平均. Defaults to 0.0.
+        rent_reset_std (float, optional): 退去時の家賃改定率の標準偏差. Defaults to 0.0.
+    """
+
+    def __init__(
+        self,
+        turnover_rate=0.25,
+        mean_vacancy_months=2.0,
+        releasing_cost=0,
+        rent_reset_mean=0.0,
+        rent_reset_std=0.0,
+    ) -> None:
+        self.turnover_rate = turnover_rate
+        self.mean_vacancy_months = mean_vacancy_months
+        self.releasing_cost = releasing_cost
+        self.rent_reset_mean = rent_reset_mean
+        self.rent_reset_std = rent_reset_std
+
+    @classmethod
+    def from_parameters(
+        cls, parameters: Parameters, mean_vacancy_months: float = 2.0, **kwargs
+    ) -> "VacancyModel":
+        """物件情報の空室リスク（%/年）, 退去時のリフォーム、広告費用（円/年）からモデルを作成する
+
+        空室リスク（%/年）は年間の期待空室率とし, 期待空室月数が一致するように退去確率を設定する.
+        """
+        building_names = parameters.get_building_names()
+        vacancy_ratio = np.array(
+            [
+                float(
+                    parameters.get_value(item="空室リスク（%/年）", building_name=name)
+                )
+                for name in building_names
+            ]
+        )
+        releasing_cost = np.array(
+            [
+                float(
+                    parameters.get_value(
+                        item="退去時のリフォーム、広告費用（円/年）", building_name=name
+                    )
+                )
+                for name in building_names
+            ]
+        )
+        turnover_rate = np.clip(
+            vacancy_ratio / 100 * 12 / mean_vacancy_months, 0.0, 1.0
+        )
+        return cls(
+            turnover_rate=turnover_rate,
+            mean_vacancy_months=mean_vacancy_months,
+            releasing_cost=releasing_cost,
+            **kwargs,
+        )
+
+
+class StochasticCashFlowResult:
+    """確率シミュレーションの結果（パスごと・年ごとの配列）
+
+    Args:
+        years (np.ndarray): 年
+        datas (Dict[str, np.ndarray]): 項目名 -> 配列（パス数 x 年数）
+    """
+
+    def __init__(self, years: np.ndarray, datas: Dict[str, np.ndarray]) -> None:
+        self.years = years
+        self.datas = datas
+
+    def get_path_count(self) -> int:
+        return len(next(iter(self.datas.values())))
+
+    def summarize(
+        self,
+        columns: List[str] = None,
+        quantiles: Sequence[float] = (0.05, 0.25, 0.5, 0.75, 0.95),
+    ) -> pd.DataFrame:
+        """年・項目ごとの分布の要約（平均, 標準偏差, 分位点, 負となる確率）を返す
+
+        Args:
+            columns (List[str], optional): 要約する項目. Defaults to None（全項目）.
+            quantiles (Sequence[float], optional): 分位点. Defaults to (0.05, 0.25, 0.5, 0.75, 0.95).
+
+        Returns:
+            pd.DataFrame: (年, 項目)をインデックスとした要約
+        """
+        columns = list(self.datas.keys()) if columns is None else columns
+        dfs = []
+        for column in columns:
+            values = self.datas[column]
+            summary = {
+                "mean": values.mean(axis=0),
+                "std": values.std(axis=0),
+                "min": values.min(axis=0),
+                "max": values.max(axis=0),
+            }
+            for q, quantile_values in zip(
+                quantiles, np.quantile(values, quantiles, axis=0)
+            ):
+                summary[f"p{q * 100:g}"] = quantile_values
+            summary["負の確率"] = (values < 0).mean(axis=0)
+            df = pd.DataFrame(summary, index=self.years)
+            df.index.name = "年"
+            df.insert(0, "項目", column)
+            dfs.append(df)
+        return pd.concat(dfs).set_index("項目", append=True)
+
+
+class StochasticCashFlowSimulator:
+    """空室・家賃改定を確率的に扱い, 不動産収支・税金・キャッシュフローをパスごとに計算する
+
+    家賃以外の決定的な値（減価償却, ローン, 売却差額, 不動産所得なしの税額）は基準の計算結果を1度だけ作成して再利用し,
+    (パス数 x 物件数 x 年数)の配列でまとめて計算する.
+    乱数は物件名ごとに独立したストリームとするため, 同じseedであれば物件の追加・並び替えによらず各物件の結果は再現する.
+
+    Args:
+        parameters (Parameters): パラメーター
+        model (VacancyModel): 空室・家賃改定のモデル
+        seed (int, optional): 乱数のシード. Defaults to 0.
+    """
+
+    def __init__(
+        self, parameters: Parameters, model: VacancyModel, seed: int = 0
+    ) -> None:
+        if parameters.is_only_tax_calculation():
+            raise VacancySimulationError(
+                "stochastic simulation is not supported for tax only calculation!"
+            )
+        self.__parameters = parameters
+        self.__model = model
+        self.__seed = seed
+        self.__building_names = parameters.get_building_names()
+
+        # 決定的な値は1度だけ計算しておく
+        dfs = execute_stages(parameters=parameters)
+        self.__components = get_real_estate_cash_components(
+            parameters=parameters,
+            loan_df=dfs["loan_data"],
+            building_deprecation_df=dfs["building_deprecation_data"],
+        )
+        self.__tax_without_real_estate = calc_tax_array(parameters=parameters)
+        self.__income, self.__expenses = get_income_arrays(parameters=parameters)
+        self.__sale_profits = get_sale_profits(
+            parameters=parameters, real_estate_sale_df=dfs["real_estate_sale_data"]
+        )
+        start_year = parameters.get_simulation_start_year()
+        self.__years = np.arange(
+            start_year, start_year + parameters.get_simulation_interval()
+        )
+
+    @classmethod
+    def from_compiled_inputs(
+        cls,
+        inputs: Dict[str, np.ndarray],
+        model: VacancyModel,
+        building_names: List[str],
+        seed: int = 0,
+    ) -> "StochasticCashFlowSimulator":
+        """コンパイル済みの入力（get_compiled_inputsの結果）から作成する
+
+        パラメーターの読み込み・決定的な値の計算を行わないため, 共有メモリの配列からワーカーで作成できる.
+        パラメーターを保持しないため, simulate_to_cubeは利用できない.
+
+        Args:
+            inputs (Dict[str, np.ndarray]): コンパイル済みの入力
+            model (VacancyModel): 空室・家賃改定のモデル
+            building_names (List[str]): 物件名（乱数のストリームを決める）
+            seed (int, optional): 乱数のシード. Defaults to 0.
+
+        Returns:
+            StochasticCashFlowSimulator: シミュレーター
+        """
+        simulator = cls.__new__(cls)
+        simulator.__parameters = None
+        simulator.__model = model
+        simulator.__seed = seed
+        simulator.__building_names = list(building_names)
+        simulator.__components = {
+            name: value for name, value in inputs.items() if name not in COMPILED_ITEMS
+        }
+        simulator.__tax_without_real_estate = inputs["不動産所得なしの税額"]
+        simulator.__income = inputs["給与"]
+        simulator.__expenses = inputs["経費"]
+        simulator.__sale_profits = inputs["物件売却益"]
+        simulator.__years = inputs["年"]
+        return simulator
+
+    def get_compiled_inputs(self) -> Dict[str, np.ndarray]:
+        """パスの計算に利用する決定的な値を, 項目名 -> 配列で返す（パラメーターをコンパイルした結果）"""
+        return {
+            **self.__components,
+            "不動産所得なしの税額": self.__tax_without_real_estate,
+            "物件売却益": self.__sale_profits,
+            "給与": self.__income,
+            "経費": self.__expenses,
+            "年": self.__years,
+        }
+
+    def get_building_names(self) -> List[str]:
+        return list(self.__building_names)
+
+    def get_model(self) -> VacancyModel:
+        return self.__model
+
+    def get_seed(self) -> int:
+        return self.__seed
+
+    def simulate_occupancy(self, path_count: int, path_offset: int = 0) -> Dict:
+        """物件ごとの入居月数・退去・家賃改定係数を(パス数 x 物件数 x 年数)で生成する
+
+        path_offsetを指定すると, 通しのパス番号path_offset以降の乱数を生成する（分割実行でも結果は一致する）.
+
+        Args:
+            path_count (int): パス数
+            path_offset (int, optional): 先頭のパス番号. Defaults to 0.
+
+        Returns:
+            Dict: 入居月数, 退去, 家賃係数
+        """
+        year_count = len(self.__years)
+        shape = (path_count, len(self.__building_names), year_count)
+        occupied_months = np.empty(shape, dtype=np.int64)
+        turnovers = np.empty(shape, dtype=bool)
+        rent_factors = np.empty(shape)
+        for i, building_name in enumerate(self.__building_names):
+            turnover_rate = _get_building_value(self.__model.turnover_rate, i)
+            mean_vacancy_months = _get_building_value(
+                self.__model.mean_vacancy_months, i
+            )
+            rent_reset_mean = _get_building_value(self.__model.rent_reset_mean, i)
+            rent_reset_std = _get_building_value(self.__model.rent_reset_std, i)
+
+            # 物件別の乱数ストリームから, パスのブロック単位で乱数を生成する
+            uniforms = np.empty((path_count, year_count))
+            vacancy_months = np.empty((path_count, year_count), dtype=np.int64)
+            resets = np.empty((path_count, year_count))
+            first_block = path_offset // PATH_BLOCK_SIZE
+            last_block = (path_offset + path_count - 1) // PATH_BLOCK_SIZE
+            for block_index in range(first_block, last_block + 1):
+                rng = get_building_rng(
+                    seed=self.__seed,
+                    building_name=building_name,
+                    block_index=block_index,
+                )
+                block_shape = (PATH_BLOCK_SIZE, year_count)
+                block_uniforms = rng.random(block_shape)
+                block_vacancy_months = rng.poisson(mean_vacancy_months, block_shape)
+                block_resets = rng.normal(rent_reset_mean, rent_reset_std, block_shape)
+
+                # ブロックのうち, 対象のパスの範囲を切り出す
+                block_start = block_index * PATH_BLOCK_SIZE
+                start = max(path_offset, block_start)
+                stop = min(path_offset + path_count, block_start + PATH_BLOCK_SIZE)
+                target = slice(start - path_offset, stop - path_offset)
+                source = slice(start - block_start, stop - block_start)
+                uniforms[target] = block_uniforms[source]
+                vacancy_months[target] = block_vacancy_months[source]
+                resets[target] = block_resets[source]
+
+            # 退去・家賃改定は保有期間のみとし, 家賃係数は購入年から累積する
+            turnovers[:, i] = (uniforms < turnover_rate) & self.__components[
+                "保有期間"
+            ][i]
+            occupied_months[:, i] = 12 - np.where(
+                turnovers[:, i], np.minimum(vacancy_months, 12), 0
+            )
+            rent_factors[:, i] = np.cumprod(
+                np.where(turnovers[:, i], 1 + resets, 1.0), axis=1
+            )
+        return {
+            "入居月数": occupied_months,
+            "退去": turnovers,
+            "家賃係数": rent_factors,
+        }
+
+    def simulate(
+        self, path_count: int, path_offset: int = 0
+    ) -> StochasticCashFlowResult:
+        """パスごとの不動産収支, 税額, キャッシュフローを計算する
+
+        Args:
+            path_count (int): パス数
+            path_offset (int, optional): 先頭のパス番号. Defaults to 0.
+
+        Returns:
+            StochasticCashFlowResult: パスごと・年ごとの結果
+        """
+        occupancy = self.simulate_occupancy(
+            path_count=path_count, path_offset=path_offset
+        )
+        return self.calculate(occupancy=occupancy)
+
+    def simulate_aggregated(
+        self,
+        path_count: int,
+        chunk_size: int = 10000,
+        columns: List[str] = None,
+        path_offset: int = 0,
+    ) -> StreamingAggregator:
+        """パスをチャンク単位で計算して逐次集計し, パス数によらず一定のメモリで統計量を返す
+
+        Args:
+            path_count (int): パス数
+            chunk_size (int, optional): 1度に計算するパス数. Defaults to 10000.
+            columns (List[str], optional): 集計する項目. Defaults to None（全項目）.
+            path_offset (int, optional): 先頭のパス番号. Defaults to 0.
+
+        Returns:
+            StreamingAggregator: 年・項目ごとの集計
+        """
+        aggregator = None
+        for start in range(path_offset, path_offset + path_count, chunk_size):
+            count = min(chunk_size, path_offset + path_count - start)
+            result = self.simulate(path_count=count, path_offset=start)
+            if aggregator is None:
+                aggregator = StreamingAggregator(
+                    years=result.years,
+                    columns=list(result.datas.keys()) if columns is None else columns,
+                )
+            aggregator.update(result.datas)
+        return aggregator
+
+    def simulate_to_cube(
+        self,
+        directory: str,
+        path_count: int,
+        chunk_size: int = 10000,
+        columns: List[str] = None,
+        path_offset: int = 0,
+        resume: bool = False,
+        on_progress: Callable[[Progress], None] = None,
+    ) -> ResultCube:
+        """パスをチャンク単位で計算し, パス番号 x 年 x 項目の計算結果キューブに逐次書き込む
+
+        チャンクの書き込みごとにチェックポイントを記録し, resumeの場合は書き込み済みで
+        破損していないチャンクをスキップする（パスの乱数はパス番号で決まるため, 再開しても結果は一致する）.
+
+        Args:
+            directory (str): キューブのディレクトリ
+            path_count (int): パス数
+            chunk_size (int, optional): 1度に計算するパス数. Defaults to 10000.
+            columns (List[str], optional): 書き込む項目. Defaults to None（全項目）.
+            path_offset (int, optional): 先頭のパス番号. Defaults to 0.
+            resume (bool, optional): 既存のキューブへの書き込みを再開する. Defaults to False.
+            on_progress (Callable[[Progress], None], optional): チャンクごとに進捗を通知する関数. Defaults to None.
+
+        Returns:
+            ResultCube: 書き込んだキューブ
+        """
+        if self.__parameters is None:
+            raise VacancySimulationError(
+                "simulate_to_cube requires parameters! create simulator from parameters"
+            )
+        # 項目とデータ型は1パスの計算結果から決める
+        probe = self.simulate(path_count=1, path_offset=path_offset)
+        columns = list(probe.datas.keys()) if columns is None else columns
+        cube = ResultCube.create_or_open(
+            directory=directory,
+            axes=[
+                ("パス番号", range(path_offset, path_offset + path_count)),
+                ("年", probe.years),
+                (METRIC_AXIS, columns),
+            ],
+            dtype=np.result_type(*[probe.datas[column].dtype for column in columns]),
+            attributes={"seed": self.__seed, "path_offset": path_offset},
+            resume=resume,
+        )
+        store = cube.get_checkpoint_store()
+        job_fingerprint = fingerprint_json(
+            {
+                "parameters": get_parameters_fingerprint(parameters=self.__parameters),
+                "model": {
+                    name: np.asarray(value).tolist()
+                    for name, value in vars(self.__model).items()
+                },
+                "seed": self.__seed,
+            }
+        )
+        tracker = ProgressTracker(total=path_count, on_progress=on_progress)
+        for start in range(path_offset, path_offset + path_count, chunk_size):
+            count = min(chunk_size, path_offset + path_count - start)
+            target = slice(start - path_offset, start - path_offset + count)
+            key = f"paths_{start}_{start + count - 1}"
+            fingerprint = fingerprint_json(
+                {"job": job_fingerprint, "start": start, "count": count}
+            )
+            if resume and store.is_done(
+                key=key,
+                fingerprint=fingerprint,
+                get_output_fingerprint=lambda _: cube.get_fingerprint(target),
+            ):
+                tracker.skip(count)
+                continue
+
+            chunk_start_time = time.perf_counter()
+            result = self.simulate(path_count=count, path_offset=start)
+            cube.write(
+                target, np.stack([result.datas[column] for column in columns], axis=-1)
+            )
+            # キューブをディスクに書き込んでから記録し, 記録のあるチャンクは必ず書き込み済みとする
+            cube.flush()
+            store.record(
+                key=key,
+                fingerprint=fingerprint,
+                outputs={"data": cube.get_fingerprint(target)},
+                elapsed_time=time.perf_counter() - chunk_start_time,
+            )
+            tracker.complete(count)
+        return cube
+
+    def calculate(self, occupancy: Dict) -> StochasticCashFlowResult:
+        """入居状況（simulate_occupancyの結果）から不動産収支, 税額, キャッシュフローを計算する"""
+        c = self.__components
+        owned = c["保有期間"]
+        releasing_cost = np.asarray(self.__model.releasing_cost, dtype=float)
+        releasing_cost = np.broadcast_to(releasing_cost, (len(self.__building_names),))
+
+        # 物件ごとの不動産収支（パス数 x 物件数 x 年数）
+        rent_income = (
+            (c["家賃収入（円/月）"] * occupancy["家賃係数"]).astype(np.int64)
+            * occupancy["入居月数"]
+            * owned
+        )
+        building_expenses = c["物件経費"] + (
+            occupancy["退去"] * releasing_cost[:, None] * owned
+        ).astype(np.int64)
+        petty_expenses = (
+            calc_petty_expenses_array(
+                expenses=building_expenses + c["減価償却費"],
+                ratio=c["雑費割合"],
+                upper=c["雑費上限"],
+                lower=c["雑費下限"],
+            )
+            * owned
+        )
+        book_expenses = (
+            building_expenses
+            + c["減価償却費"]
+            + c["ローン利息（建物分）"]
+            + petty_expenses
+        )
+        book_income = rent_income - book_expenses
+        real_income = (
+            rent_income - (building_expenses + c["ローン支払い"]) + c["初期費用カット"]
+        )
+
+        # 物件を合算し, 税額とキャッシュフローを計算する（パス数 x 年数）
+        datas = {
+            "総収入": rent_income.sum(axis=1),
+            "物件経費": building_expenses.sum(axis=1),
+            "雑費": petty_expenses.sum(axis=1),
+            "帳簿上の収支": book_income.sum(axis=1),
+            "リアル収支": real_income.sum(axis=1),
+        }
+        tax_with_real_estate = calc_tax_amount_array(
+            income=self.__income,
+            expenses=self.__expenses,
+            real_estate_income=datas["帳簿上の収支"],
+        )
+        datas["税額"] = tax_with_real_estate
+        datas["課税差額"] = tax_with_real_estate - self.__tax_without_real_estate
+        datas["物件売却益"] = np.broadcast_to(
+            self.__sale_profits, datas["リアル収支"].shape
+        )
+        datas["収支差額"] = (
+            datas["リアル収支"] - datas["課税差額"] + datas["物件売却益"]
+        )
+        datas["差額累計"] = np.cumsum(datas["収支差額"], axis=1)
+        return StochasticCashFlowResult(years=self.__years, datas=datas)
+
+
+def get_sale_profits(
+    parameters: Parameters, real_estate_sale_df: pd.DataFrame
+) -> np.ndarray:
+    """年ごとの物件売却益（売却予定年の売却差額の合計）を返す（CashFlowCalculatorと同じ計上方法）"""
+    simulation_start_year = parameters.get_simulation_start_year()
+    sale_profits = np.zeros(parameters.get_simulation_interval(), dtype=np.int64)
+    for building_name in parameters.get_building_names():
+        sale_year = parameters.get_expected_sale_date(building_name=building_name).year
+        year_index = sale_year - simulation_start_year + 1
+        if not 1 <= year_index <= len(sale_profits):
+            continue
+        values = real_estate_sale_df[
+            (real_estate_sale_df["年"] == year_index)
+            & (real_estate_sale_df["物件名"] == building_name)
+        ]["売却差額"].values
+        if len(values) != 1:
+            raise VacancySimulationError(
+                f"real estate sale data is dupricated! value is {values}"
+            )
+        sale_profits[year_index - 1] += values[0]
+    return sale_profits
+
+
+def get_building_rng(
+    seed: int, building_name: str, block_index: int
+) -> np.random.Generator:
+    """(シード, 物件名, パスのブロック番号)ごとに独立した乱数生成器を返す"""
+    building_key = zlib.crc32(building_name.encode("utf-8"))
+    return np.random.default_rng(
+        np.random.SeedSequence(entropy=seed, spawn_key=(building_key, block_index))
+    )
+
+
+def _get_building_value(value, building_index: int) -> float:
+    value = np.asarray(value, dtype=float)
+    return float(value) if value.ndim == 0 else float(value[building_index])
+
+
+class VacancySimulationError(Exception):
+    pass
@@ -0,0 +1,262 @@
+"""パラメーターファイルの保存を監視し, 計算結果を更新する
+
+パラメーターファイルの更新日時・サイズをポーリングし, 変更された場合は前回読み込んだパラメーターとの差分
+（parameters_diff.ParametersDiff）から, 変更された入力項目に依存するステージのみを再計算する（executor.execute_diff）.
+計算結果のファイルは内容が変わったもののみを書き換え, 計算されなくなったデータ（税額のみの計算に切り替えた場合など）のファイルは削除する.
+"""
+
+from params import Parameters, ParametersReader
+from executor import Executor, execute_diff, execute_stages
+from excel_export import get_result_xlsx_file_name
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+import hashlib
+import os
+import pandas as pd
+import time
+
+# パラメーターファイルを確認する間隔の既定値（秒）
+DEFAULT_INTERVAL = 0.2
+
+
+class WatchUpdate(NamedTuple):
+    """1回の更新（読み込み・再計算・書き込み）の結果
+
+    final_cumulativeは最終年の差額累計, tax_totalは不動産収支を含めた税額の合計とし,
+    *_deltaは前回の計算結果からの差分（初回はNone）とする. 税額のみの計算の場合, 差額累計はNoneとする.
+    stage_namesは実際に計算したステージ名, removed_namesは計算されなくなりファイルを削除したデータ名とする.
+    """
+
+    stage_names: List[str]
+    written_names: List[str]
+    removed_names: List[str]
+    final_cumulative: Optional[float]
+    final_cumulative_delta: Optional[float]
+    tax_total: float
+    tax_total_delta: Optional[float]
+    elapsed_time: float
+
+
+class ParameterFileWatcher:
+    """パラメーターファイルの変更を監視し, 差分のステージのみを再計算して計算結果のフォルダを更新する
+
+    Args:
+        parameter_file_path (str): パラメーターファイルのパス
+        result_folder (str): 計算結果のフォルダ（更新のたびに同じフォルダのファイルを書き換える）
+        file_format (str, optional): "csv"または"xlsx". Defaults to "csv".
+        calc_extra_dfs (Callable[[Parameters], Dict[str, pd.DataFrame]], optional): ステージ以外に出力するデータを計算する関数. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        parameter_file_path: str,
+        result_folder: str,
+        file_format: str = "csv",
+        calc_extra_dfs: Callable[[Parameters], Dict[str, pd.DataFrame]] = None,
+    ) -> None:
+        if file_format not in ("csv", "xlsx"):
+            raise WatchError(f"file format is not supported! value is {file_format}")
+        self.__parameter_file_path = parameter_file_path
+        self.__result_folder = result_folder
+        self.__file_format = file_format
+        self.__calc_extra_dfs = calc_extra_dfs
+        self.__executor = Executor(
+            parameter_file_path=parameter_file_path, result_folder=result_folder
+        )
+        self.__file_state = None
+        self.__pending_file_state = None
+        self.__parameters = None
+        self.__dfs = None
+        self.__content_hashes: Dict[str, str] = {}
+
+    def poll(self) -> Optional[WatchUpdate]:
+        """パラメーターファイルが変更された場合は計算結果を更新する
+
+        保存の途中のファイルを読み込まないよう, 更新日時・サイズが連続する2回の確認で変わらない場合に読み込む.
+        読み込みに失敗した場合は例外を送出し, ファイルが再度変更されるまで読み込まない.
+
+        Returns:
+            Optional[WatchUpdate]: 更新の結果（変更がない場合はNone）
+        """
+        file_state = self.__get_file_state()
+        if file_state == self.__file_state:
+            return None
+        if file_state != self.__pending_file_state:
+            self.__pending_file_state = file_state
+            return None
+        self.__file_state = file_state
+        return self.update()
+
+    def update(self) -> WatchUpdate:
+        """パラメーターファイルを読み込み, 前回からの差分のステージを再計算して計算結果を書き込む"""
+        start = time.perf_counter()
+        parameters = ParametersReader(
+            params_file_path=self.__parameter_file_path
+        ).read_params()
+        if self.__parameters is None:
+            dfs = execute_stages(parameters=parameters)
+            stage_names = list(dfs.keys())
+        else:
+            result = execute_diff(
+                base_parameters=self.__parameters,
+                revised_parameters=parameters,
+                base_dfs=self.__dfs,
+            )
+            dfs = result.revised_dfs
+            # 再計算の対象でも, 税額のみの計算の場合は計算されないステージを除く
+            stage_names = [name for name in result.stage_names if name in dfs]
+        output_dfs = dict(dfs)
+        if self.__calc_extra_dfs is not None:
+            output_dfs.update(self.__calc_extra_dfs(parameters))
+        written_names, removed_names = self.__write_changed_results(dfs=output_dfs)
+
+        final_cumulative = _get_final_cumulative(dfs)
+        tax_total = _get_tax_total(dfs)
+        final_cumulative_delta = None
+        tax_total_delta = None
+        if self.__dfs is not None:
+            previous_final_cumulative = _get_final_cumulative(self.__dfs)
+            if final_cumulative is not None and previous_final_cumulative is not None:
+                final_cumulative_delta = final_cumulative - previous_final_cumulative
+            tax_total_delta = tax_total - _get_tax_total(self.__dfs)
+        self.__parameters = parameters
+        self.__dfs = dfs
+        return WatchUpdate(
+            stage_names=stage_names,
+            written_names=written_names,
+            removed_names=removed_names,
+            final_cumulative=final_cumulative,
+            final_cumulative_delta=final_cumulative_delta,
+            tax_total=tax_total,
+            tax_total_delta=tax_total_delta,
+            elapsed_time=time.perf_counter() - start,
+        )
+
+    def run(
+        self,
+        on_update: Callable[[WatchUpdate], None],
+        on_error: Callable[[Exception], None],
+        interval: float = DEFAULT_INTERVAL,
+    ) -> None:
+        """interval秒ごとにpollを繰り返す（KeyboardInterruptで終了する）
+
+        Args:
+            on_update (Callable[[WatchUpdate], None]): 計算結果を更新するごとに呼ぶ関数
+            on_error (Callable[[Exception], None]): 読み込み・計算に失敗した場合に呼ぶ関数
+            interval (float, optional): 確認する間隔（秒）. Defaults to DEFAULT_INTERVAL.
+        """
+        while True:
+            try:
+                update = self.poll()
+            except (KeyboardInterrupt, WatchError):
+                raise
+            except Exception as e:
+                on_error(e)
+            else:
+                if update is not None:
+                    on_update(update)
+            time.sleep(interval)
+
+    def __get_file_state(self) -> tuple:
+        try:
+            stat = os.stat(self.__parameter_file_path)
+        except FileNotFoundError:
+            # 保存時に一時ファイルと置き換える間は存在しない場合がある
+            return self.__file_state
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def __write_changed_results(
+        self, dfs: Dict[str, pd.DataFrame]
+    ) -> Tuple[List[str], List[str]]:
+        """内容が変わったデータのファイルを書き込み, 計算されなくなったデータのファイルを削除する
+
+        Returns:
+            Tuple[List[str], List[str]]: 書き込んだデータ名と, 削除したデータ名
+        """
+        contents = {name: df.to_csv() for name, df in dfs.items()}
+        content_hashes = {
+            name: hashlib.sha256(content.encode("utf-8")).hexdigest()
+            for name, content in contents.items()
+        }
+        changed_names = [
+            name
+            for name in dfs
+            if content_hashes[name] != self.__content_hashes.get(name)
+            or not os.path.exists(self.__get_file_path(name))
+        ]
+        removed_names = [name for name in self.__content_hashes if name not in dfs]
+        if len(changed_names) == 0 and len(removed_names) == 0:
+            return [], []
+
+        if self.__file_format == "xlsx":
+            # 全てのデータを1つのExcelファイルに保存するため, データが変わった場合もなくなった場合もファイル全体を書き換える
+            self.__executor.save_results(dfs=dfs, file_format="xlsx")
+        else:
+            os.makedirs(self.__result_folder, exist_ok=True)
+            for name in changed_names:
+                # DataFrame.to_csvでファイルに保存する場合と同じ内容で書き込む
+                with open(
+                    self.__get_file_path(name), "w", encoding="utf-8", newline=""
+                ) as f:
+                    f.write(contents[name])
+            for name in removed_names:
+                if os.path.exists(self.__get_file_path(name)):
+                    os.remove(self.__get_file_path(name))
+        self.__content_hashes = content_hashes
+        return changed_names, removed_names
+
+    def __get_file_path(self, name: str) -> str:
+        if self.__file_format == "xlsx":
+            return os.path.join(
+                self.__result_folder,
+                get_result_xlsx_file_name(self.__parameter_file_path),
+            )
+        return os.path.join(self.__result_folder, f"{name}.csv")
+
+
+def format_update(update: WatchUpdate) -> str:
+    """更新の結果を1行の表示用の文字列で返す"""
+    items = [
+        time.strftime("%H:%M:%S"),
+        f"{update.elapsed_time:.2f}s",
+        f"recalculated {len(update.stage_names)} stages",
+        f"changed {len(update.written_names)} results",
+    ]
+    if len(update.removed_names) > 0:
+        items.append(f"removed {len(update.removed_names)} results")
+    if update.final_cumulative is not None:
+        items.append(
+            "差額累計 "
+            + _format_value_with_delta(
+                update.final_cumulative, update.final_cumulative_delta
+            )
+        )
+    items.append(
+        "税額合計 " + _format_value_with_delta(update.tax_total, update.tax_total_delta)
+    )
+    return " | ".join(items)
+
+
+def _format_value_with_delta(value: float, delta: Optional[float]) -> str:
+    text = f"{value:,.0f}"
+    if delta is not None:
+        text += f" ({delta:+,.0f})"
+    return text
+
+
+def _get_final_cumulative(dfs: Dict[str, pd.DataFrame]) -> Optional[float]:
+    if "cash_flow_data" not in dfs:
+        return None
+    return float(dfs["cash_flow_data"]["差額累計"].iloc[-1])
+
+
+def _get_tax_total(dfs: Dict[str, pd.DataFrame]) -> float:
+    name = (
+        "tax_data_with_real_estate_cash"
+        if "tax_data_with_real_estate_cash" in dfs
+        else "tax_data"
+    )
+    return float(dfs[name]["税額"].sum())
+
+
+class WatchError(Exception):
+    pass